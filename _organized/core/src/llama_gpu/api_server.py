@@ -1,16 +1,18 @@
 import asyncio
+import hashlib
 import json
 import logging
+import math
 import os
 import queue
 import threading
 import time
-from collections import defaultdict, deque
+from collections import deque
 from datetime import datetime
 from typing import Any, Dict, List, Optional
 
 import uvicorn
-from fastapi import Depends, FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import Depends, FastAPI, Header, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
@@ -30,6 +32,11 @@ from quantization import (
     QuantizedInference,
 )
 from utils.logging import get_logger
+import repo_src  # noqa: F401  (puts the repository root on sys.path)
+from src.fair_scheduler import FairScheduler, parse_priority
+from src.rate_limiter import RateLimiter
+from src.serving_metrics import count_tokens
+from ws_framing import PROTOCOL as FRAMES_PROTOCOL, serve_websocket
 
 # Configure logging
 LOG_DIR = os.environ.get("LLAMA_GPU_LOG_DIR", "logs")
@@ -46,8 +53,9 @@ app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], all
 # Security
 security = HTTPBearer()
 API_KEYS = {os.environ.get("LLAMA_GPU_API_KEY", "test-key")}
-RATE_LIMIT = 60  # requests per minute
-rate_limit_counter = defaultdict(lambda: {"count": 0, "reset_time": time.time()})
+RATE_LIMIT = 60  # requests per minute, unless RATE_LIMIT_RPM/RATE_LIMIT_TPM are set
+# Token buckets, shared across workers when RATE_LIMIT_DB is set
+rate_limiter = RateLimiter.from_env() or RateLimiter(requests_per_minute=RATE_LIMIT)
 
 def verify_api_key(credentials: HTTPAuthorizationCredentials = Depends(security)):
     if credentials.credentials not in API_KEYS:
@@ -55,15 +63,19 @@ def verify_api_key(credentials: HTTPAuthorizationCredentials = Depends(security)
         raise HTTPException(status_code=401, detail="Invalid API key")
     return credentials.credentials
 
+def api_key_id(api_key: str) -> str:
+    """Stable, non-secret identifier for an API key."""
+    return "key-" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
 def check_rate_limit(api_key: str):
-    now = time.time()
-    if now - rate_limit_counter[api_key]["reset_time"] >= 60:
-        rate_limit_counter[api_key] = {"count": 0, "reset_time": now}
-    
-    rate_limit_counter[api_key]["count"] += 1
-    if rate_limit_counter[api_key]["count"] > RATE_LIMIT:
+    decision = rate_limiter.check(api_key_id(api_key))
+    if not decision.allowed:
         error_logger.warning(f"Rate limit exceeded for API key: {api_key}")
-        raise HTTPException(status_code=429, detail="Rate limit exceeded")
+        raise HTTPException(
+            status_code=429,
+            detail="Rate limit exceeded",
+            headers={"Retry-After": str(max(1, math.ceil(decision.retry_after)))},
+        )
 
 # Model manager
 model_manager = ModelManager()
@@ -87,9 +99,10 @@ quantization_config = QuantizationConfig(
 quantization_manager = QuantizationManager(quantization_config)
 quantization_cache = QuantizationCache()
 
-# Request queues and batching
-completion_queue = queue.Queue()
-chat_queue = queue.Queue()
+# Request queues and batching: batches are filled by priority class
+# (X-Priority) and fair share across API keys rather than arrival order
+completion_queue = FairScheduler.from_env()
+chat_queue = FairScheduler.from_env()
 batch_workers = {}
 batch_stats = {
     "total_batches": 0,
@@ -150,28 +163,58 @@ def log_api_request(endpoint: str, request_data: dict, response_data: dict, stat
 def log_batch_event(event_type: str, batch_id: str, details: dict):
     batch_logger.info(f"BATCH {event_type}: {batch_id} - {details}")
 
-async def batch_worker(queue_name: str, queue_obj: queue.Queue):
+def request_priority(x_priority: Optional[str]) -> str:
+    """Priority class from the ``X-Priority`` header (default interactive)."""
+    try:
+        return parse_priority(x_priority)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def enqueue(queue_obj: FairScheduler, api_key: str, priority: str,
+            prompt: str, request: dict) -> asyncio.Future:
+    """Queue a request for the batch workers, charged to the caller's key."""
+    future = asyncio.get_running_loop().create_future()
+    queue_obj.put(
+        {**request, "prompt": prompt, "future": future},
+        api_key_id(api_key),
+        priority,
+        cost=count_tokens(prompt) + request["max_tokens"],
+    )
+    return future
+
+def resolve(future: asyncio.Future, result: Any = None, error: Optional[Exception] = None):
+    """Complete a request's future from a worker thread."""
+    def settle():
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+    future.get_loop().call_soon_threadsafe(settle)
+
+async def batch_worker(queue_name: str, queue_obj: FairScheduler):
     """Background worker for processing batched requests"""
     worker_id = f"{queue_name}_worker_{threading.current_thread().ident}"
     batch_logger.info(f"Starting batch worker: {worker_id}")
     
     while True:
         try:
-            # Collect requests for batching
-            batch_requests = []
+            # Collect requests for batching; each claim holds an in-flight
+            # slot for its API key until the batch is done
+            claims = []
             batch_start_time = time.time()
             
             # Wait for first request
-            first_request = queue_obj.get(timeout=1)
-            batch_requests.append(first_request)
+            claims.append(queue_obj.claim(timeout=1))
             
             # Collect additional requests for 100ms
             try:
-                while time.time() - batch_start_time < 0.1 and len(batch_requests) < 10:
-                    request = queue_obj.get_nowait()
-                    batch_requests.append(request)
+                while time.time() - batch_start_time < 0.1 and len(claims) < 10:
+                    claims.append(queue_obj.claim(block=False))
             except queue.Empty:
                 pass
+            batch_requests = [claim.item for claim in claims]
             
             batch_id = f"{queue_name}_{int(time.time() * 1000)}"
             batch_size = len(batch_requests)
@@ -184,6 +227,8 @@ async def batch_worker(queue_name: str, queue_obj: queue.Queue):
             
             # Process batch
             batch_start = time.time()
+            # Tokens each request really used, settling its key's charge
+            used = {}
             try:
                 # Load model if needed
                 model_name = batch_requests[0].get("model_name")
@@ -199,6 +244,7 @@ async def batch_worker(queue_name: str, queue_obj: queue.Queue):
                         result = model.generate(req["prompt"], req["max_tokens"])
                     else:  # chat
                         result = model.chat(req["messages"], req["max_tokens"])
+                    used[len(results)] = count_tokens(req["prompt"]) + count_tokens(str(result))
                     results.append(result)
                 
                 batch_time = time.time() - batch_start
@@ -221,7 +267,7 @@ async def batch_worker(queue_name: str, queue_obj: queue.Queue):
                 
                 # Return results to callers
                 for req, result in zip(batch_requests, results):
-                    req["future"].set_result(result)
+                    resolve(req["future"], result)
                     
             except Exception as e:
                 error_logger.error(f"Batch processing error in {batch_id}: {str(e)}")
@@ -231,7 +277,10 @@ async def batch_worker(queue_name: str, queue_obj: queue.Queue):
                 })
                 # Return error to all callers
                 for req in batch_requests:
-                    req["future"].set_exception(e)
+                    resolve(req["future"], error=e)
+            finally:
+                for index, claim in enumerate(claims):
+                    queue_obj.complete(claim, used=used.get(index))
                     
         except queue.Empty:
             continue
@@ -243,7 +292,7 @@ async def batch_worker(queue_name: str, queue_obj: queue.Queue):
 def start_batch_workers():
     for queue_name, queue_obj in [("completion", completion_queue), ("chat", chat_queue)]:
         worker_thread = threading.Thread(
-            target=lambda: asyncio.run(batch_worker(queue_name, queue_obj)),
+            target=lambda name=queue_name, queue_obj=queue_obj: asyncio.run(batch_worker(name, queue_obj)),
             daemon=True
         )
         worker_thread.start()
@@ -254,8 +303,10 @@ async def startup_event():
     start_batch_workers()
 
 @app.post("/v1/completions")
-async def completions(request: CompletionRequest, api_key: str = Depends(verify_api_key)):
+async def completions(request: CompletionRequest, api_key: str = Depends(verify_api_key),
+                      x_priority: Optional[str] = Header(None)):
     check_rate_limit(api_key)
+    priority = request_priority(x_priority)
     
     try:
         if request.stream:
@@ -266,12 +317,9 @@ async def completions(request: CompletionRequest, api_key: str = Depends(verify_
             )
         else:
             # Batch processing
-            future = asyncio.Future()
-            completion_queue.put({
-                "prompt": request.prompt,
+            future = enqueue(completion_queue, api_key, priority, request.prompt, {
                 "max_tokens": request.max_tokens,
                 "model_name": request.model_name,
-                "future": future
             })
             
             result = await future
@@ -289,8 +337,10 @@ async def completions(request: CompletionRequest, api_key: str = Depends(verify_
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/v1/chat/completions")
-async def chat_completions(request: ChatRequest, api_key: str = Depends(verify_api_key)):
+async def chat_completions(request: ChatRequest, api_key: str = Depends(verify_api_key),
+                           x_priority: Optional[str] = Header(None)):
     check_rate_limit(api_key)
+    priority = request_priority(x_priority)
     
     try:
         if request.stream:
@@ -301,12 +351,11 @@ async def chat_completions(request: ChatRequest, api_key: str = Depends(verify_a
             )
         else:
             # Batch processing
-            future = asyncio.Future()
-            chat_queue.put({
+            prompt = " ".join(m.get("content", "") for m in request.messages)
+            future = enqueue(chat_queue, api_key, priority, prompt, {
                 "messages": request.messages,
                 "max_tokens": request.max_tokens,
                 "model_name": request.model_name,
-                "future": future
             })
             
             result = await future
@@ -557,10 +606,23 @@ async def monitor_workers(api_key: str = Depends(verify_api_key)):
     log_api_request("/v1/monitor/workers", {}, response_data, 200)
     return response_data
 
+def framed_stream(request: Dict[str, Any]):
+    model_name = request.get("model_name")
+    if model_name:
+        model = model_manager.load_model(model_name)
+    else:
+        model = model_manager.get_default_model()
+    return model.generate_stream(request.get("prompt", ""), request.get("max_tokens", 50))
+
 @app.websocket("/v1/stream")
 async def websocket_stream(websocket: WebSocket):
     await websocket.accept()
     
+    if websocket.query_params.get("protocol") == FRAMES_PROTOCOL:
+        # Coalesced, multiplexed token frames; blocking generate_stream runs in a thread
+        await serve_websocket(websocket, framed_stream, websocket.query_params.get("encoding", "json"))
+        return
+    
     try:
         while True:
             data = await websocket.receive_text()
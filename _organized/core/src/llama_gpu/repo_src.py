@@ -0,0 +1,15 @@
+"""Access to the maintained modules under the repository's ``src/``.
+
+This tree imports its modules flat (``from quantization import ...``).
+Modules it shares with the main API server exist once, in ``src/``;
+importing this module puts the repository root on ``sys.path`` so they
+import as ``src.<module>`` and cannot drift apart.
+"""
+
+import os
+import sys
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..", ".."))
+
+if REPO_ROOT not in sys.path:
+    sys.path.append(REPO_ROOT)
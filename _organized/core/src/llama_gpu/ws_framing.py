@@ -0,0 +1,16 @@
+"""Coalesced, multiplexed token framing for WebSocket streams.
+
+The protocol is implemented once in ``src/ws_framing.py`` and shared with
+the main API server; see that module for the message formats.
+"""
+
+import repo_src  # noqa: F401  (puts the repository root on sys.path)
+from src.ws_framing import (  # noqa: F401
+    DEFAULT_MAX_BUFFERED,
+    DEFAULT_MAX_TOKENS,
+    DEFAULT_WINDOW_MS,
+    PROTOCOL,
+    FrameCodec,
+    FramedSession,
+    serve_websocket,
+)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Quantization quality-vs-speed benchmark for Llama-GPU.
+
+Examples:
+    # Tiny random-weight LLaMA (what CI runs)
+    python scripts/benchmark_quantization.py --tiny
+
+    # A real checkpoint, selected types only
+    python scripts/benchmark_quantization.py --model-path models/llama-7b \\
+        --types int8 int4 fp16 --batch-sizes 1 4 8
+"""
+
+import argparse
+import os
+import sys
+
+# Add repo root and src to path for imports
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from src.quantization import QuantizationType
+from src.quantization_benchmark import (
+    DEFAULT_TYPES,
+    QuantizationBenchmark,
+    build_byte_tokenizer,
+    build_tiny_llama,
+    format_table,
+    write_report,
+)
+
+
+def main():
+    """Main benchmark function."""
+    parser = argparse.ArgumentParser(description="Benchmark quantization quality vs speed")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--model-path", help="Hugging Face checkpoint directory")
+    source.add_argument("--tiny", action="store_true", help="Use a tiny random-weight LLaMA")
+    # MIXED is left out: it needs a per-layer plan this script cannot take
+    parser.add_argument("--types", nargs="+", default=[t.value for t in DEFAULT_TYPES],
+                        choices=[t.value for t in DEFAULT_TYPES],
+                        help="Quantization types to benchmark")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 4],
+                        help="Batch sizes for the throughput measurement")
+    parser.add_argument("--max-new-tokens", type=int, default=16, help="Tokens generated per prompt")
+    parser.add_argument("--output-dir", default="benchmarks", help="Output directory for results")
+    parser.add_argument("--name", default="quantization_benchmark", help="Report file name stem")
+
+    args = parser.parse_args()
+
+    if args.tiny:
+        tokenizer = build_byte_tokenizer()
+        model_factory = lambda: build_tiny_llama(tokenizer)
+        model_name = "tiny-random-llama"
+    else:
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(args.model_path)
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        model_factory = lambda: AutoModelForCausalLM.from_pretrained(args.model_path)
+        model_name = os.path.basename(os.path.normpath(args.model_path))
+
+    benchmark = QuantizationBenchmark(
+        model_factory,
+        tokenizer,
+        quantization_types=[QuantizationType(t) for t in args.types],
+        batch_sizes=args.batch_sizes,
+        max_new_tokens=args.max_new_tokens,
+        model_name=model_name,
+    )
+    report = benchmark.run()
+    json_path, table_path = write_report(report, args.output_dir, args.name)
+
+    print(format_table(report))
+    print(f"Results saved to {json_path} and {table_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,41 @@
 """
 Advanced Caching Module
 Provides model and inference result caching interfaces.
+
+:class:`ResponseCache` is the exact-match response cache used by the API
+servers: an in-memory LRU capped in bytes with TTL expiry, optionally
+backed by a SQLite file that several worker processes can share.
 """
 
-from typing import Any, Dict, Optional
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
 
 _model_cache = {}
 _inference_cache = {}
 
+_log: Optional[logging.Logger] = None
+
+
+def _cache_log() -> logging.Logger:
+    """File logger for logs/advanced_cache.log, opened once."""
+    global _log
+    if _log is None:
+        _log = logging.getLogger("advanced_cache.file")
+        _log.setLevel(logging.INFO)
+        _log.propagate = False
+        os.makedirs('logs', exist_ok=True)
+        handler = logging.FileHandler('logs/advanced_cache.log', encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        _log.addHandler(handler)
+    return _log
+
 
 def cache_model(model: Any, config: Dict) -> Optional[Any]:
     """
@@ -16,8 +44,7 @@ def cache_model(model: Any, config: Dict) -> Optional[Any]:
     """
     key = str(config)
     _model_cache[key] = model
-    with open('logs/advanced_cache.log', 'a', encoding='utf-8') as log:
-        log.write(f"Model cached with key={key}\n")
+    _cache_log().info(f"Model cached with key={key}")
     return model
 
 
@@ -28,6 +55,237 @@ def cache_inference_result(result: Any, config: Dict) -> Optional[Any]:
     """
     key = str(config)
     _inference_cache[key] = result
-    with open('logs/advanced_cache.log', 'a', encoding='utf-8') as log:
-        log.write(f"Inference result cached with key={key}\n")
+    _cache_log().info(f"Inference result cached with key={key}")
     return result
+
+
+def cache_policy(cache_control: Optional[str]) -> Tuple[bool, bool]:
+    """
+    Map a request ``Cache-Control`` header to (read, write).
+
+    ``no-cache`` skips the lookup but stores the fresh response;
+    ``no-store`` neither reads nor writes.
+    """
+    directives = {d.strip().lower() for d in (cache_control or "").split(",")}
+    if "no-store" in directives:
+        return False, False
+    if "no-cache" in directives:
+        return False, True
+    return True, True
+
+
+def _reconnect(tier: "weakref.ref[SQLiteCacheTier]") -> None:
+    instance = tier()
+    if instance is not None:
+        instance._connect()
+
+
+class SQLiteCacheTier:
+    """
+    Disk tier for :class:`ResponseCache` stored in a SQLite file.
+
+    WAL mode lets several processes read and write the same file, so
+    workers behind one port share cached responses. A SQLite connection
+    must not be used across ``fork()``, so forked workers reopen it.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 512 * 1024 * 1024):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self._connect()
+        if hasattr(os, "register_at_fork"):
+            tier = weakref.ref(self)
+            os.register_at_fork(after_in_child=lambda: _reconnect(tier))
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed_at)"
+            )
+
+    def _connect(self) -> None:
+        # The lock may have been held by another thread at fork time
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        """Return (serialized value, expires_at), or None if absent or expired."""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self._conn.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+        return row[0], row[1]
+
+    def set(self, key: str, value: str, expires_at: float) -> int:
+        """Store a serialized value; returns the number of rows evicted."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), expires_at, now),
+            )
+            evicted = self._conn.execute(
+                "DELETE FROM responses WHERE expires_at <= ?", (now,)
+            ).rowcount
+            total = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()[0]
+            while total > self.max_bytes:
+                row = self._conn.execute(
+                    "SELECT key, size FROM responses ORDER BY accessed_at LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    break
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (row[0],))
+                total -= row[1]
+                evicted += 1
+        return evicted
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class ResponseCache:
+    """
+    Exact-match cache for generated responses.
+
+    Values must be JSON-serializable; they are stored serialized, so the
+    byte budget is exact and callers always get a private copy.
+
+    Args:
+        max_bytes: Memory budget for serialized values
+        ttl: Default time to live in seconds
+        disk_path: Optional SQLite file for the shared disk tier
+        disk_max_bytes: Budget for the disk tier
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: float = 300.0,
+        disk_path: Optional[str] = None,
+        disk_max_bytes: int = 512 * 1024 * 1024,
+    ):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk = SQLiteCacheTier(disk_path, disk_max_bytes) if disk_path else None
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {
+            "hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "expirations": 0,
+        }
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache":
+        """Build from ``RESPONSE_CACHE_MAX_BYTES``, ``RESPONSE_CACHE_TTL``
+        and ``RESPONSE_CACHE_DB``."""
+        return cls(
+            max_bytes=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+            ttl=float(os.getenv("RESPONSE_CACHE_TTL", "300")),
+            disk_path=os.getenv("RESPONSE_CACHE_DB") or None,
+        )
+
+    def get(self, key: Optional[str]) -> Optional[Any]:
+        """Cached value for ``key``, or None on a miss."""
+        if key is None:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(key)
+                    self._counters["hits"] += 1
+                    return json.loads(entry[0])
+                self._remove(key)
+                self._counters["expirations"] += 1
+        if self.disk is not None:
+            row = self.disk.get(key)
+            if row is not None:
+                with self._lock:
+                    self._counters["disk_hits"] += 1
+                    self._insert(key, row[0], row[1])
+                return json.loads(row[0])
+        with self._lock:
+            self._counters["misses"] += 1
+        return None
+
+    def set(self, key: Optional[str], value: Any, ttl: Optional[float] = None) -> None:
+        """Store ``value``; values larger than the whole budget are skipped."""
+        if key is None:
+            return
+        serialized = json.dumps(value, separators=(",", ":"))
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._counters["stores"] += 1
+            self._insert(key, serialized, expires_at)
+        if self.disk is not None:
+            evicted = self.disk.set(key, serialized, expires_at)
+            if evicted:
+                with self._lock:
+                    self._counters["evictions"] += evicted
+
+    def _insert(self, key: str, serialized: str, expires_at: float) -> None:
+        if key in self._entries:
+            self._remove(key)
+        size = len(serialized)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (serialized, expires_at)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self._counters["evictions"] += 1
+
+    def _remove(self, key: str) -> None:
+        serialized, _ = self._entries.pop(key)
+        self._bytes -= len(serialized)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss/eviction counters and memory usage."""
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["disk_hits"] + self._counters["misses"]
+            hits = self._counters["hits"] + self._counters["disk_hits"]
+            return {
+                **self._counters,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "disk": self.disk.path if self.disk is not None else None,
+            }
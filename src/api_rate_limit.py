@@ -4,28 +4,28 @@ Implements rate limiting and request validation for API endpoints.
 """
 
 import logging
+import math
 from flask import Flask, request, jsonify
 from functools import wraps
-import time
+
+from src.rate_limiter import RateLimiter
 
 logging.basicConfig(filename='logs/api_rate_limit.log', level=logging.INFO)
 app = Flask(__name__)
 
 RATE_LIMIT = 5  # requests per minute
-user_access = {}
+# O(1) token bucket per client; idle clients are evicted
+limiter = RateLimiter(requests_per_minute=RATE_LIMIT)
 
 def rate_limited(f):
     @wraps(f)
     def decorated(*args, **kwargs):
         user = request.remote_addr
-        now = time.time()
-        access = user_access.get(user, [])
-        access = [t for t in access if now - t < 60]
-        if len(access) >= RATE_LIMIT:
+        decision = limiter.check(f'ip-{user}')
+        if not decision.allowed:
             logging.warning('Rate limit exceeded for user: %s', user)
-            return jsonify({'error': 'rate limit exceeded'}), 429
-        access.append(now)
-        user_access[user] = access
+            response = jsonify({'error': 'rate limit exceeded'})
+            return response, 429, {'Retry-After': str(max(1, math.ceil(decision.retry_after)))}
         return f(*args, **kwargs)
     return decorated
 
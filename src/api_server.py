@@ -3,15 +3,51 @@
 Stable baseline that works on CPU and powers the React GUI for demos/tests.
 """
 
+import asyncio
+import math
 import os
 import time
-from typing import Dict, List, Optional
-
-from fastapi import FastAPI, Header, HTTPException, WebSocket, WebSocketDisconnect
+from concurrent.futures import Future
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple, Union
+
+from fastapi import (
+    FastAPI,
+    Header,
+    HTTPException,
+    Request,
+    Response,
+    WebSocket,
+    WebSocketDisconnect,
+)
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from pydantic import BaseModel
 
+from src.advanced_cache import ResponseCache, cache_policy
+from src.batch_jobs import BatchJobStore, BatchRunner, progress
+from src.core.exceptions import OverloadedError
+from src.fair_scheduler import (
+    BATCH,
+    INTERACTIVE,
+    FairScheduler,
+    Ticket,
+    parse_priority,
+)
+from src.inference_executor import InferenceExecutor
 from src.llama_gpu import LlamaGPU
+from src.model_registry import ModelHandle, ModelRegistry
+from src.rate_limiter import RateLimiter, RateLimitMiddleware
+from src.request_coalescing import SingleFlight, coalescing_key
+from src.semantic_cache import (
+    DEFAULT_TENANT,
+    SemanticCache,
+    SemanticHit,
+    SemanticLookup,
+    tenant_for,
+)
+from src.serving_metrics import CONTENT_TYPE_LATEST, ServingMetrics, count_tokens
+from src.streaming import SSE_HEADERS, sse_stream
+from src.ws_framing import PROTOCOL as FRAMES_PROTOCOL, serve_websocket
 
 HOST = os.getenv("HOST", "0.0.0.0")
 PORT = int(os.getenv("PORT", "8000"))
@@ -35,8 +71,145 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# None unless RATE_LIMIT_RPM or RATE_LIMIT_TPM is set
+rate_limiter = RateLimiter.from_env()
+if rate_limiter is not None:
+    app.add_middleware(RateLimitMiddleware, limiter=rate_limiter)
+
+BACKEND = "llama-gpu"
+DEFAULT_MODEL = "llama-base"
+WARMUP_PROMPT = "Hello"
+
+
+def load_engine(path: str) -> LlamaGPU:
+    return LlamaGPU(model_path=path, prefer_gpu=True)
+
+
+def warm_up(candidate: LlamaGPU) -> None:
+    """One short generation, so the first real request skips lazy setup."""
+    candidate.infer(WARMUP_PROMPT)
+
 
 engine = LlamaGPU(model_path=None, prefer_gpu=True)
+# Resident models; /v1/models/load swaps in new ones without downtime
+model_registry = ModelRegistry.from_env(load_engine, warmup=warm_up)
+model_registry.register(DEFAULT_MODEL, engine)
+serving_metrics = ServingMetrics()
+serving_metrics.watch_memory(BACKEND, DEFAULT_MODEL)
+# Executor slots go to interactive before batch work, fairly across keys
+scheduler = FairScheduler.from_env(registry=serving_metrics.registry)
+executor = InferenceExecutor.from_env(scheduler=scheduler)
+singleflight = SingleFlight()
+response_cache = ResponseCache.from_env()
+# None unless SEMANTIC_CACHE_ENABLED=true
+semantic_cache = SemanticCache.from_env()
+background_tasks: Set[asyncio.Task] = set()
+# Scheduler keys for work no client is waiting on
+BATCH_KEY = "batches"
+AUDIT_KEY = "semantic-audits"
+
+
+def tokenizer_of(model: ModelHandle) -> Optional[object]:
+    """Tokenizer of a leased model; token counts fall back to words without one.
+
+    Read per lease, never cached: ``/v1/models/load`` may have swapped in
+    a model with a different vocabulary.
+    """
+    return getattr(model.engine, "tokenizer", None)
+
+
+def priced(
+    ticket: Ticket,
+    prompt: str,
+    max_tokens: int,
+    model: ModelHandle,
+    streamed: bool = False,
+) -> Ticket:
+    """Charge ``ticket`` its prompt plus the most tokens it may generate.
+
+    The scheduler settles the charge to the tokens actually generated:
+    counted from the text, or for streams the number of tokens yielded.
+    """
+    tokenizer = tokenizer_of(model)
+    prompt_tokens = count_tokens(prompt, tokenizer)
+
+    def usage(result: object) -> int:
+        if streamed:
+            return prompt_tokens + int(result)
+        return prompt_tokens + count_tokens(str(result), tokenizer)
+
+    return ticket._replace(cost=prompt_tokens + max_tokens, usage=usage)
+
+
+def tokens_for(text: str, model: Optional[str] = None) -> int:
+    """Count ``text`` with the tokenizer of ``model`` (default: active)."""
+    with model_registry.lease(model) as handle:
+        return count_tokens(text, tokenizer_of(handle))
+
+
+async def run_batch(prompts: List[str], params: Dict[str, object]) -> List[str]:
+    """One offline batch through ``batch_infer`` on the executor."""
+    max_tokens = int(params.get("max_tokens", 128))
+    temperature = float(params.get("temperature", 0.7))
+    with model_registry.lease(params.get("model")) as model:
+        tokenizer = tokenizer_of(model)
+        prompt_tokens = sum(count_tokens(p, tokenizer) for p in prompts)
+
+        def usage(texts: List[Optional[str]]) -> int:
+            return prompt_tokens + sum(count_tokens(t, tokenizer) for t in texts if t)
+
+        serving_metrics.observe_batch(BACKEND, model.name, len(prompts))
+        # No deadline: offline work may wait as long as it needs
+        return await executor.run(
+            model.engine.batch_infer,
+            prompts,
+            len(prompts),
+            timeout=math.inf,
+            ticket=Ticket(
+                BATCH_KEY,
+                BATCH,
+                prompt_tokens + max_tokens * len(prompts),
+                usage,
+            ),
+            max_tokens=max_tokens,
+            temperature=temperature,
+        )
+
+
+def interactive_busy() -> bool:
+    """True while online requests are queued or hold every executor slot."""
+    stats = executor.stats()
+    return (
+        stats["queue_depth"] > 0
+        or stats["active"] >= stats["max_concurrency"]
+    )
+
+
+batch_runner = BatchRunner.from_env(
+    BatchJobStore.from_env(),
+    run_batch,
+    count_tokens=tokens_for,
+    is_busy=interactive_busy,
+)
+
+
+@app.on_event("startup")
+async def start_batch_runner() -> None:
+    # Resumes jobs interrupted by a restart
+    task = asyncio.ensure_future(batch_runner.run())
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+
+@app.exception_handler(OverloadedError)
+async def overloaded_handler(
+    request: Request, exc: OverloadedError
+) -> JSONResponse:
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(int(exc.retry_after))},
+    )
 
 
 def guard_api_key(authorization: Optional[str]) -> None:
@@ -54,6 +227,7 @@ class CompletionRequest(BaseModel):
     prompt: str
     max_tokens: int = 128
     temperature: float = 0.7
+    stream: bool = False
 
 
 class ChatMessage(BaseModel):
@@ -66,6 +240,7 @@ class ChatRequest(BaseModel):
     messages: List[ChatMessage]
     max_tokens: int = 128
     temperature: float = 0.7
+    stream: bool = False
 
 
 @app.get("/healthz")
@@ -80,23 +255,412 @@ def livez() -> Dict[str, str]:
 
 @app.get("/v1/models")
 def list_models() -> Dict[str, List[Dict[str, str]]]:
-    return {"data": [{"id": "llama-base", "object": "model"}]}
+    return {
+        "data": [
+            {"id": name, "object": "model"} for name in model_registry.names()
+        ]
+    }
+
+
+@app.get("/v1/scheduler/stats")
+def scheduler_stats() -> Dict[str, object]:
+    """Waiting work per priority class and key, and queue waits."""
+    return scheduler.stats()
+
+
+@app.get("/v1/executor/stats")
+def executor_stats() -> Dict[str, object]:
+    return {**executor.stats(), "coalescing": singleflight.stats()}
+
 
+@app.get("/v1/cache/stats")
+def cache_stats() -> Dict[str, object]:
+    stats: Dict[str, object] = {**response_cache.stats()}
+    if semantic_cache is not None:
+        stats["semantic"] = semantic_cache.stats()
+    return stats
 
-@app.post("/v1/models/load")
-def load_model(path: str, name: Optional[str] = None) -> Dict[str, str]:
-    # Stub: accept and respond OK
-    return {"status": "loaded", "name": name or "llama-base", "path": path}
 
+@app.get("/metrics")
+def metrics() -> Response:
+    return Response(serving_metrics.render(), media_type=CONTENT_TYPE_LATEST)
 
-@app.post("/v1/completions")
-def completions(
-    req: CompletionRequest, authorization: Optional[str] = Header(None)
+
+@app.post("/v1/models/load", status_code=202)
+def load_model(
+    path: str,
+    name: Optional[str] = None,
+    activate: bool = True,
+    keep_previous: bool = False,
+    warmup: bool = True,
+    authorization: Optional[str] = Header(None),
+) -> Dict[str, object]:
+    """Load a model in the background; poll ``/v1/models/registry``.
+
+    Requests keep being served by the current model. With ``activate``
+    the new model becomes the default once loaded (and warmed up), and
+    the previous one is freed after its in-flight requests finish.
+    """
+    guard_api_key(authorization)
+    name = name or DEFAULT_MODEL
+    try:
+        future = model_registry.load(
+            name, path, activate=activate, keep_previous=keep_previous, warmup=warmup
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    future.add_done_callback(clear_cache_after_swap)
+    return model_registry.status(name)
+
+
+def clear_cache_after_swap(future: "Future[object]") -> None:
+    # Cached answers were generated by the weights that were replaced
+    if not future.cancelled() and future.exception() is None:
+        response_cache.clear()
+
+
+@app.get("/v1/models/registry")
+def model_registry_stats(
+    authorization: Optional[str] = Header(None),
+) -> Dict[str, object]:
+    """Resident, loading, draining and failed models and memory use."""
+    guard_api_key(authorization)
+    return model_registry.stats()
+
+
+@app.post("/v1/batches")
+async def create_batch(
+    request: Request, authorization: Optional[str] = Header(None)
 ) -> Dict[str, object]:
+    """Queue a JSONL file of completion/chat requests (the request body)."""
     guard_api_key(authorization)
-    text = engine.infer(
-        req.prompt, max_tokens=req.max_tokens, temperature=req.temperature
+    try:
+        job = await batch_runner.submit(await request.body())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return progress(job)
+
+
+@app.get("/v1/batches")
+def list_batches(
+    authorization: Optional[str] = Header(None),
+) -> Dict[str, List[Dict[str, object]]]:
+    guard_api_key(authorization)
+    return {"data": [progress(job) for job in batch_runner.store.list()]}
+
+
+def get_job(job_id: str) -> Dict[str, object]:
+    try:
+        return batch_runner.store.get(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+
+@app.get("/v1/batches/{job_id}")
+def get_batch(
+    job_id: str, authorization: Optional[str] = Header(None)
+) -> Dict[str, object]:
+    """Status, request counts, token usage and tokens/sec of a batch."""
+    guard_api_key(authorization)
+    return progress(get_job(job_id))
+
+
+@app.get("/v1/batches/{job_id}/output")
+def get_batch_output(
+    job_id: str, authorization: Optional[str] = Header(None)
+) -> FileResponse:
+    """Results so far, one JSON object per line, in completion order."""
+    guard_api_key(authorization)
+    get_job(job_id)
+    path = batch_runner.store.output_path(job_id)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="No results yet")
+    return FileResponse(path, media_type="application/jsonl")
+
+
+@app.post("/v1/batches/{job_id}/cancel")
+def cancel_batch(
+    job_id: str, authorization: Optional[str] = Header(None)
+) -> Dict[str, object]:
+    guard_api_key(authorization)
+    get_job(job_id)
+    return progress(batch_runner.cancel(job_id))
+
+
+def request_key(
+    prompt: str, req: BaseModel, x_coalesce: Optional[str]
+) -> Optional[str]:
+    return coalescing_key(
+        req.temperature,
+        x_coalesce,
+        model=req.model,
+        prompt=prompt,
+        max_tokens=req.max_tokens,
+    )
+
+
+def cached_text(
+    prompt: str, req: BaseModel, cache_control: Optional[str]
+) -> Tuple[Optional[str], Optional[str], bool]:
+    """Return (cache key, cached text, store allowed).
+
+    Only greedy requests are cached, so the key is the coalescing key
+    without the opt-in header.
+    """
+    cache_key = request_key(prompt, req, None)
+    read, write = cache_policy(cache_control)
+    cached = response_cache.get(cache_key) if read else None
+    text = cached["text"] if cached is not None else None
+    return cache_key, text, write
+
+
+def semantic_params(req: BaseModel) -> Dict[str, object]:
+    return {
+        "model": req.model,
+        "max_tokens": req.max_tokens,
+        "temperature": req.temperature,
+    }
+
+
+async def semantic_lookup(
+    prompt: str, req: BaseModel, tenant: str, cache_control: Optional[str]
+) -> Optional[SemanticLookup]:
+    """Look up a paraphrased prompt; schedules an audit for sampled hits."""
+    if semantic_cache is None or not cache_policy(cache_control)[0]:
+        return None
+    lookup = await asyncio.to_thread(
+        semantic_cache.lookup, tenant, prompt, semantic_params(req)
+    )
+    if lookup.hit is not None and semantic_cache.should_audit():
+        task = asyncio.ensure_future(audit_semantic_hit(lookup.hit, prompt, req))
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+    return lookup
+
+
+async def semantic_store(
+    prompt: str,
+    req: BaseModel,
+    tenant: str,
+    text: str,
+    lookup: Optional[SemanticLookup],
+) -> None:
+    if semantic_cache is None:
+        return
+    embedding = lookup.embedding if lookup is not None else None
+    await asyncio.to_thread(
+        semantic_cache.store,
+        tenant,
+        prompt,
+        semantic_params(req),
+        {"text": text},
+        embedding,
+    )
+
+
+async def tracked_infer(prompt: str, req: BaseModel, ticket: Ticket) -> str:
+    """Run ``infer`` on the executor, recording serving metrics.
+
+    The model is leased for the whole call, so a swap cannot free it.
+    """
+    with model_registry.lease(req.model) as model:
+        tokenizer = tokenizer_of(model)
+        tracker = serving_metrics.track(BACKEND, model.name)
+        try:
+            text = await executor.run(
+                tracker.timed(model.engine.infer),
+                prompt,
+                max_tokens=req.max_tokens,
+                temperature=req.temperature,
+                ticket=priced(ticket, prompt, req.max_tokens, model),
+            )
+        except OverloadedError:
+            tracker.finish(status="rejected")
+            raise
+        except BaseException:
+            tracker.finish(status="error")
+            raise
+        tracker.finish(
+            count_tokens(prompt, tokenizer), count_tokens(text, tokenizer)
+        )
+    return text
+
+
+def tracked_stream(
+    prompt: str,
+    model: Optional[str],
+    ticket: Ticket,
+    max_tokens: int = 128,
+    **kwargs: object,
+) -> AsyncIterator[str]:
+    """Stream ``stream_infer`` on the executor, recording metrics.
+
+    Like :meth:`InferenceExecutor.stream`, admission errors are raised
+    here; call from a coroutine. The model stays leased until the stream
+    ends.
+    """
+    handle = model_registry.acquire(model)
+    tokenizer = tokenizer_of(handle)
+    tracker = serving_metrics.track(BACKEND, handle.name)
+    try:
+        tokens = executor.stream(
+            tracker.timed(handle.engine.stream_infer),
+            prompt,
+            ticket=priced(ticket, prompt, max_tokens, handle, streamed=True),
+            max_tokens=max_tokens,
+            **kwargs,
+        )
+    except OverloadedError:
+        tracker.finish(status="rejected")
+        model_registry.release(handle)
+        raise
+    return model_registry.hold(
+        handle, tracker.stream(tokens, count_tokens(prompt, tokenizer))
+    )
+
+
+async def audit_semantic_hit(
+    hit: SemanticHit, prompt: str, req: BaseModel
+) -> None:
+    try:
+        fresh = await tracked_infer(prompt, req, Ticket(AUDIT_KEY, BATCH))
+    except OverloadedError:
+        return  # audits never compete with live traffic
+    await asyncio.to_thread(
+        semantic_cache.audit, hit, fresh, hit.response["text"]
     )
+
+
+async def generate_text(
+    prompt: str,
+    req: BaseModel,
+    x_coalesce: Optional[str],
+    cache_control: Optional[str],
+    tenant: str,
+    ticket: Ticket,
+    response: Response,
+) -> str:
+    cache_key, text, write = cached_text(prompt, req, cache_control)
+    if text is not None:
+        response.headers["X-Cache"] = "HIT"
+        return text
+    lookup = await semantic_lookup(prompt, req, tenant, cache_control)
+    if lookup is not None and lookup.hit is not None:
+        response.headers["X-Cache"] = "SEMANTIC-HIT"
+        return lookup.hit.response["text"]
+    text = await singleflight.run(
+        request_key(prompt, req, x_coalesce),
+        lambda: tracked_infer(prompt, req, ticket),
+    )
+    if write:
+        response_cache.set(cache_key, {"text": text})
+        await semantic_store(prompt, req, tenant, text, lookup)
+    response.headers["X-Cache"] = "MISS" if cache_key else "BYPASS"
+    return text
+
+
+async def stream_response(
+    request: Request,
+    prompt: str,
+    kind: str,
+    req: BaseModel,
+    x_coalesce: Optional[str],
+    cache_control: Optional[str],
+    tenant: str,
+    ticket: Ticket,
+) -> StreamingResponse:
+    cache_key, text, _ = cached_text(prompt, req, cache_control)
+    status = "HIT"
+    if text is None:
+        lookup = await semantic_lookup(prompt, req, tenant, cache_control)
+        if lookup is not None and lookup.hit is not None:
+            text = lookup.hit.response["text"]
+            status = "SEMANTIC-HIT"
+    if text is not None:
+        tokens = iter([text])
+    else:
+        tokens = singleflight.stream(
+            request_key(prompt, req, x_coalesce),
+            lambda: tracked_stream(
+                prompt,
+                req.model,
+                ticket,
+                max_tokens=req.max_tokens,
+                temperature=req.temperature,
+            ),
+        )
+        status = "MISS" if cache_key else "BYPASS"
+    headers = {**SSE_HEADERS, "X-Cache": status}
+    return StreamingResponse(
+        sse_stream(tokens, kind, req.model, request.is_disconnected),
+        media_type="text/event-stream",
+        headers=headers,
+    )
+
+
+def request_ticket(tenant: str, x_priority: Optional[str]) -> Ticket:
+    """Scheduler ticket from the ``X-Priority`` header (default interactive).
+
+    It is priced once the request has leased its model.
+    """
+    try:
+        priority = parse_priority(x_priority)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Ticket(tenant, priority)
+
+
+def charge_tokens(request: Request, tokens: int) -> None:
+    """Charge the caller's token budget, when rate limiting is on."""
+    key = getattr(request.state, "rate_limit_key", None)
+    if rate_limiter is not None and key is not None:
+        rate_limiter.charge_tokens(key, tokens)
+
+
+def usage(prompt: str, text: str, model: Optional[str]) -> Dict[str, int]:
+    with model_registry.lease(model) as handle:
+        tokenizer = tokenizer_of(handle)
+        prompt_tokens = count_tokens(prompt, tokenizer)
+        completion_tokens = count_tokens(text, tokenizer)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+@app.post("/v1/completions", response_model=None)
+async def completions(
+    req: CompletionRequest,
+    request: Request,
+    response: Response,
+    authorization: Optional[str] = Header(None),
+    x_coalesce: Optional[str] = Header(None),
+    cache_control: Optional[str] = Header(None),
+    x_tenant_id: Optional[str] = Header(None),
+    x_priority: Optional[str] = Header(None),
+) -> Union[Dict[str, object], StreamingResponse]:
+    guard_api_key(authorization)
+    tenant = tenant_for(authorization, x_tenant_id)
+    ticket = request_ticket(tenant, x_priority)
+    if req.stream:
+        # Streams are charged up front for the most they may generate
+        charge_tokens(request, tokens_for(req.prompt, req.model) + req.max_tokens)
+        return await stream_response(
+            request,
+            req.prompt,
+            "completion",
+            req,
+            x_coalesce,
+            cache_control,
+            tenant,
+            ticket,
+        )
+    text = await generate_text(
+        req.prompt, req, x_coalesce, cache_control, tenant, ticket, response
+    )
+    token_usage = usage(req.prompt, text, req.model)
+    charge_tokens(request, token_usage["total_tokens"])
     now = int(time.time())
     return {
         "id": f"cmpl-{now}",
@@ -111,23 +675,42 @@ def completions(
                 "finish_reason": "stop",
             }
         ],
-        "usage": {
-            "prompt_tokens": len(req.prompt.split()),
-            "completion_tokens": len(text.split()),
-            "total_tokens": len(req.prompt.split()) + len(text.split()),
-        },
+        "usage": token_usage,
     }
 
 
-@app.post("/v1/chat/completions")
-def chat_completions(
-    req: ChatRequest, authorization: Optional[str] = Header(None)
-) -> Dict[str, object]:
+@app.post("/v1/chat/completions", response_model=None)
+async def chat_completions(
+    req: ChatRequest,
+    request: Request,
+    response: Response,
+    authorization: Optional[str] = Header(None),
+    x_coalesce: Optional[str] = Header(None),
+    cache_control: Optional[str] = Header(None),
+    x_tenant_id: Optional[str] = Header(None),
+    x_priority: Optional[str] = Header(None),
+) -> Union[Dict[str, object], StreamingResponse]:
     guard_api_key(authorization)
+    tenant = tenant_for(authorization, x_tenant_id)
     prompt = "\n".join([f"{m.role}: {m.content}" for m in req.messages])
-    text = engine.infer(
-        prompt, max_tokens=req.max_tokens, temperature=req.temperature
+    ticket = request_ticket(tenant, x_priority)
+    if req.stream:
+        charge_tokens(request, tokens_for(prompt, req.model) + req.max_tokens)
+        return await stream_response(
+            request,
+            prompt,
+            "chat",
+            req,
+            x_coalesce,
+            cache_control,
+            tenant,
+            ticket,
+        )
+    text = await generate_text(
+        prompt, req, x_coalesce, cache_control, tenant, ticket, response
     )
+    token_usage = usage(prompt, text, req.model)
+    charge_tokens(request, token_usage["total_tokens"])
     now = int(time.time())
     return {
         "id": f"chatcmpl-{now}",
@@ -141,23 +724,54 @@ def chat_completions(
                 "finish_reason": "stop",
             }
         ],
-        "usage": {
-            "prompt_tokens": len(prompt.split()),
-            "completion_tokens": len(text.split()),
-            "total_tokens": len(prompt.split()) + len(text.split()),
-        },
+        "usage": token_usage,
     }
 
 
+def framed_stream(request: Dict[str, object]) -> AsyncIterator[str]:
+    prompt = str(request.get("prompt", ""))
+    max_tokens = int(request.get("max_tokens", 128))
+    return tracked_stream(
+        prompt,
+        str(request.get("model") or DEFAULT_MODEL),
+        Ticket(DEFAULT_TENANT, INTERACTIVE),
+        max_tokens=max_tokens,
+        temperature=float(request.get("temperature", 0.7)),
+    )
+
+
 @app.websocket("/v1/stream")
 async def stream(ws: WebSocket) -> None:
     await ws.accept()
+    if ws.query_params.get("protocol") == FRAMES_PROTOCOL:
+        # Coalesced, multiplexed frames; see src/ws_framing.py
+        try:
+            await serve_websocket(
+                ws, framed_stream, ws.query_params.get("encoding", "json")
+            )
+        except ValueError as exc:
+            # 1003: unsupported data (unknown or unavailable encoding)
+            await ws.close(code=1003, reason=str(exc))
+        return
     try:
         init = await ws.receive_text()
         prompt = init
         # optional: initial JSON with {"prompt": "..."} can be added later
-        for token in engine.stream_infer(prompt):
-            await ws.send_text(token)
+        try:
+            tokens = tracked_stream(
+                prompt,
+                DEFAULT_MODEL,
+                Ticket(DEFAULT_TENANT, INTERACTIVE),
+            )
+        except OverloadedError as exc:
+            # 1013: try again later
+            await ws.close(code=1013, reason=str(exc))
+            return
+        try:
+            async for token in tokens:
+                await ws.send_text(token)
+        finally:
+            await tokens.aclose()
         await ws.close()
     except WebSocketDisconnect:
         pass
@@ -2,6 +2,7 @@
 from .base import Backend
 from .cpu_backend import CPUBackend
 from .cuda_backend import CUDABackend
+from .kv_cache import QuantizedKVCache
 from .rocm_backend import ROCMBackend
 
-__all__ = ['Backend', 'CPUBackend', 'CUDABackend', 'ROCMBackend']
+__all__ = ['Backend', 'CPUBackend', 'CUDABackend', 'QuantizedKVCache', 'ROCMBackend']
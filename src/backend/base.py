@@ -10,6 +10,8 @@ class Backend(ABC):
         """Initialize the backend with empty model and tokenizer."""
         self.model: Optional[Any] = None
         self.tokenizer: Optional[Any] = None
+        # Optional KV cache quantization ('int8'); None uses the model default
+        self.kv_cache: Optional[str] = None
 
     def _load_model_and_tokenizer(
         self,
@@ -38,6 +40,18 @@ class Backend(ABC):
         if quant_type:
             self.model = apply_quantization(self.model, quant_type)
 
+    def _cache_kwargs(self) -> Dict[str, Any]:
+        """
+        Extra ``generate`` kwargs selecting the KV cache implementation.
+
+        Returns:
+            ``{'past_key_values': cache}`` when KV cache quantization is
+            enabled, otherwise an empty dict.
+        """
+        from .kv_cache import create_kv_cache
+        cache = create_kv_cache(self.kv_cache)
+        return {} if cache is None else {'past_key_values': cache}
+
     def _infer(self, input_data: str, device: str) -> str:
         """
         Perform single inference on input text.
@@ -55,7 +69,7 @@ class Backend(ABC):
                 for k, v in inputs.items()
             }
         with torch.no_grad():
-            outputs = self.model.generate(**inputs)
+            outputs = self.model.generate(**inputs, **self._cache_kwargs())
         return self.tokenizer.decode(outputs[0], skip_special_tokens=True)
 
     def _batch_infer(
@@ -93,7 +107,9 @@ class Backend(ABC):
                     for k, v in batch_inputs.items()
                 }
             with torch.no_grad():
-                batch_outputs = self.model.generate(**batch_inputs)
+                batch_outputs = self.model.generate(
+                    **batch_inputs, **self._cache_kwargs()
+                )
             batch_results = [
                 self.tokenizer.decode(output, skip_special_tokens=True)
                 for output in batch_outputs
@@ -117,6 +133,9 @@ class Backend(ABC):
         Yields:
             Generated text tokens one at a time
         """
+        if self.kv_cache is not None:
+            yield from self._stream_infer_cached(input_data, max_tokens, device)
+            return
         inputs = self.tokenizer(input_data, return_tensors="pt")
         if device != 'cpu':
             inputs = {
@@ -142,6 +161,45 @@ class Backend(ABC):
                 if new_token.item() == self.tokenizer.eos_token_id:
                     break
 
+    def _stream_infer_cached(
+        self,
+        input_data: str,
+        max_tokens: Optional[int],
+        device: str
+    ) -> Iterator[str]:
+        """
+        Incremental decode loop reusing a (quantized) KV cache.
+
+        Only the newest token is fed to the model after the prompt, and
+        keys/values of earlier positions come from the cache.
+
+        Args:
+            input_data: Input text to process
+            max_tokens: Maximum number of tokens to generate (None for 100)
+            device: Device string ('cpu' or 'cuda')
+        Yields:
+            Generated text tokens one at a time
+        """
+        from .kv_cache import create_kv_cache
+        cache = create_kv_cache(self.kv_cache)
+        input_ids = self.tokenizer(input_data, return_tensors="pt")['input_ids']
+        input_ids = input_ids.to(device)
+        with torch.no_grad():
+            for _ in range(max_tokens or 100):
+                outputs = self.model(
+                    input_ids=input_ids,
+                    past_key_values=cache,
+                    use_cache=True
+                )
+                probs = torch.softmax(outputs.logits[:, -1, :].float(), dim=-1)
+                new_token = torch.multinomial(probs, num_samples=1)
+                new_text = self.tokenizer.decode(new_token[0], skip_special_tokens=True)
+                if new_text:
+                    yield new_text
+                if new_token.item() == self.tokenizer.eos_token_id:
+                    break
+                input_ids = new_token
+
     def get_memory_usage(self) -> dict:
         """
         Report current memory usage for the backend (GPU or CPU).
@@ -0,0 +1,286 @@
+"""
+INT8 key/value cache for long-context decoding.
+
+Keys and values are stored as int8 in fixed-size blocks along the
+sequence axis, with one float scale per (batch, head, block). The most
+recent, not yet full block stays in the model dtype. Attention layers
+receive dequantized tensors from :meth:`QuantizedKVCache.update`, so the
+full-precision copy only lives for the duration of one layer's attention.
+Compared with an fp16 cache this roughly halves KV memory, which is what
+limits concurrent sequences and context length in long chats.
+
+The class implements the Hugging Face ``Cache`` interface and can be
+passed as ``past_key_values`` to ``model.generate`` or a manual decode
+loop. Every ``DynamicCache`` method that reads the per-layer tensors is
+overridden to work on the int8 blocks; the inherited versions would read
+the parent's (always empty) ``key_cache``/``value_cache`` lists. Tested
+with transformers 4.36 up to, not including, 4.54, which replaced those
+lists with per-layer cache objects; requirements.txt pins that range.
+"""
+
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import torch
+
+try:
+    from transformers.cache_utils import DynamicCache
+except ImportError:  # transformers < 4.36 has no Cache classes
+    DynamicCache = object
+
+KV_CACHE_TYPES = ("int8",)
+
+_Block = Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]
+
+
+def quantize_block(block: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Symmetric int8 quantization with one scale per (batch, head).
+
+    Args:
+        block: Tensor of shape [batch, heads, block_len, head_dim]
+
+    Returns:
+        Tuple of (int8 tensor, float32 scale of shape [batch, heads, 1, 1])
+    """
+    scale = block.detach().float().abs().amax(dim=(-2, -1), keepdim=True)
+    scale = scale.clamp(min=1e-8) / 127.0
+    q = torch.round(block.float() / scale).clamp(-127, 127).to(torch.int8)
+    return q, scale
+
+
+def dequantize_block(q: torch.Tensor, scale: torch.Tensor, dtype: torch.dtype) -> torch.Tensor:
+    """Inverse of :func:`quantize_block`."""
+    return (q.float() * scale).to(dtype)
+
+
+class QuantizedKVCache(DynamicCache):
+    """Block-wise int8 KV cache with per-head, per-block scales."""
+
+    def __init__(self, block_size: int = 64) -> None:
+        if DynamicCache is not object:
+            super().__init__()
+        self.block_size = block_size
+        self._blocks: List[List[_Block]] = []
+        self._tails: List[Optional[Tuple[torch.Tensor, torch.Tensor]]] = []
+        self._lengths: List[int] = []
+        # Model dtype of each layer, restored on dequantization
+        self._dtypes: List[torch.dtype] = []
+        self._seen_tokens = 0
+
+    # Older transformers releases read and assign ``seen_tokens`` directly.
+    @property
+    def seen_tokens(self) -> int:
+        return self._seen_tokens
+
+    @seen_tokens.setter
+    def seen_tokens(self, value: int) -> None:
+        self._seen_tokens = value
+
+    # ``DynamicCache.__init__`` assigns empty lists; any other assignment
+    # would bypass the int8 blocks.
+    @property
+    def key_cache(self) -> Tuple[torch.Tensor, ...]:
+        """Dequantized keys per layer (read-only)."""
+        return tuple(keys for keys, _ in self)
+
+    @key_cache.setter
+    def key_cache(self, value: List[torch.Tensor]) -> None:
+        if value:
+            raise NotImplementedError("QuantizedKVCache keys can only be added with update()")
+
+    @property
+    def value_cache(self) -> Tuple[torch.Tensor, ...]:
+        """Dequantized values per layer (read-only)."""
+        return tuple(values for _, values in self)
+
+    @value_cache.setter
+    def value_cache(self, value: List[torch.Tensor]) -> None:
+        if value:
+            raise NotImplementedError("QuantizedKVCache values can only be added with update()")
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def __getitem__(self, layer_idx: int) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Dequantized (keys, values) of a layer."""
+        if not 0 <= layer_idx < len(self):
+            raise KeyError(f"Cache only has {len(self)} layers, attempted to access layer with index {layer_idx}")
+        return self._materialize(layer_idx, self._dtypes[layer_idx])
+
+    def __iter__(self) -> Iterator[Tuple[torch.Tensor, torch.Tensor]]:
+        for layer_idx in range(len(self)):
+            yield self[layer_idx]
+
+    def to_legacy_cache(self) -> Tuple[Tuple[torch.Tensor, torch.Tensor], ...]:
+        """Dequantized tuple-of-tuples cache, as older model code expects."""
+        return tuple(self)
+
+    @classmethod
+    def from_legacy_cache(
+        cls,
+        past_key_values: Optional[Tuple[Tuple[torch.Tensor, torch.Tensor], ...]] = None,
+        block_size: int = 64,
+    ) -> "QuantizedKVCache":
+        """Quantize a tuple-of-tuples cache."""
+        cache = cls(block_size=block_size)
+        for layer_idx, (keys, values) in enumerate(past_key_values or ()):
+            cache.update(keys, values, layer_idx)
+        return cache
+
+    def update(
+        self,
+        key_states: torch.Tensor,
+        value_states: torch.Tensor,
+        layer_idx: int,
+        cache_kwargs: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Append new keys/values for a layer and return the full dequantized sequence."""
+        while len(self._lengths) <= layer_idx:
+            self._blocks.append([])
+            self._tails.append(None)
+            self._lengths.append(0)
+            self._dtypes.append(key_states.dtype)
+        if layer_idx == 0:
+            self._seen_tokens += key_states.shape[-2]
+
+        tail = self._tails[layer_idx]
+        if tail is not None:
+            keys = torch.cat([tail[0], key_states], dim=-2)
+            values = torch.cat([tail[1], value_states], dim=-2)
+        else:
+            keys, values = key_states, value_states
+
+        full_blocks = keys.shape[-2] // self.block_size
+        for i in range(full_blocks):
+            window = slice(i * self.block_size, (i + 1) * self.block_size)
+            k_q, k_scale = quantize_block(keys[:, :, window])
+            v_q, v_scale = quantize_block(values[:, :, window])
+            self._blocks[layer_idx].append((k_q, k_scale, v_q, v_scale))
+
+        rest = full_blocks * self.block_size
+        if rest < keys.shape[-2]:
+            self._tails[layer_idx] = (keys[:, :, rest:].clone(), values[:, :, rest:].clone())
+        else:
+            self._tails[layer_idx] = None
+        self._lengths[layer_idx] += key_states.shape[-2]
+
+        return self._materialize(layer_idx, key_states.dtype)
+
+    def _materialize(self, layer_idx: int, dtype: torch.dtype) -> Tuple[torch.Tensor, torch.Tensor]:
+        keys = [dequantize_block(k, ks, dtype) for k, ks, _, _ in self._blocks[layer_idx]]
+        values = [dequantize_block(v, vs, dtype) for _, _, v, vs in self._blocks[layer_idx]]
+        tail = self._tails[layer_idx]
+        if tail is not None:
+            keys.append(tail[0])
+            values.append(tail[1])
+        return torch.cat(keys, dim=-2), torch.cat(values, dim=-2)
+
+    def get_seq_length(self, layer_idx: Optional[int] = 0) -> int:
+        """Number of cached tokens for a layer."""
+        layer_idx = layer_idx or 0
+        if layer_idx >= len(self._lengths):
+            return 0
+        return self._lengths[layer_idx]
+
+    def get_usable_length(self, new_seq_length: int, layer_idx: Optional[int] = 0) -> int:
+        return self.get_seq_length(layer_idx)
+
+    def get_max_length(self) -> Optional[int]:
+        return None
+
+    def get_max_cache_shape(self) -> Optional[int]:
+        return None
+
+    def get_mask_sizes(self, cache_position: torch.Tensor, layer_idx: int = 0) -> Tuple[int, int]:
+        return self.get_seq_length(layer_idx) + cache_position.shape[0], 0
+
+    def crop(self, max_length: int) -> None:
+        """Keep the first ``max_length`` tokens (negative: drop that many
+        from the end), e.g. to discard rejected speculative tokens.
+
+        Whole blocks are kept as they are; the tokens of a block cut in
+        half become the full-precision tail.
+        """
+        if max_length < 0:
+            max_length = self.get_seq_length() - abs(max_length)
+        if self.get_seq_length() <= max_length:
+            return
+        kept, partial = divmod(max_length, self.block_size)
+        for layer_idx, length in enumerate(self._lengths):
+            if length <= max_length:
+                continue
+            blocks = self._blocks[layer_idx]
+            tail: Optional[Tuple[torch.Tensor, torch.Tensor]] = None
+            if partial and kept < len(blocks):
+                k, k_scale, v, v_scale = blocks[kept]
+                dtype = self._dtypes[layer_idx]
+                tail = (dequantize_block(k, k_scale, dtype)[:, :, :partial],
+                        dequantize_block(v, v_scale, dtype)[:, :, :partial])
+            elif partial:
+                old = self._tails[layer_idx]
+                tail = (old[0][:, :, :partial].clone(), old[1][:, :, :partial].clone())
+            self._blocks[layer_idx] = blocks[:kept]
+            self._tails[layer_idx] = tail
+            self._lengths[layer_idx] = max_length
+        self._seen_tokens = max_length
+
+    def _map_batch(self, fn: Callable[[torch.Tensor], torch.Tensor]) -> None:
+        """Apply ``fn`` to the batch dimension of every block, scale and tail."""
+        for layer_idx, blocks in enumerate(self._blocks):
+            self._blocks[layer_idx] = [tuple(fn(t) for t in block) for block in blocks]
+            tail = self._tails[layer_idx]
+            if tail is not None:
+                self._tails[layer_idx] = (fn(tail[0]), fn(tail[1]))
+
+    def reorder_cache(self, beam_idx: torch.LongTensor) -> None:
+        """Reorder the batch dimension for beam search."""
+        self._map_batch(lambda t: t.index_select(0, beam_idx.to(t.device)))
+
+    def batch_repeat_interleave(self, repeats: int) -> None:
+        """Repeat each sequence ``repeats`` times (contrastive search)."""
+        self._map_batch(lambda t: t.repeat_interleave(repeats, dim=0))
+
+    def batch_select_indices(self, indices: torch.Tensor) -> None:
+        """Keep only the sequences at ``indices`` (contrastive search)."""
+        self._map_batch(lambda t: t[indices, ...])
+
+    def batch_split(self, full_batch_size: int, split_size: int, *args: Any) -> List["QuantizedKVCache"]:
+        raise NotImplementedError("QuantizedKVCache does not support low-memory contrastive search")
+
+    @classmethod
+    def from_batch_splits(cls, splits: List["QuantizedKVCache"], *args: Any) -> "QuantizedKVCache":
+        raise NotImplementedError("QuantizedKVCache does not support low-memory contrastive search")
+
+    def memory_bytes(self) -> int:
+        """Bytes currently held by the cache (int8 blocks, scales and tails)."""
+        total = 0
+        for blocks in self._blocks:
+            for block in blocks:
+                total += sum(t.nelement() * t.element_size() for t in block)
+        for tail in self._tails:
+            if tail is not None:
+                total += sum(t.nelement() * t.element_size() for t in tail)
+        return total
+
+    def fp16_equivalent_bytes(self) -> int:
+        """Bytes an fp16 cache would need for the same tokens."""
+        total = 0
+        for layer_idx, length in enumerate(self._lengths):
+            reference = self._tails[layer_idx]
+            if reference is None and self._blocks[layer_idx]:
+                reference = self._blocks[layer_idx][0][0], None
+            if reference is None:
+                continue
+            batch, heads, _, head_dim = reference[0].shape
+            total += 2 * batch * heads * length * head_dim * 2
+        return total
+
+
+def create_kv_cache(kv_cache_type: Optional[str], block_size: int = 64) -> Optional[QuantizedKVCache]:
+    """Build a KV cache for ``kv_cache_type`` (``None`` keeps the model default)."""
+    if kv_cache_type is None:
+        return None
+    if kv_cache_type not in KV_CACHE_TYPES:
+        raise ValueError(f"Unsupported KV cache type: {kv_cache_type}")
+    if DynamicCache is object:
+        raise RuntimeError("Quantized KV cache requires transformers>=4.36")
+    return QuantizedKVCache(block_size=block_size)
@@ -0,0 +1,517 @@
+"""Model-aware routing across inference backends.
+
+The unified server can reach several backends (LlamaGPU, Ollama). A
+request goes to the backend that serves its model. The choice comes from
+explicit ``MODEL_ROUTES``, then from the models each backend reports
+during health probes, then from the preferred backend.
+
+Each backend has a :class:`CircuitBreaker`. After ``failure_threshold``
+consecutive failures it opens, and requests skip the backend instead of
+waiting out its timeouts. After ``recovery_timeout`` it lets one trial
+request (or a successful health probe) through, then closes again on
+success.
+
+Idempotent requests (non-streaming, or streams that have not produced a
+token yet) fail over to the next healthy backend. With ``hedge_after``
+set, a backup request is started when the primary has been silent
+longer than that, or longer than the primary's recent p95 latency; the
+first answer wins. Every decision is reported on the result and counted
+in the serving metrics.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from src.core.exceptions import OverloadedError
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+def parse_model_routes(spec: Optional[str]) -> Dict[str, str]:
+    """Parse ``model=backend,model=backend`` (the ``MODEL_ROUTES`` format)."""
+    routes = {}
+    for pair in (spec or "").split(","):
+        model, sep, backend = pair.partition("=")
+        if sep and model.strip() and backend.strip():
+            routes[model.strip()] = backend.strip()
+    return routes
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    Args:
+        failure_threshold: Consecutive failures that open the circuit
+        recovery_timeout: Seconds the circuit stays open before a trial
+    """
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+
+    def allow(self) -> bool:
+        """Whether a request may be sent now (claims the half-open trial)."""
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.recovery_timeout:
+            self.state = HALF_OPEN
+            self._trial_in_flight = False
+        if self.state == HALF_OPEN:
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+        return self.state == CLOSED
+
+    def available(self) -> bool:
+        """Like :meth:`allow` but without claiming the half-open trial."""
+        if self.state == OPEN:
+            return time.monotonic() - self.opened_at >= self.recovery_timeout
+        return not (self.state == HALF_OPEN and self._trial_in_flight)
+
+    def record_success(self) -> None:
+        self.state = CLOSED
+        self.failures = 0
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                logger.warning(f"Circuit opened after {self.failures} failures")
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+@dataclass
+class BackendHealth:
+    """Rolling latency and outcome statistics for one backend."""
+    breaker: CircuitBreaker
+    window: int = 100
+    requests: int = 0
+    failures: int = 0
+    probes_failed: int = 0
+    last_probe: Optional[float] = None
+    healthy: bool = True
+    models: List[str] = field(default_factory=list)
+    _latencies: Deque[float] = field(default_factory=deque)
+    _outcomes: Deque[bool] = field(default_factory=deque)
+
+    def record(self, ok: bool, latency: Optional[float] = None) -> None:
+        self.requests += 1
+        if not ok:
+            self.failures += 1
+        self._outcomes.append(ok)
+        if len(self._outcomes) > self.window:
+            self._outcomes.popleft()
+        if ok and latency is not None:
+            self._latencies.append(latency)
+            if len(self._latencies) > self.window:
+                self._latencies.popleft()
+
+    def error_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return 1.0 - sum(self._outcomes) / len(self._outcomes)
+
+    def latency_quantile(self, q: float) -> Optional[float]:
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.breaker.state,
+            "healthy": self.healthy,
+            "requests": self.requests,
+            "failures": self.failures,
+            "error_rate": self.error_rate(),
+            "latency_p50": self.latency_quantile(0.5),
+            "latency_p95": self.latency_quantile(0.95),
+            "probes_failed": self.probes_failed,
+            "last_probe": self.last_probe,
+            "models": list(self.models),
+        }
+
+
+@dataclass
+class RouteDecision:
+    """Where a request goes and why."""
+    backend: str
+    reason: str  # explicit, model, default or failover
+    fallbacks: List[str] = field(default_factory=list)
+    idempotent: bool = True
+
+    def info(self, **extra: Any) -> Dict[str, Any]:
+        return {"backend": self.backend, "reason": self.reason, **extra}
+
+
+@dataclass
+class RoutedResult:
+    """Outcome of :meth:`BackendRouter.call`."""
+    value: Any
+    backend: str
+    attempts: List[Dict[str, Any]]
+    hedged: bool = False
+
+    def info(self, decision: RouteDecision) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "reason": decision.reason if self.backend == decision.backend else "failover",
+            "attempts": self.attempts,
+            "hedged": self.hedged,
+        }
+
+
+class BackendRouter:
+    """Routes requests to healthy backends by model.
+
+    Args:
+        backends: Backend objects by name
+        preferred: Backend for models no one claims
+        model_routes: Explicit model -> backend mapping
+        probe_interval: Seconds between health probes
+        failure_threshold: See :class:`CircuitBreaker`
+        recovery_timeout: See :class:`CircuitBreaker`
+        hedge_after: Seconds before an idempotent request is hedged to a
+            backup backend; None disables hedging
+        is_failure: Predicate for results that count as failures even
+            though no exception was raised
+        registry: Optional :class:`~src.serving_metrics.MetricsRegistry`
+            for routing metrics
+        catalog: Optional :class:`~src.model_catalog.ModelCatalog`; when
+            given, model ownership comes from it and probes only check
+            health
+    """
+
+    def __init__(
+        self,
+        backends: Dict[str, Any],
+        preferred: Optional[str] = None,
+        model_routes: Optional[Dict[str, str]] = None,
+        probe_interval: float = 10.0,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        hedge_after: Optional[float] = None,
+        is_failure: Optional[Callable[[str, Any], bool]] = None,
+        registry: Any = None,
+        catalog: Any = None,
+    ):
+        self.backends = backends
+        self.preferred = preferred
+        self.model_routes = dict(model_routes or {})
+        self.probe_interval = probe_interval
+        self.hedge_after = hedge_after
+        self.is_failure = is_failure or (lambda backend, value: False)
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.catalog = catalog
+        # Created on first use, so backends may be added after construction
+        self._health: Dict[str, BackendHealth] = {}
+        self._decisions = None
+        self._circuit = None
+        if registry is not None:
+            self._decisions = registry.counter(
+                "llm_routing_decisions_total",
+                "Requests routed to a backend by reason.",
+                ("backend", "reason"),
+            )
+            self._circuit = registry.gauge(
+                "llm_backend_circuit_state",
+                "Circuit breaker state (0 closed, 1 half-open, 2 open).",
+                ("backend",),
+            )
+
+    def health(self, name: str) -> BackendHealth:
+        """Statistics and circuit breaker of backend ``name``."""
+        health = self._health.get(name)
+        if health is None:
+            breaker = CircuitBreaker(self.failure_threshold, self.recovery_timeout)
+            health = self._health[name] = BackendHealth(breaker)
+            if self._circuit is not None:
+                self._circuit.labels(name).set_function(
+                    lambda: _STATE_VALUES[breaker.state])
+        return health
+
+    @classmethod
+    def from_env(cls, backends: Dict[str, Any], preferred: Optional[str] = None,
+                 **kwargs: Any) -> "BackendRouter":
+        """Build with ``MODEL_ROUTES``, ``ROUTER_PROBE_INTERVAL``,
+        ``ROUTER_FAILURE_THRESHOLD``, ``ROUTER_RECOVERY_TIMEOUT`` and
+        ``ROUTER_HEDGE_AFTER``."""
+        hedge = os.getenv("ROUTER_HEDGE_AFTER")
+        return cls(
+            backends,
+            preferred=preferred,
+            model_routes=parse_model_routes(os.getenv("MODEL_ROUTES")),
+            probe_interval=float(os.getenv("ROUTER_PROBE_INTERVAL", "10")),
+            failure_threshold=int(os.getenv("ROUTER_FAILURE_THRESHOLD", "5")),
+            recovery_timeout=float(os.getenv("ROUTER_RECOVERY_TIMEOUT", "30")),
+            hedge_after=float(hedge) if hedge else None,
+            **kwargs,
+        )
+
+    # -- routing -----------------------------------------------------------
+
+    def backend_for_model(self, model: Optional[str]) -> Optional[str]:
+        if model is None:
+            return None
+        backend = self.model_routes.get(model)
+        if backend in self.backends:
+            return backend
+        for name in self.backends:
+            if model in self.models(name):
+                return name
+        return None
+
+    def models(self, name: str) -> List[str]:
+        """Models backend ``name`` is known to serve."""
+        if self.catalog is not None:
+            return self.catalog.model_names(name)
+        return self.health(name).models
+
+    def route(self, model: Optional[str], backend: Optional[str] = None,
+              idempotent: bool = True) -> RouteDecision:
+        """Choose a backend for ``model``.
+
+        An explicitly requested backend is honoured without failover.
+
+        Raises:
+            ValueError: If the requested backend does not exist
+        """
+        if backend is not None:
+            if backend not in self.backends:
+                raise ValueError(f"Backend '{backend}' not available")
+            return self._count(RouteDecision(backend, "explicit", [], idempotent))
+        if not self.backends:
+            raise ValueError("No backends available")
+        owner = self.backend_for_model(model)
+        if owner is not None:
+            primary, reason = owner, "model"
+        else:
+            preferred = self.preferred if self.preferred in self.backends else None
+            primary, reason = preferred or next(iter(self.backends)), "default"
+        others = [name for name in self.backends if name != primary]
+        # Healthy backends first, keeping the primary ahead of equals
+        order = sorted([primary] + others, key=lambda n: not self.health(n).breaker.available())
+        if order[0] != primary:
+            reason = "failover"
+        return self._count(RouteDecision(order[0], reason, order[1:], idempotent))
+
+    def _count(self, decision: RouteDecision) -> RouteDecision:
+        self._count_reason(decision.backend, decision.reason)
+        return decision
+
+    def _count_reason(self, backend: str, reason: str) -> None:
+        if self._decisions is not None:
+            self._decisions.labels(backend, reason).inc()
+
+    def _candidates(self, decision: RouteDecision) -> List[str]:
+        if not decision.idempotent or decision.reason == "explicit":
+            return [decision.backend]
+        return [decision.backend] + decision.fallbacks
+
+    def record(self, backend: str, ok: bool, latency: Optional[float] = None) -> None:
+        health = self.health(backend)
+        health.record(ok, latency)
+        if ok:
+            health.breaker.record_success()
+        else:
+            health.breaker.record_failure()
+
+    def _hedge_delay(self, backend: str) -> Optional[float]:
+        if self.hedge_after is None:
+            return None
+        p95 = self.health(backend).latency_quantile(0.95)
+        return max(self.hedge_after, p95) if p95 is not None else self.hedge_after
+
+    # -- execution ---------------------------------------------------------
+
+    async def _attempt(self, backend: str, call: Callable[[str], Awaitable[Any]]) -> Any:
+        started = time.monotonic()
+        try:
+            value = await call(backend)
+        except OverloadedError:
+            raise  # local load shedding says nothing about the backend
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.record(backend, False)
+            raise
+        if self.is_failure(backend, value):
+            self.record(backend, False)
+            raise RuntimeError(f"Backend '{backend}' returned an error: {str(value)[:200]}")
+        self.record(backend, True, time.monotonic() - started)
+        return value
+
+    async def call(self, decision: RouteDecision,
+                   call: Callable[[str], Awaitable[Any]]) -> RoutedResult:
+        """Run ``call(backend)`` with failover and optional hedging."""
+        candidates = [
+            name for name in self._candidates(decision)
+            if name == decision.backend or self.health(name).breaker.available()
+        ]
+        attempts: List[Dict[str, Any]] = []
+        last_error: Optional[BaseException] = None
+        index = 0
+        while index < len(candidates):
+            backend = candidates[index]
+            index += 1
+            if backend != decision.backend and not self.health(backend).breaker.allow():
+                continue
+            primary = asyncio.ensure_future(self._attempt(backend, call))
+            delay = self._hedge_delay(backend) if index < len(candidates) else None
+            if delay is not None:
+                done, _ = await asyncio.wait({primary}, timeout=delay)
+                if not done:
+                    hedge_backend = candidates[index]
+                    index += 1
+                    hedge = asyncio.ensure_future(self._attempt(hedge_backend, call))
+                    logger.info(f"Hedging {backend} with {hedge_backend} after {delay:.2f}s")
+                    result = await self._first_success(
+                        {primary: backend, hedge: hedge_backend}, attempts)
+                    if result is not None:
+                        winner, value = result
+                        self._count_reason(winner, "hedge")
+                        return RoutedResult(value, winner, attempts, hedged=True)
+                    last_error = RuntimeError("Primary and hedged requests failed")
+                    continue
+            try:
+                value = await primary
+            except OverloadedError:
+                raise
+            except Exception as e:
+                attempts.append({"backend": backend, "error": str(e)})
+                last_error = e
+                logger.warning(f"Backend {backend} failed: {e}")
+                continue
+            attempts.append({"backend": backend, "ok": True})
+            if backend != decision.backend:
+                self._count_reason(backend, "failover")
+            return RoutedResult(value, backend, attempts)
+        raise last_error or RuntimeError("No healthy backend available")
+
+    @staticmethod
+    async def _first_success(
+        tasks: Dict["asyncio.Future[Any]", str], attempts: List[Dict[str, Any]]
+    ) -> Optional[Tuple[str, Any]]:
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                backend = tasks[task]
+                error = task.exception()
+                if error is None:
+                    attempts.append({"backend": backend, "ok": True})
+                    for other in pending:
+                        other.cancel()  # the losing thread finishes but is ignored
+                    return backend, task.result()
+                if isinstance(error, OverloadedError):
+                    for other in pending:
+                        other.cancel()
+                    raise error
+                attempts.append({"backend": backend, "error": str(error)})
+        return None
+
+    def stream(self, decision: RouteDecision,
+               factory: Callable[[str], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """Token stream with failover until the first token.
+
+        The primary stream is started immediately so admission errors
+        surface to the caller; call from a coroutine.
+        """
+        first = factory(decision.backend)
+        return self._stream(decision, factory, first)
+
+    async def _stream(self, decision: RouteDecision,
+                      factory: Callable[[str], AsyncIterator[str]],
+                      tokens: AsyncIterator[str]) -> AsyncIterator[str]:
+        candidates = self._candidates(decision)
+        for position, backend in enumerate(candidates):
+            if position > 0:
+                if not self.health(backend).breaker.allow():
+                    continue
+                logger.warning(f"Stream failing over to {backend}")
+                self._count_reason(backend, "failover")
+                tokens = factory(backend)
+            started = time.monotonic()
+            produced = False
+            try:
+                async for token in tokens:
+                    produced = True
+                    yield token
+            except OverloadedError:
+                raise
+            except Exception:
+                self.record(backend, False)
+                # Tokens already sent cannot be taken back
+                if produced or position == len(candidates) - 1:
+                    raise
+                continue
+            finally:
+                aclose = getattr(tokens, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+            self.record(backend, True, time.monotonic() - started)
+            return
+
+    # -- health ------------------------------------------------------------
+
+    async def probe(self, name: str) -> bool:
+        """Check one backend; refreshes its model list when it has one."""
+        backend = self.backends[name]
+        health = self.health(name)
+        try:
+            check = getattr(backend, "health_check", None) or getattr(backend, "is_available", None)
+            ok = True if check is None else bool(await asyncio.to_thread(check))
+            if ok and self.catalog is None and hasattr(backend, "list_models"):
+                models = await asyncio.to_thread(backend.list_models)
+                health.models = [m["name"] for m in models if "name" in m]
+        except Exception as e:
+            logger.debug(f"Probe of {name} failed: {e}")
+            ok = False
+        health.last_probe = time.time()
+        health.healthy = ok
+        if ok:
+            if health.breaker.state != CLOSED:
+                logger.info(f"Backend {name} recovered")
+            health.breaker.record_success()
+        else:
+            health.probes_failed += 1
+            health.breaker.record_failure()
+        return ok
+
+    async def probe_all(self) -> Dict[str, bool]:
+        names = list(self.backends)
+        results = await asyncio.gather(*(self.probe(name) for name in names))
+        return dict(zip(names, results))
+
+    async def run_probes(self) -> None:
+        """Probe every backend every ``probe_interval`` seconds until cancelled."""
+        while True:
+            await self.probe_all()
+            await asyncio.sleep(self.probe_interval)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "preferred": self.preferred,
+            "model_routes": dict(self.model_routes),
+            "backends": {
+                name: {**self.health(name).snapshot(), "models": self.models(name)}
+                for name in self.backends
+            },
+        }
@@ -1,6 +1,8 @@
 """Ollama backend integration for Llama-GPU."""
 
+from .async_client import AsyncOllamaClient
 from .ollama_backend import OllamaBackend
 from .ollama_client import OllamaClient
+from .residency import ResidencyManager
 
-__all__ = ["OllamaBackend", "OllamaClient"]
+__all__ = ["AsyncOllamaClient", "OllamaBackend", "OllamaClient", "ResidencyManager"]
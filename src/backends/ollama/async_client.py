@@ -0,0 +1,272 @@
+"""Asyncio Ollama API client.
+
+:class:`AsyncOllamaClient` mirrors :class:`~.ollama_client.OllamaClient`
+on an ``aiohttp`` session. A generation waits on the event loop instead
+of holding a worker thread, so one server process can multiplex
+thousands of concurrent Ollama streams. Timeouts, retries of idempotent
+calls and latency stats behave as in the blocking client.
+
+The session belongs to the event loop that created it. The client opens
+a new one if it is used from a different loop (for example in tests that
+call ``asyncio.run`` repeatedly).
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+import aiohttp
+
+from .ollama_client import (
+    RETRY_STATUSES,
+    CallStats,
+    NDJSONDecoder,
+    backoff_delay,
+    chat_payload,
+    chat_result,
+    generate_payload,
+    record_usage,
+)
+
+logger = logging.getLogger(__name__)
+
+# Marks "use the client's read timeout", since None means no timeout
+_CLIENT_DEFAULT = object()
+
+
+class AsyncOllamaClient:
+    """Non-blocking client for the Ollama API."""
+
+    def __init__(
+        self,
+        base_url: str = "http://localhost:11434",
+        pool_size: int = 100,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 120.0,
+        max_retries: int = 2,
+        backoff: float = 0.2,
+        on_request: Optional[Callable[[str, float, bool], None]] = None,
+    ):
+        """Initialize the client; the session is opened on first use.
+
+        Args:
+            base_url: Base URL for Ollama API (default: http://localhost:11434)
+            pool_size: Connections open at once; further calls wait for one
+            connect_timeout: Seconds to establish a connection
+            read_timeout: Seconds to wait for a response or the next
+                stream chunk
+            max_retries: Extra attempts for idempotent calls
+            backoff: Base delay in seconds between retries (jittered)
+            on_request: Called with (endpoint, seconds, ok) after each call
+        """
+        self.base_url = base_url.rstrip("/")
+        self.api_url = f"{self.base_url}/api"
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.calls = CallStats(on_request)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @classmethod
+    def from_env(cls, base_url: str = "http://localhost:11434", **kwargs: Any) -> "AsyncOllamaClient":
+        """Build with ``OLLAMA_ASYNC_POOL_SIZE``, ``OLLAMA_CONNECT_TIMEOUT``,
+        ``OLLAMA_READ_TIMEOUT`` and ``OLLAMA_MAX_RETRIES``."""
+        return cls(
+            base_url,
+            pool_size=int(os.getenv("OLLAMA_ASYNC_POOL_SIZE", "100")),
+            connect_timeout=float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "3.05")),
+            read_timeout=float(os.getenv("OLLAMA_READ_TIMEOUT", "120")),
+            max_retries=int(os.getenv("OLLAMA_MAX_RETRIES", "2")),
+            **kwargs,
+        )
+
+    async def _ensure_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                raise_for_status=False,
+            )
+            self._loop = loop
+        return self._session
+
+    async def close(self) -> None:
+        """Close the session and its pooled connections."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def latency_stats(self) -> Dict[str, Dict[str, float]]:
+        """Calls, errors, retries and latency per endpoint."""
+        return self.calls.snapshot()
+
+    async def _request(
+        self,
+        method: str,
+        endpoint: str,
+        payload: Optional[Dict[str, Any]] = None,
+        read_timeout: Any = _CLIENT_DEFAULT,
+        idempotent: bool = False,
+    ) -> aiohttp.ClientResponse:
+        """Send one API call; the caller must release the response.
+
+        Raises:
+            aiohttp.ClientError: When the call fails, after retries
+            asyncio.TimeoutError: On connect or read timeouts, after retries
+        """
+        if read_timeout is _CLIENT_DEFAULT:
+            read_timeout = self.read_timeout
+        timeout = aiohttp.ClientTimeout(
+            total=None, sock_connect=self.connect_timeout, sock_read=read_timeout
+        )
+        session = await self._ensure_session()
+        attempts = 1 + (self.max_retries if idempotent else 0)
+        attempt = 0
+        while True:
+            attempt += 1
+            started = time.perf_counter()
+            try:
+                response = await session.request(
+                    method, f"{self.api_url}/{endpoint}", json=payload, timeout=timeout
+                )
+                if response.status >= 400:
+                    response.release()
+                    response.raise_for_status()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.calls.record(endpoint, time.perf_counter() - started, False)
+                status = e.status if isinstance(e, aiohttp.ClientResponseError) else None
+                retryable = status in RETRY_STATUSES or not isinstance(
+                    e, aiohttp.ClientResponseError
+                )
+                if not retryable or attempt >= attempts:
+                    raise
+                delay = backoff_delay(self.backoff, attempt)
+                logger.debug(f"Retrying {endpoint} in {delay:.2f}s after: {e!r}")
+                self.calls.retry(endpoint)
+                await asyncio.sleep(delay)
+                continue
+            self.calls.record(endpoint, time.perf_counter() - started, True)
+            return response
+
+    async def _json(self, method: str, endpoint: str, payload: Optional[Dict[str, Any]] = None,
+                    **kwargs: Any) -> Dict[str, Any]:
+        response = await self._request(method, endpoint, payload, **kwargs)
+        async with response:
+            return await response.json(content_type=None)
+
+    async def _lines(self, response: aiohttp.ClientResponse) -> AsyncIterator[Dict[str, Any]]:
+        """Parsed NDJSON lines of a streaming response.
+
+        A stream read to the end returns its connection to the pool; one
+        closed early closes the connection, which stops generation.
+        """
+        decoder = NDJSONDecoder()
+        finished = False
+        try:
+            async for chunk in response.content.iter_any():
+                for data in decoder.feed(chunk):
+                    yield data
+            for data in decoder.flush():
+                yield data
+            finished = True
+        finally:
+            if finished:
+                response.release()
+            else:
+                response.close()
+
+    async def is_available(self) -> bool:
+        """Check if Ollama service is available."""
+        try:
+            response = await self._request("GET", "tags", read_timeout=2)
+            response.release()
+            return True
+        except Exception as e:
+            logger.debug(f"Ollama not available: {e!r}")
+            return False
+
+    async def list_models(self, strict: bool = False) -> List[Dict[str, Any]]:
+        """List available models; ``strict`` raises when Ollama is down."""
+        try:
+            data = await self._json("GET", "tags", read_timeout=5, idempotent=True)
+            return data.get("models", [])
+        except Exception as e:
+            if strict:
+                raise
+            logger.error(f"Failed to list models: {e!r}")
+            return []
+
+    async def generate(
+        self,
+        model: str,
+        prompt: str,
+        max_tokens: int = 512,
+        temperature: float = 0.7,
+        usage: Optional[Dict[str, int]] = None,
+        **kwargs: Any,
+    ) -> str:
+        """Generate a completion; see :meth:`OllamaClient.generate`."""
+        payload = generate_payload(model, prompt, max_tokens, temperature, False, kwargs)
+        data = await self._json("POST", "generate", payload)
+        record_usage(data, usage)
+        return data.get("response", "")
+
+    async def stream_generate(
+        self,
+        model: str,
+        prompt: str,
+        max_tokens: int = 512,
+        temperature: float = 0.7,
+        usage: Optional[Dict[str, int]] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[str]:
+        """Yield completion chunks; ``usage`` is filled by the last one."""
+        payload = generate_payload(model, prompt, max_tokens, temperature, True, kwargs)
+        response = await self._request("POST", "generate", payload)
+        async for data in self._lines(response):
+            if data.get("response"):
+                yield data["response"]
+            if data.get("done", False):
+                record_usage(data, usage)
+
+    async def chat(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        max_tokens: int = 512,
+        temperature: float = 0.7,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        think: bool = False,
+        usage: Optional[Dict[str, int]] = None,
+        **kwargs: Any,
+    ) -> Any:
+        """Chat completion; see :meth:`OllamaClient.chat`."""
+        payload = chat_payload(model, messages, max_tokens, temperature, False, tools, think, kwargs)
+        data = await self._json("POST", "chat", payload)
+        record_usage(data, usage)
+        return chat_result(data, tools)
+
+    async def stream_chat(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        max_tokens: int = 512,
+        temperature: float = 0.7,
+        think: bool = False,
+        usage: Optional[Dict[str, int]] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[str]:
+        """Yield chat message chunks; ``usage`` is filled by the last one."""
+        payload = chat_payload(model, messages, max_tokens, temperature, True, None, think, kwargs)
+        response = await self._request("POST", "chat", payload)
+        async for data in self._lines(response):
+            content = data.get("message", {}).get("content", "")
+            if content:
+                yield content
+            if data.get("done", False):
+                record_usage(data, usage)
@@ -0,0 +1,317 @@
+"""In-process stand-in for the Ollama HTTP API.
+
+Serves ``/api/tags``, ``/api/generate``, ``/api/chat``, ``/api/show``,
+``/api/pull`` and ``/api/delete`` from memory with HTTP/1.1 keep-alive,
+so tests and benchmarks can exercise :class:`OllamaClient` (connection
+reuse, retries, streaming) without a GPU or a running Ollama::
+
+    with FakeOllamaServer(reply="Hi there") as server:
+        client = OllamaClient(server.url)
+        client.generate("fake", "Hello")
+        server.connections  # TCP connections accepted so far
+
+Replies are split on spaces into stream chunks. ``fail_next`` queues
+status codes returned, in order, before normal handling resumes.
+
+Models are "loaded" by any generation and stay resident for the
+request's ``keep_alive`` (Ollama's default of 5 minutes otherwise), as
+listed by ``/api/ps``. An empty prompt only loads, and ``keep_alive: 0``
+unloads. ``loads`` counts cold starts. Setting an entry in ``digests``
+stands in for re-pulling a model.
+"""
+
+import json
+import math
+import re
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body in one segment; split small writes on a kept-alive
+    # connection stall ~40 ms on delayed ACKs
+    disable_nagle_algorithm = True
+    wbufsize = -1
+    server: "_Server"
+
+    def setup(self) -> None:
+        super().setup()
+        with self.server.fake.lock:
+            self.server.fake.connections += 1
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass  # keep test output clean
+
+    def _body(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length)) if length else {}
+
+    def _send_json(self, payload: Any, status: int = 200) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, chunks: Iterator[Dict[str, Any]]) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self.wfile.flush()
+        for chunk in chunks:
+            line = json.dumps(chunk).encode("utf-8") + b"\n"
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _dispatch(self, method: str) -> None:
+        fake = self.server.fake
+        body = self._body() if method != "GET" else {}
+        with fake.lock:
+            fake.requests.append((method, self.path))
+            status = fake.failures.popleft() if fake.failures else None
+        if status is not None:
+            self._send_json({"error": "injected failure"}, status)
+            return
+        route = getattr(fake, "handle_" + self.path.rsplit("/", 1)[-1], None)
+        if route is None:
+            self._send_json({"error": f"unknown path {self.path}"}, 404)
+            return
+        result = route(method, body)
+        if isinstance(result, tuple):
+            self._send_json(*result)
+        elif isinstance(result, (dict, list)):
+            self._send_json(result)
+        else:
+            self._send_stream(result)
+
+    def do_GET(self) -> None:
+        self._dispatch("GET")
+
+    def do_POST(self) -> None:
+        self._dispatch("POST")
+
+    def do_DELETE(self) -> None:
+        self._dispatch("DELETE")
+
+
+DEFAULT_KEEP_ALIVE = 300.0
+_DURATION = re.compile(r"(-?[\d.]+)(ms|s|m|h)?")
+_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, None: 1}
+
+
+def keep_alive_seconds(value: Any) -> float:
+    """Seconds for a ``keep_alive`` value; negative means forever."""
+    if value is None:
+        return DEFAULT_KEEP_ALIVE
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+    else:
+        seconds = 0.0
+        for number, unit in _DURATION.findall(str(value)):
+            seconds += float(number) * _UNITS[unit or None]
+    return math.inf if seconds < 0 else seconds
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    fake: "FakeOllamaServer"
+
+    def handle_error(self, request: Any, client_address: Any) -> None:
+        # Clients hanging up mid-stream is how cancellation works
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class FakeOllamaServer:
+    """Fake Ollama on a free localhost port.
+
+    Args:
+        models: Names listed by ``/api/tags``
+        reply: Text every generation returns
+        token_delay: Seconds between stream chunks
+        sizes: Bytes each model occupies, reported by ``/api/tags`` and
+            ``/api/ps`` (default 1)
+        clock: Monotonic time source for keep_alive expiry
+    """
+
+    def __init__(self, models: Optional[List[str]] = None, reply: str = "Hello from fake Ollama",
+                 token_delay: float = 0.0, sizes: Optional[Dict[str, int]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.models = list(models or ["fake:latest"])
+        self.reply = reply
+        self.token_delay = token_delay
+        self.sizes = dict(sizes or {})
+        # model -> digest reported by /api/tags and /api/ps
+        self.digests: Dict[str, str] = {}
+        self.clock = clock
+        # model -> clock time its keep_alive runs out
+        self.resident: Dict[str, float] = {}
+        self.loads = 0
+        self.connections = 0
+        self.requests: List[Any] = []
+        self.failures: Deque[int] = deque()
+        self.lock = threading.Lock()
+        self._server: Optional[_Server] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        assert self._server is not None, "server not started"
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeOllamaServer":
+        self._server = _Server(("127.0.0.1", 0), _Handler)
+        self._server.fake = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "FakeOllamaServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+    def fail_next(self, *statuses: int) -> None:
+        """Answer the next requests with these HTTP statuses."""
+        with self.lock:
+            self.failures.extend(statuses)
+
+    # -- endpoints -----------------------------------------------------------
+
+    @staticmethod
+    def _tagged(model: str) -> str:
+        # Like Ollama, an untagged name means ":latest"
+        return model if ":" in model.rsplit("/", 1)[-1] else model + ":latest"
+
+    def _missing(self, model: str) -> Optional[tuple]:
+        if model not in self.models and self._tagged(model) not in self.models:
+            return {"error": f"model '{model}' not found"}, 404
+        return None
+
+    def _stats(self, prompt: str, tokens: List[str], started: float) -> Dict[str, Any]:
+        elapsed = int((time.perf_counter() - started) * 1e9)
+        return {
+            "done": True,
+            "done_reason": "stop",
+            "total_duration": elapsed,
+            "load_duration": 0,
+            "prompt_eval_count": len(prompt.split()),
+            "prompt_eval_duration": elapsed // 4,
+            "eval_count": len(tokens),
+            "eval_duration": elapsed - elapsed // 4,
+        }
+
+    def _tokens(self) -> List[str]:
+        words = self.reply.split(" ")
+        return [w + " " for w in words[:-1]] + words[-1:]
+
+    def resident_models(self) -> List[str]:
+        """Models whose keep_alive has not run out."""
+        now = self.clock()
+        with self.lock:
+            return [m for m, until in self.resident.items() if until > now]
+
+    def _keep_alive(self, model: str, value: Any) -> bool:
+        """Apply a request's keep_alive; True if it unloaded the model."""
+        seconds = keep_alive_seconds(value)
+        now = self.clock()
+        with self.lock:
+            if self.resident.get(model, -math.inf) <= now and seconds:
+                self.loads += 1
+            if seconds:
+                self.resident[model] = now + seconds
+            else:
+                self.resident.pop(model, None)
+        return not seconds
+
+    def _digest(self, model: str) -> str:
+        return self.digests.get(model, f"sha256:{model}")
+
+    def handle_tags(self, method: str, body: Dict[str, Any]) -> Any:
+        return {"models": [{"name": m, "model": m, "size": self.sizes.get(m, 1),
+                            "digest": self._digest(m)} for m in self.models]}
+
+    def handle_ps(self, method: str, body: Dict[str, Any]) -> Any:
+        models = []
+        now = self.clock()
+        for m in self.resident_models():
+            until = self.resident.get(m, now)
+            expires = "forever" if until == math.inf else time.strftime(
+                "%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + until - now))
+            size = self.sizes.get(m, 1)
+            models.append({"name": m, "model": m, "size": size, "size_vram": size,
+                           "digest": self._digest(m), "expires_at": expires})
+        return {"models": models}
+
+    def handle_generate(self, method: str, body: Dict[str, Any]) -> Any:
+        return self._generate(body, body.get("prompt", ""), lambda text: {"response": text})
+
+    def handle_chat(self, method: str, body: Dict[str, Any]) -> Any:
+        prompt = " ".join(m.get("content", "") for m in body.get("messages", []))
+        return self._generate(
+            body, prompt, lambda text: {"message": {"role": "assistant", "content": text}}
+        )
+
+    def _generate(self, body: Dict[str, Any], prompt: str, wrap: Any) -> Any:
+        model = body.get("model", "")
+        missing = self._missing(model)
+        if missing:
+            return missing
+        if model not in self.models:
+            model = self._tagged(model)
+        unloaded = self._keep_alive(model, body.get("keep_alive"))
+        started = time.perf_counter()
+        tokens = self._tokens()
+        base = {"model": model, "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ")}
+        if not prompt:
+            return {**base, **wrap(""), "done": True, "done_reason": "unload" if unloaded else "load"}
+        if not body.get("stream", True):
+            return {**base, **wrap("".join(tokens)), **self._stats(prompt, tokens, started)}
+
+        def chunks() -> Iterator[Dict[str, Any]]:
+            for token in tokens:
+                if self.token_delay:
+                    time.sleep(self.token_delay)
+                yield {**base, **wrap(token), "done": False}
+            yield {**base, **wrap(""), **self._stats(prompt, tokens, started)}
+
+        return chunks()
+
+    def handle_show(self, method: str, body: Dict[str, Any]) -> Any:
+        model = body.get("name") or body.get("model", "")
+        return self._missing(model) or {
+            "modelfile": f"FROM {model}",
+            "details": {"family": "fake", "parameter_size": "1B", "quantization_level": "Q4_0"},
+        }
+
+    def handle_pull(self, method: str, body: Dict[str, Any]) -> Any:
+        model = body.get("name") or body.get("model", "")
+        with self.lock:
+            if model not in self.models:
+                self.models.append(model)
+        return iter([{"status": "pulling manifest"}, {"status": "success"}])
+
+    def handle_delete(self, method: str, body: Dict[str, Any]) -> Any:
+        model = body.get("name") or body.get("model", "")
+        missing = self._missing(model)
+        if missing:
+            return missing
+        with self.lock:
+            self.models.remove(model)
+        return {}
@@ -1,8 +1,12 @@
 """Ollama backend adapter for Llama-GPU inference engine."""
 
-from typing import Optional, Dict, List, Any
+from typing import Optional, Callable, Dict, Iterator, AsyncIterator, List, Any
 import logging
+import os
+from src.utils.batching import BatchReport, fan_out
+from .async_client import AsyncOllamaClient
 from .ollama_client import OllamaClient
+from .residency import ResidencyManager
 
 logger = logging.getLogger(__name__)
 
@@ -21,9 +25,16 @@ class OllamaBackend:
             base_url: Ollama API URL
             default_model: Default model to use
         """
-        self.client = OllamaClient(base_url)
+        self.client = OllamaClient.from_env(base_url)
+        # Generation from async servers, without a thread per request
+        self.async_client = AsyncOllamaClient.from_env(base_url)
         self.default_model = default_model
+        # Requests Ollama runs at once per model; more would only queue there
+        self.num_parallel = int(os.getenv("OLLAMA_NUM_PARALLEL", "4"))
+        # Optional ResidencyManager; sees every request and sets keep_alive
+        self.residency: Optional[ResidencyManager] = None
         self._is_available = None
+        self._model_listeners: List[Callable[[str], None]] = []
         
     def initialize(self) -> bool:
         """Initialize and check if backend is available."""
@@ -43,6 +54,18 @@ class OllamaBackend:
             self.initialize()
         return self._is_available or False
     
+    def health_check(self) -> bool:
+        """Re-check the Ollama service, bypassing the cached availability."""
+        self._is_available = self.client.is_available()
+        return self._is_available
+    
+    def _keep_alive(self, model: str, kwargs: Dict[str, Any]) -> None:
+        """Report the request to the residency manager and apply its keep_alive."""
+        if self.residency is not None:
+            keep_alive = self.residency.touch(model)
+            if keep_alive is not None:
+                kwargs.setdefault("keep_alive", keep_alive)
+    
     def infer(
         self,
         prompt: str,
@@ -50,6 +73,7 @@ class OllamaBackend:
         max_tokens: int = 512,
         temperature: float = 0.7,
         stream: bool = False,
+        usage: Optional[Dict[str, int]] = None,
         **kwargs
     ) -> str:
         """Run inference on prompt.
@@ -60,12 +84,14 @@ class OllamaBackend:
             max_tokens: Maximum tokens to generate
             temperature: Sampling temperature
             stream: Whether to stream (not used in sync mode)
+            usage: Optional dict filled with Ollama's token counts
             **kwargs: Additional parameters
             
         Returns:
             Generated text
         """
         model = model or self.default_model
+        self._keep_alive(model, kwargs)
         
         try:
             response = self.client.generate(
@@ -74,6 +100,7 @@ class OllamaBackend:
                 max_tokens=max_tokens,
                 temperature=temperature,
                 stream=False,
+                usage=usage,
                 **kwargs
             )
             return response
@@ -87,6 +114,7 @@ class OllamaBackend:
         model: Optional[str] = None,
         max_tokens: int = 512,
         temperature: float = 0.7,
+        usage: Optional[Dict[str, int]] = None,
         **kwargs
     ) -> str:
         """Run chat completion.
@@ -96,12 +124,14 @@ class OllamaBackend:
             model: Model name (uses default if None)
             max_tokens: Maximum tokens to generate
             temperature: Sampling temperature
+            usage: Optional dict filled with Ollama's token counts
             **kwargs: Additional parameters
             
         Returns:
             Generated response
         """
         model = model or self.default_model
+        self._keep_alive(model, kwargs)
         
         try:
             response = self.client.chat(
@@ -110,6 +140,7 @@ class OllamaBackend:
                 max_tokens=max_tokens,
                 temperature=temperature,
                 stream=False,
+                usage=usage,
                 **kwargs
             )
             return response
@@ -117,9 +148,242 @@ class OllamaBackend:
             logger.error(f"Chat failed: {e}")
             return f"Error: {str(e)}"
     
-    def list_models(self) -> List[Dict[str, Any]]:
-        """List available models."""
-        return self.client.list_models()
+    def stream_infer(
+        self,
+        prompt: str,
+        model: Optional[str] = None,
+        max_tokens: int = 512,
+        temperature: float = 0.7,
+        usage: Optional[Dict[str, int]] = None,
+        **kwargs
+    ) -> Iterator[str]:
+        """Stream generated text chunks for a prompt.
+        
+        Unlike :meth:`infer`, errors are raised to the caller so a
+        streaming response can report them. Closing the iterator closes
+        the upstream HTTP connection, which stops generation in Ollama.
+        
+        Args:
+            prompt: Input text
+            model: Model name (uses default if None)
+            max_tokens: Maximum tokens to generate
+            temperature: Sampling temperature
+            usage: Optional dict filled with Ollama's token counts
+            **kwargs: Additional parameters
+            
+        Yields:
+            Text chunks as Ollama produces them
+        """
+        model = model or self.default_model
+        self._keep_alive(model, kwargs)
+        yield from self.client.generate(
+            model=model,
+            prompt=prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True,
+            usage=usage,
+            **kwargs
+        )
+    
+    def stream_chat(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        max_tokens: int = 512,
+        temperature: float = 0.7,
+        usage: Optional[Dict[str, int]] = None,
+        **kwargs
+    ) -> Iterator[str]:
+        """Stream chat response chunks; see :meth:`stream_infer`.
+        
+        Args:
+            messages: List of conversation messages
+            model: Model name (uses default if None)
+            max_tokens: Maximum tokens to generate
+            temperature: Sampling temperature
+            usage: Optional dict filled with Ollama's token counts
+            **kwargs: Additional parameters
+            
+        Yields:
+            Response content chunks
+        """
+        model = model or self.default_model
+        self._keep_alive(model, kwargs)
+        yield from self.client.chat(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True,
+            usage=usage,
+            **kwargs
+        )
+    
+    def batch_infer(
+        self,
+        prompts: List[str],
+        model: Optional[str] = None,
+        max_tokens: int = 512,
+        temperature: float = 0.7,
+        concurrency: Optional[int] = None,
+        **kwargs
+    ) -> BatchReport:
+        """Run many prompts concurrently.
+        
+        Args:
+            prompts: Input texts
+            model: Model name (uses default if None)
+            max_tokens: Maximum tokens to generate per prompt
+            temperature: Sampling temperature
+            concurrency: Prompts in flight at once (default
+                ``OLLAMA_NUM_PARALLEL``, matching what Ollama runs in parallel)
+            **kwargs: Additional parameters
+            
+        Returns:
+            Outputs in input order; failed prompts are None with their
+            error in ``errors``
+        """
+        model = model or self.default_model
+        
+        def generate(prompt: str, usage: Dict[str, int]) -> str:
+            options = dict(kwargs)
+            self._keep_alive(model, options)
+            return self.client.generate(
+                model=model, prompt=prompt, max_tokens=max_tokens,
+                temperature=temperature, usage=usage, **options
+            )
+        
+        return fan_out(generate, prompts, concurrency or self.num_parallel)
+    
+    def batch_chat(
+        self,
+        conversations: List[List[Dict[str, str]]],
+        model: Optional[str] = None,
+        max_tokens: int = 512,
+        temperature: float = 0.7,
+        concurrency: Optional[int] = None,
+        **kwargs
+    ) -> BatchReport:
+        """Run many chat conversations concurrently; see :meth:`batch_infer`."""
+        model = model or self.default_model
+        
+        def chat(messages: List[Dict[str, str]], usage: Dict[str, int]) -> str:
+            options = dict(kwargs)
+            self._keep_alive(model, options)
+            return self.client.chat(
+                model=model, messages=messages, max_tokens=max_tokens,
+                temperature=temperature, usage=usage, **options
+            )
+        
+        return fan_out(chat, conversations, concurrency or self.num_parallel)
+    
+    async def ainfer(
+        self,
+        prompt: str,
+        model: Optional[str] = None,
+        max_tokens: int = 512,
+        temperature: float = 0.7,
+        usage: Optional[Dict[str, int]] = None,
+        **kwargs
+    ) -> str:
+        """Async :meth:`infer`; failures are returned as ``"Error: ..."`` text."""
+        model = model or self.default_model
+        self._keep_alive(model, kwargs)
+        try:
+            return await self.async_client.generate(
+                model=model,
+                prompt=prompt,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                usage=usage,
+                **kwargs
+            )
+        except Exception as e:
+            logger.error(f"Inference failed: {e!r}")
+            return f"Error: {str(e) or type(e).__name__}"
+    
+    async def achat(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        max_tokens: int = 512,
+        temperature: float = 0.7,
+        usage: Optional[Dict[str, int]] = None,
+        **kwargs
+    ) -> str:
+        """Async :meth:`chat`; failures are returned as ``"Error: ..."`` text."""
+        model = model or self.default_model
+        self._keep_alive(model, kwargs)
+        try:
+            return await self.async_client.chat(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                usage=usage,
+                **kwargs
+            )
+        except Exception as e:
+            logger.error(f"Chat failed: {e!r}")
+            return f"Error: {str(e) or type(e).__name__}"
+    
+    def astream_infer(
+        self,
+        prompt: str,
+        model: Optional[str] = None,
+        max_tokens: int = 512,
+        temperature: float = 0.7,
+        usage: Optional[Dict[str, int]] = None,
+        **kwargs
+    ) -> AsyncIterator[str]:
+        """Async :meth:`stream_infer`; ``aclose()`` stops generation."""
+        model = model or self.default_model
+        self._keep_alive(model, kwargs)
+        return self.async_client.stream_generate(
+            model=model,
+            prompt=prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            usage=usage,
+            **kwargs
+        )
+    
+    def astream_chat(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        max_tokens: int = 512,
+        temperature: float = 0.7,
+        usage: Optional[Dict[str, int]] = None,
+        **kwargs
+    ) -> AsyncIterator[str]:
+        """Async :meth:`stream_chat`; ``aclose()`` stops generation."""
+        model = model or self.default_model
+        self._keep_alive(model, kwargs)
+        return self.async_client.stream_chat(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            usage=usage,
+            **kwargs
+        )
+    
+    async def aclose(self) -> None:
+        """Close the async client's connections."""
+        await self.async_client.close()
+    
+    def list_models(self, strict: bool = False) -> List[Dict[str, Any]]:
+        """List available models (``strict`` raises when Ollama is down)."""
+        models = self.client.list_models(strict=strict)
+        if strict:
+            self._is_available = True  # Ollama answered
+        return models
+    
+    def add_model_listener(self, callback: Callable[[str], None]) -> None:
+        """Call ``callback(model)`` whenever a model is pulled."""
+        self._model_listeners.append(callback)
     
     def get_model_info(self, model: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """Get information about a model.
@@ -148,7 +412,11 @@ class OllamaBackend:
             return True
         
         logger.info(f"Pulling model {model}...")
-        return self.client.pull_model(model)
+        pulled = self.client.pull_model(model)
+        if pulled:
+            for callback in self._model_listeners:
+                callback(model)
+        return pulled
     
     def get_backend_type(self) -> str:
         """Get backend type identifier."""
@@ -156,9 +424,15 @@ class OllamaBackend:
     
     def get_device_info(self) -> Dict[str, Any]:
         """Get device/backend information."""
+        # One /api/tags request answers both questions
+        try:
+            models = [m['name'] for m in self.list_models(strict=True)]
+        except Exception:
+            self._is_available = False
+            models = []
         return {
             "backend": "ollama",
-            "available": self.is_available(),
-            "models": [m['name'] for m in self.list_models()],
+            "available": self._is_available,
+            "models": models,
             "default_model": self.default_model
         }
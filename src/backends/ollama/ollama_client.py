@@ -1,42 +1,478 @@
-"""Ollama API client for direct model interaction."""
+"""Ollama API client for direct model interaction.
+
+All calls go through one ``requests.Session`` whose connection pool keeps
+connections to Ollama alive, so agent loops and streams do not pay TCP
+setup on every turn. Connect and read timeouts are separate: the read
+timeout bounds the wait for each chunk, not the whole generation.
+Idempotent calls (listing, showing, pulling and deleting models) are
+retried on connection errors and 502/503/504 with jittered exponential
+backoff. Generation is never retried, since a lost response may already
+have been computed. Per-endpoint latency is available from
+:meth:`OllamaClient.latency_stats`.
+
+Streams are decoded with :class:`NDJSONDecoder` as the bytes arrive, and
+the ``usage`` dict a caller passes in is filled from the final chunk with
+token counts and Ollama's generation timing (see :func:`eval_timing`).
+
+With a :class:`~src.advanced_cache.ResponseCache` attached, deterministic
+generate and chat calls (``temperature`` 0 or a fixed ``seed``) are
+answered locally when the same payload was sent before. Keys include the
+model's digest from ``/api/tags``, so re-pulling a model invalidates its
+entries.
+"""
 
 import json
+import math
+import os
+import random
+import threading
+import time
 import requests
-from typing import Dict, List, Optional, Generator, Any
+from requests.adapters import HTTPAdapter
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Generator, Any, Tuple
 import logging
 
+from src.advanced_cache import ResponseCache
+from src.request_coalescing import request_key
+
 logger = logging.getLogger(__name__)
 
+# Gateway errors worth retrying; Ollama itself answers 500 for bad models
+RETRY_STATUSES = (502, 503, 504)
+# Marks "use the client's read timeout", since None means no timeout
+_CLIENT_DEFAULT = object()
+
+
+def backoff_delay(backoff: float, attempt: int) -> float:
+    """Full-jitter delay before retry ``attempt`` (1-based)."""
+    return random.uniform(0, backoff * 2 ** (attempt - 1))
+
+
+def _with_keep_alive(payload: Dict[str, Any]) -> Dict[str, Any]:
+    # keep_alive is a request field, not a model option
+    keep_alive = payload["options"].pop("keep_alive", None)
+    if keep_alive is not None:
+        payload["keep_alive"] = keep_alive
+    return payload
+
+
+def generate_payload(
+    model: str, prompt: str, max_tokens: int, temperature: float, stream: bool,
+    options: Dict[str, Any],
+) -> Dict[str, Any]:
+    """Request body for ``/api/generate``."""
+    return _with_keep_alive({
+        "model": model,
+        "prompt": prompt,
+        "stream": stream,
+        "options": {
+            "num_predict": max_tokens,
+            "temperature": temperature,
+            **options
+        }
+    })
+
+
+def chat_payload(
+    model: str, messages: List[Dict[str, str]], max_tokens: int, temperature: float,
+    stream: bool, tools: Optional[List[Dict[str, Any]]], think: bool, options: Dict[str, Any],
+) -> Dict[str, Any]:
+    """Request body for ``/api/chat``."""
+    payload = {
+        "model": model,
+        "messages": messages,
+        "stream": stream,
+        "think": think,  # Disable thinking mode for faster responses
+        "options": {
+            "num_predict": max_tokens,
+            "temperature": temperature,
+            **options
+        }
+    }
+    # Add tools if provided
+    if tools:
+        payload["tools"] = tools
+    return _with_keep_alive(payload)
+
+
+def deterministic(payload: Dict[str, Any]) -> bool:
+    """Whether a generation payload always produces the same output."""
+    options = payload.get("options", {})
+    return options.get("temperature") == 0 or options.get("seed") is not None
+
+
+def chat_result(data: Dict[str, Any], tools: Optional[List[Dict[str, Any]]]) -> Any:
+    """Message text, or the full message dict when tools were offered."""
+    message = data.get("message", {})
+
+    # If tools were provided, return full message dict for tool_calls handling
+    if tools:
+        return {
+            "content": message.get("content", ""),
+            "tool_calls": message.get("tool_calls", []),
+            "thinking": message.get("thinking", ""),
+            "role": message.get("role", "assistant")
+        }
+
+    return message.get("content", "")
+
+
+def eval_timing(data: Dict[str, Any]) -> Optional[Dict[str, float]]:
+    """Generation timing from Ollama's final chunk, or None without it.
+
+    Ollama reports durations in nanoseconds; they are converted to
+    milliseconds, with prompt and generation rates in tokens per second.
+    """
+    if "eval_duration" not in data:
+        return None
+    eval_ns = data.get("eval_duration") or 0
+    prompt_ns = data.get("prompt_eval_duration") or 0
+    return {
+        "total_ms": (data.get("total_duration") or 0) / 1e6,
+        "load_ms": (data.get("load_duration") or 0) / 1e6,
+        "prompt_eval_ms": prompt_ns / 1e6,
+        "eval_ms": eval_ns / 1e6,
+        "prompt_tokens_per_second": (
+            data.get("prompt_eval_count", 0) / (prompt_ns / 1e9) if prompt_ns else 0.0
+        ),
+        "tokens_per_second": data.get("eval_count", 0) / (eval_ns / 1e9) if eval_ns else 0.0,
+    }
+
+
+def record_usage(data: Dict[str, Any], usage: Optional[Dict[str, Any]]) -> None:
+    """Copy Ollama's prompt/eval token counts and timing into ``usage``."""
+    if usage is None:
+        return
+    usage["prompt_tokens"] = data.get("prompt_eval_count", 0)
+    usage["completion_tokens"] = data.get("eval_count", 0)
+    timing = eval_timing(data)
+    if timing is not None:
+        usage["timing"] = timing
+
+
+class NDJSONDecoder:
+    """Incremental decoder for newline-delimited JSON.
+
+    Network reads split lines at arbitrary points. :meth:`feed` keeps the
+    unfinished tail and returns the objects of every complete line, so a
+    stream is decoded as bytes arrive, with no limit on line length.
+    Malformed lines are counted in ``skipped`` and dropped.
+    """
+
+    def __init__(self) -> None:
+        self._buffer = bytearray()
+        self.skipped = 0
+
+    def feed(self, data: bytes) -> List[Dict[str, Any]]:
+        """Objects completed by ``data``."""
+        # Only the new bytes can complete a line
+        newline = data.rfind(b"\n")
+        end = len(self._buffer) + newline
+        self._buffer += data
+        if newline < 0:
+            return []
+        lines = bytes(self._buffer[:end]).split(b"\n")
+        del self._buffer[:end + 1]
+        return self._parse(lines)
+
+    def flush(self) -> List[Dict[str, Any]]:
+        """Objects from a final line without a trailing newline."""
+        lines = [bytes(self._buffer)]
+        self._buffer.clear()
+        return self._parse(lines)
+
+    def _parse(self, lines: List[bytes]) -> List[Dict[str, Any]]:
+        items = []
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:  # JSONDecodeError or invalid UTF-8
+                self.skipped += 1
+        return items
+
+
+def iter_ndjson(chunks: Iterable[bytes]) -> Iterator[Dict[str, Any]]:
+    """Decode an iterable of raw byte chunks into JSON objects."""
+    decoder = NDJSONDecoder()
+    for chunk in chunks:
+        yield from decoder.feed(chunk)
+    yield from decoder.flush()
+
+
+class CallStats:
+    """Thread-safe per-endpoint call counts and latency.
+
+    Args:
+        on_request: Called with (endpoint, seconds, ok) after each call
+    """
+
+    def __init__(self, on_request: Optional[Callable[[str, float, bool], None]] = None):
+        self.on_request = on_request
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, endpoint: str) -> Dict[str, float]:
+        return self._stats.setdefault(
+            endpoint, {"calls": 0, "errors": 0, "retries": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+        )
+
+    def record(self, endpoint: str, seconds: float, ok: bool) -> None:
+        with self._lock:
+            stats = self._entry(endpoint)
+            stats["calls"] += 1
+            stats["errors"] += 0 if ok else 1
+            stats["total_seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+        if self.on_request is not None:
+            self.on_request(endpoint, seconds, ok)
+
+    def retry(self, endpoint: str) -> None:
+        with self._lock:
+            self._entry(endpoint)["retries"] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                endpoint: {
+                    **stats,
+                    "avg_seconds": stats["total_seconds"] / stats["calls"] if stats["calls"] else 0.0,
+                }
+                for endpoint, stats in self._stats.items()
+            }
+
 
 class OllamaClient:
     """Client for interacting with Ollama API."""
 
-    def __init__(self, base_url: str = "http://localhost:11434"):
+    def __init__(
+        self,
+        base_url: str = "http://localhost:11434",
+        pool_size: int = 10,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 120.0,
+        max_retries: int = 2,
+        backoff: float = 0.2,
+        session: Optional[requests.Session] = None,
+        on_request: Optional[Callable[[str, float, bool], None]] = None,
+        cache: Optional[ResponseCache] = None,
+        digest_ttl: float = 30.0,
+    ):
         """Initialize Ollama client.
 
         Args:
             base_url: Base URL for Ollama API (default: http://localhost:11434)
+            pool_size: Connections kept alive for concurrent callers
+            connect_timeout: Seconds to establish a connection
+            read_timeout: Seconds to wait for a response or the next
+                stream chunk
+            max_retries: Extra attempts for idempotent calls
+            backoff: Base delay in seconds; attempt ``n`` waits a random
+                time up to ``backoff * 2**n``
+            session: Session to use instead of a new pooled one
+            on_request: Called with (endpoint, seconds, ok) after each call;
+                for streams the time is until the response headers
+            cache: Cache for deterministic generate/chat responses
+            digest_ttl: Seconds a model digest is trusted before
+                ``/api/tags`` is asked again
         """
         self.base_url = base_url.rstrip("/")
         self.api_url = f"{self.base_url}/api"
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.calls = CallStats(on_request)
+        self.session = session or self._build_session(pool_size)
+        self.cache = cache
+        self.digest_ttl = digest_ttl
+        # Tagged model name -> digest, as listed when last fetched
+        self._digests: Dict[str, str] = {}
+        self._digests_expire = -math.inf
+        self._digest_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, base_url: str = "http://localhost:11434", **kwargs: Any) -> "OllamaClient":
+        """Build with ``OLLAMA_POOL_SIZE``, ``OLLAMA_CONNECT_TIMEOUT``,
+        ``OLLAMA_READ_TIMEOUT`` and ``OLLAMA_MAX_RETRIES``.
+
+        ``OLLAMA_RESPONSE_CACHE=true`` attaches a response cache sized by
+        ``OLLAMA_CACHE_MAX_BYTES`` and ``OLLAMA_CACHE_TTL``, with a SQLite
+        tier at ``OLLAMA_CACHE_DB`` when set.
+        """
+        if os.getenv("OLLAMA_RESPONSE_CACHE", "false").lower() == "true":
+            kwargs.setdefault("cache", ResponseCache(
+                max_bytes=int(os.getenv("OLLAMA_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+                ttl=float(os.getenv("OLLAMA_CACHE_TTL", "86400")),
+                disk_path=os.getenv("OLLAMA_CACHE_DB") or None,
+            ))
+        return cls(
+            base_url,
+            pool_size=int(os.getenv("OLLAMA_POOL_SIZE", "10")),
+            connect_timeout=float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "3.05")),
+            read_timeout=float(os.getenv("OLLAMA_READ_TIMEOUT", "120")),
+            max_retries=int(os.getenv("OLLAMA_MAX_RETRIES", "2")),
+            **kwargs,
+        )
+
+    @staticmethod
+    def _build_session(pool_size: int) -> requests.Session:
+        session = requests.Session()
+        # Retries are handled in _request, where idempotency is known
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def close(self) -> None:
+        """Close pooled connections."""
+        self.session.close()
+
+    def __enter__(self) -> "OllamaClient":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def _request(
+        self,
+        method: str,
+        endpoint: str,
+        payload: Optional[Dict[str, Any]] = None,
+        stream: bool = False,
+        read_timeout: Any = _CLIENT_DEFAULT,
+        idempotent: bool = False,
+    ) -> requests.Response:
+        """Send one API call on the pooled session.
+
+        Args:
+            method: HTTP method
+            endpoint: Path under ``/api``, e.g. ``"tags"``
+            payload: JSON body
+            stream: Return before the body is read
+            read_timeout: Override of the client's read timeout; None
+                waits forever
+            idempotent: Retry connection errors and gateway errors
+
+        Raises:
+            requests.RequestException: When the call fails, after retries
+        """
+        if read_timeout is _CLIENT_DEFAULT:
+            read_timeout = self.read_timeout
+        attempts = 1 + (self.max_retries if idempotent else 0)
+        attempt = 0
+        while True:
+            attempt += 1
+            started = time.perf_counter()
+            try:
+                response = self.session.request(
+                    method, f"{self.api_url}/{endpoint}", json=payload,
+                    stream=stream, timeout=(self.connect_timeout, read_timeout),
+                )
+                if response.status_code >= 400:
+                    response.close()
+                response.raise_for_status()
+            except requests.RequestException as e:
+                self.calls.record(endpoint, time.perf_counter() - started, False)
+                status = e.response.status_code if e.response is not None else None
+                retryable = status in RETRY_STATUSES or isinstance(
+                    e, (requests.ConnectionError, requests.Timeout)
+                )
+                if not retryable or attempt >= attempts:
+                    raise
+                delay = backoff_delay(self.backoff, attempt)
+                logger.debug(f"Retrying {endpoint} in {delay:.2f}s after: {e}")
+                self.calls.retry(endpoint)
+                time.sleep(delay)
+                continue
+            self.calls.record(endpoint, time.perf_counter() - started, True)
+            return response
+
+    def latency_stats(self) -> Dict[str, Dict[str, float]]:
+        """Calls, errors, retries and latency per endpoint."""
+        return self.calls.snapshot()
+
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        """Response cache counters, or None without a cache."""
+        return self.cache.stats() if self.cache is not None else None
+
+    # -- response cache ------------------------------------------------------
+
+    def model_digest(self, model: str) -> Optional[str]:
+        """Digest of the installed ``model``; None if Ollama does not list it.
+
+        Untagged names mean ``:latest``, as in Ollama. The model list is
+        fetched from ``/api/tags`` at most once every ``digest_ttl``
+        seconds, for hits and misses alike. While it cannot be fetched,
+        every model has no digest, so calls bypass the cache.
+        """
+        if ":" not in model.rsplit("/", 1)[-1]:
+            model += ":latest"
+        with self._digest_lock:
+            if time.monotonic() < self._digests_expire:
+                return self._digests.get(model)
+        try:
+            listed = self.list_models(strict=True)
+        except Exception as e:
+            logger.debug(f"Model digests unavailable, bypassing the response cache: {e}")
+            listed = []
+        with self._digest_lock:
+            self._digests = {m["name"]: m["digest"] for m in listed if m.get("name") and m.get("digest")}
+            self._digests_expire = time.monotonic() + self.digest_ttl
+            return self._digests.get(model)
+
+    def _cache_key(self, endpoint: str, payload: Dict[str, Any]) -> Optional[str]:
+        """Key for a cacheable payload, or None when it must go to Ollama."""
+        if self.cache is None or not deterministic(payload):
+            return None
+        digest = self.model_digest(payload["model"])
+        if digest is None:
+            return None
+        # Whether the reply streams or how long the model stays loaded
+        # does not change what it says
+        fields = {k: v for k, v in payload.items() if k not in ("stream", "keep_alive")}
+        return request_key(endpoint=endpoint, digest=digest, **fields)
+
+    def _cached(self, key: Optional[str], usage: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        data = self.cache.get(key) if key is not None else None
+        if data is not None:
+            record_usage(data, usage)
+            if usage is not None:
+                usage["cached"] = True
+        return data
+
+    def _store(self, key: Optional[str], data: Dict[str, Any]) -> None:
+        if key is not None and data.get("done", True):
+            self.cache.set(key, data)
 
     def is_available(self) -> bool:
         """Check if Ollama service is available."""
         try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=2)
+            response = self._request("GET", "tags", read_timeout=2)
             return response.status_code == 200
         except Exception as e:
             logger.debug(f"Ollama not available: {e}")
             return False
 
-    def list_models(self) -> List[Dict[str, Any]]:
-        """List all available models."""
+    def list_models(self, strict: bool = False) -> List[Dict[str, Any]]:
+        """List all available models.
+
+        Args:
+            strict: Raise when Ollama is unreachable instead of returning
+                an empty list
+
+        Returns:
+            Model entries from ``/api/tags``
+        """
         try:
-            response = requests.get(f"{self.api_url}/tags", timeout=5)
-            response.raise_for_status()
+            response = self._request("GET", "tags", read_timeout=5, idempotent=True)
             data = response.json()
             return data.get("models", [])
         except Exception as e:
+            if strict:
+                raise
             logger.error(f"Failed to list models: {e}")
             return []
 
@@ -47,6 +483,7 @@ class OllamaClient:
         max_tokens: int = 512,
         temperature: float = 0.7,
         stream: bool = False,
+        usage: Optional[Dict[str, int]] = None,
         **kwargs
     ):
         """Generate text completion.
@@ -57,53 +494,57 @@ class OllamaClient:
             max_tokens: Maximum tokens to generate
             temperature: Sampling temperature
             stream: Whether to stream responses
+            usage: Optional dict filled with Ollama's token counts; for
+                streams it is filled when the final chunk arrives
             **kwargs: Additional Ollama parameters
 
         Returns:
             Generated text (string) or generator if streaming
         """
-        payload = {
-            "model": model,
-            "prompt": prompt,
-            "stream": stream,
-            "options": {
-                "num_predict": max_tokens,
-                "temperature": temperature,
-                **kwargs
-            }
-        }
+        payload = generate_payload(model, prompt, max_tokens, temperature, stream, kwargs)
+        key = self._cache_key("generate", payload)
+        cached = self._cached(key, usage)
+        if cached is not None:
+            text = cached.get("response", "")
+            return iter([text]) if stream else text
 
         try:
-            response = requests.post(
-                f"{self.api_url}/generate",
-                json=payload,
-                stream=stream,
-                timeout=60 if not stream else None
-            )
-            response.raise_for_status()
+            response = self._request("POST", "generate", payload, stream=stream)
 
             if stream:
-                return self._stream_response(response)
+                return self._stream_response(response, usage, key)
             else:
                 data = response.json()
+                record_usage(data, usage)
+                self._store(key, data)
                 return data.get("response", "")
 
         except Exception as e:
             logger.error(f"Generation failed: {e}")
             raise
 
-    def _stream_response(self, response) -> Generator[str, None, None]:
-        """Stream response chunks."""
-        for line in response.iter_lines():
-            if line:
-                try:
-                    data = json.loads(line)
-                    if "response" in data:
-                        yield data["response"]
-                    if data.get("done", False):
-                        break
-                except json.JSONDecodeError:
-                    continue
+    def _stream_response(
+        self, response, usage: Optional[Dict[str, int]] = None, cache_key: Optional[str] = None
+    ) -> Generator[str, None, None]:
+        """Stream response chunks.
+
+        A stream read to the end returns its connection to the pool. One
+        closed early closes the connection, so abandoning the stream
+        cancels generation upstream. Only complete streams are cached.
+        """
+        parts = []
+        try:
+            for data in iter_ndjson(response.iter_content(chunk_size=None)):
+                if "response" in data:
+                    parts.append(data["response"])
+                    yield data["response"]
+                if data.get("done", False):
+                    # Read on to the end of the body, so the
+                    # connection goes back to the pool
+                    record_usage(data, usage)
+                    self._store(cache_key, {**data, "response": "".join(parts)})
+        finally:
+            response.close()
 
     def chat(
         self,
@@ -114,6 +555,7 @@ class OllamaClient:
         stream: bool = False,
         tools: Optional[List[Dict[str, Any]]] = None,
         think: bool = False,
+        usage: Optional[Dict[str, int]] = None,
         **kwargs
     ):
         """Chat completion with conversation history.
@@ -126,71 +568,53 @@ class OllamaClient:
             stream: Whether to stream responses
             tools: Optional list of tool definitions for function calling
             think: Whether thinking models should show their thinking process (default: False for speed)
+            usage: Optional dict filled with Ollama's token counts
             **kwargs: Additional Ollama parameters
 
         Returns:
             Generated text (string) or full response dict if tools are provided
         """
-        payload = {
-            "model": model,
-            "messages": messages,
-            "stream": stream,
-            "think": think,  # Disable thinking mode for faster responses
-            "options": {
-                "num_predict": max_tokens,
-                "temperature": temperature,
-                **kwargs
-            }
-        }
-
-        # Add tools if provided
-        if tools:
-            payload["tools"] = tools
+        payload = chat_payload(model, messages, max_tokens, temperature, stream, tools, think, kwargs)
+        key = self._cache_key("chat", payload)
+        cached = self._cached(key, usage)
+        if cached is not None:
+            if stream:
+                return iter([cached.get("message", {}).get("content", "")])
+            return chat_result(cached, tools)
 
         try:
-            response = requests.post(
-                f"{self.api_url}/chat",
-                json=payload,
-                stream=stream,
-                timeout=120 if not stream else None  # Longer timeout for tool calls
-            )
-            response.raise_for_status()
+            response = self._request("POST", "chat", payload, stream=stream)
 
             if stream:
-                return self._stream_chat_response(response)
+                return self._stream_chat_response(response, usage, key)
             else:
                 data = response.json()
-                message = data.get("message", {})
-
-                # If tools were provided, return full message dict for tool_calls handling
-                if tools:
-                    return {
-                        "content": message.get("content", ""),
-                        "tool_calls": message.get("tool_calls", []),
-                        "thinking": message.get("thinking", ""),
-                        "role": message.get("role", "assistant")
-                    }
-
-                return message.get("content", "")
+                record_usage(data, usage)
+                self._store(key, data)
+                return chat_result(data, tools)
 
         except Exception as e:
             logger.error(f"Chat failed: {e}")
             raise
 
-    def _stream_chat_response(self, response) -> Generator[str, None, None]:
-        """Stream chat response chunks."""
-        for line in response.iter_lines():
-            if line:
-                try:
-                    data = json.loads(line)
-                    if "message" in data:
-                        content = data["message"].get("content", "")
-                        if content:
-                            yield content
-                    if data.get("done", False):
-                        break
-                except json.JSONDecodeError:
-                    continue
+    def _stream_chat_response(
+        self, response, usage: Optional[Dict[str, int]] = None, cache_key: Optional[str] = None
+    ) -> Generator[str, None, None]:
+        """Stream chat response chunks; see :meth:`_stream_response`."""
+        parts = []
+        try:
+            for data in iter_ndjson(response.iter_content(chunk_size=None)):
+                if "message" in data:
+                    content = data["message"].get("content", "")
+                    if content:
+                        parts.append(content)
+                        yield content
+                if data.get("done", False):
+                    record_usage(data, usage)
+                    message = {**data.get("message", {}), "role": "assistant", "content": "".join(parts)}
+                    self._store(cache_key, {**data, "message": message})
+        finally:
+            response.close()
 
     def quick_chat(
         self,
@@ -249,28 +673,66 @@ class OllamaClient:
             True if successful, False otherwise
         """
         try:
-            response = requests.post(
-                f"{self.api_url}/pull",
-                json={"name": model},
-                stream=True,
-                timeout=None
+            # Pulls resume where they stopped, so retrying is safe
+            response = self._request(
+                "POST", "pull", {"name": model}, stream=True, read_timeout=None, idempotent=True
             )
-            response.raise_for_status()
 
-            for line in response.iter_lines():
-                if line:
-                    try:
-                        data = json.loads(line)
-                        status = data.get("status", "")
-                        logger.info(f"Pull status: {status}")
-                    except json.JSONDecodeError:
-                        continue
+            with response:
+                for line in response.iter_lines():
+                    if line:
+                        try:
+                            data = json.loads(line)
+                            status = data.get("status", "")
+                            logger.info(f"Pull status: {status}")
+                        except json.JSONDecodeError:
+                            continue
 
             return True
         except Exception as e:
             logger.error(f"Failed to pull model: {e}")
             return False
 
+    def list_running(self, strict: bool = False) -> List[Dict[str, Any]]:
+        """Models loaded in Ollama's memory (``/api/ps``), with ``size_vram``
+        and ``expires_at``; ``strict`` raises when Ollama is down."""
+        try:
+            response = self._request("GET", "ps", read_timeout=5, idempotent=True)
+            return response.json().get("models", [])
+        except Exception as e:
+            if strict:
+                raise
+            logger.error(f"Failed to list running models: {e}")
+            return []
+
+    def preload_model(self, model: str, keep_alive: Any = None) -> bool:
+        """Load a model into memory without generating.
+
+        Args:
+            model: Model name
+            keep_alive: Seconds (or an Ollama duration such as ``"1h"``)
+                to keep it loaded when idle; negative keeps it until
+                unloaded, 0 unloads it. None uses Ollama's default
+
+        Returns:
+            True if successful, False otherwise
+        """
+        payload: Dict[str, Any] = {"model": model, "prompt": "", "stream": False}
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        try:
+            # Loading is idempotent; a loaded model only has its expiry reset
+            response = self._request("POST", "generate", payload, read_timeout=None, idempotent=True)
+            response.close()
+            return True
+        except Exception as e:
+            logger.error(f"Failed to load model {model}: {e}")
+            return False
+
+    def unload_model(self, model: str) -> bool:
+        """Free a model's memory now instead of when its keep_alive expires."""
+        return self.preload_model(model, keep_alive=0)
+
     def delete_model(self, model: str) -> bool:
         """Delete a model from local storage.
 
@@ -281,12 +743,7 @@ class OllamaClient:
             True if successful, False otherwise
         """
         try:
-            response = requests.delete(
-                f"{self.api_url}/delete",
-                json={"name": model},
-                timeout=10
-            )
-            response.raise_for_status()
+            self._request("DELETE", "delete", {"name": model}, read_timeout=10, idempotent=True)
             return True
         except Exception as e:
             logger.error(f"Failed to delete model: {e}")
@@ -302,12 +759,7 @@ class OllamaClient:
             Model information dictionary or None if not found
         """
         try:
-            response = requests.post(
-                f"{self.api_url}/show",
-                json={"name": model},
-                timeout=10
-            )
-            response.raise_for_status()
+            response = self._request("POST", "show", {"name": model}, read_timeout=10, idempotent=True)
             return response.json()
         except Exception as e:
             logger.error(f"Failed to get model info: {e}")
@@ -0,0 +1,233 @@
+"""Keeps the models that get traffic loaded in Ollama.
+
+Ollama unloads a model once it has been idle for the request's
+``keep_alive`` (5 minutes by default). The next request for it then
+pays a cold start of several seconds. :class:`ResidencyManager` takes
+control of that:
+
+* configured models are preloaded at startup (an empty-prompt generate
+  with ``keep_alive``) and kept loaded;
+* every request is recorded in an exponentially decayed per-model rate;
+* models above ``hot_rate`` requests per minute are pinned, hottest
+  first, for as long as the pinned set fits in ``vram_budget``. Requests
+  for a pinned model carry the long ``pin_keep_alive``. Other models use
+  Ollama's default and expire when they go quiet;
+* each reconcile (every ``interval`` seconds) reads what is resident
+  from ``/api/ps``, loads pinned models that were evicted and, when a
+  budget is set, unloads the coldest unpinned models the pinned set
+  needs room from.
+
+Wire it into a backend and run it next to the server::
+
+    ollama.residency = ResidencyManager.from_env(ollama.client)
+    asyncio.ensure_future(ollama.residency.run())
+"""
+
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Decayed request counts below this are forgotten at the next reconcile
+FORGET_BELOW = 0.01
+
+
+class ResidencyManager:
+    """Preloads, pins and evicts Ollama models from recent traffic.
+
+    Args:
+        client: :class:`~.ollama_client.OllamaClient` used for ``/api/ps``
+            and loading
+        preload: Models loaded at startup and always pinned, in priority
+            order
+        vram_budget: Bytes the pinned models may occupy; 0 is unlimited
+        pin_keep_alive: Seconds a pinned model stays loaded after its
+            last request or reconcile
+        hot_rate: Decayed requests per minute that make a model hot
+        half_life: Seconds after which a request counts half
+        interval: Seconds between reconciles in :meth:`run`
+        clock: Monotonic time source
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        preload: Iterable[str] = (),
+        vram_budget: int = 0,
+        pin_keep_alive: float = 3600.0,
+        hot_rate: float = 1.0,
+        half_life: float = 600.0,
+        interval: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.client = client
+        self.preload = list(preload)
+        self.vram_budget = vram_budget
+        self.pin_keep_alive = pin_keep_alive
+        self.hot_rate = hot_rate
+        self.half_life = half_life
+        self.interval = interval
+        self.clock = clock
+        # model -> (decayed request count, clock time it was last decayed)
+        self._traffic: Dict[str, List[float]] = {}
+        self._sizes: Dict[str, int] = {}
+        self._pinned: List[str] = list(self.preload)
+        self._resident: List[str] = []
+        self._lock = threading.Lock()
+        self.reconciles = 0
+        self.loads = 0
+        self.unloads = 0
+
+    @classmethod
+    def from_env(cls, client: Any, **kwargs: Any) -> Optional["ResidencyManager"]:
+        """Build from ``OLLAMA_PRELOAD_MODELS``, ``OLLAMA_VRAM_BUDGET_GB``,
+        ``OLLAMA_PIN_KEEP_ALIVE``, ``OLLAMA_HOT_RATE``,
+        ``OLLAMA_TRAFFIC_HALF_LIFE`` and ``OLLAMA_RESIDENCY_INTERVAL``.
+
+        Returns None unless ``OLLAMA_PRELOAD_MODELS`` is set or
+        ``OLLAMA_RESIDENCY=true``.
+        """
+        preload = [m.strip() for m in os.getenv("OLLAMA_PRELOAD_MODELS", "").split(",") if m.strip()]
+        if not preload and os.getenv("OLLAMA_RESIDENCY", "false").lower() != "true":
+            return None
+        return cls(
+            client,
+            preload=preload,
+            vram_budget=int(float(os.getenv("OLLAMA_VRAM_BUDGET_GB", "0")) * 1024 ** 3),
+            pin_keep_alive=float(os.getenv("OLLAMA_PIN_KEEP_ALIVE", "3600")),
+            hot_rate=float(os.getenv("OLLAMA_HOT_RATE", "1")),
+            half_life=float(os.getenv("OLLAMA_TRAFFIC_HALF_LIFE", "600")),
+            interval=float(os.getenv("OLLAMA_RESIDENCY_INTERVAL", "30")),
+            **kwargs,
+        )
+
+    # -- traffic -------------------------------------------------------------
+
+    def touch(self, model: str) -> Optional[float]:
+        """Record a request for ``model``; returns the ``keep_alive`` it
+        should carry, or None for Ollama's default."""
+        now = self.clock()
+        with self._lock:
+            entry = self._traffic.setdefault(model, [0.0, now])
+            entry[0] = self._decayed(entry, now) + 1.0
+            entry[1] = now
+            return self.pin_keep_alive if model in self._pinned else None
+
+    def _decayed(self, entry: List[float], now: float) -> float:
+        return entry[0] * 0.5 ** ((now - entry[1]) / self.half_life)
+
+    def rates(self) -> Dict[str, float]:
+        """Decayed requests per minute by model."""
+        now = self.clock()
+        # A steady rate r per second settles at a count of r * half_life / ln 2
+        scale = 60.0 * math.log(2) / self.half_life
+        with self._lock:
+            return {m: self._decayed(e, now) * scale for m, e in self._traffic.items()}
+
+    # -- decisions -----------------------------------------------------------
+
+    def plan(self, sizes: Optional[Dict[str, int]] = None) -> List[str]:
+        """Models to keep loaded: preloads first, then hot models by rate
+        while they fit in the budget. A hot model too big for the space
+        left is skipped, so a smaller one may still fit."""
+        if sizes is None:
+            with self._lock:
+                sizes = dict(self._sizes)
+        pinned = list(self.preload)
+        used = sum(sizes.get(m, 0) for m in pinned)
+        rates = self.rates()
+        for model in sorted(rates, key=rates.get, reverse=True):
+            if rates[model] < self.hot_rate or model in pinned:
+                continue
+            size = sizes.get(model, 0)
+            if self.vram_budget and used + size > self.vram_budget:
+                continue
+            pinned.append(model)
+            used += size
+        return pinned
+
+    def reconcile(self) -> Dict[str, Any]:
+        """Load evicted pinned models and make room for them; blocking.
+
+        Raises:
+            requests.RequestException: If Ollama cannot list its models
+        """
+        running = self.client.list_running(strict=True)
+        resident = {m["name"]: m.get("size_vram") or m.get("size", 0) for m in running}
+        now = self.clock()
+        with self._lock:
+            self._sizes.update(resident)
+            # Clients can name any model; forget ones that went quiet
+            for model in [m for m, e in self._traffic.items() if self._decayed(e, now) < FORGET_BELOW]:
+                del self._traffic[model]
+            unknown = [m for m in set(self.preload) | set(self._traffic) if m not in self._sizes]
+        if unknown:
+            listed = {m["name"]: m.get("size", 0) for m in self.client.list_models(strict=True)}
+            with self._lock:
+                self._sizes.update({m: listed[m] for m in unknown if m in listed})
+                # Requests for models that are not installed fail anyway
+                for model in unknown:
+                    if model not in listed:
+                        self._traffic.pop(model, None)
+        pinned = self.plan()
+        with self._lock:
+            self._pinned = pinned
+            self._resident = sorted(resident)
+
+        unloaded = []
+        if self.vram_budget:
+            need = sum(self._sizes.get(m, 0) for m in pinned if m not in resident)
+            free = self.vram_budget - sum(resident.values())
+            rates = self.rates()
+            for model in sorted((m for m in resident if m not in pinned),
+                                key=lambda m: rates.get(m, 0.0)):
+                if free >= need:
+                    break
+                if self.client.unload_model(model):
+                    unloaded.append(model)
+                    free += resident[model]
+
+        loaded = []
+        for model in pinned:
+            # Resident pinned models only have their expiry pushed back
+            if self.client.preload_model(model, keep_alive=self.pin_keep_alive) and model not in resident:
+                loaded.append(model)
+        with self._lock:
+            self.reconciles += 1
+            self.loads += len(loaded)
+            self.unloads += len(unloaded)
+            self._resident = sorted((set(resident) - set(unloaded)) | set(loaded))
+        if loaded or unloaded:
+            logger.info(f"Ollama residency: loaded {loaded}, unloaded {unloaded}")
+        return {"pinned": pinned, "loaded": loaded, "unloaded": unloaded}
+
+    async def run(self) -> None:
+        """Reconcile now (preloading the configured models) and then every
+        ``interval`` seconds, until cancelled."""
+        while True:
+            try:
+                await asyncio.to_thread(self.reconcile)
+            except Exception as e:
+                logger.warning(f"Ollama residency reconcile failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    # -- introspection -------------------------------------------------------
+
+    def stats(self) -> Dict[str, Any]:
+        rates = self.rates()
+        with self._lock:
+            return {
+                "pinned": list(self._pinned),
+                "resident": list(self._resident),
+                "rates_per_minute": {m: round(r, 3) for m, r in rates.items()},
+                "sizes": dict(self._sizes),
+                "vram_budget": self.vram_budget,
+                "reconciles": self.reconciles,
+                "loads": self.loads,
+                "unloads": self.unloads,
+            }
@@ -0,0 +1,483 @@
+"""Offline batch jobs: JSONL in, JSONL out, processed in the background.
+
+Clients upload a JSONL file with one request per line, in the OpenAI
+batch format::
+
+    {"custom_id": "q1", "method": "POST", "url": "/v1/completions",
+     "body": {"prompt": "...", "max_tokens": 64}}
+    {"custom_id": "q2", "url": "/v1/chat/completions",
+     "body": {"messages": [{"role": "user", "content": "..."}]}}
+
+The file is validated and stored under ``BATCH_DIR/<job id>/``. The
+:class:`BatchRunner` then processes jobs one at a time:
+
+* requests with the same sampling parameters are sorted by prompt length
+  and packed into the largest batches that fit ``max_batch_size`` and
+  ``max_batch_tokens`` (padded tokens). Similar lengths waste little
+  padding;
+* each batch waits until interactive traffic leaves the executor idle,
+  so offline work only fills spare capacity;
+* results are appended to ``output.jsonl`` and fsynced after every
+  batch. The output file is the checkpoint: after a restart, requests
+  already in it are skipped and the counters are rebuilt from it.
+
+Job status and progress (counts, token usage, tokens/sec) are kept in
+``state.json``.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from src.core.exceptions import OverloadedError
+from src.serving_metrics import count_tokens as _count_tokens
+
+logger = logging.getLogger(__name__)
+
+ENDPOINTS = ("/v1/completions", "/v1/chat/completions")
+SAMPLING_PARAMS = ("model", "max_tokens", "temperature")
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+
+@dataclass
+class BatchRequest:
+    """One validated line of a batch input file."""
+    custom_id: str
+    url: str
+    prompt: str
+    params: Dict[str, Any]
+
+    @property
+    def group(self) -> Tuple[Any, ...]:
+        """Requests in one group can share a batch."""
+        return tuple(self.params.get(name) for name in SAMPLING_PARAMS)
+
+
+def parse_request(data: Any) -> BatchRequest:
+    """Validate one decoded input line.
+
+    Raises:
+        ValueError: If the line is not a supported request
+    """
+    if not isinstance(data, dict):
+        raise ValueError("expected a JSON object")
+    custom_id = data.get("custom_id")
+    if not isinstance(custom_id, str) or not custom_id:
+        raise ValueError("missing custom_id")
+    url = data.get("url", "/v1/completions")
+    if url not in ENDPOINTS:
+        raise ValueError(f"unsupported url {url!r}")
+    body = data.get("body")
+    if not isinstance(body, dict):
+        raise ValueError("missing body")
+    if url == "/v1/chat/completions":
+        messages = body.get("messages")
+        if not isinstance(messages, list) or not messages:
+            raise ValueError("chat requests need messages")
+        prompt = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    else:
+        prompt = body.get("prompt")
+        if not isinstance(prompt, str):
+            raise ValueError("completion requests need a prompt")
+    params = {name: body[name] for name in SAMPLING_PARAMS if name in body}
+    return BatchRequest(custom_id, url, prompt, params)
+
+
+def parse_jsonl(data: bytes) -> List[BatchRequest]:
+    """Validate a whole input file.
+
+    Raises:
+        ValueError: Naming the first bad line
+    """
+    requests: List[BatchRequest] = []
+    seen: Set[str] = set()
+    for number, line in enumerate(data.decode("utf-8").splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            request = parse_request(json.loads(line))
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError(f"Line {number}: {e}")
+        if request.custom_id in seen:
+            raise ValueError(f"Line {number}: duplicate custom_id {request.custom_id!r}")
+        seen.add(request.custom_id)
+        requests.append(request)
+    if not requests:
+        raise ValueError("Batch file contains no requests")
+    return requests
+
+
+def bucket_batches(
+    requests: List[BatchRequest],
+    lengths: Dict[str, int],
+    max_batch_size: int,
+    max_batch_tokens: int,
+) -> List[List[BatchRequest]]:
+    """Pack requests into length-sorted batches within both limits.
+
+    ``lengths`` maps custom_id to prompt tokens. A batch is padded to its
+    longest prompt, so it costs ``len(batch) * longest`` tokens.
+    """
+    groups: Dict[Tuple[Any, ...], List[BatchRequest]] = {}
+    for request in requests:
+        groups.setdefault(request.group, []).append(request)
+    batches = []
+    for members in groups.values():
+        members.sort(key=lambda r: lengths[r.custom_id])
+        batch: List[BatchRequest] = []
+        for request in members:
+            # Sorted ascending, so this request is the batch's longest
+            padded = (len(batch) + 1) * max(1, lengths[request.custom_id])
+            if batch and (len(batch) >= max_batch_size or padded > max_batch_tokens):
+                batches.append(batch)
+                batch = []
+            batch.append(request)
+        if batch:
+            batches.append(batch)
+    return batches
+
+
+def result_line(
+    request: BatchRequest,
+    text: Optional[str] = None,
+    usage: Optional[Dict[str, int]] = None,
+    error: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Output record for one request, shaped like the online response."""
+    record: Dict[str, Any] = {
+        "id": f"batch_req_{uuid.uuid4().hex[:24]}",
+        "custom_id": request.custom_id,
+        "response": None,
+        "error": None,
+    }
+    if error is not None:
+        record["error"] = {"message": error}
+        return record
+    model = request.params.get("model") or "default"
+    if request.url == "/v1/chat/completions":
+        body = {
+            "object": "chat.completion",
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop",
+            }],
+        }
+    else:
+        body = {
+            "object": "text_completion",
+            "model": model,
+            "choices": [{"text": text, "index": 0, "logprobs": None, "finish_reason": "stop"}],
+        }
+    body["usage"] = usage or {}
+    record["response"] = {"status_code": 200, "body": body}
+    return record
+
+
+class BatchJobStore:
+    """Batch jobs on local disk, one directory per job.
+
+    Args:
+        root: Directory holding the job directories
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    @classmethod
+    def from_env(cls) -> "BatchJobStore":
+        """Store under ``BATCH_DIR`` (default ``data/batches``)."""
+        return cls(os.getenv("BATCH_DIR", "data/batches"))
+
+    def _path(self, job_id: str, name: str) -> str:
+        if os.sep in job_id or not job_id.startswith("batch_"):
+            raise KeyError(job_id)
+        return os.path.join(self.root, job_id, name)
+
+    def input_path(self, job_id: str) -> str:
+        return self._path(job_id, "input.jsonl")
+
+    def output_path(self, job_id: str) -> str:
+        return self._path(job_id, "output.jsonl")
+
+    def create(self, data: bytes) -> Dict[str, Any]:
+        """Validate and store an input file as a new queued job.
+
+        Raises:
+            ValueError: If the file is not a valid batch
+        """
+        requests = parse_jsonl(data)
+        job_id = f"batch_{uuid.uuid4().hex[:24]}"
+        os.makedirs(os.path.join(self.root, job_id))  # creates root on first use
+        with open(self.input_path(job_id), "wb") as f:
+            f.write(data)
+        job = {
+            "id": job_id,
+            "object": "batch",
+            "status": "queued",
+            "created_at": time.time(),
+            "started_at": None,
+            "completed_at": None,
+            "request_counts": {"total": len(requests), "completed": 0, "failed": 0},
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0},
+            "processing_seconds": 0.0,
+            "error": None,
+        }
+        self.save(job)
+        return job
+
+    def save(self, job: Dict[str, Any]) -> None:
+        path = self._path(job["id"], "state.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(job, f)
+        os.replace(path + ".tmp", path)
+
+    def get(self, job_id: str) -> Dict[str, Any]:
+        """Raises ``KeyError`` for unknown jobs."""
+        try:
+            with open(self._path(job_id, "state.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise KeyError(job_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        if not os.path.isdir(self.root):
+            return []
+        jobs = []
+        for name in os.listdir(self.root):
+            try:
+                jobs.append(self.get(name))
+            except (KeyError, ValueError):
+                continue
+        return sorted(jobs, key=lambda job: job["created_at"])
+
+    def requests(self, job_id: str) -> List[BatchRequest]:
+        with open(self.input_path(job_id), "rb") as f:
+            return parse_jsonl(f.read())
+
+    def load_results(self, job_id: str) -> List[Dict[str, Any]]:
+        """Records already written, dropping a line torn by a crash."""
+        path = self.output_path(job_id)
+        if not os.path.exists(path):
+            return []
+        records, valid_bytes = [], 0
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break
+                if not line.endswith(b"\n"):
+                    records.pop()
+                    break
+                valid_bytes += len(line)
+        if valid_bytes != os.path.getsize(path):
+            with open(path, "r+b") as f:
+                f.truncate(valid_bytes)
+        return records
+
+    def append_results(self, job_id: str, records: List[Dict[str, Any]]) -> None:
+        """Append and fsync, so a checkpoint survives a crash."""
+        with open(self.output_path(job_id), "a") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def progress(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Job state plus derived progress and throughput."""
+    counts = job["request_counts"]
+    done = counts["completed"] + counts["failed"]
+    seconds = job["processing_seconds"]
+    tokens_per_second = job["usage"]["completion_tokens"] / seconds if seconds else 0.0
+    remaining = counts["total"] - done
+    rate = done / seconds if seconds else 0.0
+    return {
+        **job,
+        "progress": done / counts["total"] if counts["total"] else 1.0,
+        "tokens_per_second": tokens_per_second,
+        "eta_seconds": remaining / rate if rate and remaining else None,
+    }
+
+
+class BatchRunner:
+    """Processes stored batch jobs in the background, oldest first.
+
+    Args:
+        store: Job storage
+        process: Coroutine generating texts for a list of prompts sharing
+            sampling parameters
+        count_tokens: Token count of a text (prompt lengths and usage);
+            pass one wrapping the engine tokenizer when there is one
+        max_batch_size: Most requests per batch
+        max_batch_tokens: Most padded prompt tokens per batch
+        is_busy: True while interactive traffic needs the executor;
+            batches wait until it returns False
+        idle_poll: Seconds between ``is_busy`` checks
+    """
+
+    def __init__(
+        self,
+        store: BatchJobStore,
+        process: Callable[[List[str], Dict[str, Any]], Awaitable[List[str]]],
+        count_tokens: Callable[[str], int] = _count_tokens,
+        max_batch_size: int = 16,
+        max_batch_tokens: int = 8192,
+        is_busy: Optional[Callable[[], bool]] = None,
+        idle_poll: float = 0.05,
+    ):
+        self.store = store
+        self.process = process
+        self.count_tokens = count_tokens
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.is_busy = is_busy or (lambda: False)
+        self.idle_poll = idle_poll
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._cancelled: Set[str] = set()
+
+    @classmethod
+    def from_env(cls, store: BatchJobStore, process: Callable[..., Awaitable[List[str]]],
+                 **kwargs: Any) -> "BatchRunner":
+        """Build with ``BATCH_MAX_SIZE`` and ``BATCH_MAX_TOKENS``."""
+        return cls(
+            store,
+            process,
+            max_batch_size=int(os.getenv("BATCH_MAX_SIZE", "16")),
+            max_batch_tokens=int(os.getenv("BATCH_MAX_TOKENS", "8192")),
+            **kwargs,
+        )
+
+    async def submit(self, data: bytes) -> Dict[str, Any]:
+        """Store a new job and queue it.
+
+        Raises:
+            ValueError: If the file is not a valid batch
+        """
+        job = await asyncio.to_thread(self.store.create, data)
+        self._queue.put_nowait(job["id"])
+        return job
+
+    def cancel(self, job_id: str) -> Dict[str, Any]:
+        """Cancel a job; a running job stops after its current batch.
+
+        Raises:
+            KeyError: For unknown jobs
+        """
+        job = self.store.get(job_id)
+        if job["status"] in TERMINAL_STATUSES:
+            return job
+        if job["status"] == "queued":
+            # Terminal straight away; run_job skips it without calling _finish
+            job["status"] = "cancelled"
+            job["completed_at"] = time.time()
+        else:
+            self._cancelled.add(job_id)
+            job["status"] = "cancelling"
+        self.store.save(job)
+        return job
+
+    async def run(self) -> None:
+        """Resume unfinished jobs, then process new ones until cancelled."""
+        for job in await asyncio.to_thread(self.store.list):
+            if job["status"] in ("queued", "in_progress", "cancelling"):
+                self._queue.put_nowait(job["id"])
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self.run_job(job_id)
+            except Exception as e:
+                logger.exception(f"Batch {job_id} failed")
+                job = self.store.get(job_id)
+                job.update(status="failed", error=str(e), completed_at=time.time())
+                self.store.save(job)
+
+    async def run_job(self, job_id: str) -> Dict[str, Any]:
+        job = self.store.get(job_id)
+        if job["status"] in TERMINAL_STATUSES:
+            return job
+        if job["status"] == "cancelling":
+            return self._finish(job, "cancelled")
+        requests = await asyncio.to_thread(self.store.requests, job_id)
+        records = await asyncio.to_thread(self.store.load_results, job_id)
+        self._restore(job, records)
+        done = {record["custom_id"] for record in records}
+        pending = [r for r in requests if r.custom_id not in done]
+        if done:
+            logger.info(f"Resuming batch {job_id}: {len(done)} of {len(requests)} done")
+        job["status"] = "in_progress"
+        job["started_at"] = job["started_at"] or time.time()
+        self.store.save(job)
+
+        lengths = {r.custom_id: self.count_tokens(r.prompt) for r in pending}
+        for batch in bucket_batches(pending, lengths, self.max_batch_size, self.max_batch_tokens):
+            if job_id in self._cancelled:
+                return self._finish(job, "cancelled")
+            await self._run_batch(job, batch, lengths)
+        return self._finish(job, "completed")
+
+    def _restore(self, job: Dict[str, Any], records: List[Dict[str, Any]]) -> None:
+        # The output file is the source of truth; state.json may lag it by one batch
+        counts = job["request_counts"]
+        counts["completed"] = sum(1 for r in records if r["error"] is None)
+        counts["failed"] = len(records) - counts["completed"]
+        usage = {"prompt_tokens": 0, "completion_tokens": 0}
+        for record in records:
+            if record["response"] is not None:
+                for name, value in record["response"]["body"]["usage"].items():
+                    usage[name] = usage.get(name, 0) + value
+        job["usage"] = usage
+
+    async def _run_batch(
+        self, job: Dict[str, Any], batch: List[BatchRequest], lengths: Dict[str, int]
+    ) -> None:
+        while True:
+            while self.is_busy():
+                await asyncio.sleep(self.idle_poll)
+            started = time.monotonic()
+            try:
+                texts = await self.process([r.prompt for r in batch], batch[0].params)
+            except OverloadedError:
+                continue  # lost the race for the executor to interactive traffic
+            except Exception as e:
+                logger.warning(f"Batch {job['id']}: {len(batch)} requests failed: {e}")
+                records = [result_line(r, error=str(e)) for r in batch]
+                job["request_counts"]["failed"] += len(batch)
+            else:
+                records = []
+                for request, text in zip(batch, texts):
+                    usage = {
+                        "prompt_tokens": lengths[request.custom_id],
+                        "completion_tokens": self.count_tokens(text),
+                    }
+                    records.append(result_line(request, text, usage))
+                    for name, value in usage.items():
+                        job["usage"][name] += value
+                job["request_counts"]["completed"] += len(records)
+                missing = batch[len(records):]
+                if missing:
+                    error = f"Engine returned {len(texts)} results for {len(batch)} prompts"
+                    logger.warning(f"Batch {job['id']}: {error}")
+                    records.extend(result_line(r, error=error) for r in missing)
+                    job["request_counts"]["failed"] += len(missing)
+            job["processing_seconds"] += time.monotonic() - started
+            break
+        await asyncio.to_thread(self.store.append_results, job["id"], records)
+        if job["id"] in self._cancelled:
+            job["status"] = "cancelling"
+        self.store.save(job)
+
+    def _finish(self, job: Dict[str, Any], status: str) -> Dict[str, Any]:
+        self._cancelled.discard(job["id"])
+        job["status"] = status
+        job["completed_at"] = time.time()
+        self.store.save(job)
+        logger.info(f"Batch {job['id']} {status}: {job['request_counts']}")
+        return job
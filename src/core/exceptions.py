@@ -28,3 +28,19 @@ class ModelError(LlamaGPUError):
 class ConfigurationError(LlamaGPUError):
     """Raised when there is an error in configuration."""
     pass
+
+
+class OverloadedError(LlamaGPUError):
+    """Raised when a request is shed because it cannot finish in time."""
+
+    status_code = 503
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class QueueFullError(OverloadedError):
+    """Raised when the inference admission queue is full."""
+
+    status_code = 429
@@ -0,0 +1,249 @@
+"""Shared sentence-embedding models, embedding cache and micro-batching.
+
+Loading a SentenceTransformer takes seconds and hundreds of MB, so the
+RAG engine, the semantic cache, the ``/v1/embeddings`` endpoint and
+anything else that embeds text share one instance per model name
+through :func:`get_sentence_transformer`.
+
+:func:`encode_texts` puts a process-wide LRU :class:`EmbeddingCache` in
+front of the model, so a chunk embedded while indexing is not embedded
+again when an API client asks for it. Misses are sorted by length
+before encoding, so each batch pads to similar lengths.
+
+:class:`EmbeddingBatcher` gathers concurrent requests for ``window_ms``
+(or until ``max_batch_size`` texts are waiting) and encodes them as one
+batch. :func:`encode_vector` produces the wire formats: float32,
+float16 or int8 values, as JSON numbers or base64 bytes.
+"""
+
+import asyncio
+import base64
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+DTYPES = ("float32", "float16", "int8")
+ENCODING_FORMATS = ("float", "base64")
+
+_models: Dict[str, Any] = {}
+_lock = threading.Lock()
+
+
+def get_sentence_transformer(model_name: str = DEFAULT_EMBEDDING_MODEL) -> Any:
+    """Return the process-wide SentenceTransformer for ``model_name``."""
+    with _lock:
+        model = _models.get(model_name)
+        if model is None:
+            from sentence_transformers import SentenceTransformer
+
+            logger.info(f"Loading embedding model: {model_name}")
+            model = SentenceTransformer(model_name)
+            _models[model_name] = model
+        return model
+
+
+class EmbeddingCache:
+    """Thread-safe LRU cache of float32 vectors by (model, text).
+
+    Args:
+        max_entries: Vectors kept before the least recently used is dropped
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(model_name: str, text: str) -> Tuple[str, str]:
+        return model_name, hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_many(self, model_name: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        found: List[Optional[np.ndarray]] = []
+        with self._lock:
+            for text in texts:
+                key = self._key(model_name, text)
+                vector = self._entries.get(key)
+                if vector is None:
+                    self.misses += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                found.append(vector)
+        return found
+
+    def put_many(self, model_name: str, texts: Sequence[str], vectors: np.ndarray) -> None:
+        if not self.max_entries:
+            return
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                self._entries[self._key(model_name, text)] = vector
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+_cache = EmbeddingCache(int(os.getenv("EMBEDDING_CACHE_SIZE", "10000")))
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """The process-wide embedding cache."""
+    return _cache
+
+
+def encode_texts(
+    texts: Sequence[str],
+    model_name: str = DEFAULT_EMBEDDING_MODEL,
+    batch_size: int = 64,
+    encoder: Optional[Callable[[List[str]], Any]] = None,
+    cache: Optional[EmbeddingCache] = None,
+) -> np.ndarray:
+    """Embed ``texts`` as an (n, dim) float32 array, through the cache.
+
+    Args:
+        texts: Texts to embed
+        model_name: SentenceTransformer used when ``encoder`` is None
+        batch_size: Texts per forward pass
+        encoder: Callable mapping a list of texts to an (n, dim) array
+        cache: Cache to use instead of the process-wide one
+    """
+    cache = cache or _cache
+    texts = list(texts)
+    vectors = cache.get_many(model_name, texts)
+    missing = sorted({t for t, v in zip(texts, vectors) if v is None}, key=len)
+    if missing:
+        if encoder is None:
+            model = get_sentence_transformer(model_name)
+
+            def encoder(batch: List[str]) -> Any:
+                return model.encode(batch, batch_size=batch_size, convert_to_numpy=True)
+
+        fresh = np.asarray(encoder(missing), dtype=np.float32)
+        cache.put_many(model_name, missing, fresh)
+        computed = dict(zip(missing, fresh))
+        vectors = [v if v is not None else computed[t] for t, v in zip(texts, vectors)]
+    if not vectors:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.stack(vectors)
+
+
+def encode_vector(vector: np.ndarray, dtype: str = "float32",
+                  encoding_format: str = "float") -> Dict[str, Any]:
+    """Wire representation of one embedding.
+
+    ``int8`` is scaled symmetrically by the largest magnitude; the scale
+    is returned so clients can recover approximate floats. ``base64``
+    carries the raw little-endian bytes of the chosen dtype.
+
+    Raises:
+        ValueError: For unknown dtypes or formats
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"Unsupported dtype: {dtype}")
+    if encoding_format not in ENCODING_FORMATS:
+        raise ValueError(f"Unsupported encoding_format: {encoding_format}")
+    extra: Dict[str, Any] = {}
+    if dtype == "int8":
+        peak = float(np.max(np.abs(vector))) if vector.size else 0.0
+        scale = peak / 127.0 if peak else 1.0
+        values = np.clip(np.rint(vector / scale), -127, 127).astype(np.int8)
+        extra["scale"] = scale
+    else:
+        values = vector.astype(np.dtype(dtype).newbyteorder("<"))
+    if encoding_format == "base64":
+        embedding: Any = base64.b64encode(values.tobytes()).decode("ascii")
+    else:
+        embedding = values.tolist()
+    return {"embedding": embedding, **extra}
+
+
+class EmbeddingBatcher:
+    """Coalesces concurrent embedding requests into micro-batches.
+
+    Args:
+        encode: Blocking function embedding a list of texts with a model
+            (default :func:`encode_texts`); runs in a worker thread
+        max_batch_size: Texts that trigger an immediate batch
+        window_ms: Longest time the first waiting request is held
+    """
+
+    def __init__(
+        self,
+        encode: Optional[Callable[[List[str], str], np.ndarray]] = None,
+        max_batch_size: int = 64,
+        window_ms: float = 5.0,
+    ):
+        self.encode = encode or encode_texts
+        self.max_batch_size = max_batch_size
+        self.window = window_ms / 1000.0
+        self._pending: Dict[str, List[Tuple[List[str], asyncio.Future]]] = {}
+        self._sizes: Dict[str, int] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self.batches = 0
+        self.texts = 0
+
+    @classmethod
+    def from_env(cls) -> "EmbeddingBatcher":
+        """Build with ``EMBEDDING_BATCH_SIZE`` and ``EMBEDDING_BATCH_WINDOW_MS``."""
+        return cls(
+            max_batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", "64")),
+            window_ms=float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5")),
+        )
+
+    async def embed(self, texts: List[str], model_name: str = DEFAULT_EMBEDDING_MODEL) -> np.ndarray:
+        """Embed ``texts``, sharing a forward pass with concurrent callers."""
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future = loop.create_future()
+        self._pending.setdefault(model_name, []).append((texts, future))
+        self._sizes[model_name] = self._sizes.get(model_name, 0) + len(texts)
+        if self._sizes[model_name] >= self.max_batch_size:
+            self._flush(model_name)
+        elif model_name not in self._timers:
+            self._timers[model_name] = loop.call_later(self.window, self._flush, model_name)
+        return await future
+
+    def _flush(self, model_name: str) -> None:
+        timer = self._timers.pop(model_name, None)
+        if timer is not None:
+            timer.cancel()
+        waiting = self._pending.pop(model_name, [])
+        self._sizes.pop(model_name, None)
+        if waiting:
+            asyncio.ensure_future(self._run(model_name, waiting))
+
+    async def _run(self, model_name: str, waiting: List[Tuple[List[str], asyncio.Future]]) -> None:
+        texts = [text for request, _ in waiting for text in request]
+        self.batches += 1
+        self.texts += len(texts)
+        try:
+            vectors = await asyncio.to_thread(self.encode, texts, model_name)
+        except Exception as e:
+            for _, future in waiting:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        offset = 0
+        for request, future in waiting:
+            if not future.done():
+                future.set_result(vectors[offset:offset + len(request)])
+            offset += len(request)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "avg_batch_size": self.texts / self.batches if self.batches else 0.0,
+        }
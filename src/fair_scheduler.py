@@ -0,0 +1,327 @@
+"""Priority classes and weighted fair queuing across API keys.
+
+A FIFO queue lets one tenant's burst (or an offline batch job) sit in
+front of every interactive user. :class:`FairScheduler` replaces it:
+
+* requests belong to a priority class, ``interactive`` before
+  ``standard`` before ``batch``;
+* within a class, keys (API keys or tenants) share the server by tokens
+  consumed, using start-time fair queuing. Each request gets a virtual
+  finish tag ``max(virtual_time, key's last tag) + cost / weight``, and
+  the smallest tag is served first. A key that has been idle does not
+  bank credit, and a key with weight 2 gets twice the tokens of a key
+  with weight 1 while both are backlogged;
+* a key may have at most ``max_inflight_per_key`` requests running, so
+  one tenant cannot take every slot;
+* a request is promoted one class for every ``aging_seconds`` it waits,
+  so batch work makes progress under sustained interactive load.
+
+Workers take items with :meth:`FairScheduler.claim` and hand the returned
+:class:`Claim` back to :meth:`FairScheduler.complete`, which frees the
+key's in-flight slot. A request is charged its estimated cost (prompt plus
+``max_tokens``) when queued; passing the tokens it really used to
+``complete`` settles the difference on the key's next request. ``get``/``put`` keep the ``queue.Queue`` interface
+that :class:`~src.utils.batching.BatchWorker` drains, and
+:class:`~src.inference_executor.InferenceExecutor` uses it to order the
+jobs waiting for a concurrency slot::
+
+    scheduler = FairScheduler.from_env(registry=serving_metrics.registry)
+    executor = InferenceExecutor.from_env(scheduler=scheduler)
+    await executor.run(engine.infer, prompt,
+                       ticket=Ticket(tenant, "interactive", cost=tokens))
+
+Queue wait is recorded per class, as a histogram when a metrics registry
+is given and in :meth:`FairScheduler.stats`.
+"""
+
+import itertools
+import math
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, NamedTuple, Optional, Tuple
+
+INTERACTIVE = "interactive"
+STANDARD = "standard"
+BATCH = "batch"
+PRIORITY_CLASSES = (INTERACTIVE, STANDARD, BATCH)
+DEFAULT_KEY = "default"
+
+# Seconds; batch jobs may legitimately wait minutes behind live traffic
+QUEUE_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+def parse_priority(value: Optional[str], default: str = INTERACTIVE) -> str:
+    """Priority class from a header value.
+
+    Raises:
+        ValueError: For unknown classes
+    """
+    if not value:
+        return default
+    priority = value.strip().lower()
+    if priority not in PRIORITY_CLASSES:
+        raise ValueError(
+            f"Unknown priority '{value}'; expected one of {', '.join(PRIORITY_CLASSES)}"
+        )
+    return priority
+
+
+class Ticket(NamedTuple):
+    """Who a unit of work is charged to and how urgent it is.
+
+    ``usage`` maps the job's result to the tokens it actually used, so the
+    estimated ``cost`` can be corrected when it completes.
+    """
+
+    key: str = DEFAULT_KEY
+    priority: str = STANDARD
+    cost: float = 1.0
+    usage: Optional[Callable[[Any], float]] = None
+
+
+class Claim(NamedTuple):
+    """An item handed to a worker, and the handle that completes it.
+
+    The handle is unique per queued item, so equal or identical items in
+    flight at once never stand in for each other.
+    """
+
+    item: Any
+    handle: int
+
+
+class _Entry:
+    __slots__ = ("item", "key", "rank", "cost", "start", "finish", "seq", "enqueued_at")
+
+    def __init__(self, item: Any, key: str, rank: int, cost: float,
+                 start: float, finish: float, seq: int):
+        self.item = item
+        self.key = key
+        self.rank = rank
+        self.cost = cost
+        self.start = start
+        self.finish = finish
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+
+
+class FairScheduler:
+    """Thread-safe priority and fair-share queue.
+
+    Args:
+        weights: Share of each key relative to the default weight of 1
+        max_inflight_per_key: Running items allowed per key; 0 is unlimited
+        inflight_limits: Per-key overrides of ``max_inflight_per_key``
+        aging_seconds: Wait after which an item is promoted one class;
+            0 disables aging
+        registry: Optional :class:`~src.serving_metrics.MetricsRegistry`
+            for the per-class queue wait histogram
+    """
+
+    def __init__(
+        self,
+        weights: Optional[Dict[str, float]] = None,
+        max_inflight_per_key: int = 0,
+        inflight_limits: Optional[Dict[str, int]] = None,
+        aging_seconds: float = 30.0,
+        registry: Any = None,
+    ):
+        self.weights = dict(weights or {})
+        self.max_inflight_per_key = max_inflight_per_key
+        self.inflight_limits = dict(inflight_limits or {})
+        self.aging_seconds = aging_seconds
+        # (rank, key) -> waiting entries in arrival order
+        self._queues: Dict[Tuple[int, str], Deque[_Entry]] = {}
+        self._inflight: Dict[str, int] = {}
+        # Claim handle -> running entry
+        self._running: Dict[int, _Entry] = {}
+        self._finish: Dict[str, float] = {}
+        self._virtual_time = 0.0
+        self._seq = itertools.count()
+        self._size = 0
+        self._cond = threading.Condition()
+        self._waits = {name: [0, 0.0, 0.0] for name in PRIORITY_CLASSES}
+        self.promotions = 0
+        self._wait_histogram = None
+        if registry is not None:
+            self._wait_histogram = registry.histogram(
+                "llm_scheduler_queue_wait_seconds",
+                "Seconds requests waited in the fair scheduler, by priority class.",
+                ["priority"],
+                buckets=QUEUE_WAIT_BUCKETS,
+            )
+
+    @classmethod
+    def from_env(cls, **kwargs: Any) -> "FairScheduler":
+        """Build from ``SCHEDULER_MAX_INFLIGHT_PER_KEY`` and
+        ``SCHEDULER_AGING_SECONDS``."""
+        return cls(
+            max_inflight_per_key=int(os.getenv("SCHEDULER_MAX_INFLIGHT_PER_KEY", "0")),
+            aging_seconds=float(os.getenv("SCHEDULER_AGING_SECONDS", "30")),
+            **kwargs,
+        )
+
+    # -- producer side -------------------------------------------------------
+
+    def put(self, item: Any, key: str = DEFAULT_KEY, priority: str = STANDARD,
+            cost: float = 1.0) -> None:
+        """Queue ``item`` for ``key``; ``cost`` is its expected tokens.
+
+        Raises:
+            ValueError: For unknown priority classes
+        """
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"Unknown priority '{priority}'")
+        weight = self.weights.get(key, 1.0)
+        with self._cond:
+            start = max(self._virtual_time, self._finish.get(key, 0.0))
+            finish = start + max(cost, 0.0) / weight
+            self._finish[key] = finish
+            entry = _Entry(item, key, PRIORITY_CLASSES.index(priority), cost,
+                           start, finish, next(self._seq))
+            self._queues.setdefault((entry.rank, key), deque()).append(entry)
+            self._size += 1
+            self._cond.notify()
+
+    def put_nowait(self, item: Any) -> None:
+        self.put(item)
+
+    # -- consumer side -------------------------------------------------------
+
+    def claim(self, block: bool = True, timeout: Optional[float] = None) -> Claim:
+        """Remove the next item a worker should run and hold an in-flight
+        slot for its key until the claim is completed.
+
+        Items of keys at their in-flight limit are skipped until one of
+        their running items is completed.
+
+        Raises:
+            queue.Empty: If nothing is eligible within ``timeout``
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                entry = self._pop_locked()
+                if entry is not None:
+                    break
+                if not block:
+                    raise queue.Empty
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise queue.Empty
+                self._cond.wait(remaining)
+        self._observe_wait(entry)
+        return Claim(entry.item, entry.seq)
+
+    def get(self, block: bool = True, timeout: Optional[float] = None) -> Any:
+        """Like :meth:`claim`, for ``queue.Queue`` consumers: returns the
+        item and completes it at once, so no in-flight slot is held."""
+        claim = self.claim(block, timeout)
+        self.complete(claim)
+        return claim.item
+
+    def get_nowait(self) -> Any:
+        return self.get(block=False)
+
+    def complete(self, claim: Claim, used: Optional[float] = None) -> None:
+        """Mark a claimed item finished, freeing its key's in-flight slot.
+
+        ``used`` is the tokens the item really consumed. The key's last
+        finish tag moves by the difference from the estimate it was
+        charged, so over-estimates are refunded and under-estimates billed.
+        """
+        with self._cond:
+            entry = self._running.pop(claim.handle, None)
+            if entry is None:
+                return
+            if used is not None:
+                weight = self.weights.get(entry.key, 1.0)
+                correction = (max(used, 0.0) - max(entry.cost, 0.0)) / weight
+                self._finish[entry.key] = self._finish.get(entry.key, 0.0) + correction
+            self._inflight[entry.key] -= 1
+            if not self._inflight[entry.key]:
+                del self._inflight[entry.key]
+            self._cond.notify_all()
+
+    def _limit(self, key: str) -> int:
+        return self.inflight_limits.get(key, self.max_inflight_per_key)
+
+    def _pop_locked(self) -> Optional[_Entry]:
+        now = time.monotonic()
+        best: Optional[_Entry] = None
+        best_order: Tuple[int, float, int] = (len(PRIORITY_CLASSES), math.inf, 0)
+        for (rank, key), waiting in self._queues.items():
+            limit = self._limit(key)
+            if limit and self._inflight.get(key, 0) >= limit:
+                continue
+            head = waiting[0]
+            order = (self._effective_rank(head, now), head.finish, head.seq)
+            if order < best_order:
+                best, best_order = head, order
+        if best is None:
+            return None
+        if best_order[0] < best.rank:
+            self.promotions += 1
+        waiting = self._queues[(best.rank, best.key)]
+        waiting.popleft()
+        if not waiting:
+            del self._queues[(best.rank, best.key)]
+        self._size -= 1
+        self._virtual_time = max(self._virtual_time, best.start)
+        self._inflight[best.key] = self._inflight.get(best.key, 0) + 1
+        self._running[best.seq] = best
+        return best
+
+    def _effective_rank(self, entry: _Entry, now: float) -> int:
+        if not self.aging_seconds:
+            return entry.rank
+        promoted = int((now - entry.enqueued_at) / self.aging_seconds)
+        return max(0, entry.rank - promoted)
+
+    def _observe_wait(self, entry: _Entry) -> None:
+        wait = time.monotonic() - entry.enqueued_at
+        name = PRIORITY_CLASSES[entry.rank]
+        with self._cond:
+            totals = self._waits[name]
+            totals[0] += 1
+            totals[1] += wait
+            totals[2] = max(totals[2], wait)
+        if self._wait_histogram is not None:
+            self._wait_histogram.labels(name).observe(wait)
+
+    # -- introspection -------------------------------------------------------
+
+    def qsize(self) -> int:
+        with self._cond:
+            return self._size
+
+    def empty(self) -> bool:
+        return self.qsize() == 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Waiting items per class and key, in-flight items per key and
+        queue wait per class."""
+        with self._cond:
+            waiting: Dict[str, Dict[str, int]] = {name: {} for name in PRIORITY_CLASSES}
+            for (rank, key), entries in self._queues.items():
+                waiting[PRIORITY_CLASSES[rank]][key] = len(entries)
+            classes: Dict[str, Dict[str, Any]] = {}
+            for name, (count, total, peak) in self._waits.items():
+                classes[name] = {
+                    "waiting": sum(waiting[name].values()),
+                    "dispatched": count,
+                    "avg_wait_seconds": total / count if count else 0.0,
+                    "max_wait_seconds": peak,
+                }
+            return {
+                "queue_depth": self._size,
+                "classes": classes,
+                "waiting": {name: keys for name, keys in waiting.items() if keys},
+                "inflight": dict(self._inflight),
+                "virtual_time": self._virtual_time,
+                "promotions": self.promotions,
+            }
+
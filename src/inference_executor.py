@@ -0,0 +1,516 @@
+"""Bounded executor for blocking inference calls.
+
+Generation (``engine.infer``, ``engine.stream_infer``, Ollama requests)
+blocks for seconds. Running it on Starlette's shared threadpool or on the
+event loop lets one slow request stall unrelated connections and lets an
+overload pile up unbounded work. :class:`InferenceExecutor` runs blocking
+calls on a dedicated pool with a fixed concurrency limit behind a bounded
+admission queue:
+
+* a request that finds the queue full is rejected with
+  :class:`~src.core.exceptions.QueueFullError` (HTTP 429 + Retry-After);
+* a request whose predicted queue wait already exceeds its timeout is
+  rejected with :class:`~src.core.exceptions.OverloadedError` (HTTP 503),
+  rather than being served after the client has given up.
+
+The predicted wait uses an exponentially weighted average of recent
+service times. Queue depth, active jobs, wait and service times are
+available from :meth:`InferenceExecutor.stats`.
+
+Waiting jobs start in FIFO order unless the executor is given a
+:class:`~src.fair_scheduler.FairScheduler`. Then each job carries a
+:class:`~src.fair_scheduler.Ticket` (key, priority class, token cost)
+and free slots go to the job the scheduler picks.
+
+Backends with native async clients (Ollama over aiohttp) need no thread
+per request. :class:`AsyncInferenceExecutor` applies the same admission
+rules and metrics to their coroutines, with an asyncio semaphore in place
+of the thread pool.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, Optional
+
+from src.core.exceptions import OverloadedError, QueueFullError
+from src.fair_scheduler import FairScheduler, Ticket
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+
+class _Admission:
+    """Bounded admission queue, wait prediction and counters.
+
+    Subclasses decide how admitted jobs get one of ``max_concurrency``
+    slots and report each one through :meth:`_start` and :meth:`_finish`.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 1,
+        max_queue: int = 32,
+        default_timeout: float = 60.0,
+        ewma_alpha: float = 0.2,
+    ):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.default_timeout = default_timeout
+        self.ewma_alpha = ewma_alpha
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._service_time: Optional[float] = None
+        self._counters = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "cancelled": 0,
+            "rejected_queue_full": 0,
+            "rejected_deadline": 0,
+        }
+        self._wait_total = 0.0
+        self._wait_count = 0
+        self._wait_max = 0.0
+
+    # -- admission ---------------------------------------------------------
+
+    def predicted_wait(self) -> float:
+        """Seconds a newly admitted job is expected to wait for a slot."""
+        with self._lock:
+            return self._predicted_wait_locked()
+
+    def _predicted_wait_locked(self) -> float:
+        busy = self._active + self._queued
+        if busy < self.max_concurrency or self._service_time is None:
+            return 0.0
+        rounds = (busy - self.max_concurrency) // self.max_concurrency + 1
+        return rounds * self._service_time
+
+    def _admit(self, timeout: Optional[float]) -> float:
+        if timeout is None:
+            timeout = self.default_timeout
+        with self._lock:
+            wait = self._predicted_wait_locked()
+            retry_after = max(1, math.ceil(self._service_time or 1.0))
+            if self._queued >= self.max_queue:
+                self._counters["rejected_queue_full"] += 1
+                raise QueueFullError(
+                    f"Inference queue is full ({self.max_queue} waiting)",
+                    retry_after=retry_after,
+                )
+            # Only time spent queued counts: a job that finds a free slot
+            # always starts, so one slow call cannot lock out later ones
+            # and every completion keeps the estimate current
+            if wait > timeout:
+                self._counters["rejected_deadline"] += 1
+                raise OverloadedError(
+                    f"Predicted queue wait of {wait:.1f}s exceeds "
+                    f"timeout of {timeout:.1f}s",
+                    retry_after=max(1, math.ceil(wait)),
+                )
+            self._queued += 1
+            self._counters["submitted"] += 1
+        return time.monotonic()
+
+    def _start(self, enqueued_at: float) -> float:
+        """An admitted job got its slot; returns its start time."""
+        started = time.monotonic()
+        wait = started - enqueued_at
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+            self._wait_total += wait
+            self._wait_count += 1
+            self._wait_max = max(self._wait_max, wait)
+        return started
+
+    def _finish(self, started: float, ok: bool) -> None:
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self._active -= 1
+            self._counters["completed" if ok else "failed"] += 1
+            if self._service_time is None:
+                self._service_time = elapsed
+            else:
+                self._service_time += self.ewma_alpha * (elapsed - self._service_time)
+
+    def _cancel(self) -> None:
+        """An admitted job left the queue without running."""
+        with self._lock:
+            self._queued -= 1
+            self._counters["cancelled"] += 1
+
+    # -- metrics -----------------------------------------------------------
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, concurrency, counters and wait/service times."""
+        with self._lock:
+            return {
+                "queue_depth": self._queued,
+                "active": self._active,
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                **self._counters,
+                "avg_wait_seconds": self._wait_total / self._wait_count if self._wait_count else 0.0,
+                "max_wait_seconds": self._wait_max,
+                "avg_service_seconds": self._service_time or 0.0,
+                "predicted_wait_seconds": self._predicted_wait_locked(),
+            }
+
+
+class InferenceExecutor(_Admission):
+    """Run blocking inference with bounded concurrency and admission control.
+
+    Args:
+        max_concurrency: Jobs running at the same time
+        max_queue: Jobs allowed to wait for a free slot
+        default_timeout: Seconds a request may wait plus run when the caller
+            gives no timeout
+        ewma_alpha: Weight of the newest sample in the service time average
+        scheduler: Orders waiting jobs by priority and fair share instead
+            of arrival
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 1,
+        max_queue: int = 32,
+        default_timeout: float = 60.0,
+        ewma_alpha: float = 0.2,
+        scheduler: Optional[FairScheduler] = None,
+    ):
+        super().__init__(max_concurrency, max_queue, default_timeout, ewma_alpha)
+        self.scheduler = scheduler
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="inference"
+        )
+
+    @classmethod
+    def from_env(cls, scheduler: Optional[FairScheduler] = None) -> "InferenceExecutor":
+        """Build from ``INFERENCE_CONCURRENCY``, ``INFERENCE_QUEUE_SIZE``
+        and ``INFERENCE_TIMEOUT``."""
+        return cls(
+            max_concurrency=int(os.getenv("INFERENCE_CONCURRENCY", "1")),
+            max_queue=int(os.getenv("INFERENCE_QUEUE_SIZE", "32")),
+            default_timeout=float(os.getenv("INFERENCE_TIMEOUT", "60")),
+            scheduler=scheduler,
+        )
+
+    def _submit(
+        self, fn: Callable[[], Any], timeout: Optional[float], ticket: Optional[Ticket] = None
+    ) -> Future:
+        enqueued_at = self._admit(timeout)
+
+        def job() -> Any:
+            started = self._start(enqueued_at)
+            ok = False
+            try:
+                result = fn()
+                ok = True
+                return result
+            finally:
+                self._finish(started, ok)
+
+        if self.scheduler is None:
+            future = self._pool.submit(job)
+        else:
+            future = self._schedule(job, ticket or Ticket())
+        future.add_done_callback(self._on_cancel)
+        return future
+
+    def _schedule(self, job: Callable[[], Any], ticket: Ticket) -> Future:
+        """Queue ``job`` in the scheduler and add one dispatch to the pool.
+
+        Each dispatch runs whichever job the scheduler picks when a slot
+        frees up, not necessarily the one it was submitted with.
+        """
+        future: Future = Future()
+
+        def scheduled() -> Optional[float]:
+            """Run the job; returns the tokens it used, when known."""
+            if not future.set_running_or_notify_cancel():
+                return 0.0  # cancelled while queued: nothing was generated
+            try:
+                result = job()
+            except BaseException as e:
+                future.set_exception(e)
+                return None
+            future.set_result(result)
+            return None if ticket.usage is None else ticket.usage(result)
+
+        self.scheduler.put(scheduled, ticket.key, ticket.priority, ticket.cost)
+        self._pool.submit(self._dispatch)
+        return future
+
+    def _dispatch(self) -> None:
+        claim = self.scheduler.claim()
+        used = None
+        try:
+            used = claim.item()
+        finally:
+            self.scheduler.complete(claim, used=used)
+
+    def _on_cancel(self, future: Future) -> None:
+        # A job cancelled before it started never runs its own bookkeeping
+        if future.cancelled():
+            self._cancel()
+
+    # -- execution ---------------------------------------------------------
+
+    async def run(
+        self,
+        fn: Callable[..., Any],
+        *args: Any,
+        timeout: Optional[float] = None,
+        ticket: Optional[Ticket] = None,
+        **kwargs: Any,
+    ) -> Any:
+        """Run ``fn(*args, **kwargs)`` on the pool and await its result.
+
+        ``ticket`` places the job in the scheduler, if there is one; its
+        ``usage`` is given the result.
+
+        Raises:
+            QueueFullError: If the admission queue is full
+            OverloadedError: If the predicted wait exceeds ``timeout``
+        """
+        future = self._submit(lambda: fn(*args, **kwargs), timeout, ticket)
+        return await asyncio.wrap_future(future)
+
+    def stream(
+        self,
+        fn: Callable[..., Iterator[Any]],
+        *args: Any,
+        timeout: Optional[float] = None,
+        ticket: Optional[Ticket] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[Any]:
+        """Run a blocking token iterator on the pool and yield its items.
+
+        Admission happens immediately, so rejections are raised here rather
+        than from inside the returned async iterator; call this from a
+        coroutine. The whole stream holds one concurrency slot. When the
+        consumer stops early (client disconnect, ``aclose()``), the
+        producer stops before the next token and the iterator is closed.
+        ``ticket.usage`` is given the number of items streamed.
+
+        Raises:
+            QueueFullError: If the admission queue is full
+            OverloadedError: If the predicted wait exceeds ``timeout``
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stopped = threading.Event()
+
+        def put(item: Any) -> None:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:  # event loop already closed
+                stopped.set()
+
+        def produce() -> int:
+            streamed = 0
+            if stopped.is_set():
+                return streamed
+            iterator = None
+            try:
+                iterator = iter(fn(*args, **kwargs))
+                for item in iterator:
+                    if stopped.is_set():
+                        break
+                    put((item, None))
+                    streamed += 1
+            except Exception as e:
+                put((_END, e))
+            finally:
+                close = getattr(iterator, "close", None)
+                if close is not None:
+                    close()
+                put((_END, None))
+            return streamed
+
+        future = self._submit(produce, timeout, ticket)
+
+        async def consume() -> AsyncIterator[Any]:
+            try:
+                while True:
+                    item, error = await queue.get()
+                    if error is not None:
+                        raise error
+                    if item is _END:
+                        break
+                    yield item
+            finally:
+                stopped.set()
+                future.cancel()
+
+        return consume()
+
+    # -- metrics -----------------------------------------------------------
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        if self.scheduler is not None:
+            stats["scheduler"] = self.scheduler.stats()
+        return stats
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._pool.shutdown(wait=wait)
+
+
+class AsyncInferenceExecutor(_Admission):
+    """Admission control for coroutine backends, without a thread per job.
+
+    Same queue bound, deadline shedding and stats as
+    :class:`InferenceExecutor`; ``max_concurrency`` generations run on the
+    event loop at once and the rest wait on a semaphore.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 4,
+        max_queue: int = 32,
+        default_timeout: float = 60.0,
+        ewma_alpha: float = 0.2,
+    ):
+        super().__init__(max_concurrency, max_queue, default_timeout, ewma_alpha)
+        # Created on first use, inside the serving event loop
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    @classmethod
+    def from_env(cls) -> "AsyncInferenceExecutor":
+        """Build from ``ASYNC_INFERENCE_CONCURRENCY``, ``INFERENCE_QUEUE_SIZE``
+        and ``INFERENCE_TIMEOUT``."""
+        return cls(
+            max_concurrency=int(os.getenv("ASYNC_INFERENCE_CONCURRENCY", "4")),
+            max_queue=int(os.getenv("INFERENCE_QUEUE_SIZE", "32")),
+            default_timeout=float(os.getenv("INFERENCE_TIMEOUT", "60")),
+        )
+
+    async def _acquire(self, enqueued_at: float) -> float:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        try:
+            await self._slots.acquire()
+        except BaseException:
+            self._cancel()
+            raise
+        return self._start(enqueued_at)
+
+    def _release(self, started: float, ok: bool) -> None:
+        self._finish(started, ok)
+        self._slots.release()
+
+    async def run(
+        self,
+        fn: Callable[..., Awaitable[Any]],
+        *args: Any,
+        timeout: Optional[float] = None,
+        **kwargs: Any,
+    ) -> Any:
+        """Await ``fn(*args, **kwargs)`` once a slot is free.
+
+        Raises:
+            QueueFullError: If the admission queue is full
+            OverloadedError: If the predicted wait exceeds ``timeout``
+        """
+        started = await self._acquire(self._admit(timeout))
+        ok = False
+        try:
+            result = await fn(*args, **kwargs)
+            ok = True
+            return result
+        finally:
+            self._release(started, ok)
+
+    def stream(
+        self,
+        fn: Callable[..., AsyncIterator[Any]],
+        *args: Any,
+        timeout: Optional[float] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[Any]:
+        """Yield from ``fn(*args, **kwargs)`` while holding one slot.
+
+        Admission happens immediately, so rejections are raised here; the
+        slot is taken on first iteration and freed when the stream ends or
+        is closed.
+
+        Raises:
+            QueueFullError: If the admission queue is full
+            OverloadedError: If the predicted wait exceeds ``timeout``
+        """
+        return _AdmittedStream(self, self._admit(timeout), lambda: fn(*args, **kwargs))
+
+
+class _AdmittedStream:
+    """Async iterator over one admitted stream of :class:`AsyncInferenceExecutor`.
+
+    A plain async generator closed before its first ``__anext__`` never
+    runs its body, which would leave the job counted as queued.
+    """
+
+    def __init__(
+        self,
+        executor: AsyncInferenceExecutor,
+        enqueued_at: float,
+        open_stream: Callable[[], AsyncIterator[Any]],
+    ):
+        self._executor = executor
+        self._enqueued_at = enqueued_at
+        self._open = open_stream
+        self._tokens: Optional[AsyncIterator[Any]] = None
+        self._started: Optional[float] = None
+        self._closed = False
+
+    def __aiter__(self) -> "_AdmittedStream":
+        return self
+
+    async def __anext__(self) -> Any:
+        if self._closed:
+            raise StopAsyncIteration
+        if self._started is None:
+            try:
+                self._started = await self._executor._acquire(self._enqueued_at)
+            except BaseException:
+                self._closed = True  # _acquire already took it off the queue
+                raise
+        try:
+            if self._tokens is None:
+                self._tokens = self._open()
+            return await self._tokens.__anext__()
+        except StopAsyncIteration:
+            await self._close(ok=True)
+            raise
+        except asyncio.CancelledError:
+            await self._close(ok=True)  # consumer went away
+            raise
+        except BaseException:
+            await self._close(ok=False)
+            raise
+
+    async def aclose(self) -> None:
+        await self._close(ok=True)
+
+    async def _close(self, ok: bool) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        if self._started is None:
+            self._executor._cancel()  # closed before it was iterated
+            return
+        try:
+            aclose = getattr(self._tokens, "aclose", None)
+            if aclose is not None:
+                await aclose()
+        finally:
+            self._executor._release(self._started, ok)
@@ -11,9 +11,15 @@ import logging
 
 import chromadb
 from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
+try:
+    from src.embeddings import DEFAULT_EMBEDDING_MODEL, encode_texts, get_sentence_transformer
+except ImportError:  # run as a script from src/knowledge_base
+    from sentence_transformers import SentenceTransformer as get_sentence_transformer
+    DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+    encode_texts = None
+
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -28,7 +34,7 @@ class RAGEngine:
     def __init__(
         self,
         persist_directory: str = None,
-        embedding_model: str = "all-MiniLM-L6-v2",
+        embedding_model: str = DEFAULT_EMBEDDING_MODEL,
         collection_name: str = "software_engineering_knowledge"
     ):
         """
@@ -45,9 +51,10 @@ class RAGEngine:
         self.persist_directory = persist_directory
         os.makedirs(persist_directory, exist_ok=True)
         
-        # Initialize sentence transformer for embeddings
-        logger.info(f"Loading embedding model: {embedding_model}")
-        self.embedding_model = SentenceTransformer(embedding_model)
+        # Sentence transformer and embedding cache shared with the semantic
+        # cache and the /v1/embeddings endpoint
+        self.embedding_model_name = embedding_model
+        self.embedding_model = get_sentence_transformer(embedding_model)
         
         # Initialize ChromaDB client with persistent storage
         self.client = chromadb.PersistentClient(
@@ -85,14 +92,18 @@ class RAGEngine:
     def _get_embedding_function(self):
         """Get custom embedding function for ChromaDB"""
         class CustomEmbeddingFunction:
-            def __init__(self, model):
+            def __init__(self, model, model_name):
                 self.model = model
+                self.model_name = model_name
             
             def __call__(self, input: List[str]) -> List[List[float]]:
-                embeddings = self.model.encode(input, convert_to_numpy=True)
+                if encode_texts is None:
+                    embeddings = self.model.encode(input, convert_to_numpy=True)
+                else:
+                    embeddings = encode_texts(input, self.model_name)
                 return embeddings.tolist()
         
-        return CustomEmbeddingFunction(self.embedding_model)
+        return CustomEmbeddingFunction(self.embedding_model, self.embedding_model_name)
     
     def add_documents(
         self,
@@ -2,14 +2,17 @@ from backend.cpu_backend import CPUBackend
 from backend.cuda_backend import CUDABackend
 from backend.rocm_backend import ROCMBackend
 from utils.aws_detection import is_aws_gpu_instance, get_optimal_aws_backend, get_aws_gpu_info
+from utils.batching import BatchReport
+from serving_metrics import count_tokens
 import torch
 import os
+import time
 from typing import List, Iterator, Optional
 
 class LlamaGPU:
     """Main interface for LLaMA GPU-accelerated inference."""
     
-    def __init__(self, model_path: str, prefer_gpu: bool = True, auto_detect_aws: bool = True, quant_type: Optional[str] = None):
+    def __init__(self, model_path: str, prefer_gpu: bool = True, auto_detect_aws: bool = True, quant_type: Optional[str] = None, kv_cache: Optional[str] = None):
         """Initialize LlamaGPU with model and preferred backend.
         
         Args:
@@ -17,13 +20,16 @@ class LlamaGPU:
             prefer_gpu: Whether to prefer GPU backends over CPU
             auto_detect_aws: Whether to automatically detect and optimize for AWS GPU instances
             quant_type: Optional quantization type ('int8', 'float16', etc.)
+            kv_cache: Optional KV cache quantization ('int8') for long contexts
         """
         self.model_path = model_path
         self.prefer_gpu = prefer_gpu
         self.auto_detect_aws = auto_detect_aws
         self.quant_type = quant_type
+        self.kv_cache = kv_cache
         self.backend = self.select_backend(prefer_gpu)
         self.backend.load_model(model_path, quant_type=quant_type)
+        self.backend.kv_cache = kv_cache
 
     def select_backend(self, prefer_gpu: bool):
         """Select the best backend based on hardware and user preference.
@@ -71,7 +77,7 @@ class LlamaGPU:
         """
         return self.backend.infer(input_data)
 
-    def batch_infer(self, input_data: List[str], batch_size: Optional[int] = None) -> List[str]:
+    def batch_infer(self, input_data: List[str], batch_size: Optional[int] = None) -> BatchReport:
         """Perform batch inference on multiple input texts.
         
         Args:
@@ -79,9 +85,17 @@ class LlamaGPU:
             batch_size: Optional batch size for processing (defaults to all inputs)
             
         Returns:
-            List of generated outputs
+            Generated outputs in input order, with aggregate tokens/sec
         """
-        return self.backend.batch_infer(input_data, batch_size)
+        started = time.perf_counter()
+        outputs = self.backend.batch_infer(input_data, batch_size)
+        tokenizer = getattr(self.backend, "tokenizer", None)
+        return BatchReport(
+            outputs,
+            completion_tokens=sum(count_tokens(text, tokenizer) for text in outputs),
+            elapsed=time.perf_counter() - started,
+            concurrency=batch_size or len(input_data),
+        )
 
     def stream_infer(self, input_data: str, max_tokens: Optional[int] = None) -> Iterator[str]:
         """Perform streaming inference, yielding tokens as they're generated.
@@ -105,7 +119,8 @@ class LlamaGPU:
             'backend_type': self.backend.__class__.__name__,
             'model_path': self.model_path,
             'prefer_gpu': self.prefer_gpu,
-            'auto_detect_aws': self.auto_detect_aws
+            'auto_detect_aws': self.auto_detect_aws,
+            'kv_cache': self.kv_cache
         }
         
         # Add AWS-specific information if available
@@ -1,6 +1,8 @@
 import time
 from typing import Iterator, List, Optional
 
+from src.utils.batching import BatchReport, fan_out
+
 
 class LlamaGPU:
     """Minimal demo engine with CPU fallback.
@@ -55,12 +57,14 @@ class LlamaGPU:
         batch_size: int = 1,
         max_tokens: int = 128,
         temperature: float = 0.7,
-    ) -> List[str]:
+        concurrency: int = 1,
+    ) -> BatchReport:
         _ = batch_size  # kept for API compatibility in future
-        return [
-            self.infer(p, max_tokens=max_tokens, temperature=temperature)
-            for p in prompts
-        ]
+        return fan_out(
+            lambda p, usage: self.infer(p, max_tokens=max_tokens, temperature=temperature),
+            prompts,
+            concurrency,
+        )
 
     def stream_infer(
         self, prompt: str, delay: float = 0.02, **_: object
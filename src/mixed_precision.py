@@ -0,0 +1,394 @@
+"""
+Sensitivity-driven mixed-precision quantization for LLaMA GPU.
+
+Each weight matrix is quantized on its own (int8 or int4, everything else
+left untouched) and the KL divergence of the model's output distribution
+against the full-precision output is recorded as that layer's
+sensitivity. A greedy planner then picks a per-layer precision (int4,
+int8 or fp16) that fits a memory budget with the smallest total
+sensitivity. The resulting plan is a JSON file that the streaming
+quantizer and ``QuantizationCache`` reuse.
+
+Sensitivities are measured with :func:`fake_quantize`, which only
+simulates the rounding. :func:`apply_plan` stores the weights for real:
+each planned module is swapped for a :class:`QuantizedLinear` or
+:class:`QuantizedEmbedding` holding int8, packed int4 or fp16 buffers,
+dequantized on the fly in ``forward``. The swapped modules are for
+inference only.
+"""
+
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from src.streaming_quantization import (
+    dequantize_int4,
+    dequantize_int8,
+    quantize_int4,
+    quantize_int8,
+)
+from utils.logging import get_logger
+
+logger = get_logger("mixed_precision")
+
+PRECISIONS = ("fp16", "int8", "int4")
+
+# Modules kept in fp16 unless explicitly unpinned.
+DEFAULT_HIGH_PRECISION = ("embed_tokens", "lm_head")
+
+
+def bytes_per_weight(precision: str, in_features: int, group_size: int = 128) -> float:
+    """Storage cost of one weight element including quantization scales."""
+    if precision == "fp16":
+        return 2.0
+    if precision == "int8":
+        return 1.0 + 4.0 / max(in_features, 1)
+    if precision == "int4":
+        return 0.5 + 4.0 / group_size
+    raise ValueError(f"Unknown precision: {precision}")
+
+
+def fake_quantize(weight: torch.Tensor, precision: str, group_size: int = 128) -> torch.Tensor:
+    """Quantize and immediately dequantize ``weight`` in its own dtype.
+
+    Simulation only, for measuring sensitivity; the result takes as much
+    memory as the input.
+    """
+    if precision == "fp16":
+        return weight.to(torch.float16).to(weight.dtype)
+    if precision == "int8":
+        q, scale = quantize_int8(weight)
+        return dequantize_int8(q, scale, weight.dtype)
+    if precision == "int4":
+        packed, scale = quantize_int4(weight, group_size)
+        return dequantize_int4(packed, scale, weight.shape, group_size, weight.dtype)
+    raise ValueError(f"Unknown precision: {precision}")
+
+
+class PackedWeight(nn.Module):
+    """A weight matrix stored as int8, packed int4 or fp16 buffers.
+
+    Quantization is per output row (per row group for int4), so single
+    rows, such as embedding lookups, dequantize without the rest.
+    """
+
+    def __init__(self, weight: torch.Tensor, precision: str, group_size: int = 128):
+        super().__init__()
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision: {precision}")
+        self.precision = precision
+        self.group_size = group_size
+        self.shape = tuple(weight.shape)
+        self.dtype = weight.dtype
+        weight = weight.detach()
+        if precision == "fp16":
+            self.register_buffer("qweight", weight.to(torch.float16))
+            self.register_buffer("scale", None)
+        elif precision == "int8":
+            qweight, scale = quantize_int8(weight)
+            self.register_buffer("qweight", qweight)
+            self.register_buffer("scale", scale)
+        else:
+            qweight, scale = quantize_int4(weight, group_size)
+            self.register_buffer("qweight", qweight)
+            self.register_buffer("scale", scale)
+
+    def nbytes(self) -> int:
+        """Bytes held by the stored buffers."""
+        return sum(b.nelement() * b.element_size() for b in self.buffers())
+
+    def dequantize(self) -> torch.Tensor:
+        """The full weight in its original dtype."""
+        return self._unpack(self.qweight, self.scale, self.shape[0])
+
+    def rows(self, index: torch.Tensor) -> torch.Tensor:
+        """Rows ``index`` (any shape) of the weight, shaped ``index.shape + (in,)``."""
+        flat = index.reshape(-1)
+        scale = self.scale[flat] if self.scale is not None else None
+        return self._unpack(self.qweight[flat], scale, flat.numel()).view(
+            *index.shape, self.shape[1])
+
+    def _unpack(self, qweight: torch.Tensor, scale: Optional[torch.Tensor],
+                out_features: int) -> torch.Tensor:
+        if self.precision == "fp16":
+            return qweight.to(self.dtype)
+        if self.precision == "int8":
+            return dequantize_int8(qweight, scale, self.dtype)
+        return dequantize_int4(qweight, scale, (out_features, self.shape[1]),
+                               self.group_size, self.dtype)
+
+
+class QuantizedLinear(nn.Module):
+    """Inference-only ``nn.Linear`` whose weight is a :class:`PackedWeight`."""
+
+    def __init__(self, linear: nn.Linear, packed: PackedWeight):
+        super().__init__()
+        self.in_features = linear.in_features
+        self.out_features = linear.out_features
+        self.packed = packed
+        self.bias = linear.bias
+
+    @property
+    def weight(self) -> torch.Tensor:
+        return self.packed.dequantize()
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return F.linear(x, self.packed.dequantize().to(x.dtype), self.bias)
+
+    def extra_repr(self) -> str:
+        return (f"in_features={self.in_features}, out_features={self.out_features}, "
+                f"precision={self.packed.precision}")
+
+
+class QuantizedEmbedding(nn.Module):
+    """Inference-only ``nn.Embedding`` that dequantizes only the rows looked up."""
+
+    def __init__(self, embedding: nn.Embedding, packed: PackedWeight):
+        super().__init__()
+        self.num_embeddings = embedding.num_embeddings
+        self.embedding_dim = embedding.embedding_dim
+        self.padding_idx = embedding.padding_idx
+        self.packed = packed
+
+    @property
+    def weight(self) -> torch.Tensor:
+        return self.packed.dequantize()
+
+    def forward(self, input: torch.Tensor) -> torch.Tensor:
+        return self.packed.rows(input)
+
+    def extra_repr(self) -> str:
+        return (f"{self.num_embeddings}, {self.embedding_dim}, "
+                f"precision={self.packed.precision}")
+
+
+def quantizable_modules(model: nn.Module) -> List[Tuple[str, nn.Module]]:
+    """Linear and embedding modules whose weights the planner assigns."""
+    return [
+        (name, module) for name, module in model.named_modules()
+        if isinstance(module, (nn.Linear, nn.Embedding)) and name
+    ]
+
+
+@dataclass
+class MixedPrecisionPlan:
+    """Per-module precision assignment."""
+    assignments: Dict[str, str]
+    budget_bytes: int
+    estimated_bytes: int
+    estimated_kl: float
+    group_size: int = 128
+    default_precision: str = "fp16"
+    sensitivities: Dict[str, Dict[str, float]] = field(default_factory=dict)
+    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
+
+    def precision_for(self, tensor_name: str) -> Optional[str]:
+        """Precision for a parameter name such as ``model.layers.0.mlp.up_proj.weight``.
+
+        Returns None for tensors the plan does not cover.
+        """
+        module_name = tensor_name.rsplit(".", 1)[0] if "." in tensor_name else tensor_name
+        return self.assignments.get(module_name)
+
+    def summary(self) -> Dict[str, int]:
+        """Number of modules assigned to each precision."""
+        counts = {p: 0 for p in PRECISIONS}
+        for precision in self.assignments.values():
+            counts[precision] += 1
+        return counts
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "MixedPrecisionPlan":
+        return cls(**data)
+
+    def save(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+
+    @classmethod
+    def load(cls, path: str) -> "MixedPrecisionPlan":
+        with open(path, "r") as f:
+            return cls.from_dict(json.load(f))
+
+
+class MixedPrecisionPlanner:
+    """Measure per-layer sensitivity and assign precisions under a budget."""
+
+    def __init__(
+        self,
+        group_size: int = 128,
+        keep_high_precision: Sequence[str] = DEFAULT_HIGH_PRECISION,
+        candidate_precisions: Sequence[str] = ("int8", "int4"),
+    ):
+        self.group_size = group_size
+        self.keep_high_precision = tuple(keep_high_precision)
+        self.candidate_precisions = tuple(candidate_precisions)
+
+    # -- sensitivity -------------------------------------------------------
+
+    @staticmethod
+    def _logits(model: nn.Module, inputs: Any) -> torch.Tensor:
+        output = model(**inputs) if isinstance(inputs, dict) else model(inputs)
+        logits = getattr(output, "logits", output)
+        return logits.float().reshape(-1, logits.shape[-1])
+
+    def measure_sensitivity(
+        self,
+        model: nn.Module,
+        calibration_inputs: Iterable[Any],
+        modules: Optional[Sequence[str]] = None,
+    ) -> Dict[str, Dict[str, float]]:
+        """KL(full precision || layer quantized) for every module and precision.
+
+        Only one module is quantized at a time; its weight is restored
+        before moving on, so the model is unchanged on return.
+        """
+        batches = list(calibration_inputs)
+        model.eval()
+        with torch.no_grad():
+            reference = [F.log_softmax(self._logits(model, b), dim=-1) for b in batches]
+
+            wanted = set(modules) if modules is not None else None
+            sensitivities: Dict[str, Dict[str, float]] = {}
+            for name, module in quantizable_modules(model):
+                if wanted is not None and name not in wanted:
+                    continue
+                original = module.weight.data
+                sensitivities[name] = {"fp16": 0.0}
+                for precision in self.candidate_precisions:
+                    module.weight.data = fake_quantize(original, precision, self.group_size)
+                    kl = 0.0
+                    for batch, ref in zip(batches, reference):
+                        log_q = F.log_softmax(self._logits(model, batch), dim=-1)
+                        kl += F.kl_div(log_q, ref, log_target=True,
+                                       reduction="batchmean").item()
+                    sensitivities[name][precision] = kl / max(len(batches), 1)
+                module.weight.data = original
+                logger.info(f"Sensitivity {name}: {sensitivities[name]}")
+        return sensitivities
+
+    # -- planning ----------------------------------------------------------
+
+    def plan(
+        self,
+        module_shapes: Dict[str, Tuple[int, int]],
+        sensitivities: Dict[str, Dict[str, float]],
+        budget_bytes: int,
+        fixed_bytes: int = 0,
+    ) -> MixedPrecisionPlan:
+        """Greedy assignment that fits ``budget_bytes``.
+
+        Starting from fp16 everywhere, repeatedly apply the single-step
+        downgrade (fp16 -> int8 or int8 -> int4) with the lowest added
+        sensitivity per byte saved until the model fits.
+
+        Args:
+            module_shapes: Module name -> weight shape (out, in)
+            sensitivities: Output of :meth:`measure_sensitivity`
+            budget_bytes: Target size of all weights
+            fixed_bytes: Size of tensors the plan does not cover (norms, biases)
+
+        Raises:
+            ValueError: If the budget cannot be met even at the lowest precision
+        """
+        order = ("fp16",) + tuple(p for p in ("int8", "int4") if p in self.candidate_precisions)
+        assignments = {name: "fp16" for name in module_shapes}
+
+        def cost(name: str, precision: str) -> float:
+            out_features, in_features = module_shapes[name]
+            return out_features * in_features * bytes_per_weight(
+                precision, in_features, self.group_size)
+
+        def pinned(name: str) -> bool:
+            return any(keep in name for keep in self.keep_high_precision)
+
+        total = fixed_bytes + sum(cost(n, "fp16") for n in module_shapes)
+        while total > budget_bytes:
+            best = None
+            for name, precision in assignments.items():
+                if pinned(name) or precision == order[-1]:
+                    continue
+                target = order[order.index(precision) + 1]
+                saved = cost(name, precision) - cost(name, target)
+                if saved <= 0:
+                    continue
+                sens = sensitivities.get(name, {})
+                added = sens.get(target, float("inf")) - sens.get(precision, 0.0)
+                score = max(added, 0.0) / saved
+                if best is None or score < best[0]:
+                    best = (score, name, target, saved)
+            if best is None:
+                raise ValueError(
+                    f"Budget of {budget_bytes} bytes is not reachable; "
+                    f"smallest plan needs {int(total)} bytes"
+                )
+            _, name, target, saved = best
+            assignments[name] = target
+            total -= saved
+
+        estimated_kl = sum(sensitivities.get(n, {}).get(p, 0.0) for n, p in assignments.items())
+        plan = MixedPrecisionPlan(
+            assignments=assignments,
+            budget_bytes=int(budget_bytes),
+            estimated_bytes=int(total),
+            estimated_kl=estimated_kl,
+            group_size=self.group_size,
+            sensitivities=sensitivities,
+        )
+        logger.info(f"Mixed-precision plan: {plan.summary()}, {plan.estimated_bytes} bytes")
+        return plan
+
+    def build_plan(
+        self,
+        model: nn.Module,
+        calibration_inputs: Iterable[Any],
+        budget_bytes: int,
+    ) -> MixedPrecisionPlan:
+        """Measure sensitivities on ``model`` and plan for ``budget_bytes``."""
+        modules = quantizable_modules(model)
+        module_shapes = {name: tuple(m.weight.shape) for name, m in modules}
+        covered = {id(m.weight) for _, m in modules}
+        fixed_bytes = sum(
+            p.nelement() * 2 for p in model.parameters() if id(p) not in covered
+        )
+        sensitivities = self.measure_sensitivity(model, calibration_inputs)
+        return self.plan(module_shapes, sensitivities, budget_bytes, fixed_bytes)
+
+
+def apply_plan(model: nn.Module, plan: MixedPrecisionPlan) -> nn.Module:
+    """Quantize ``model`` in place according to ``plan``.
+
+    Each planned module is replaced by a :class:`QuantizedLinear` or
+    :class:`QuantizedEmbedding` storing its weight at the planned
+    precision. ``fp16`` modules whose weights are already 16-bit are left
+    as they are. Modules sharing one weight (tied embeddings) share one
+    :class:`PackedWeight`.
+    """
+    packed: Dict[int, PackedWeight] = {}
+    with torch.no_grad():
+        for name, module in quantizable_modules(model):
+            precision = plan.assignments.get(name)
+            if precision is None:
+                continue
+            weight = module.weight
+            if precision == "fp16" and weight.element_size() <= 2:
+                continue
+            if id(weight) not in packed:
+                packed[id(weight)] = PackedWeight(weight, precision, plan.group_size)
+            wrapper = QuantizedLinear if isinstance(module, nn.Linear) else QuantizedEmbedding
+            parent_name, _, child = name.rpartition(".")
+            parent = model.get_submodule(parent_name) if parent_name else model
+            setattr(parent, child, wrapper(module, packed[id(weight)]))
+    return model
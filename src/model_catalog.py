@@ -0,0 +1,208 @@
+"""In-memory catalog of the models each backend serves.
+
+``/v1/models`` and ``/v1/backends`` used to ask Ollama's ``/api/tags`` on
+every request, so every dashboard poll reached the daemon. The
+:class:`ModelCatalog` refreshes backend model lists in the background
+every ``refresh_interval`` seconds, and right away when a backend
+reports a pulled or loaded model. Requests only read the last snapshot.
+
+A backend that is down, or slower than ``timeout``, is marked
+unavailable. Its last known models are kept and flagged ``stale``, and
+the other backends are unaffected. Each snapshot has a content hash
+that the server sends as an ``ETag``. It changes only when a model list
+or availability changes, so pollers can revalidate with
+``If-None-Match`` and get an empty 304.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def etag_for(payload: Any) -> str:
+    """Strong ETag of a JSON-serializable payload."""
+    body = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return '"' + hashlib.sha256(body.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an ``If-None-Match`` header covers ``etag``."""
+    if not if_none_match:
+        return False
+    candidates = [c.strip() for c in if_none_match.split(",")]
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    return "*" in candidates or etag in (c[2:] if c.startswith("W/") else c for c in candidates)
+
+
+@dataclass
+class CatalogEntry:
+    """Last known model list of one backend."""
+    models: List[Dict[str, Any]] = field(default_factory=list)
+    available: bool = False
+    updated_at: Optional[float] = None  # when the model list last changed
+    checked_at: Optional[float] = None  # last refresh attempt
+    error: Optional[str] = None
+
+    @property
+    def stale(self) -> bool:
+        """True when the last refresh failed and older models are served."""
+        return self.error is not None and bool(self.models)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "available": self.available,
+            "models": [m["name"] for m in self.models],
+            "updated_at": self.updated_at,
+            "stale": self.stale,
+            "error": self.error,
+        }
+
+
+class ModelCatalog:
+    """Background-refreshed model lists for a set of backends.
+
+    Backends with a ``list_models(strict=True)`` method are polled. A
+    backend without one is listed from ``static_models``.
+
+    Args:
+        backends: Backend objects by name
+        static_models: Fixed model entries (``{"name": ...}``) per backend
+        refresh_interval: Seconds between background refreshes
+        timeout: Seconds one backend may take to list its models
+    """
+
+    def __init__(
+        self,
+        backends: Dict[str, Any],
+        static_models: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+        refresh_interval: float = 30.0,
+        timeout: float = 5.0,
+    ):
+        self.backends = backends
+        self.static_models = dict(static_models or {})
+        self.refresh_interval = refresh_interval
+        self.timeout = timeout
+        self.entries: Dict[str, CatalogEntry] = {}
+        self.refreshes = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+        self._pending: set = set()
+        self._wake: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @classmethod
+    def from_env(cls, backends: Dict[str, Any], **kwargs: Any) -> "ModelCatalog":
+        """Build with ``MODEL_CATALOG_REFRESH`` and ``MODEL_CATALOG_TIMEOUT``."""
+        return cls(
+            backends,
+            refresh_interval=float(os.getenv("MODEL_CATALOG_REFRESH", "30")),
+            timeout=float(os.getenv("MODEL_CATALOG_TIMEOUT", "5")),
+            **kwargs,
+        )
+
+    # -- reads ---------------------------------------------------------------
+
+    def entry(self, name: str) -> CatalogEntry:
+        with self._lock:
+            return self.entries.get(name) or CatalogEntry()
+
+    def model_names(self, name: str) -> List[str]:
+        return [m["name"] for m in self.entry(name).models]
+
+    def models(self) -> List[Dict[str, Any]]:
+        """OpenAI-style model objects across all backends."""
+        data = []
+        for name in list(self.backends):
+            for model in self.entry(name).models:
+                item = {"id": model["name"], "object": "model", "backend": name}
+                if "size" in model:
+                    item["size"] = model["size"]
+                data.append(item)
+        return data
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {name: self.entry(name).to_dict() for name in list(self.backends)}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "refresh_interval": self.refresh_interval,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+        }
+
+    # -- refresh -------------------------------------------------------------
+
+    def _fetch(self, name: str) -> List[Dict[str, Any]]:
+        lister = getattr(self.backends[name], "list_models", None)
+        if lister is None:
+            return list(self.static_models.get(name, []))
+        return lister(strict=True)
+
+    async def refresh(self, name: Optional[str] = None) -> None:
+        """Refresh one backend, or all of them concurrently."""
+        names = [name] if name is not None else list(self.backends)
+        await asyncio.gather(*(self._refresh_one(n) for n in names))
+
+    async def _refresh_one(self, name: str) -> None:
+        now = time.time()
+        try:
+            models = await asyncio.wait_for(asyncio.to_thread(self._fetch, name), self.timeout)
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            logger.warning(f"Model catalog refresh of {name} failed: {error}")
+            self.failures += 1
+            with self._lock:
+                previous = self.entries.get(name) or CatalogEntry()
+                self.entries[name] = CatalogEntry(
+                    previous.models, False, previous.updated_at, now, error
+                )
+            return
+        self.refreshes += 1
+        with self._lock:
+            previous = self.entries.get(name)
+            # Keep the timestamp (and so the ETag) while nothing changed
+            changed = previous is None or previous.models != models
+            updated_at = now if changed else previous.updated_at
+            self.entries[name] = CatalogEntry(list(models), True, updated_at, now)
+
+    def invalidate(self, name: Optional[str] = None) -> None:
+        """Refresh ``name`` (or everything) soon; safe from any thread."""
+        self._pending.add(name)
+        if self._loop is not None and self._wake is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def watch(self, name: str) -> None:
+        """Invalidate ``name`` whenever its backend reports a model change."""
+        backend = self.backends[name]
+        if hasattr(backend, "add_model_listener"):
+            backend.add_model_listener(lambda model: self.invalidate(name))
+
+    async def run(self) -> None:
+        """Refresh periodically and on invalidation until cancelled.
+
+        The first refresh happens after ``refresh_interval``; await
+        :meth:`refresh` beforehand to fill the catalog at startup.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        if self._pending:
+            self._wake.set()
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.refresh_interval)
+            except asyncio.TimeoutError:
+                self._pending.add(None)
+            self._wake.clear()
+            pending, self._pending = self._pending, set()
+            if None in pending:
+                await self.refresh()
+            else:
+                await asyncio.gather(*(self.refresh(n) for n in pending if n in self.backends))
@@ -0,0 +1,307 @@
+"""Resident models with background loading and zero-downtime swaps.
+
+:class:`ModelRegistry` holds every loaded engine by name. ``load()``
+returns immediately. The model is built on a loader thread, optionally
+warmed up, and then published atomically. Requests never see a
+half-loaded model, and serving continues on the current model while
+the new one loads.
+
+Requests take a lease on a model for as long as they use it (a whole
+stream for streaming requests). A model that is replaced or evicted is
+retired: it takes no new leases and is freed when its last lease is
+released. In-flight requests therefore drain on the old weights.
+
+Activating a new model retires the previous active one, unless the load
+asks to keep it. Several models may be resident at once, either loaded
+without activation or kept. With a ``memory_budget``, the least recently
+used models are evicted after a load until the resident total fits.
+Neither the active nor the just loaded model is evicted. A swap briefly
+holds both the old and new weights.
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+RETIRED = "retired"
+
+
+def model_bytes(engine: Any) -> int:
+    """Parameter and buffer bytes of an engine's torch model, 0 if unknown."""
+    model = getattr(getattr(engine, "backend", engine), "model", None)
+    if model is None or not hasattr(model, "parameters"):
+        return 0
+    tensors = list(model.parameters()) + list(getattr(model, "buffers", lambda: [])())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+def release_memory(engine: Any) -> None:
+    """Drop an engine's weights and return cached GPU memory to the driver."""
+    backend = getattr(engine, "backend", None)
+    for owner in (engine, backend):
+        if owner is not None and hasattr(owner, "model"):
+            owner.model = None
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+class ModelHandle:
+    """One resident (or loading) model."""
+
+    def __init__(self, name: str, source: Optional[str] = None):
+        self.name = name
+        self.source = source
+        self.engine: Any = None
+        self.state = LOADING
+        self.size_bytes = 0
+        self.refcount = 0
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.ready_at: Optional[float] = None
+        self.last_used = time.monotonic()
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "source": self.source,
+            "state": self.state,
+            "size_bytes": self.size_bytes,
+            "in_flight": self.refcount,
+            "error": self.error,
+            "created_at": self.created_at,
+            "ready_at": self.ready_at,
+        }
+
+
+class ModelRegistry:
+    """Named engines with leases, atomic activation and LRU eviction.
+
+    Args:
+        loader: Builds an engine from a source (path or hub id)
+        memory_budget: Bytes all resident models may use; 0 is unlimited
+        warmup: Runs once on a freshly loaded engine before it is published
+        measure: Size of an engine in bytes
+        free: Releases a retired engine's memory
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[str], Any],
+        memory_budget: int = 0,
+        warmup: Optional[Callable[[Any], Any]] = None,
+        measure: Callable[[Any], int] = model_bytes,
+        free: Callable[[Any], None] = release_memory,
+    ):
+        self.loader = loader
+        self.memory_budget = memory_budget
+        self.warmup = warmup
+        self.measure = measure
+        self.free = free
+        self.active: Optional[str] = None
+        self._models: Dict[str, ModelHandle] = {}
+        self._loading: Dict[str, ModelHandle] = {}
+        self._retired: List[ModelHandle] = []
+        self._failed: Dict[str, ModelHandle] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-loader")
+        self.swaps = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls, loader: Callable[[str], Any], **kwargs: Any) -> "ModelRegistry":
+        """Budget from ``MODEL_MEMORY_BUDGET_MB`` (0 or unset: unlimited)."""
+        budget_mb = float(os.getenv("MODEL_MEMORY_BUDGET_MB", "0"))
+        return cls(loader, memory_budget=int(budget_mb * 1024 * 1024), **kwargs)
+
+    # -- publishing ----------------------------------------------------------
+
+    def register(self, name: str, engine: Any, activate: bool = True,
+                 keep_previous: bool = False, source: Optional[str] = None) -> ModelHandle:
+        """Publish an already loaded engine."""
+        handle = ModelHandle(name, source)
+        handle.engine = engine
+        handle.size_bytes = self.measure(engine)
+        self._publish(handle, activate, keep_previous)
+        return handle
+
+    def load(self, name: str, source: str, activate: bool = True,
+             keep_previous: bool = False, warmup: bool = True) -> "Future[ModelHandle]":
+        """Load ``source`` as ``name`` in the background.
+
+        Serving continues on the current models meanwhile. Loads run one
+        at a time, in order. With ``activate``, the model becomes the
+        default when ready and the previous default is retired unless
+        ``keep_previous`` is set.
+
+        Raises:
+            ValueError: If ``name`` is already loading
+        """
+        with self._lock:
+            if name in self._loading:
+                raise ValueError(f"Model '{name}' is already loading")
+            handle = self._loading[name] = ModelHandle(name, source)
+            self._failed.pop(name, None)
+        return self._pool.submit(self._load, handle, activate, keep_previous, warmup)
+
+    def _load(self, handle: ModelHandle, activate: bool, keep_previous: bool,
+              warmup: bool) -> ModelHandle:
+        started = time.monotonic()
+        try:
+            engine = self.loader(handle.source)
+            if warmup and self.warmup is not None:
+                self.warmup(engine)
+            handle.engine = engine
+            handle.size_bytes = self.measure(engine)
+        except Exception as e:
+            logger.error(f"Loading model {handle.name} from {handle.source} failed: {e}")
+            handle.state, handle.error = FAILED, str(e)
+            with self._lock:
+                self._loading.pop(handle.name, None)
+                self._failed[handle.name] = handle
+            raise
+        logger.info(f"Loaded model {handle.name} in {time.monotonic() - started:.1f}s")
+        self._publish(handle, activate, keep_previous)
+        return handle
+
+    def _publish(self, handle: ModelHandle, activate: bool, keep_previous: bool) -> None:
+        with self._lock:
+            handle.state = READY
+            handle.ready_at = time.time()
+            previous = self._models.get(handle.name)
+            self._models[handle.name] = handle
+            self._loading.pop(handle.name, None)
+            outgoing = self.active if activate and self.active != handle.name else None
+            if activate:
+                if self.active is not None:
+                    self.swaps += 1
+                self.active = handle.name
+            if previous is not None:
+                self._retire_locked(previous)
+            if outgoing is not None and not keep_previous:
+                self._retire_locked(self._models.pop(outgoing))
+            self._evict_locked(handle.name)
+        self._collect()
+        logger.info(f"Model {handle.name} ready (active: {self.active})")
+
+    def _evict_locked(self, loaded: str) -> None:
+        """Evict least recently used models (not the active or the just
+        loaded one) until the budget holds."""
+        if not self.memory_budget:
+            return
+        candidates = sorted(
+            (h for h in self._models.values() if h.name not in (self.active, loaded)),
+            key=lambda h: h.last_used,
+        )
+        for handle in candidates:
+            if self._resident_bytes_locked() <= self.memory_budget:
+                break
+            del self._models[handle.name]
+            self._retire_locked(handle)
+            self.evictions += 1
+            logger.info(f"Evicting model {handle.name} ({handle.size_bytes} bytes)")
+        if self._resident_bytes_locked() > self.memory_budget:
+            logger.warning(f"Resident models use {self._resident_bytes_locked()} bytes, "
+                           f"over the budget of {self.memory_budget}")
+
+    def _resident_bytes_locked(self) -> int:
+        return sum(h.size_bytes for h in self._models.values())
+
+    def _retire_locked(self, handle: ModelHandle) -> None:
+        handle.state = RETIRED
+        self._retired.append(handle)
+
+    def _collect(self) -> None:
+        """Free retired models whose last lease has been released."""
+        with self._lock:
+            idle = [h for h in self._retired if h.refcount == 0]
+            self._retired = [h for h in self._retired if h.refcount > 0]
+        for handle in idle:
+            logger.info(f"Freeing model {handle.name}")
+            self.free(handle.engine)
+            handle.engine = None
+
+    # -- leases --------------------------------------------------------------
+
+    def acquire(self, name: Optional[str] = None) -> ModelHandle:
+        """Lease ``name``, or the active model when ``name`` is not resident.
+
+        Raises:
+            LookupError: If no model is ready
+        """
+        with self._lock:
+            handle = self._models.get(name) if name else None
+            if handle is None and self.active is not None:
+                handle = self._models.get(self.active)
+            if handle is None:
+                raise LookupError("No model is loaded")
+            handle.refcount += 1
+            handle.last_used = time.monotonic()
+            return handle
+
+    def release(self, handle: ModelHandle) -> None:
+        with self._lock:
+            handle.refcount -= 1
+            drained = handle.state == RETIRED and handle.refcount == 0
+        if drained:
+            self._collect()
+
+    @contextmanager
+    def lease(self, name: Optional[str] = None) -> Iterator[ModelHandle]:
+        handle = self.acquire(name)
+        try:
+            yield handle
+        finally:
+            self.release(handle)
+
+    async def hold(self, handle: ModelHandle, tokens: AsyncIterator[Any]) -> AsyncIterator[Any]:
+        """Yield ``tokens``, releasing the lease when the stream ends."""
+        try:
+            async for token in tokens:
+                yield token
+        finally:
+            aclose = getattr(tokens, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            self.release(handle)
+
+    # -- introspection -------------------------------------------------------
+
+    def names(self) -> List[str]:
+        with self._lock:
+            return list(self._models)
+
+    def status(self, name: str) -> Dict[str, Any]:
+        """Raises ``KeyError`` for unknown models."""
+        with self._lock:
+            handle = self._loading.get(name) or self._models.get(name) or self._failed.get(name)
+            if handle is None:
+                raise KeyError(name)
+            return {**handle.info(), "active": name == self.active}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "active": self.active,
+                "memory_budget": self.memory_budget,
+                "resident_bytes": self._resident_bytes_locked(),
+                "models": [h.info() for h in self._models.values()],
+                "loading": [h.info() for h in self._loading.values()],
+                "draining": [h.info() for h in self._retired],
+                "failed": [h.info() for h in self._failed.values()],
+                "swaps": self.swaps,
+                "evictions": self.evictions,
+            }
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False)
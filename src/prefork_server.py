@@ -0,0 +1,259 @@
+"""Multi-worker serving with fork-after-load shared model weights.
+
+Running ``uvicorn --workers N`` imports the app, and with it the model,
+once per worker. :class:`PreforkServer` inverts that: the parent imports
+the app (loading the weights) once, binds the listening socket, freezes
+the garbage collector and then forks N workers that serve on the shared
+socket. Workers map the parent's pages copy-on-write. Tensor storage
+lives in separate allocations that the interpreter never writes to, and
+``gc.freeze()`` keeps collections from touching the frozen object
+headers, so the weights stay physically shared. Only per-request state
+is private to each worker.
+
+The parent supervises the workers and re-forks any that die; a re-fork is
+cheap because the weights are already resident. SIGTERM/SIGINT stop all
+workers. Fork is POSIX-only. Spawn-based start methods cannot share
+module-level engines, so they are not supported.
+
+Usage::
+
+    python -m src.prefork_server --app src.api_server:app --workers 4
+"""
+
+import argparse
+import gc
+import importlib
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def rss_bytes(pid: int) -> int:
+    """Resident set size of ``pid``, counting shared pages in full."""
+    with open(f"/proc/{pid}/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def pss_bytes(pid: int) -> int:
+    """Proportional set size of ``pid``; shared pages are split between
+    the processes mapping them, so PSS sums to real memory use."""
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            if line.startswith("Pss:"):
+                return int(line.split()[1]) * 1024
+    raise ValueError(f"No Pss entry for process {pid}")
+
+
+def memory_report(pids: List[int]) -> Dict[int, Dict[str, int]]:
+    """RSS and PSS in bytes for each live process in ``pids``."""
+    report = {}
+    for pid in pids:
+        try:
+            report[pid] = {"rss": rss_bytes(pid), "pss": pss_bytes(pid)}
+        except (OSError, ValueError):
+            continue
+    return report
+
+
+def freeze_heap() -> None:
+    """Collect garbage, then move every surviving object to the permanent
+    generation so later collections in the workers leave their pages alone."""
+    gc.disable()
+    gc.collect()
+    gc.freeze()
+    gc.enable()
+
+
+def limit_torch_threads(workers: int) -> None:
+    """Split the CPU between workers so N intra-op pools do not oversubscribe."""
+    torch = sys.modules.get("torch")
+    if torch is None:
+        return
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // workers))
+
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    """Listening socket inherited by every worker."""
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class PreforkServer:
+    """Fork ``workers`` processes that each call ``serve(sock)``.
+
+    Args:
+        serve: Worker entry point; runs until the worker should exit
+        workers: Number of worker processes
+        host: Address to bind when no socket is given
+        port: Port to bind when no socket is given (0 picks a free port)
+        sock: Already bound listening socket
+        restart: Re-fork workers that exit while the server is running
+    """
+
+    def __init__(
+        self,
+        serve: Callable[[socket.socket], Any],
+        workers: int = 2,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        sock: Optional[socket.socket] = None,
+        restart: bool = True,
+    ):
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        self.serve = serve
+        self.workers = workers
+        self.restart = restart
+        self.sock = sock or bind_socket(host, port)
+        self.pids: Dict[int, int] = {}  # pid -> worker index
+        self.restarts = 0
+        self._stopping = False
+
+    @property
+    def address(self) -> tuple:
+        return self.sock.getsockname()
+
+    @property
+    def worker_pids(self) -> List[int]:
+        return sorted(self.pids)
+
+    def start(self) -> "PreforkServer":
+        """Freeze the heap and fork all workers."""
+        freeze_heap()
+        for index in range(self.workers):
+            self._spawn(index)
+        logger.info(f"Started {self.workers} workers on {self.address}: {self.worker_pids}")
+        return self
+
+    def _spawn(self, index: int) -> int:
+        pid = os.fork()
+        if pid == 0:
+            self._run_worker(index)
+        self.pids[pid] = index
+        return pid
+
+    def _run_worker(self, index: int) -> None:
+        # Never return into the parent's stack from a forked child
+        code = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            self.serve(self.sock)
+        except BaseException:
+            logger.exception(f"Worker {index} failed")
+            code = 1
+        finally:
+            os._exit(code)
+
+    def reap(self) -> List[int]:
+        """Collect exited workers, re-forking them if ``restart`` is set."""
+        exited = []
+        while self.pids:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            index = self.pids.pop(pid, None)
+            if index is None:
+                continue
+            exited.append(pid)
+            if self.restart and not self._stopping:
+                logger.warning(f"Worker {index} (pid {pid}) exited with status {status}; restarting")
+                self.restarts += 1
+                self._spawn(index)
+        return exited
+
+    def supervise(self, poll_interval: float = 0.5) -> None:
+        """Block until stopped by SIGTERM/SIGINT, restarting dead workers."""
+        def handle(signum: int, _frame: Any) -> None:
+            self._stopping = True
+
+        signal.signal(signal.SIGTERM, handle)
+        signal.signal(signal.SIGINT, handle)
+        while not self._stopping and self.pids:
+            self.reap()
+            time.sleep(poll_interval)
+        self.stop()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """SIGTERM all workers, SIGKILL whatever is left after ``timeout``."""
+        self._stopping = True
+        for pid in self.pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + timeout
+        while self.pids and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.05)
+        for pid in list(self.pids):
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+            self.pids.pop(pid, None)
+        self.sock.close()
+
+    def __enter__(self) -> "PreforkServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+
+def load_app(path: str) -> Any:
+    """Import ``module:attribute`` (this is where the weights are loaded)."""
+    module_name, _, attribute = path.partition(":")
+    module = importlib.import_module(module_name)
+    return getattr(module, attribute or "app")
+
+
+def uvicorn_worker(app: Any, **config: Any) -> Callable[[socket.socket], None]:
+    """Worker entry point that serves an ASGI app with uvicorn."""
+    def serve(sock: socket.socket) -> None:
+        import uvicorn
+
+        server = uvicorn.Server(uvicorn.Config(app, **config))
+        server.run(sockets=[sock])
+
+    return serve
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Prefork API server with shared model weights")
+    parser.add_argument("--app", default="src.api_server:app", help="module:attribute of the ASGI app")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "2")))
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper())
+    sock = bind_socket(args.host, args.port)
+    app = load_app(args.app)
+    limit_torch_threads(args.workers)
+    server = PreforkServer(
+        uvicorn_worker(app, log_level=args.log_level),
+        workers=args.workers,
+        sock=sock,
+    )
+    server.start().supervise()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ This module provides INT8/INT4 quantization, dynamic quantization,
 and quantized model management for memory efficiency.
 """
 
+import copy
 import logging
 import os
 import time
@@ -32,6 +33,7 @@ class QuantizationType(Enum):
     BF16 = "bf16"
     DYNAMIC = "dynamic"
     STATIC = "static"
+    MIXED = "mixed"
 
 @dataclass
 class QuantizationConfig:
@@ -43,6 +45,7 @@ class QuantizationConfig:
     reduce_range: bool = True
     memory_efficient: bool = True
     preserve_accuracy: bool = True
+    mixed_precision_plan: Optional[str] = None  # path to a MixedPrecisionPlan JSON
 
 class QuantizationManager:
     """Manager for model quantization operations."""
@@ -76,6 +79,8 @@ class QuantizationManager:
                 quantized_model = self._fp16_quantization(model)
             elif self.config.quantization_type == QuantizationType.BF16:
                 quantized_model = self._bf16_quantization(model)
+            elif self.config.quantization_type == QuantizationType.MIXED:
+                quantized_model = self._mixed_precision_quantization(model)
             else:
                 raise ValueError(f"Unsupported quantization type: {self.config.quantization_type}")
             
@@ -106,7 +111,36 @@ class QuantizationManager:
         except Exception as e:
             logger.error(f"Quantization failed for {model_name}: {str(e)}")
             raise
-    
+
+    def quantize_checkpoint(self, checkpoint_dir: str, output_dir: str,
+                            model_name: str = "default",
+                            progress_callback=None) -> Dict[str, Any]:
+        """Quantize a checkpoint on disk layer by layer.
+
+        Unlike :meth:`quantize_model` the full-precision model is never
+        resident; see :mod:`src.streaming_quantization`.
+        """
+        from src.streaming_quantization import StreamingQuantizer
+
+        quantizer = StreamingQuantizer(self.config, progress_callback=progress_callback)
+        result = quantizer.quantize_checkpoint(checkpoint_dir, output_dir)
+        memory_saved = result.original_size - result.quantized_size
+
+        self.quantized_models[model_name] = {
+            "model": None,
+            "path": output_dir,
+            "config": self.config,
+            "original_size": result.original_size,
+            "quantized_size": result.quantized_size,
+            "memory_saved": memory_saved,
+            "quantization_time": result.elapsed
+        }
+        self.quantization_stats["total_models"] += 1
+        self.quantization_stats["memory_saved"] += memory_saved
+        self.quantization_stats["quantization_times"].append(result.elapsed)
+
+        return result.to_dict()
+
     def _dynamic_quantization(self, model: nn.Module) -> nn.Module:
         """Apply dynamic quantization."""
         logger.info("Applying dynamic quantization")
@@ -145,8 +179,9 @@ class QuantizationManager:
     
     def _custom_int4_quantization(self, model: nn.Module) -> nn.Module:
         """Custom INT4 quantization implementation."""
-        quantized_model = model.__class__()
-        quantized_model.load_state_dict(model.state_dict())
+        # deepcopy works for models whose constructor needs arguments
+        # (e.g. Hugging Face models built from a config)
+        quantized_model = copy.deepcopy(model)
         
         # Quantize linear layers to INT4
         for name, module in quantized_model.named_modules():
@@ -175,6 +210,17 @@ class QuantizationManager:
         
         return quantized
     
+    def _mixed_precision_quantization(self, model: nn.Module) -> nn.Module:
+        """Apply a saved per-layer mixed-precision plan."""
+        from src.mixed_precision import MixedPrecisionPlan, apply_plan
+        
+        if not self.config.mixed_precision_plan:
+            raise ValueError("Mixed quantization requires config.mixed_precision_plan")
+        logger.info(f"Applying mixed-precision plan {self.config.mixed_precision_plan}")
+        
+        plan = MixedPrecisionPlan.load(self.config.mixed_precision_plan)
+        return apply_plan(copy.deepcopy(model), plan)
+    
     def _fp16_quantization(self, model: nn.Module) -> nn.Module:
         """Apply FP16 quantization."""
         logger.info("Applying FP16 quantization")
@@ -223,10 +269,30 @@ class QuantizationManager:
                 "memory_saved": model_info["memory_saved"],
                 "quantization_time": model_info["quantization_time"],
                 "original_size": model_info["original_size"],
-                "quantized_size": model_info["quantized_size"]
+                "quantized_size": model_info["quantized_size"],
+                "accuracy_loss": model_info.get("accuracy_loss")
             }
         return {}
     
+    def record_accuracy_loss(self, model_name: str, baseline_perplexity: float,
+                             quantized_perplexity: float) -> float:
+        """Record accuracy loss as the relative perplexity increase.
+        
+        Returns:
+            Relative loss, e.g. 0.05 for a 5% perplexity increase
+        """
+        accuracy_loss = 0.0
+        if baseline_perplexity > 0:
+            accuracy_loss = (quantized_perplexity - baseline_perplexity) / baseline_perplexity
+        
+        if model_name in self.quantized_models:
+            self.quantized_models[model_name]["accuracy_loss"] = accuracy_loss
+        losses = [info["accuracy_loss"] for info in self.quantized_models.values()
+                  if "accuracy_loss" in info]
+        self.quantization_stats["accuracy_loss"] = sum(losses) / len(losses) if losses else accuracy_loss
+        
+        return accuracy_loss
+    
     def get_overall_stats(self) -> Dict[str, Any]:
         """Get overall quantization statistics."""
         avg_time = 0.0
@@ -245,42 +311,61 @@ class QuantizationManager:
 class QuantizedInference:
     """Quantized inference engine."""
     
-    def __init__(self, quantized_model: nn.Module, config: QuantizationConfig):
+    def __init__(self, quantized_model: nn.Module, config: QuantizationConfig,
+                 tokenizer: Optional[Any] = None):
         self.quantized_model = quantized_model
         self.config = config
-        self.tokenizer = None
+        self.tokenizer = tokenizer
         
         # Set model to evaluation mode
         self.quantized_model.eval()
         
         logger.info(f"Quantized inference engine initialized with {config.quantization_type.value} quantization")
     
+    def _encode(self, prompt: str) -> torch.Tensor:
+        """Encode a prompt into input ids."""
+        if self.tokenizer is None:
+            # Fallback tokenization, only meaningful for toy models
+            tokens = [ord(c) % 1000 for c in prompt[:100]]  # Simple character-based
+            return torch.tensor([tokens], dtype=torch.long)
+        return self.tokenizer.encode(prompt, return_tensors="pt")
+    
+    def generate_tokens(self, prompt: str, max_tokens: int = 50) -> Tuple[List[int], float]:
+        """Greedy-decode up to ``max_tokens`` tokens.
+        
+        Returns:
+            Tuple of (generated token ids, time to first token in seconds).
+            Errors are raised rather than masked.
+        """
+        start_time = time.perf_counter()
+        current_input = self._encode(prompt)
+        eos_token_id = getattr(self.tokenizer, "eos_token_id", None)
+        generated_tokens: List[int] = []
+        time_to_first_token = 0.0
+        
+        with torch.no_grad():
+            for _ in range(max_tokens):
+                # Forward pass through quantized model
+                output = self.quantized_model(current_input)
+                logits = getattr(output, "logits", output)
+                
+                # Get next token (simple greedy decoding)
+                next_token = torch.argmax(logits[0, -1, :]).unsqueeze(0)
+                if not generated_tokens:
+                    time_to_first_token = time.perf_counter() - start_time
+                generated_tokens.append(next_token.item())
+                if eos_token_id is not None and generated_tokens[-1] == eos_token_id:
+                    break
+                
+                # Update input for next iteration
+                current_input = torch.cat([current_input, next_token.unsqueeze(0)], dim=1)
+        
+        return generated_tokens, time_to_first_token
+    
     def generate(self, prompt: str, max_tokens: int = 50, **kwargs) -> str:
         """Generate text using quantized model."""
         try:
-            # Simple tokenization (in real implementation, use proper tokenizer)
-            if self.tokenizer is None:
-                # Fallback tokenization
-                tokens = [ord(c) % 1000 for c in prompt[:100]]  # Simple character-based
-                input_tensor = torch.tensor([tokens], dtype=torch.long)
-            else:
-                input_tensor = self.tokenizer.encode(prompt, return_tensors="pt")
-            
-            # Generate tokens
-            generated_tokens = []
-            current_input = input_tensor
-            
-            with torch.no_grad():
-                for _ in range(max_tokens):
-                    # Forward pass through quantized model
-                    output = self.quantized_model(current_input)
-                    
-                    # Get next token (simple greedy decoding)
-                    next_token = torch.argmax(output[0, -1, :]).unsqueeze(0)
-                    generated_tokens.append(next_token.item())
-                    
-                    # Update input for next iteration
-                    current_input = torch.cat([current_input, next_token.unsqueeze(0)], dim=1)
+            generated_tokens, _ = self.generate_tokens(prompt, max_tokens)
             
             # Decode tokens
             if self.tokenizer is None:
@@ -296,17 +381,26 @@ class QuantizedInference:
             return f"Generated text for: {prompt}"
     
     def benchmark_performance(self, test_prompts: List[str], max_tokens: int = 50) -> Dict[str, Any]:
-        """Benchmark quantized model performance."""
+        """Benchmark quantized model performance.
+        
+        Only tokens that were actually generated are counted; prompts whose
+        generation fails are reported in ``failed_prompts``.
+        """
         logger.info(f"Starting performance benchmark with {len(test_prompts)} prompts")
         
         start_time = time.time()
         total_tokens = 0
+        failed_prompts = 0
+        first_token_times = []
         
         for prompt in test_prompts:
             try:
-                result = self.generate(prompt, max_tokens)
-                total_tokens += max_tokens
+                tokens, time_to_first_token = self.generate_tokens(prompt, max_tokens)
+                total_tokens += len(tokens)
+                if tokens:
+                    first_token_times.append(time_to_first_token)
             except Exception as e:
+                failed_prompts += 1
                 logger.error(f"Benchmark failed for prompt '{prompt}': {str(e)}")
         
         end_time = time.time()
@@ -316,6 +410,7 @@ class QuantizedInference:
         avg_time_per_prompt = total_time / len(test_prompts) if test_prompts else 0
         tokens_per_second = total_tokens / total_time if total_time > 0 else 0
         throughput = len(test_prompts) / total_time if total_time > 0 else 0
+        avg_ttft = sum(first_token_times) / len(first_token_times) if first_token_times else 0
         
         # Estimate memory usage
         memory_usage = self._estimate_memory_usage()
@@ -326,7 +421,9 @@ class QuantizedInference:
             "tokens_per_second": tokens_per_second,
             "throughput": throughput,
             "total_prompts": len(test_prompts),
+            "failed_prompts": failed_prompts,
             "total_tokens": total_tokens,
+            "avg_time_to_first_token": avg_ttft,
             "memory_usage": memory_usage
         }
         
@@ -401,10 +498,19 @@ class QuantizationCache:
                     "symmetric": config.symmetric,
                     "reduce_range": config.reduce_range,
                     "memory_efficient": config.memory_efficient,
-                    "preserve_accuracy": config.preserve_accuracy
+                    "preserve_accuracy": config.preserve_accuracy,
+                    "mixed_precision_plan": config.mixed_precision_plan
                 }
             }
             
+            # Keep a copy of the plan next to the weights so the entry stays
+            # usable if the original plan file moves
+            if config.mixed_precision_plan and os.path.exists(config.mixed_precision_plan):
+                import shutil
+                plan_path = os.path.join(self.cache_dir, f"{model_name}_plan.json")
+                shutil.copyfile(config.mixed_precision_plan, plan_path)
+                self.cache_index[model_name]["plan_path"] = plan_path
+            
             # Save updated index
             self._save_cache_index()
             
@@ -444,6 +550,15 @@ class QuantizationCache:
             logger.error(f"Failed to load cached model {model_name}: {str(e)}")
             return None
     
+    def load_cached_plan(self, model_name: str):
+        """Load the mixed-precision plan cached with a model, if any."""
+        from src.mixed_precision import MixedPrecisionPlan
+        
+        entry = self.cache_index.get(model_name)
+        if not entry or not entry.get("plan_path") or not os.path.exists(entry["plan_path"]):
+            return None
+        return MixedPrecisionPlan.load(entry["plan_path"])
+    
     def get_cache_stats(self) -> Dict[str, Any]:
         """Get cache statistics."""
         total_size = 0
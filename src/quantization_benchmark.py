@@ -0,0 +1,443 @@
+"""
+Quantization quality-vs-speed benchmark matrix.
+
+For every ``QuantizationType`` this harness measures perplexity on a fixed
+local corpus, generation throughput at several batch sizes, time to first
+token, serialized model size and peak RSS, and writes a JSON report plus a
+Markdown comparison table that can be diffed between releases.
+
+CI runs it against a tiny random-weight LLaMA with a byte-level tokenizer;
+real runs load the model and tokenizer from a checkpoint directory.
+"""
+
+import gc
+import io
+import json
+import math
+import os
+import platform
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import torch
+import torch.nn as nn
+
+from src.quantization import QuantizationConfig, QuantizationManager, QuantizationType
+from utils.logging import get_logger
+
+logger = get_logger("quantization_benchmark")
+
+REPORT_VERSION = 1
+
+# Fixed evaluation corpus. Changing it invalidates comparisons with
+# previously published reports, so bump REPORT_VERSION if you do.
+DEFAULT_CORPUS = (
+    "The GPU executes thousands of threads in parallel, grouping them into "
+    "warps or wavefronts that share a single instruction stream.",
+    "Quantization maps floating point weights onto a small set of integer "
+    "levels and stores a scale so the original range can be recovered.",
+    "A key-value cache stores the attention keys and values of previous "
+    "tokens so that each decoding step only processes the newest token.",
+    "Large language models are usually limited by memory bandwidth during "
+    "decoding and by compute during the initial prompt processing.",
+    "Perplexity is the exponential of the average negative log-likelihood "
+    "that a model assigns to each token of a held-out text.",
+    "Batching several requests together amortizes the cost of reading the "
+    "weights from memory across more useful work per step.",
+    "Mixed precision keeps sensitive layers in higher precision while the "
+    "bulk of the parameters are stored in fewer bits.",
+    "Benchmarks are only useful when they are repeatable, so the inputs, "
+    "seeds and measurement windows must stay fixed between runs.",
+)
+
+DEFAULT_PROMPTS = (
+    "Explain what a GPU warp is.",
+    "Why does quantization save memory?",
+    "Describe the key-value cache.",
+    "What limits decoding speed?",
+)
+
+# MIXED needs a per-layer plan (see src/mixed_precision.py); without one
+# it can only produce an error row
+DEFAULT_TYPES = tuple(t for t in QuantizationType if t is not QuantizationType.MIXED)
+
+
+# ---------------------------------------------------------------------------
+# Tiny model for CI
+# ---------------------------------------------------------------------------
+
+def build_byte_tokenizer():
+    """Build a byte-level Hugging Face tokenizer (256 byte tokens + specials).
+
+    It is a real ``PreTrainedTokenizerFast`` so the benchmark exercises the
+    same encode/decode/padding code paths as a production tokenizer.
+    """
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers
+    from transformers import PreTrainedTokenizerFast
+
+    specials = ["<unk>", "<s>", "</s>"]
+    alphabet = pre_tokenizers.ByteLevel.alphabet()
+    vocab = {token: i for i, token in enumerate(specials + sorted(alphabet))}
+    backend = Tokenizer(models.BPE(vocab=vocab, merges=[], unk_token="<unk>"))
+    backend.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    backend.decoder = decoders.ByteLevel()
+    return PreTrainedTokenizerFast(
+        tokenizer_object=backend,
+        unk_token="<unk>",
+        bos_token="<s>",
+        eos_token="</s>",
+        pad_token="</s>",
+    )
+
+
+def build_tiny_llama(tokenizer=None, seed: int = 0, hidden_size: int = 64,
+                     num_layers: int = 2) -> nn.Module:
+    """Build a tiny random-weight ``LlamaForCausalLM`` for CI runs."""
+    from transformers import LlamaConfig, LlamaForCausalLM
+
+    tokenizer = tokenizer or build_byte_tokenizer()
+    torch.manual_seed(seed)
+    config = LlamaConfig(
+        vocab_size=len(tokenizer),
+        hidden_size=hidden_size,
+        intermediate_size=hidden_size * 2,
+        num_hidden_layers=num_layers,
+        num_attention_heads=4,
+        num_key_value_heads=4,
+        max_position_embeddings=512,
+        bos_token_id=tokenizer.bos_token_id,
+        eos_token_id=tokenizer.eos_token_id,
+        pad_token_id=tokenizer.pad_token_id,
+    )
+    model = LlamaForCausalLM(config)
+    model.eval()
+    return model
+
+
+# ---------------------------------------------------------------------------
+# Measurements
+# ---------------------------------------------------------------------------
+
+def _current_rss() -> int:
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+class PeakRSSMonitor:
+    """Sample process RSS in a background thread and keep the peak."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self) -> None:
+        while not self._stop.is_set():
+            self.peak = max(self.peak, _current_rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> "PeakRSSMonitor":
+        self.peak = _current_rss()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.peak = max(self.peak, _current_rss())
+
+
+def serialized_size(model: nn.Module) -> int:
+    """Bytes needed to store the model's state dict.
+
+    Unlike counting ``parameters()``, this includes packed weights held by
+    dynamically quantized modules.
+    """
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell()
+
+
+def compute_perplexity(model: nn.Module, tokenizer, texts: Iterable[str],
+                       max_length: int = 256) -> float:
+    """Token-weighted perplexity of ``model`` over ``texts``."""
+    total_nll = 0.0
+    total_tokens = 0
+    with torch.no_grad():
+        for text in texts:
+            input_ids = tokenizer(text, return_tensors="pt",
+                                  truncation=True, max_length=max_length)["input_ids"]
+            if input_ids.shape[1] < 2:
+                continue
+            output = model(input_ids=input_ids, labels=input_ids)
+            predicted = input_ids.shape[1] - 1
+            total_nll += output.loss.float().item() * predicted
+            total_tokens += predicted
+    if total_tokens == 0:
+        return float("nan")
+    return math.exp(total_nll / total_tokens)
+
+
+class _FirstTokenTimer:
+    """Generation streamer that records when the first new token arrives."""
+
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self._calls = 0
+
+    def put(self, value: torch.Tensor) -> None:
+        # The first call carries the prompt; the second the first new token.
+        self._calls += 1
+        if self._calls == 2 and self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+
+    def end(self) -> None:
+        pass
+
+    @property
+    def time_to_first_token(self) -> float:
+        if self.first_token_at is None:
+            return 0.0
+        return self.first_token_at - self.start
+
+
+def _count_generated(new_tokens: torch.Tensor, eos_token_id: Optional[int]) -> int:
+    """Count tokens per row up to and including the first EOS."""
+    if eos_token_id is None:
+        return new_tokens.numel()
+    count = 0
+    for row in new_tokens.tolist():
+        if eos_token_id in row:
+            count += row.index(eos_token_id) + 1
+        else:
+            count += len(row)
+    return count
+
+
+def measure_generation(model: nn.Module, tokenizer, prompts: Sequence[str],
+                       batch_size: int, max_new_tokens: int) -> Dict[str, Any]:
+    """Greedy generation throughput and time to first token at one batch size."""
+    padding_side = tokenizer.padding_side
+    tokenizer.padding_side = "left"
+    total_tokens = 0
+    failed = 0
+    first_token_times: List[float] = []
+    start_time = time.perf_counter()
+    try:
+        for i in range(0, len(prompts), batch_size):
+            batch = list(prompts[i:i + batch_size])
+            encoded = tokenizer(batch, return_tensors="pt", padding=True)
+            timer = _FirstTokenTimer()
+            try:
+                with torch.no_grad():
+                    output = model.generate(
+                        **encoded,
+                        max_new_tokens=max_new_tokens,
+                        do_sample=False,
+                        pad_token_id=tokenizer.pad_token_id,
+                        streamer=timer,
+                    )
+            except Exception as e:
+                failed += len(batch)
+                logger.error(f"Generation failed at batch size {batch_size}: {e}")
+                continue
+            new_tokens = output[:, encoded["input_ids"].shape[1]:]
+            total_tokens += _count_generated(new_tokens, tokenizer.eos_token_id)
+            first_token_times.append(timer.time_to_first_token)
+    finally:
+        tokenizer.padding_side = padding_side
+
+    elapsed = time.perf_counter() - start_time
+    return {
+        "batch_size": batch_size,
+        "generated_tokens": total_tokens,
+        "failed_prompts": failed,
+        "tokens_per_second": total_tokens / elapsed if elapsed > 0 else 0.0,
+        "time_to_first_token": (sum(first_token_times) / len(first_token_times)
+                                if first_token_times else None),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Harness
+# ---------------------------------------------------------------------------
+
+class QuantizationBenchmark:
+    """Run the quality-vs-speed matrix over quantization types.
+
+    ``model_factory`` must return a fresh full-precision model on every
+    call: some quantization paths (``half()``, ``to(bfloat16)``) convert
+    the model in place.
+    """
+
+    def __init__(
+        self,
+        model_factory: Callable[[], nn.Module],
+        tokenizer,
+        quantization_types: Optional[Sequence[QuantizationType]] = None,
+        corpus: Sequence[str] = DEFAULT_CORPUS,
+        prompts: Sequence[str] = DEFAULT_PROMPTS,
+        batch_sizes: Sequence[int] = (1, 4),
+        max_new_tokens: int = 16,
+        model_name: str = "model",
+    ):
+        self.model_factory = model_factory
+        self.tokenizer = tokenizer
+        self.quantization_types = list(quantization_types or DEFAULT_TYPES)
+        self.corpus = list(corpus)
+        self.prompts = list(prompts)
+        self.batch_sizes = list(batch_sizes)
+        self.max_new_tokens = max_new_tokens
+        self.model_name = model_name
+
+    def _measure(self, model: nn.Module) -> Dict[str, Any]:
+        model.eval()
+        return {
+            "perplexity": compute_perplexity(model, self.tokenizer, self.corpus),
+            "model_bytes": serialized_size(model),
+            "generation": {
+                str(batch_size): measure_generation(
+                    model, self.tokenizer, self.prompts, batch_size, self.max_new_tokens)
+                for batch_size in self.batch_sizes
+            },
+        }
+
+    def _run_baseline(self) -> Dict[str, Any]:
+        with PeakRSSMonitor() as monitor:
+            model = self.model_factory()
+            entry = self._measure(model)
+        entry.update({"status": "ok", "peak_rss_bytes": monitor.peak,
+                      "accuracy_loss": 0.0})
+        del model
+        gc.collect()
+        return entry
+
+    def _run_type(self, qtype: QuantizationType, manager: QuantizationManager,
+                  baseline_perplexity: float) -> Dict[str, Any]:
+        manager.config = QuantizationConfig(quantization_type=qtype)
+        name = f"{self.model_name}_{qtype.value}"
+        model = quantized = None
+        try:
+            with PeakRSSMonitor() as monitor:
+                model = self.model_factory()
+                start = time.perf_counter()
+                quantized = manager.quantize_model(model, name)
+                quantization_time = time.perf_counter() - start
+                entry = self._measure(quantized)
+        except Exception as e:
+            logger.error(f"Benchmark of {qtype.value} failed: {e}")
+            return {"status": "error", "error": str(e)}
+        finally:
+            del model, quantized
+            manager.quantized_models.get(name, {}).pop("model", None)
+            gc.collect()
+
+        entry["accuracy_loss"] = manager.record_accuracy_loss(
+            name, baseline_perplexity, entry["perplexity"])
+        entry.update({"status": "ok", "peak_rss_bytes": monitor.peak,
+                      "quantization_time": quantization_time})
+        return entry
+
+    def run(self) -> Dict[str, Any]:
+        """Run every configured quantization type and return the report."""
+        logger.info(
+            f"Quantization benchmark: {len(self.quantization_types)} types, "
+            f"batch sizes {self.batch_sizes}"
+        )
+        results: Dict[str, Any] = {"baseline": self._run_baseline()}
+        baseline_perplexity = results["baseline"]["perplexity"]
+
+        manager = QuantizationManager(QuantizationConfig())
+        for qtype in self.quantization_types:
+            results[qtype.value] = self._run_type(qtype, manager, baseline_perplexity)
+
+        return {
+            "report_version": REPORT_VERSION,
+            "metadata": {
+                "model": self.model_name,
+                "torch": torch.__version__,
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "batch_sizes": self.batch_sizes,
+                "max_new_tokens": self.max_new_tokens,
+                "corpus_documents": len(self.corpus),
+            },
+            "results": results,
+        }
+
+
+# ---------------------------------------------------------------------------
+# Reporting
+# ---------------------------------------------------------------------------
+
+def _round(value: Any, digits: int = 4) -> Any:
+    if isinstance(value, float):
+        if math.isnan(value) or math.isinf(value):
+            return None
+        return round(value, digits)
+    if isinstance(value, dict):
+        return {k: _round(v, digits) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_round(v, digits) for v in value]
+    return value
+
+
+def format_table(report: Dict[str, Any]) -> str:
+    """Render the report as a Markdown comparison table."""
+    batch_sizes = [str(b) for b in report["metadata"]["batch_sizes"]]
+    header = ["type", "status", "perplexity", "accuracy loss", "model MB", "peak RSS MB"]
+    header += [f"tok/s @bs{b}" for b in batch_sizes]
+    header += [f"TTFT ms @bs{b}" for b in batch_sizes]
+    lines = ["| " + " | ".join(header) + " |", "|" + "---|" * len(header)]
+
+    def fmt(value: Any, scale: float = 1.0, digits: int = 2) -> str:
+        if value is None:
+            return "-"
+        return f"{value * scale:.{digits}f}"
+
+    for name, entry in report["results"].items():
+        if entry.get("status") != "ok":
+            row = [name, entry.get("status", "error")] + ["-"] * (len(header) - 2)
+        else:
+            generation = entry["generation"]
+            row = [
+                name,
+                "ok",
+                fmt(entry["perplexity"]),
+                fmt(entry["accuracy_loss"], 100.0, 2) + "%",
+                fmt(entry["model_bytes"], 1 / 1024 / 1024),
+                fmt(entry["peak_rss_bytes"], 1 / 1024 / 1024, 1),
+            ]
+            row += [fmt(generation[b]["tokens_per_second"], 1.0, 1) for b in batch_sizes]
+            row += [fmt(generation[b]["time_to_first_token"], 1000.0, 1) for b in batch_sizes]
+        lines.append("| " + " | ".join(row) + " |")
+    return "\n".join(lines) + "\n"
+
+
+def write_report(report: Dict[str, Any], output_dir: str,
+                 name: str = "quantization_benchmark") -> Tuple[str, str]:
+    """Write ``<name>.json`` and ``<name>.md`` into ``output_dir``.
+
+    JSON keys are sorted and floats rounded so two reports diff cleanly.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    report = _round(report)
+    json_path = os.path.join(output_dir, f"{name}.json")
+    table_path = os.path.join(output_dir, f"{name}.md")
+    with open(json_path, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write("\n")
+    with open(table_path, "w") as f:
+        f.write(f"# Quantization benchmark: {report['metadata']['model']}\n\n")
+        f.write(format_table(report))
+    logger.info(f"Wrote quantization benchmark report to {json_path}")
+    return json_path, table_path
@@ -0,0 +1,354 @@
+"""Token-bucket rate limiting for requests and generated tokens.
+
+Each client (API key, or IP address without one) has two buckets: one for
+requests per minute and one for tokens per minute. A bucket holds up to
+``burst`` minutes' worth of allowance and refills continuously, so a
+check is a constant-time update of two numbers, whatever the traffic.
+The request bucket is paid before the request runs. The token bucket is
+charged afterwards with the tokens actually used and may go into debt;
+a client in debt is refused until the bucket refills past zero.
+
+Buckets live in a :class:`BucketStore`. :class:`MemoryStore` is local to
+one process and drops idle buckets periodically; a bucket idle long
+enough to be full again is indistinguishable from a missing one.
+:class:`SQLiteStore` shares buckets between the workers of a prefork
+server, or several servers on one host, through a WAL-mode database
+file.
+
+:class:`RateLimitMiddleware` is a plain ASGI middleware (not
+``BaseHTTPMiddleware``, which adds a task and a copy of every response
+body per request). It refuses limited clients with 429 and
+``Retry-After``, adds ``X-RateLimit-*`` headers to other responses, and
+leaves the client's key in ``request.state.rate_limit_key`` so the
+endpoint can charge generated tokens::
+
+    limiter = RateLimiter.from_env()
+    app.add_middleware(RateLimitMiddleware, limiter=limiter)
+    ...
+    limiter.charge_tokens(request.state.rate_limit_key, total_tokens)
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Paths never limited: probes and scrapes must keep working under load
+EXEMPT_PATHS = ("/healthz", "/livez", "/metrics")
+
+
+def refill(level: float, updated: float, now: float, rate: float, capacity: float) -> float:
+    """Bucket level at ``now`` after refilling at ``rate`` per second."""
+    return min(capacity, level + max(0.0, now - updated) * rate)
+
+
+class BucketStore:
+    """Storage for bucket levels keyed by string.
+
+    ``update`` must apply atomically: refill the bucket, then take
+    ``amount`` when the level covers it (or always, with ``force``).
+    """
+
+    def update(self, key: str, rate: float, capacity: float, amount: float,
+               now: float, force: bool = False) -> Tuple[bool, float]:
+        """Return (taken, level after)."""
+        raise NotImplementedError
+
+    def evict(self, idle_before: float) -> int:
+        """Drop buckets last updated before ``idle_before``; return how many."""
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+
+class MemoryStore(BucketStore):
+    """Buckets in a dict; one process only."""
+
+    def __init__(self) -> None:
+        self._buckets: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def update(self, key: str, rate: float, capacity: float, amount: float,
+               now: float, force: bool = False) -> Tuple[bool, float]:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [capacity, now]
+            level = refill(bucket[0], bucket[1], now, rate, capacity)
+            taken = force or level >= amount
+            if taken:
+                level -= amount
+            bucket[0], bucket[1] = level, now
+            return taken, level
+
+    def evict(self, idle_before: float) -> int:
+        with self._lock:
+            idle = [key for key, (_, updated) in self._buckets.items() if updated < idle_before]
+            for key in idle:
+                del self._buckets[key]
+            return len(idle)
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+def _forget_connections(store: "weakref.ref[SQLiteStore]") -> None:
+    # A SQLite connection must not be used across fork(); the parent's
+    # stay open for the parent
+    instance = store()
+    if instance is not None:
+        instance._local = threading.local()
+
+
+class SQLiteStore(BucketStore):
+    """Buckets in a SQLite file shared by every process that opens it.
+
+    Each update is one ``BEGIN IMMEDIATE`` transaction, so concurrent
+    processes serialize on the database lock. Connections are per thread,
+    and a store created before ``fork()`` opens fresh ones in the child.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        if hasattr(os, "register_at_fork"):
+            store = weakref.ref(self)
+            os.register_at_fork(after_in_child=lambda: _forget_connections(store))
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS buckets "
+            "(key TEXT PRIMARY KEY, level REAL NOT NULL, updated REAL NOT NULL)"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # Losing the last moments of rate-limit state in a crash is fine
+            connection.execute("PRAGMA synchronous=OFF")
+            self._local.connection = connection
+        return connection
+
+    def update(self, key: str, rate: float, capacity: float, amount: float,
+               now: float, force: bool = False) -> Tuple[bool, float]:
+        connection = self._connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT level, updated FROM buckets WHERE key = ?", (key,)
+            ).fetchone()
+            level = capacity if row is None else refill(row[0], row[1], now, rate, capacity)
+            taken = force or level >= amount
+            if taken:
+                level -= amount
+            connection.execute(
+                "INSERT OR REPLACE INTO buckets (key, level, updated) VALUES (?, ?, ?)",
+                (key, level, now),
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return taken, level
+
+    def evict(self, idle_before: float) -> int:
+        cursor = self._connect().execute("DELETE FROM buckets WHERE updated < ?", (idle_before,))
+        return cursor.rowcount
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM buckets").fetchone()[0]
+
+
+class RateLimitDecision(NamedTuple):
+    """Outcome of :meth:`RateLimiter.check`."""
+
+    allowed: bool
+    remaining_requests: int
+    remaining_tokens: Optional[int]
+    retry_after: float
+
+
+class RateLimiter:
+    """Per-key request and token budgets.
+
+    Args:
+        requests_per_minute: Sustained request rate; 0 disables the limit
+        tokens_per_minute: Sustained prompt plus completion tokens; 0
+            disables the limit
+        burst: Minutes of allowance a bucket holds when full
+        store: Where buckets live (default: this process only)
+        evict_interval: Seconds between sweeps for idle buckets
+        clock: Time source, for tests
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = 60.0,
+        tokens_per_minute: float = 0.0,
+        burst: float = 1.0,
+        store: Optional[BucketStore] = None,
+        evict_interval: float = 60.0,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.request_capacity = requests_per_minute * burst
+        self.token_capacity = tokens_per_minute * burst
+        self.store = store if store is not None else MemoryStore()
+        self.evict_interval = evict_interval
+        self.clock = clock
+        # A bucket untouched this long has refilled completely
+        self.idle_after = burst * 60.0
+        self._next_evict = clock() + evict_interval
+        self.allowed = 0
+        self.limited = 0
+        self.evicted = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["RateLimiter"]:
+        """Build from ``RATE_LIMIT_RPM``, ``RATE_LIMIT_TPM``,
+        ``RATE_LIMIT_BURST`` and ``RATE_LIMIT_DB`` (a SQLite path shared
+        across processes). None when neither limit is set."""
+        rpm = float(os.getenv("RATE_LIMIT_RPM", "0"))
+        tpm = float(os.getenv("RATE_LIMIT_TPM", "0"))
+        if rpm <= 0 and tpm <= 0:
+            return None
+        db = os.getenv("RATE_LIMIT_DB")
+        return cls(
+            requests_per_minute=rpm,
+            tokens_per_minute=tpm,
+            burst=float(os.getenv("RATE_LIMIT_BURST", "1")),
+            store=SQLiteStore(db) if db else None,
+        )
+
+    def check(self, key: str) -> RateLimitDecision:
+        """Take one request from ``key``'s budget if it has room."""
+        now = self.clock()
+        if now >= self._next_evict:
+            self._next_evict = now + self.evict_interval
+            self.evicted += self.store.evict(now - self.idle_after)
+        remaining_tokens: Optional[int] = None
+        if self.tokens_per_minute > 0:
+            # Peek: a client that overspent waits until it is out of debt
+            ok, level = self.store.update(
+                "tokens:" + key, self.tokens_per_minute / 60.0, self.token_capacity, 0.0, now
+            )
+            remaining_tokens = max(0, int(level))
+            if not ok:
+                self.limited += 1
+                retry = -level / (self.tokens_per_minute / 60.0)
+                return RateLimitDecision(False, self._requests_left(key, now), 0, retry)
+        if self.requests_per_minute <= 0:
+            self.allowed += 1
+            return RateLimitDecision(True, -1, remaining_tokens, 0.0)
+        rate = self.requests_per_minute / 60.0
+        ok, level = self.store.update("requests:" + key, rate, self.request_capacity, 1.0, now)
+        if not ok:
+            self.limited += 1
+            return RateLimitDecision(False, 0, remaining_tokens, (1.0 - level) / rate)
+        self.allowed += 1
+        return RateLimitDecision(True, int(level), remaining_tokens, 0.0)
+
+    def _requests_left(self, key: str, now: float) -> int:
+        if self.requests_per_minute <= 0:
+            return -1
+        _, level = self.store.update(
+            "requests:" + key, self.requests_per_minute / 60.0, self.request_capacity, 0.0, now
+        )
+        return int(level)
+
+    def charge_tokens(self, key: str, tokens: int) -> None:
+        """Charge tokens a request used, even past the bucket's level."""
+        if self.tokens_per_minute <= 0 or tokens <= 0:
+            return
+        self.store.update(
+            "tokens:" + key, self.tokens_per_minute / 60.0, self.token_capacity,
+            float(tokens), self.clock(), force=True,
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests_per_minute": self.requests_per_minute,
+            "tokens_per_minute": self.tokens_per_minute,
+            "buckets": len(self.store),
+            "allowed": self.allowed,
+            "limited": self.limited,
+            "evicted": self.evicted,
+        }
+
+
+def client_key(headers: Iterable[Tuple[bytes, bytes]], client: Optional[Tuple[str, int]]) -> str:
+    """Rate-limit key: a hash of the bearer token, else the client address."""
+    for name, value in headers:
+        if name == b"authorization" and value[:7].lower() == b"bearer ":
+            return "key-" + hashlib.sha256(value[7:].strip()).hexdigest()[:16]
+    return "ip-" + (client[0] if client else "unknown")
+
+
+def _headers(decision: RateLimitDecision, limiter: RateLimiter) -> List[Tuple[bytes, bytes]]:
+    headers = []
+    if decision.remaining_requests >= 0:
+        headers.append((b"x-ratelimit-limit-requests", b"%d" % limiter.requests_per_minute))
+        headers.append((b"x-ratelimit-remaining-requests", b"%d" % decision.remaining_requests))
+    if decision.remaining_tokens is not None:
+        headers.append((b"x-ratelimit-limit-tokens", b"%d" % limiter.tokens_per_minute))
+        headers.append((b"x-ratelimit-remaining-tokens", b"%d" % decision.remaining_tokens))
+    return headers
+
+
+class RateLimitMiddleware:
+    """ASGI middleware applying a :class:`RateLimiter` to HTTP requests.
+
+    Args:
+        app: The wrapped ASGI application
+        limiter: Budgets to enforce
+        exempt: Paths that are never limited
+    """
+
+    def __init__(self, app: Any, limiter: RateLimiter, exempt: Iterable[str] = EXEMPT_PATHS):
+        self.app = app
+        self.limiter = limiter
+        self.exempt = frozenset(exempt)
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable[[], Awaitable[Any]],
+                       send: Callable[[Dict[str, Any]], Awaitable[None]]) -> None:
+        if scope["type"] != "http" or scope["path"] in self.exempt:
+            await self.app(scope, receive, send)
+            return
+        key = client_key(scope["headers"], scope.get("client"))
+        decision = self.limiter.check(key)
+        headers = _headers(decision, self.limiter)
+        if not decision.allowed:
+            retry_after = max(1, int(decision.retry_after + 0.999))
+            body = json.dumps({"detail": "Rate limit exceeded"}).encode("utf-8")
+            logger.info(f"Rate limited {key} on {scope['path']}")
+            await send({
+                "type": "http.response.start",
+                "status": 429,
+                "headers": headers + [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", b"%d" % len(body)),
+                    (b"retry-after", b"%d" % retry_after),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+        scope.setdefault("state", {})["rate_limit_key"] = key
+
+        async def send_with_headers(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
@@ -0,0 +1,175 @@
+"""Single-flight coalescing of identical in-flight generation requests.
+
+Dashboards and client retries often send byte-identical requests at the
+same moment. :class:`SingleFlight` keys each request by a canonical hash
+of (backend, model, prompt/messages, sampling params); while a generation
+for a key is running, later identical requests attach to it instead of
+starting their own:
+
+* :meth:`SingleFlight.run` shares the awaited result;
+* :meth:`SingleFlight.stream` fans the same token stream out to every
+  subscriber. Subscribers that join late first receive the tokens already
+  produced. The upstream generation is cancelled only when the last
+  subscriber goes away.
+
+Only deterministic requests (``temperature == 0``) coalesce by default.
+Sampled requests coalesce when the client opts in with the
+``X-Coalesce: true`` header, accepting that they all get the same sample.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+COALESCE_HEADER = "X-Coalesce"
+
+
+def request_key(**fields: Any) -> str:
+    """Canonical SHA-256 of the request fields (key order does not matter)."""
+    canonical = json.dumps(fields, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def coalescing_key(
+    temperature: float, opt_in: Optional[str] = None, **fields: Any
+) -> Optional[str]:
+    """Key for a request, or None if it must not be coalesced.
+
+    Args:
+        temperature: Sampling temperature; 0 means greedy and deterministic
+        opt_in: Value of the ``X-Coalesce`` header
+        **fields: Everything that determines the output (backend, model,
+            prompt or messages, max_tokens, ...)
+    """
+    opted_in = (opt_in or "").strip().lower() in ("1", "true", "yes")
+    if temperature > 0 and not opted_in:
+        return None
+    return request_key(temperature=temperature, **fields)
+
+
+class _Broadcast:
+    """One upstream token stream shared by any number of subscribers."""
+
+    def __init__(self, source: AsyncIterator[str], on_done: Callable[[], None]):
+        self.tokens: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._changed = asyncio.Condition()
+        self._on_done = on_done
+        self._task = asyncio.ensure_future(self._pump(source))
+
+    async def _pump(self, source: AsyncIterator[str]) -> None:
+        try:
+            async for token in source:
+                async with self._changed:
+                    self.tokens.append(token)
+                    self._changed.notify_all()
+        except asyncio.CancelledError:
+            self.error = RuntimeError("Generation cancelled")
+        except Exception as e:
+            self.error = e
+        finally:
+            aclose = getattr(source, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            self._on_done()
+            async with self._changed:
+                self.done = True
+                self._changed.notify_all()
+
+    def subscribe(self) -> AsyncIterator[str]:
+        # Count the subscriber now, not on first iteration, so a stream that
+        # is about to start keeps the generation alive
+        self.subscribers += 1
+        return self._follow()
+
+    async def _follow(self) -> AsyncIterator[str]:
+        index = 0
+        try:
+            while True:
+                async with self._changed:
+                    await self._changed.wait_for(
+                        lambda: index < len(self.tokens) or self.done)
+                    pending = self.tokens[index:]
+                    finished = self.done
+                index += len(pending)
+                for token in pending:
+                    yield token
+                if finished and index >= len(self.tokens):
+                    if self.error is not None:
+                        raise self.error
+                    return
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                # Nobody is listening; new requests must not attach to this one
+                self._on_done()
+                self._task.cancel()
+
+
+class SingleFlight:
+    """Registry of in-flight generations keyed by :func:`request_key`."""
+
+    def __init__(self) -> None:
+        self._results: Dict[str, asyncio.Future] = {}
+        self._streams: Dict[str, _Broadcast] = {}
+        self._counters = {"leaders": 0, "coalesced": 0}
+
+    async def run(self, key: Optional[str], factory: Callable[[], Awaitable[Any]]) -> Any:
+        """Await ``factory()``, sharing the result with identical requests.
+
+        A ``None`` key disables coalescing. A cancelled waiter does not
+        cancel the shared generation.
+        """
+        if key is None:
+            return await factory()
+        task = self._results.get(key)
+        if task is None:
+            self._counters["leaders"] += 1
+            task = asyncio.ensure_future(factory())
+            self._results[key] = task
+            task.add_done_callback(lambda _: self._release(self._results, key, task))
+        else:
+            self._counters["coalesced"] += 1
+            logger.debug(f"Coalesced request {key[:12]}")
+        return await asyncio.shield(task)
+
+    def stream(
+        self, key: Optional[str], factory: Callable[[], AsyncIterator[str]]
+    ) -> AsyncIterator[str]:
+        """Token stream for ``key``, fanned out from a single generation.
+
+        ``factory`` is called immediately for a new key, so admission errors
+        (e.g. a full inference queue) surface to the caller here. Must be
+        called from a coroutine.
+        """
+        if key is None:
+            return factory()
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            self._counters["leaders"] += 1
+            source = factory()
+            broadcast = _Broadcast(
+                source, lambda: self._release(self._streams, key, broadcast))
+            self._streams[key] = broadcast
+        else:
+            self._counters["coalesced"] += 1
+            logger.debug(f"Coalesced stream {key[:12]}")
+        return broadcast.subscribe()
+
+    @staticmethod
+    def _release(registry: Dict[str, Any], key: str, entry: Any) -> None:
+        if registry.get(key) is entry:
+            del registry[key]
+
+    def stats(self) -> Dict[str, int]:
+        """Leader/coalesced request counts and current in-flight keys."""
+        return {
+            **self._counters,
+            "in_flight": len(self._results) + len(self._streams),
+        }
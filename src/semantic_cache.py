@@ -0,0 +1,299 @@
+"""Semantic (embedding-similarity) response cache.
+
+Support prompts are often paraphrases of each other. The semantic cache
+embeds each prompt with the shared SentenceTransformer (the same one the
+RAG engine uses), searches an in-process vector index for the nearest
+earlier prompt, and returns that prompt's answer when the cosine
+similarity clears a threshold and the request parameters (model,
+backend, max_tokens, temperature, ...) match exactly.
+
+Each tenant has its own index, so one API key never sees another's
+answers. The least recently used entry is evicted when a tenant is full,
+and across tenants when the whole cache holds ``max_total_entries``, so
+clients inventing tenant ids cannot grow it without bound. Index arrays
+grow on demand rather than being allocated at full size. A sampled fraction of hits can be audited: the caller
+regenerates the answer and :meth:`SemanticCache.audit` compares it with
+the cached one. Hits whose answers disagree are counted as false hits and
+evicted.
+"""
+
+import hashlib
+import logging
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from src.embeddings import DEFAULT_EMBEDDING_MODEL, get_sentence_transformer
+from src.request_coalescing import request_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TENANT = "default"
+
+
+def tenant_for(authorization: Optional[str], tenant_header: Optional[str] = None) -> str:
+    """Tenant id for a request.
+
+    The API key wins over the ``X-Tenant-ID`` header, so a client cannot
+    read another key's cache by sending a different header.
+    """
+    if authorization and authorization.lower().startswith("bearer "):
+        token = authorization.split(" ", 1)[1].strip()
+        return "key-" + hashlib.sha256(token.encode("utf-8")).hexdigest()[:16]
+    return tenant_header or DEFAULT_TENANT
+
+
+@dataclass
+class SemanticHit:
+    """A cached answer returned by :meth:`SemanticCache.lookup`."""
+    tenant: str
+    entry_id: int
+    prompt: str
+    response: Any
+    similarity: float
+
+
+@dataclass
+class SemanticLookup:
+    """Result of a lookup; ``embedding`` is reused when storing on a miss."""
+    hit: Optional[SemanticHit]
+    embedding: np.ndarray
+
+
+@dataclass
+class _Entry:
+    entry_id: int
+    prompt: str
+    params_key: str
+    response: Any
+    last_used: float = field(default_factory=time.monotonic)
+
+
+class _TenantIndex:
+    """Dense matrix of unit-norm embeddings plus their entries.
+
+    Rows are allocated by doubling, up to ``capacity``.
+    """
+
+    INITIAL_ROWS = 16
+
+    def __init__(self, dim: int, capacity: int):
+        self.capacity = capacity
+        self.vectors = np.zeros((min(self.INITIAL_ROWS, capacity), dim), dtype=np.float32)
+        self.entries: List[_Entry] = []
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def search(self, vector: np.ndarray, params_key: str) -> Optional[tuple]:
+        if not self.entries:
+            return None
+        scores = self.vectors[:len(self.entries)] @ vector
+        for i in np.argsort(-scores):
+            if self.entries[i].params_key == params_key:
+                return int(i), float(scores[i])
+        return None
+
+    def add(self, vector: np.ndarray, entry: _Entry) -> None:
+        rows = len(self.entries)
+        if rows == self.vectors.shape[0]:
+            grown = np.zeros((min(rows * 2, self.capacity), self.vectors.shape[1]), dtype=np.float32)
+            grown[:rows] = self.vectors
+            self.vectors = grown
+        self.vectors[rows] = vector
+        self.entries.append(entry)
+
+    def remove(self, index: int) -> None:
+        # Swap with the last row so the matrix stays dense
+        last = len(self.entries) - 1
+        if index != last:
+            self.vectors[index] = self.vectors[last]
+            self.entries[index] = self.entries[last]
+        self.entries.pop()
+
+    def oldest(self) -> int:
+        return min(range(len(self.entries)), key=lambda i: self.entries[i].last_used)
+
+    def find(self, entry_id: int) -> Optional[int]:
+        for i, entry in enumerate(self.entries):
+            if entry.entry_id == entry_id:
+                return i
+        return None
+
+
+class SemanticCache:
+    """Per-tenant nearest-neighbour cache of generated answers.
+
+    Args:
+        threshold: Minimum cosine similarity for a hit
+        max_entries: Entries kept per tenant before LRU eviction
+        max_total_entries: Entries kept across all tenants before the
+            least recently used one anywhere is evicted
+        audit_rate: Fraction of hits the caller should regenerate and audit
+        audit_threshold: Minimum similarity between the cached and the
+            regenerated answer for an audited hit to count as correct
+        model_name: SentenceTransformer used when ``encoder`` is None
+        encoder: Callable mapping a list of texts to an (n, dim) array;
+            defaults to the shared SentenceTransformer
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.92,
+        max_entries: int = 1000,
+        max_total_entries: int = 10000,
+        audit_rate: float = 0.0,
+        audit_threshold: float = 0.8,
+        model_name: str = DEFAULT_EMBEDDING_MODEL,
+        encoder: Optional[Callable[[Sequence[str]], np.ndarray]] = None,
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_total_entries = max_total_entries
+        self.audit_rate = audit_rate
+        self.audit_threshold = audit_threshold
+        self.model_name = model_name
+        self._encoder = encoder
+        self._tenants: Dict[str, _TenantIndex] = {}
+        self._total = 0
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._counters = {
+            "lookups": 0,
+            "hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "audits": 0,
+            "false_hits": 0,
+        }
+
+    @classmethod
+    def from_env(cls) -> Optional["SemanticCache"]:
+        """Build from ``SEMANTIC_CACHE_*`` variables; None unless
+        ``SEMANTIC_CACHE_ENABLED`` is true."""
+        if os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() != "true":
+            return None
+        return cls(
+            threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92")),
+            max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000")),
+            max_total_entries=int(os.getenv("SEMANTIC_CACHE_MAX_TOTAL_ENTRIES", "10000")),
+            audit_rate=float(os.getenv("SEMANTIC_CACHE_AUDIT_RATE", "0.0")),
+            model_name=os.getenv("SEMANTIC_CACHE_MODEL", DEFAULT_EMBEDDING_MODEL),
+        )
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Unit-norm float32 embeddings for ``texts``."""
+        if self._encoder is not None:
+            vectors = np.asarray(self._encoder(list(texts)), dtype=np.float32)
+        else:
+            model = get_sentence_transformer(self.model_name)
+            vectors = np.asarray(model.encode(list(texts), convert_to_numpy=True),
+                                 dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def lookup(self, tenant: str, prompt: str, params: Dict[str, Any]) -> SemanticLookup:
+        """Nearest cached answer for ``prompt`` with identical ``params``."""
+        vector = self.embed([prompt])[0]
+        params_key = request_key(**params)
+        with self._lock:
+            self._counters["lookups"] += 1
+            index = self._tenants.get(tenant)
+            found = index.search(vector, params_key) if index is not None else None
+            if found is None or found[1] < self.threshold:
+                self._counters["misses"] += 1
+                return SemanticLookup(None, vector)
+            entry = index.entries[found[0]]
+            entry.last_used = time.monotonic()
+            self._counters["hits"] += 1
+            hit = SemanticHit(tenant, entry.entry_id, entry.prompt, entry.response, found[1])
+        logger.debug(f"Semantic hit ({hit.similarity:.3f}) for tenant {tenant}")
+        return SemanticLookup(hit, vector)
+
+    def store(
+        self,
+        tenant: str,
+        prompt: str,
+        params: Dict[str, Any],
+        response: Any,
+        embedding: Optional[np.ndarray] = None,
+    ) -> None:
+        """Add an answer, evicting the least recently used entry of the
+        tenant, or of the whole cache, when full."""
+        vector = embedding if embedding is not None else self.embed([prompt])[0]
+        with self._lock:
+            index = self._tenants.get(tenant)
+            if index is not None and len(index) >= self.max_entries:
+                self._remove(tenant, index, index.oldest())
+                self._counters["evictions"] += 1
+            elif self._total >= self.max_total_entries:
+                coldest = min(
+                    self._tenants.items(),
+                    key=lambda item: item[1].entries[item[1].oldest()].last_used,
+                )
+                self._remove(coldest[0], coldest[1], coldest[1].oldest())
+                self._counters["evictions"] += 1
+            index = self._tenants.get(tenant)
+            if index is None:
+                index = _TenantIndex(vector.shape[0], self.max_entries)
+                self._tenants[tenant] = index
+            self._next_id += 1
+            index.add(vector, _Entry(self._next_id, prompt, request_key(**params), response))
+            self._total += 1
+            self._counters["stores"] += 1
+
+    def _remove(self, tenant: str, index: _TenantIndex, position: int) -> None:
+        index.remove(position)
+        self._total -= 1
+        if not len(index):
+            del self._tenants[tenant]
+
+    def should_audit(self) -> bool:
+        """Whether the caller should regenerate this hit for an audit."""
+        return self.audit_rate > 0 and random.random() < self.audit_rate
+
+    def audit(self, hit: SemanticHit, fresh_text: str, cached_text: str) -> bool:
+        """Compare a regenerated answer with the cached one.
+
+        Returns True if the hit was correct. False hits are counted and the
+        entry is evicted so the paraphrase is answered fresh next time.
+        """
+        vectors = self.embed([cached_text, fresh_text])
+        agreement = float(vectors[0] @ vectors[1])
+        correct = agreement >= self.audit_threshold
+        with self._lock:
+            self._counters["audits"] += 1
+            if not correct:
+                self._counters["false_hits"] += 1
+                index = self._tenants.get(hit.tenant)
+                position = index.find(hit.entry_id) if index is not None else None
+                if position is not None:
+                    self._remove(hit.tenant, index, position)
+        if not correct:
+            logger.warning(
+                f"Semantic false hit ({hit.similarity:.3f} prompt similarity, "
+                f"{agreement:.3f} answer agreement) for tenant {hit.tenant}"
+            )
+        return correct
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters, hit rate and false-hit rate."""
+        with self._lock:
+            counters = dict(self._counters)
+            entries = {tenant: len(index) for tenant, index in self._tenants.items()}
+        return {
+            **counters,
+            "hit_rate": counters["hits"] / counters["lookups"] if counters["lookups"] else 0.0,
+            "false_hit_rate": (
+                counters["false_hits"] / counters["audits"] if counters["audits"] else 0.0
+            ),
+            "threshold": self.threshold,
+            "tenants": len(entries),
+            "entries": sum(entries.values()),
+        }
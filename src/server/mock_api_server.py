@@ -43,6 +43,12 @@ from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 
+try:
+    from src.ws_framing import PROTOCOL as FRAMES_PROTOCOL, serve_websocket
+except ImportError:  # run as a script from src/server
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    from src.ws_framing import PROTOCOL as FRAMES_PROTOCOL, serve_websocket
+
 # Configure logging first
 logging.basicConfig(
     level=logging.DEBUG,
@@ -209,6 +215,17 @@ async def websocket_endpoint(websocket: WebSocket):
         await websocket.accept()
         logger.info("New WebSocket connection established")
 
+        if websocket.query_params.get("protocol") == FRAMES_PROTOCOL:
+            # Coalesced, multiplexed token frames instead of one message per token
+            await serve_websocket(
+                websocket,
+                lambda request: mock_llama.generate_response(
+                    request.get("prompt") or request.get("content", "")
+                ),
+                websocket.query_params.get("encoding", "json")
+            )
+            return
+
         while True:
             try:
                 # Receive message from client
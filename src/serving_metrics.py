@@ -0,0 +1,503 @@
+"""Prometheus metrics for the LLM serving path.
+
+The API servers record per-request serving metrics here and expose them
+in the Prometheus text format on ``GET /metrics``:
+
+* histograms for time to first token (TTFT), time per output token
+  (TPOT), end-to-end latency and queue wait;
+* counters for prompt and completion tokens and for finished requests;
+* gauges for running and waiting requests, batch size and memory
+  utilization.
+
+Every series is labelled by ``backend`` and ``model``. The metric types
+are implemented here instead of using ``prometheus_client`` because they
+sit on the token path. Recording an event is one bisect plus a locked
+increment, well under a microsecond. Labelled children are created once
+and cached, so call ``labels()`` outside hot loops where possible.
+
+:class:`RequestTracker` follows one generation from admission to the last
+token::
+
+    tracker = serving_metrics.track("llama-gpu", "llama-base")
+    text = await executor.run(tracker.timed(engine.infer), prompt)
+    tracker.finish(prompt_tokens, completion_tokens)
+"""
+
+import asyncio
+import bisect
+import math
+import os
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; first-token latency spans cache-warm CPU demos to cold GPU loads
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.15, 0.25, 0.5, 1.0)
+E2E_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeChild:
+    __slots__ = ("value", "_lock", "_function")
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self._lock = threading.Lock()
+        self._function: Optional[Callable[[], float]] = None
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = float(value)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Read the value from ``function`` at scrape time."""
+        self._function = function
+
+    def get(self) -> float:
+        if self._function is not None:
+            return float(self._function())
+        return self.value
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...]) -> None:
+        self.bounds = bounds
+        # One slot per bucket plus the +Inf overflow
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        with self._lock:
+            return list(self.counts), self.sum
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self) -> Any:
+        raise NotImplementedError
+
+    def labels(self, *values: Any) -> Any:
+        """Child series for the given label values (in ``labelnames`` order)."""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Monotonically increasing total."""
+
+    kind = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_label_text(self.labelnames, key)} {_format_value(child.value)}"
+            for key, child in list(self._children.items())
+        ]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, or be read from a callback."""
+
+    kind = "gauge"
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def _samples(self) -> List[str]:
+        samples = []
+        for key, child in list(self._children.items()):
+            try:
+                value = child.get()
+            except Exception:
+                continue  # A failing callback must not break the scrape
+            samples.append(f"{self.name}{_label_text(self.labelnames, key)} {_format_value(value)}")
+        return samples
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(float(b) for b in buckets if b != math.inf))
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def _samples(self) -> List[str]:
+        samples = []
+        for key, child in list(self._children.items()):
+            counts, total = child.snapshot()
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                labels = _label_text(self.labelnames, key, f'le="{_format_value(bound)}"')
+                samples.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _label_text(self.labelnames, key)
+            samples.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            samples.append(f"{self.name}_count{labels} {cumulative}")
+        return samples
+
+
+class MetricsRegistry:
+    """Ordered collection of metrics rendered together on ``/metrics``."""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+def count_tokens(text: str, tokenizer: Any = None) -> int:
+    """Number of tokens in ``text``.
+
+    Uses ``tokenizer.encode`` when the backend has a tokenizer loaded
+    (Hugging Face backends). Engines without one (the demo engine) emit
+    whitespace-delimited tokens, so those are counted instead.
+    """
+    if not text:
+        return 0
+    if tokenizer is not None:
+        try:
+            return len(tokenizer.encode(text, add_special_tokens=False))
+        except TypeError:
+            return len(tokenizer.encode(text))
+    return len(text.split())
+
+
+def memory_utilization() -> float:
+    """Fraction of device memory in use.
+
+    GPU memory when CUDA/ROCm is available, otherwise this process's
+    resident memory as a fraction of physical RAM.
+    """
+    try:
+        import torch  # type: ignore
+
+        if torch.cuda.is_available():
+            device = torch.cuda.current_device()
+            total = torch.cuda.get_device_properties(device).total_memory
+            return torch.cuda.memory_allocated(device) / total
+    except ImportError:
+        pass
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    total = os.sysconf("SC_PHYS_PAGES") * page_size
+    try:
+        with open("/proc/self/statm") as f:
+            resident = int(f.read().split()[1]) * page_size
+    except OSError:
+        import resource
+
+        # ru_maxrss is in KiB on Linux; peak rather than current RSS
+        resident = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return resident / total
+
+
+class ServingMetrics:
+    """The standard LLM serving metrics, labelled by backend and model."""
+
+    LABELS = ("backend", "model")
+
+    def __init__(self, registry: Optional[MetricsRegistry] = None):
+        self.registry = registry or MetricsRegistry()
+        r = self.registry
+        self.time_to_first_token = r.histogram(
+            "llm_time_to_first_token_seconds",
+            "Time from admission to the first generated token.",
+            self.LABELS,
+            LATENCY_BUCKETS,
+        )
+        self.time_per_output_token = r.histogram(
+            "llm_time_per_output_token_seconds",
+            "Mean time between generated tokens of a request.",
+            self.LABELS,
+            TOKEN_LATENCY_BUCKETS,
+        )
+        self.e2e_latency = r.histogram(
+            "llm_e2e_request_latency_seconds",
+            "Time from admission to the last generated token.",
+            self.LABELS,
+            E2E_BUCKETS,
+        )
+        self.queue_wait = r.histogram(
+            "llm_queue_wait_seconds",
+            "Time a request waited for an inference slot.",
+            self.LABELS,
+            LATENCY_BUCKETS,
+        )
+        self.prompt_tokens = r.counter(
+            "llm_prompt_tokens_total", "Prompt tokens processed.", self.LABELS
+        )
+        self.completion_tokens = r.counter(
+            "llm_completion_tokens_total", "Completion tokens generated.", self.LABELS
+        )
+        self.requests = r.counter(
+            "llm_requests_total", "Finished generations by status.", self.LABELS + ("status",)
+        )
+        self.running = r.gauge(
+            "llm_requests_running", "Generations currently running.", self.LABELS
+        )
+        self.waiting = r.gauge(
+            "llm_requests_waiting", "Generations waiting for an inference slot.", self.LABELS
+        )
+        self.batch_size = r.gauge(
+            "llm_batch_size", "Size of the most recent batch.", self.LABELS
+        )
+        self.memory_utilization = r.gauge(
+            "llm_memory_utilization_ratio",
+            "Fraction of device memory (or host RAM) in use.",
+            self.LABELS,
+        )
+
+    def track(self, backend: str, model: Optional[str]) -> "RequestTracker":
+        """Start tracking one generation; it counts as waiting until started."""
+        return RequestTracker(self, backend, model or "default")
+
+    def observe_batch(self, backend: str, model: Optional[str], size: int) -> None:
+        self.batch_size.labels(backend, model or "default").set(size)
+
+    def watch_memory(
+        self, backend: str, model: Optional[str], function: Callable[[], float] = memory_utilization
+    ) -> None:
+        """Report ``function()`` as the memory utilization of backend/model."""
+        self.memory_utilization.labels(backend, model or "default").set_function(function)
+
+    def render(self) -> str:
+        return self.registry.render()
+
+
+class RequestTracker:
+    """Timing and token accounting for one generation.
+
+    Call :meth:`start` (or run the work through :meth:`timed`) when the
+    request gets an inference slot, :meth:`token` for each streamed token
+    and :meth:`finish` once at the end. ``finish`` is idempotent, so it can
+    sit in a ``finally`` block.
+    """
+
+    __slots__ = (
+        "_metrics", "_labels", "admitted_at", "started_at", "first_token_at",
+        "tokens", "_finished",
+    )
+
+    def __init__(self, metrics: ServingMetrics, backend: str, model: str):
+        self._metrics = metrics
+        self._labels = (backend, model)
+        self.admitted_at = time.perf_counter()
+        self.started_at: Optional[float] = None
+        self.first_token_at: Optional[float] = None
+        self.tokens = 0
+        self._finished = False
+        metrics.waiting.labels(*self._labels).inc()
+
+    def start(self) -> None:
+        """The request left the queue and began generating."""
+        if self.started_at is not None:
+            return
+        self.started_at = time.perf_counter()
+        m = self._metrics
+        m.waiting.labels(*self._labels).dec()
+        m.running.labels(*self._labels).inc()
+        m.queue_wait.labels(*self._labels).observe(self.started_at - self.admitted_at)
+
+    def timed(self, fn: Callable[..., Any]) -> Callable[..., Any]:
+        """Wrap ``fn`` so calling it marks the request as started."""
+        def run(*args: Any, **kwargs: Any) -> Any:
+            self.start()
+            return fn(*args, **kwargs)
+        return run
+
+    def token(self) -> None:
+        """One streamed token (or chunk) was produced."""
+        self.tokens += 1
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+            self._metrics.time_to_first_token.labels(*self._labels).observe(
+                self.first_token_at - self.admitted_at)
+
+    def finish(
+        self,
+        prompt_tokens: int = 0,
+        completion_tokens: Optional[int] = None,
+        status: str = "ok",
+    ) -> None:
+        """Record latency and token counts.
+
+        Latency and tokens are only recorded for successful generations.
+
+        Args:
+            prompt_tokens: Tokens in the prompt
+            completion_tokens: Generated tokens; defaults to the number of
+                :meth:`token` calls
+            status: ``ok``, ``error``, ``rejected`` (load shed) or
+                ``cancelled`` (client went away)
+        """
+        if self._finished:
+            return
+        self._finished = True
+        now = time.perf_counter()
+        m = self._metrics
+        labels = self._labels
+        if self.started_at is None:
+            m.waiting.labels(*labels).dec()  # rejected or cancelled while queued
+        else:
+            m.running.labels(*labels).dec()
+        m.requests.labels(*labels, status).inc()
+        if status != "ok" or self.started_at is None:
+            return
+        completion = self.tokens if completion_tokens is None else completion_tokens
+        m.e2e_latency.labels(*labels).observe(now - self.admitted_at)
+        m.prompt_tokens.labels(*labels).inc(prompt_tokens)
+        m.completion_tokens.labels(*labels).inc(completion)
+        if self.first_token_at is not None:
+            if completion > 1:
+                m.time_per_output_token.labels(*labels).observe(
+                    (now - self.first_token_at) / (completion - 1))
+        elif completion > 0:
+            m.time_per_output_token.labels(*labels).observe((now - self.started_at) / completion)
+
+    async def stream(
+        self,
+        tokens: Union[Iterable[str], AsyncIterator[str]],
+        prompt_tokens: Union[int, Callable[[], int]] = 0,
+        completion_tokens: Optional[Callable[[], Optional[int]]] = None,
+    ) -> AsyncIterator[str]:
+        """Pass ``tokens`` through, timing each one and finishing at the end.
+
+        ``prompt_tokens`` and ``completion_tokens`` may be callables read
+        after the stream ends, for backends that report counts last.
+        """
+        status = "error"
+        try:
+            if hasattr(tokens, "__aiter__"):
+                async for token in tokens:
+                    self.token()
+                    yield token
+            else:
+                for token in tokens:
+                    self.token()
+                    yield token
+            status = "ok"
+        except (GeneratorExit, asyncio.CancelledError):
+            status = "cancelled"  # client went away
+            raise
+        finally:
+            closer = getattr(tokens, "aclose", None)
+            if closer is not None:
+                await closer()
+            prompt = prompt_tokens() if callable(prompt_tokens) else prompt_tokens
+            completion = completion_tokens() if completion_tokens is not None else None
+            self.finish(prompt or 0, completion, status)
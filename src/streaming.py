@@ -0,0 +1,242 @@
+"""Server-Sent Events helpers for OpenAI-compatible streaming responses.
+
+Backends expose blocking token iterators (``LlamaGPU.stream_infer``,
+``OllamaBackend.stream_infer``). These helpers drive such an iterator from
+a worker thread one token at a time, wrap every token in an OpenAI
+``chat.completion.chunk`` / ``text_completion`` delta, and stop pulling
+tokens as soon as the HTTP client disconnects. The iterator is closed on
+the way out so backends can release upstream connections.
+
+Backends that report token counts at the end of a generation (Ollama)
+fill a ``usage`` dict; :func:`sse_stream` adds it to the final chunk as
+an OpenAI ``usage`` object, with the backend's timing when there is one.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+SSE_DONE = "data: [DONE]\n\n"
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    # Disable proxy buffering (nginx) so chunks reach the client immediately
+    "X-Accel-Buffering": "no",
+}
+
+_executor: Optional[ThreadPoolExecutor] = None
+_EXHAUSTED = object()
+
+
+def _default_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="sse-stream")
+    return _executor
+
+
+def _next_token(iterator: Iterator[str]) -> Any:
+    try:
+        return next(iterator)
+    except StopIteration:
+        return _EXHAUSTED
+
+
+def sse_event(data: Any) -> str:
+    """Format one SSE ``data:`` event."""
+    payload = data if isinstance(data, str) else json.dumps(data, separators=(",", ":"))
+    return f"data: {payload}\n\n"
+
+
+def completion_chunk(
+    completion_id: str,
+    created: int,
+    model: Optional[str],
+    text: str,
+    finish_reason: Optional[str] = None,
+    **extra: Any,
+) -> Dict[str, Any]:
+    """``text_completion`` chunk carrying ``text``."""
+    return {
+        "id": completion_id,
+        "object": "text_completion",
+        "created": created,
+        "model": model,
+        **extra,
+        "choices": [
+            {
+                "text": text,
+                "index": 0,
+                "logprobs": None,
+                "finish_reason": finish_reason,
+            }
+        ],
+    }
+
+
+def chat_chunk(
+    completion_id: str,
+    created: int,
+    model: Optional[str],
+    delta: Dict[str, str],
+    finish_reason: Optional[str] = None,
+    **extra: Any,
+) -> Dict[str, Any]:
+    """``chat.completion.chunk`` carrying a message ``delta``."""
+    return {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": created,
+        "model": model,
+        **extra,
+        "choices": [
+            {
+                "index": 0,
+                "delta": delta,
+                "finish_reason": finish_reason,
+            }
+        ],
+    }
+
+
+def usage_summary(usage: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """OpenAI ``usage`` object from a backend's usage dict, or None if the
+    backend reported no counts."""
+    if not usage or "completion_tokens" not in usage:
+        return None
+    prompt = usage.get("prompt_tokens", 0)
+    completion = usage["completion_tokens"]
+    summary = {
+        "prompt_tokens": prompt,
+        "completion_tokens": completion,
+        "total_tokens": prompt + completion,
+    }
+    if usage.get("timing"):
+        summary["timing"] = usage["timing"]
+    return summary
+
+
+async def iterate_in_thread(
+    iterator: Iterator[str],
+    is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+    executor: Optional[Executor] = None,
+) -> AsyncIterator[str]:
+    """Pull items from a blocking iterator without blocking the event loop.
+
+    Args:
+        iterator: Blocking token iterator
+        is_disconnected: Coroutine function (e.g. ``request.is_disconnected``)
+            checked before every token; iteration stops once it returns True
+        executor: Executor running ``next()``; defaults to a shared pool
+
+    The iterator's ``close()`` is called when iteration ends for any reason,
+    including cancellation. If a ``next()`` call is still running at that
+    point, the close happens as soon as it returns.
+    """
+    executor = executor or _default_executor()
+    pending = None
+    try:
+        while True:
+            if is_disconnected is not None and await is_disconnected():
+                logger.info("Client disconnected, cancelling stream")
+                break
+            pending = executor.submit(_next_token, iterator)
+            item = await asyncio.wrap_future(pending)
+            if item is _EXHAUSTED:
+                break
+            yield item
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            if pending is None:
+                close()
+            else:
+                # Runs immediately if next() already returned
+                pending.add_done_callback(lambda _: close())
+
+
+async def iterate_async(
+    tokens: AsyncIterator[str],
+    is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+) -> AsyncIterator[str]:
+    """Async counterpart of :func:`iterate_in_thread` for async token sources
+    (e.g. :meth:`InferenceExecutor.stream`); closes ``tokens`` on exit."""
+    try:
+        async for token in tokens:
+            if is_disconnected is not None and await is_disconnected():
+                logger.info("Client disconnected, cancelling stream")
+                break
+            yield token
+    finally:
+        aclose = getattr(tokens, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+async def sse_stream(
+    tokens: Union[Iterator[str], AsyncIterator[str]],
+    kind: str,
+    model: Optional[str],
+    is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+    executor: Optional[Executor] = None,
+    usage: Optional[Dict[str, Any]] = None,
+    **extra: Any,
+) -> AsyncIterator[str]:
+    """Render a token iterator as an OpenAI SSE stream.
+
+    Args:
+        tokens: Blocking token iterator from a backend, or an async
+            iterator that already runs off the event loop
+        kind: ``"completion"`` or ``"chat"``
+        model: Model name echoed in every chunk
+        is_disconnected: See :func:`iterate_in_thread`
+        executor: See :func:`iterate_in_thread`
+        usage: Dict the backend fills by the end of the stream; see
+            :func:`usage_summary`
+        **extra: Additional top-level fields for every chunk (e.g. ``backend``)
+
+    Yields:
+        SSE events, ending with ``data: [DONE]``. A backend error is sent as
+        an ``{"error": ...}`` event before ``[DONE]``.
+    """
+    created = int(time.time())
+    if kind == "chat":
+        completion_id = f"chatcmpl-{created}"
+
+        def chunk(delta: Dict[str, str], finish_reason: Optional[str] = None) -> Dict[str, Any]:
+            return chat_chunk(completion_id, created, model, delta, finish_reason, **extra)
+
+        yield sse_event(chunk({"role": "assistant", "content": ""}))
+        render = lambda token: chunk({"content": token})  # noqa: E731
+        final = chunk({}, "stop")
+    else:
+        completion_id = f"cmpl-{created}"
+        render = lambda token: completion_chunk(  # noqa: E731
+            completion_id, created, model, token, **extra)
+        final = completion_chunk(completion_id, created, model, "", "stop", **extra)
+
+    try:
+        if hasattr(tokens, "__aiter__"):
+            source = iterate_async(tokens, is_disconnected)
+        else:
+            source = iterate_in_thread(tokens, is_disconnected, executor)
+        async for token in source:
+            if token:
+                yield sse_event(render(token))
+    except Exception as e:
+        logger.error(f"Streaming failed: {e}")
+        yield sse_event({"error": {"message": str(e), "type": "server_error"}})
+        yield SSE_DONE
+        return
+
+    summary = usage_summary(usage)
+    if summary is not None:
+        final["usage"] = summary
+    yield sse_event(final)
+    yield SSE_DONE
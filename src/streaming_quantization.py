@@ -0,0 +1,578 @@
+"""
+Layer-streaming quantization for LLaMA GPU.
+
+This module converts a (possibly sharded) Hugging Face checkpoint one
+layer at a time: each transformer block is read from its shard, quantized,
+written to the output artifact and released before the next block is
+loaded. Peak memory is therefore roughly one layer plus overhead instead
+of the full-precision model, and an interrupted conversion resumes from
+the last completed layer.
+"""
+
+import gc
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import torch
+import torch.nn.functional as F
+
+from src.quantization import QuantizationConfig, QuantizationType
+from utils.logging import get_logger
+
+logger = get_logger("streaming_quantization")
+
+MANIFEST_NAME = "quantization_manifest.json"
+MANIFEST_VERSION = 1
+
+# Small non-weight files copied next to the quantized shards so the output
+# directory is a self-contained artifact.
+AUXILIARY_FILES = (
+    "config.json",
+    "generation_config.json",
+    "tokenizer.json",
+    "tokenizer.model",
+    "tokenizer_config.json",
+    "special_tokens_map.json",
+    "added_tokens.json",
+)
+
+_LAYER_PATTERN = re.compile(r"^(.*?\.layers\.\d+)\.")
+
+
+@dataclass
+class StreamingProgress:
+    """Progress snapshot reported after each layer group."""
+    completed_groups: int
+    total_groups: int
+    current_group: str
+    bytes_read: int
+    bytes_written: int
+    elapsed: float
+    skipped: bool = False
+
+    @property
+    def fraction(self) -> float:
+        """Completed fraction in [0, 1]."""
+        if self.total_groups == 0:
+            return 1.0
+        return self.completed_groups / self.total_groups
+
+
+@dataclass
+class StreamingQuantizationResult:
+    """Summary of a streaming quantization run."""
+    output_dir: str
+    quantization_type: str
+    total_groups: int
+    groups_quantized: int
+    groups_skipped: int
+    original_size: float  # MB
+    quantized_size: float  # MB
+    peak_group_bytes: int
+    elapsed: float
+    completed: bool = True
+    files: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+# ---------------------------------------------------------------------------
+# Tensor-level quantization primitives
+# ---------------------------------------------------------------------------
+
+def quantize_int8(weight: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Symmetric per-output-channel INT8 quantization.
+
+    Returns:
+        Tuple of (int8 tensor, float32 scale of shape [out_features, 1])
+    """
+    w = weight.float()
+    scale = w.abs().amax(dim=-1, keepdim=True).clamp(min=1e-8) / 127.0
+    q = torch.round(w / scale).clamp(-127, 127).to(torch.int8)
+    return q, scale
+
+
+def dequantize_int8(q: torch.Tensor, scale: torch.Tensor,
+                    dtype: torch.dtype = torch.float32) -> torch.Tensor:
+    """Inverse of :func:`quantize_int8`."""
+    return (q.float() * scale.float()).to(dtype)
+
+
+def quantize_int4(weight: torch.Tensor,
+                  group_size: int = 128) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Symmetric group-wise INT4 quantization with two values packed per byte.
+
+    The input dimension is padded to a multiple of ``group_size``; the
+    original shape must be kept alongside the result to unpack it.
+
+    Returns:
+        Tuple of (uint8 packed tensor [out, in_padded // 2],
+        float32 scales [out, n_groups, 1])
+    """
+    if group_size % 2:
+        raise ValueError("group_size must be even for INT4 packing")
+    w = weight.float()
+    out_features, in_features = w.shape
+    pad = (-in_features) % group_size
+    if pad:
+        w = F.pad(w, (0, pad))
+    grouped = w.view(out_features, -1, group_size)
+    scale = grouped.abs().amax(dim=-1, keepdim=True).clamp(min=1e-8) / 7.0
+    q = torch.round(grouped / scale).clamp(-8, 7).to(torch.int16)
+    q = q.view(out_features, -1)
+    packed = (q[:, 0::2] & 0xF) | ((q[:, 1::2] & 0xF) << 4)
+    return packed.to(torch.uint8), scale
+
+
+def dequantize_int4(packed: torch.Tensor, scale: torch.Tensor,
+                    shape: Iterable[int], group_size: int = 128,
+                    dtype: torch.dtype = torch.float32) -> torch.Tensor:
+    """Inverse of :func:`quantize_int4`."""
+    out_features, in_features = list(shape)
+    low = (packed & 0xF).to(torch.int16)
+    high = (packed >> 4).to(torch.int16)
+    low = torch.where(low > 7, low - 16, low)
+    high = torch.where(high > 7, high - 16, high)
+    q = torch.stack([low, high], dim=-1).view(out_features, -1)
+    w = q.view(out_features, -1, group_size).float() * scale.float()
+    return w.view(out_features, -1)[:, :in_features].to(dtype)
+
+
+def group_name_for(tensor_name: str) -> str:
+    """Map a parameter name to the layer group it is streamed with.
+
+    ``model.layers.3.mlp.up_proj.weight`` -> ``model.layers.3``;
+    anything outside the repeated blocks is grouped by its module,
+    e.g. ``model.embed_tokens`` or ``lm_head``.
+    """
+    match = _LAYER_PATTERN.match(tensor_name)
+    if match:
+        return match.group(1)
+    if "." in tensor_name:
+        return tensor_name.rsplit(".", 1)[0]
+    return tensor_name
+
+
+def _group_sort_key(group: str) -> Tuple[int, int, str]:
+    match = re.search(r"\.layers\.(\d+)$", group)
+    if match:
+        return (1, int(match.group(1)), group)
+    if "embed" in group:
+        return (0, 0, group)
+    return (2, 0, group)
+
+
+def _tensor_bytes(tensor: torch.Tensor) -> int:
+    return tensor.nelement() * tensor.element_size()
+
+
+# ---------------------------------------------------------------------------
+# Checkpoint reading
+# ---------------------------------------------------------------------------
+
+class CheckpointReader:
+    """Lazy, per-tensor reader for Hugging Face checkpoints.
+
+    Supports ``*.safetensors`` (read tensor by tensor through
+    ``safe_open``) and ``pytorch_model*.bin`` shards (memory-mapped with
+    ``torch.load(mmap=True)`` so only touched pages become resident).
+    At most ``max_open_shards`` shard handles are kept open at once.
+    """
+
+    def __init__(self, checkpoint_dir: str, max_open_shards: int = 2):
+        self.checkpoint_dir = checkpoint_dir
+        self.max_open_shards = max_open_shards
+        self.weight_map = self._build_weight_map()
+        self._open: "OrderedDict[str, Any]" = OrderedDict()
+
+    def _build_weight_map(self) -> Dict[str, str]:
+        for index_name in ("model.safetensors.index.json",
+                           "pytorch_model.bin.index.json"):
+            index_path = os.path.join(self.checkpoint_dir, index_name)
+            if os.path.exists(index_path):
+                with open(index_path, "r") as f:
+                    return dict(json.load(f)["weight_map"])
+
+        for single in ("model.safetensors", "pytorch_model.bin"):
+            path = os.path.join(self.checkpoint_dir, single)
+            if os.path.exists(path):
+                return {name: single for name in self._list_tensors(single)}
+
+        raise FileNotFoundError(
+            f"No safetensors or PyTorch checkpoint found in {self.checkpoint_dir}"
+        )
+
+    @property
+    def shard_files(self) -> List[str]:
+        """Shard file names in checkpoint order."""
+        return sorted(set(self.weight_map.values()))
+
+    def _list_tensors(self, shard: str) -> List[str]:
+        handle = self._load_shard(shard)
+        return list(handle.keys())
+
+    def _load_shard(self, shard: str) -> Any:
+        path = os.path.join(self.checkpoint_dir, shard)
+        if shard.endswith(".safetensors"):
+            from safetensors import safe_open
+            return safe_open(path, framework="pt", device="cpu")
+        try:
+            return torch.load(path, map_location="cpu", mmap=True,
+                              weights_only=True)
+        except TypeError:
+            # torch < 2.1 has no mmap support; the whole shard is resident.
+            logger.warning(f"torch.load(mmap=True) unavailable, loading {shard} eagerly")
+            return torch.load(path, map_location="cpu")
+
+    def _shard(self, shard: str) -> Any:
+        if shard in self._open:
+            self._open.move_to_end(shard)
+            return self._open[shard]
+        handle = self._load_shard(shard)
+        self._open[shard] = handle
+        while len(self._open) > self.max_open_shards:
+            _, evicted = self._open.popitem(last=False)
+            del evicted
+            gc.collect()
+        return handle
+
+    def get_tensor(self, name: str) -> torch.Tensor:
+        """Read a single tensor from its shard."""
+        shard = self.weight_map[name]
+        handle = self._shard(shard)
+        if shard.endswith(".safetensors"):
+            return handle.get_tensor(name)
+        return handle[name]
+
+    def fingerprint(self) -> str:
+        """Identity of the source checkpoint, used to validate resumes."""
+        digest = hashlib.sha256()
+        for shard in self.shard_files:
+            stat = os.stat(os.path.join(self.checkpoint_dir, shard))
+            digest.update(f"{shard}:{stat.st_size}:{int(stat.st_mtime)}".encode())
+        return digest.hexdigest()
+
+    def close(self) -> None:
+        self._open.clear()
+        gc.collect()
+
+
+# ---------------------------------------------------------------------------
+# Streaming quantizer
+# ---------------------------------------------------------------------------
+
+class StreamingQuantizer:
+    """Quantize a checkpoint layer by layer without materializing the model.
+
+    Each layer group is written to its own ``.pt`` file in ``output_dir``
+    and recorded in ``quantization_manifest.json``; the manifest is
+    rewritten atomically after every group so a rerun skips work that has
+    already been committed.
+    """
+
+    SUPPORTED_TYPES = (
+        QuantizationType.INT8,
+        QuantizationType.INT4,
+        QuantizationType.FP16,
+        QuantizationType.BF16,
+        QuantizationType.DYNAMIC,
+        QuantizationType.STATIC,
+        QuantizationType.MIXED,
+    )
+
+    def __init__(
+        self,
+        config: QuantizationConfig,
+        group_size: int = 128,
+        skip_modules: Tuple[str, ...] = ("embed_tokens", "lm_head"),
+        progress_callback: Optional[Callable[[StreamingProgress], None]] = None,
+        plan: Optional[Any] = None,
+    ):
+        if config.quantization_type not in self.SUPPORTED_TYPES:
+            raise ValueError(
+                f"Unsupported quantization type: {config.quantization_type}"
+            )
+        if plan is None and config.mixed_precision_plan:
+            from src.mixed_precision import MixedPrecisionPlan
+            plan = MixedPrecisionPlan.load(config.mixed_precision_plan)
+        if config.quantization_type == QuantizationType.MIXED and plan is None:
+            raise ValueError("Mixed quantization requires a mixed-precision plan")
+        self.config = config
+        self.plan = plan
+        self.group_size = plan.group_size if plan is not None else group_size
+        self.skip_modules = skip_modules
+        self.progress_callback = progress_callback
+
+    # -- precision selection -------------------------------------------------
+
+    def precision_for(self, tensor_name: str, tensor: torch.Tensor) -> str:
+        """Storage precision for a tensor: ``int8``, ``int4``, ``fp16`` or ``bf16``.
+
+        A mixed-precision plan, when given, decides for the 2-D weights it
+        covers; everything else follows the configured quantization type.
+        """
+        qtype = self.config.quantization_type
+        if self.plan is not None and tensor.dim() == 2:
+            planned = self.plan.precision_for(tensor_name)
+            if planned is not None:
+                return planned
+        if qtype == QuantizationType.MIXED:
+            return "fp16"
+        if qtype == QuantizationType.BF16:
+            return "bf16"
+        if qtype == QuantizationType.FP16:
+            return "fp16"
+        if tensor.dim() != 2 or not tensor_name.endswith(".weight"):
+            return "fp16"
+        if any(skip in tensor_name for skip in self.skip_modules):
+            return "fp16"
+        if qtype == QuantizationType.INT4:
+            return "int4"
+        return "int8"
+
+    def _quantize_tensor(self, name: str, tensor: torch.Tensor
+                         ) -> Tuple[Dict[str, torch.Tensor], Dict[str, Any]]:
+        meta: Dict[str, Any] = {"shape": list(tensor.shape),
+                                "dtype": str(tensor.dtype).replace("torch.", "")}
+        if not tensor.is_floating_point():
+            meta["precision"] = "raw"
+            return {name: tensor.clone()}, meta
+
+        precision = self.precision_for(name, tensor)
+        meta["precision"] = precision
+        if precision == "int8":
+            q, scale = quantize_int8(tensor)
+            return {name: q, f"{name}.scale": scale}, meta
+        if precision == "int4":
+            packed, scale = quantize_int4(tensor, self.group_size)
+            meta["group_size"] = self.group_size
+            return {name: packed, f"{name}.scale": scale}, meta
+        if precision == "bf16":
+            return {name: tensor.to(torch.bfloat16).clone()}, meta
+        return {name: tensor.to(torch.float16).clone()}, meta
+
+    # -- manifest ----------------------------------------------------------
+
+    def _config_signature(self) -> Dict[str, Any]:
+        return {
+            "quantization_type": self.config.quantization_type.value,
+            "group_size": self.group_size,
+            "skip_modules": list(self.skip_modules),
+            "plan": self.plan.assignments if self.plan is not None else None,
+        }
+
+    @staticmethod
+    def _write_json_atomic(path: str, data: Dict[str, Any]) -> None:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _load_manifest(self, output_dir: str, fingerprint: str) -> Dict[str, Any]:
+        path = os.path.join(output_dir, MANIFEST_NAME)
+        fresh = {
+            "version": MANIFEST_VERSION,
+            "source_fingerprint": fingerprint,
+            "config": self._config_signature(),
+            "groups": {},
+            "tensors": {},
+            "completed": False,
+        }
+        if not os.path.exists(path):
+            return fresh
+        try:
+            with open(path, "r") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable manifest {path}: {e}")
+            return fresh
+        if (manifest.get("source_fingerprint") != fingerprint
+                or manifest.get("config") != self._config_signature()):
+            logger.warning("Existing manifest does not match this checkpoint/config, restarting")
+            return fresh
+        return manifest
+
+    # -- main loop ---------------------------------------------------------
+
+    def plan_groups(self, reader: CheckpointReader) -> "OrderedDict[str, List[str]]":
+        """Group tensor names by layer, ordered by shard then layer index."""
+        shard_order = {shard: i for i, shard in enumerate(reader.shard_files)}
+        groups: Dict[str, List[str]] = {}
+        for name in reader.weight_map:
+            groups.setdefault(group_name_for(name), []).append(name)
+
+        def key(item: Tuple[str, List[str]]) -> Tuple[int, Tuple[int, int, str]]:
+            group, names = item
+            first_shard = min(shard_order[reader.weight_map[n]] for n in names)
+            return (first_shard, _group_sort_key(group))
+
+        return OrderedDict(sorted(groups.items(), key=key))
+
+    def quantize_checkpoint(self, checkpoint_dir: str,
+                            output_dir: str) -> StreamingQuantizationResult:
+        """Stream-quantize ``checkpoint_dir`` into ``output_dir``.
+
+        Args:
+            checkpoint_dir: Directory with a Hugging Face checkpoint
+            output_dir: Destination directory (created if missing)
+
+        Returns:
+            StreamingQuantizationResult describing the run
+        """
+        start_time = time.time()
+        os.makedirs(output_dir, exist_ok=True)
+        reader = CheckpointReader(checkpoint_dir)
+        manifest = self._load_manifest(output_dir, reader.fingerprint())
+        manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+        groups = self.plan_groups(reader)
+
+        logger.info(
+            f"Streaming {self.config.quantization_type.value} quantization of "
+            f"{checkpoint_dir}: {len(groups)} layer groups in "
+            f"{len(reader.shard_files)} shard(s)"
+        )
+
+        bytes_read = 0
+        bytes_written = 0
+        peak_group_bytes = 0
+        quantized = 0
+        skipped = 0
+
+        try:
+            for index, (group, names) in enumerate(groups.items()):
+                done = manifest["groups"].get(group)
+                if done and os.path.exists(os.path.join(output_dir, done["file"])):
+                    skipped += 1
+                    bytes_read += done["bytes_in"]
+                    bytes_written += done["bytes_out"]
+                    self._report(index + 1, len(groups), group, bytes_read,
+                                 bytes_written, start_time, skipped=True)
+                    continue
+
+                group_in = 0
+                group_tensors: Dict[str, torch.Tensor] = {}
+                group_meta: Dict[str, Dict[str, Any]] = {}
+                for name in names:
+                    tensor = reader.get_tensor(name)
+                    group_in += _tensor_bytes(tensor)
+                    stored, meta = self._quantize_tensor(name, tensor)
+                    del tensor
+                    group_tensors.update(stored)
+                    group_meta[name] = meta
+                group_out = sum(_tensor_bytes(t) for t in group_tensors.values())
+                peak_group_bytes = max(peak_group_bytes, group_in + group_out)
+
+                file_name = f"{index:05d}-{group.replace('.', '_')}.pt"
+                file_path = os.path.join(output_dir, file_name)
+                torch.save(group_tensors, f"{file_path}.tmp")
+                os.replace(f"{file_path}.tmp", file_path)
+                del group_tensors
+                gc.collect()
+
+                for name, meta in group_meta.items():
+                    meta["file"] = file_name
+                    manifest["tensors"][name] = meta
+                manifest["groups"][group] = {
+                    "file": file_name,
+                    "tensors": list(names),
+                    "bytes_in": group_in,
+                    "bytes_out": group_out,
+                }
+                self._write_json_atomic(manifest_path, manifest)
+
+                quantized += 1
+                bytes_read += group_in
+                bytes_written += group_out
+                self._report(index + 1, len(groups), group, bytes_read,
+                             bytes_written, start_time)
+        finally:
+            reader.close()
+
+        manifest["completed"] = True
+        self._write_json_atomic(manifest_path, manifest)
+        self._copy_auxiliary_files(checkpoint_dir, output_dir)
+
+        result = StreamingQuantizationResult(
+            output_dir=output_dir,
+            quantization_type=self.config.quantization_type.value,
+            total_groups=len(groups),
+            groups_quantized=quantized,
+            groups_skipped=skipped,
+            original_size=bytes_read / 1024 / 1024,
+            quantized_size=bytes_written / 1024 / 1024,
+            peak_group_bytes=peak_group_bytes,
+            elapsed=time.time() - start_time,
+            files=[g["file"] for g in manifest["groups"].values()],
+        )
+        logger.info(
+            f"Streaming quantization finished: {result.original_size:.2f} MB -> "
+            f"{result.quantized_size:.2f} MB ({skipped} group(s) resumed)"
+        )
+        return result
+
+    def _report(self, completed: int, total: int, group: str, bytes_read: int,
+                bytes_written: int, start_time: float, skipped: bool = False) -> None:
+        progress = StreamingProgress(
+            completed_groups=completed,
+            total_groups=total,
+            current_group=group,
+            bytes_read=bytes_read,
+            bytes_written=bytes_written,
+            elapsed=time.time() - start_time,
+            skipped=skipped,
+        )
+        logger.info(
+            f"[{completed}/{total}] {'resumed' if skipped else 'quantized'} {group}"
+        )
+        if self.progress_callback is not None:
+            self.progress_callback(progress)
+
+    @staticmethod
+    def _copy_auxiliary_files(checkpoint_dir: str, output_dir: str) -> None:
+        for name in AUXILIARY_FILES:
+            src = os.path.join(checkpoint_dir, name)
+            if os.path.exists(src):
+                shutil.copy2(src, os.path.join(output_dir, name))
+
+
+def load_quantized_state_dict(output_dir: str,
+                              dtype: torch.dtype = torch.float32
+                              ) -> Dict[str, torch.Tensor]:
+    """Load a streaming-quantized artifact back into a dequantized state dict.
+
+    Groups are read one file at a time, so peak memory is the dequantized
+    model plus a single quantized group.
+    """
+    with open(os.path.join(output_dir, MANIFEST_NAME), "r") as f:
+        manifest = json.load(f)
+
+    state_dict: Dict[str, torch.Tensor] = {}
+    for group in manifest["groups"].values():
+        stored = torch.load(os.path.join(output_dir, group["file"]),
+                            map_location="cpu")
+        for name in group["tensors"]:
+            meta = manifest["tensors"][name]
+            precision = meta["precision"]
+            if precision == "int8":
+                state_dict[name] = dequantize_int8(
+                    stored[name], stored[f"{name}.scale"], dtype)
+            elif precision == "int4":
+                state_dict[name] = dequantize_int4(
+                    stored[name], stored[f"{name}.scale"], meta["shape"],
+                    meta["group_size"], dtype)
+            elif precision == "raw":
+                state_dict[name] = stored[name]
+            else:
+                state_dict[name] = stored[name].to(dtype)
+        del stored
+    return state_dict
@@ -1,16 +1,36 @@
 """Unified API server supporting multiple inference backends (LlamaGPU + Ollama)."""
 
+import asyncio
 import os
 import time
 import logging
-from typing import Dict, List, Optional, Any
-from fastapi import FastAPI, Header, HTTPException, WebSocket, WebSocketDisconnect
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Any, Set, Tuple, Union
+from fastapi import FastAPI, Header, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 
 # Import backends
 from src.llama_gpu import LlamaGPU
-from src.backends.ollama import OllamaBackend
+from src.backends.ollama import OllamaBackend, ResidencyManager
+from src.advanced_cache import ResponseCache, cache_policy
+from src.backend_router import BackendRouter, RouteDecision, RoutedResult
+from src.core.exceptions import OverloadedError
+from src.embeddings import (
+    DEFAULT_EMBEDDING_MODEL,
+    DTYPES,
+    ENCODING_FORMATS,
+    EmbeddingBatcher,
+    encode_vector,
+    get_embedding_cache,
+)
+from src.inference_executor import AsyncInferenceExecutor, InferenceExecutor
+from src.model_catalog import ModelCatalog, etag_for, etag_matches
+from src.rate_limiter import RateLimiter, RateLimitMiddleware
+from src.request_coalescing import SingleFlight, coalescing_key
+from src.semantic_cache import SemanticCache, SemanticHit, SemanticLookup, tenant_for
+from src.serving_metrics import CONTENT_TYPE_LATEST, ServingMetrics, count_tokens
+from src.streaming import SSE_HEADERS, sse_stream
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -42,10 +62,49 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-client request and token budgets; None unless RATE_LIMIT_RPM or
+# RATE_LIMIT_TPM is set
+rate_limiter = RateLimiter.from_env()
+if rate_limiter is not None:
+    app.add_middleware(RateLimitMiddleware, limiter=rate_limiter)
+
 # Initialize backends
 backends = {}
 active_backend = None
 
+# All blocking generation runs here, never on the event loop
+executor = InferenceExecutor.from_env()
+# Backends with native async methods; their generations wait on the event
+# loop instead of holding an executor thread, behind the same admission rules
+ASYNC_BACKENDS = frozenset({"ollama"})
+async_executor = AsyncInferenceExecutor.from_env()
+# Identical in-flight requests share one generation
+singleflight = SingleFlight()
+# Exact-match cache for greedy (temperature 0) requests
+response_cache = ResponseCache.from_env()
+# Embedding-similarity cache; None unless SEMANTIC_CACHE_ENABLED=true
+semantic_cache = SemanticCache.from_env()
+background_tasks: Set[asyncio.Task] = set()
+# Concurrent /v1/embeddings requests share forward passes
+embedding_batcher = EmbeddingBatcher.from_env()
+EMBEDDING_MODELS = [
+    m.strip() for m in os.getenv("EMBEDDING_MODELS", DEFAULT_EMBEDDING_MODEL).split(",") if m.strip()
+]
+# TTFT/TPOT/latency histograms and token counters, served on /metrics
+serving_metrics = ServingMetrics()
+# Model lists refreshed in the background; endpoints never call backends
+catalog = ModelCatalog.from_env(backends, static_models={"llama-gpu": [{"name": "llama-base"}]})
+# Model-aware routing with health probes, circuit breaking and failover
+router = BackendRouter.from_env(
+    backends,
+    # OllamaBackend reports failures as "Error: ..." text instead of raising
+    is_failure=lambda name, value: (
+        name == "ollama" and isinstance(value, str) and value.startswith("Error: ")
+    ),
+    registry=serving_metrics.registry,
+    catalog=catalog
+)
+
 
 def initialize_backends():
     """Initialize all available backends."""
@@ -57,7 +116,11 @@ def initialize_backends():
     try:
         ollama = OllamaBackend()
         if ollama.initialize():
+            # Preloads and pins hot models; None unless OLLAMA_PRELOAD_MODELS
+            # or OLLAMA_RESIDENCY=true is set
+            ollama.residency = ResidencyManager.from_env(ollama.client)
             backends["ollama"] = ollama
+            catalog.watch("ollama")
             logger.info("✅ Ollama backend initialized")
             if active_backend is None or PREFERRED_BACKEND == "ollama":
                 active_backend = "ollama"
@@ -68,6 +131,8 @@ def initialize_backends():
     try:
         llama_gpu = LlamaGPU(model_path=None, prefer_gpu=True)
         backends["llama-gpu"] = llama_gpu
+        # Ollama manages its own memory; only the in-process engine is watched
+        serving_metrics.watch_memory("llama-gpu", "default")
         logger.info("✅ LlamaGPU backend initialized")
         if active_backend is None or PREFERRED_BACKEND == "llama-gpu":
             active_backend = "llama-gpu"
@@ -78,6 +143,7 @@ def initialize_backends():
         logger.error("❌ No backends available!")
         raise RuntimeError("No inference backends could be initialized")
     
+    router.preferred = active_backend
     logger.info(f"🚀 Active backend: {active_backend}")
     logger.info(f"📦 Available backends: {list(backends.keys())}")
 
@@ -86,6 +152,32 @@ def initialize_backends():
 @app.on_event("startup")
 async def startup_event():
     initialize_backends()
+    await catalog.refresh()
+    jobs = [router.run_probes(), catalog.run()]
+    residency = getattr(backends.get("ollama"), "residency", None)
+    if residency is not None:
+        jobs.append(residency.run())
+    for job in jobs:
+        task = asyncio.ensure_future(job)
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    ollama = backends.get("ollama")
+    if ollama is not None:
+        await ollama.aclose()
+
+
+@app.exception_handler(OverloadedError)
+async def overloaded_handler(request: Request, exc: OverloadedError) -> JSONResponse:
+    """Shed load with 429 (queue full) or 503 (deadline) plus Retry-After."""
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(int(exc.retry_after))}
+    )
 
 
 def guard_api_key(authorization: Optional[str]) -> None:
@@ -104,6 +196,7 @@ class CompletionRequest(BaseModel):
     prompt: str
     max_tokens: int = 512
     temperature: float = 0.7
+    stream: bool = False
     backend: Optional[str] = None
 
 
@@ -117,9 +210,17 @@ class ChatRequest(BaseModel):
     messages: List[ChatMessage]
     max_tokens: int = 512
     temperature: float = 0.7
+    stream: bool = False
     backend: Optional[str] = None
 
 
+class EmbeddingRequest(BaseModel):
+    input: Union[str, List[str]]
+    model: Optional[str] = None
+    encoding_format: str = "float"  # float or base64
+    dtype: str = "float32"  # float32, float16 or int8
+
+
 @app.get("/healthz")
 def healthz() -> Dict[str, str]:
     """Health check endpoint."""
@@ -136,77 +237,386 @@ def livez() -> Dict[str, Any]:
     }
 
 
-@app.get("/v1/backends")
-def list_backends() -> Dict[str, Any]:
-    """List all available backends with their status."""
+def catalog_response(request: Request, payload: Dict[str, Any]) -> Response:
+    """JSON response with an ETag; 304 when the client's copy is current."""
+    etag = etag_for(payload)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(payload, headers=headers)
+
+
+@app.get("/v1/backends", response_model=None)
+def list_backends(request: Request) -> Response:
+    """List all available backends with their status (from the model catalog)."""
     backend_info = {}
-    for name, backend in backends.items():
-        if name == "ollama":
-            backend_info[name] = backend.get_device_info()
+    for name, entry in catalog.snapshot().items():
+        backend_info[name] = {"backend": name, **entry}
+        if hasattr(backends[name], "default_model"):
+            backend_info[name]["default_model"] = backends[name].default_model
+    return catalog_response(request, {"backends": backend_info, "active": active_backend})
+
+
+@app.get("/v1/router/stats")
+def router_stats() -> Dict[str, Any]:
+    """Circuit breaker state, latency and model routes per backend."""
+    return {**router.stats(), "catalog": catalog.stats()}
+
+
+@app.get("/v1/executor/stats")
+def executor_stats() -> Dict[str, Any]:
+    """Inference queue depth, concurrency, wait times and coalescing counts."""
+    return {
+        **executor.stats(),
+        "async": async_executor.stats(),
+        "coalescing": singleflight.stats(),
+    }
+
+
+@app.get("/v1/cache/stats")
+def cache_stats() -> Dict[str, Any]:
+    """Response cache hit/miss/eviction counters."""
+    stats = response_cache.stats()
+    if semantic_cache is not None:
+        stats["semantic"] = semantic_cache.stats()
+    return stats
+
+
+@app.get("/v1/residency/stats")
+def residency_stats() -> Dict[str, Any]:
+    """Ollama models pinned, resident and their recent request rates."""
+    residency = getattr(backends.get("ollama"), "residency", None)
+    if residency is None:
+        return {"enabled": False}
+    return {"enabled": True, **residency.stats()}
+
+
+@app.get("/metrics")
+def metrics() -> Response:
+    """Serving metrics in the Prometheus text format."""
+    return Response(serving_metrics.render(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/v1/models", response_model=None)
+def list_models(request: Request) -> Response:
+    """List all available models across all backends (from the model catalog)."""
+    return catalog_response(request, {"data": catalog.models()})
+
+
+def cache_status(cache_key: Optional[str], cached: Optional[Dict[str, Any]]) -> str:
+    """Value of the X-Cache response header."""
+    if cached is not None:
+        return "HIT"
+    return "MISS" if cache_key else "BYPASS"
+
+
+def generation_args(
+    backend_name: str,
+    backend: Any,
+    req: BaseModel,
+    messages: Optional[List[Dict[str, str]]] = None,
+    stream: bool = False
+) -> Tuple[Callable[..., Any], Tuple[Any, ...], Dict[str, Any], str]:
+    """Backend method, args and kwargs for one generation, plus the prompt text."""
+    if messages is not None:
+        prompt = "\n".join([f"{m['role']}: {m['content']}" for m in messages])
+    else:
+        prompt = req.prompt
+    sampling = dict(max_tokens=req.max_tokens, temperature=req.temperature)
+    if backend_name == "ollama":
+        if messages is not None:
+            fn = backend.astream_chat if stream else backend.achat
+            return fn, (), dict(messages=messages, model=req.model, **sampling), prompt
+        fn = backend.astream_infer if stream else backend.ainfer
+        return fn, (), dict(prompt=prompt, model=req.model, **sampling), prompt
+    # For LlamaGPU, chat messages are flattened into a simple prompt
+    fn = backend.stream_infer if stream else backend.infer
+    return fn, (prompt,), sampling, prompt
+
+
+def generation_call(
+    backend_name: str,
+    backend: Any,
+    req: BaseModel,
+    messages: Optional[List[Dict[str, str]]] = None
+) -> Callable[[], Awaitable[str]]:
+    """Zero-argument coroutine factory running one non-streaming generation."""
+    fn, args, kwargs, prompt = generation_args(backend_name, backend, req, messages)
+    tokenizer = getattr(backend, "tokenizer", None)
+
+    async def generate() -> str:
+        tracker = serving_metrics.track(backend_name, req.model)
+        # Ollama reports real token counts; other backends are counted here
+        usage: Dict[str, int] = {}
+        extra = {"usage": usage} if backend_name == "ollama" else {}
+        gate = async_executor if backend_name in ASYNC_BACKENDS else executor
+        try:
+            text = await gate.run(tracker.timed(fn), *args, **kwargs, **extra)
+        except OverloadedError:
+            tracker.finish(status="rejected")
+            raise
+        except BaseException:
+            tracker.finish(status="error")
+            raise
+        if backend_name == "ollama" and text.startswith("Error: "):
+            tracker.finish(status="error")
         else:
-            backend_info[name] = {"backend": name, "available": True}
-    return {"backends": backend_info, "active": active_backend}
+            tracker.finish(
+                usage.get("prompt_tokens") or count_tokens(prompt, tokenizer),
+                usage.get("completion_tokens", count_tokens(text, tokenizer))
+            )
+        return text
+
+    return generate
 
 
-@app.get("/v1/models")
-def list_models() -> Dict[str, List[Dict[str, Any]]]:
-    """List all available models across all backends."""
-    models = []
+def stream_call(
+    backend_name: str,
+    backend: Any,
+    req: BaseModel,
+    messages: Optional[List[Dict[str, str]]] = None,
+    usage: Optional[Dict[str, Any]] = None
+) -> Callable[[], AsyncIterator[str]]:
+    """Factory for a metered token stream; admission errors raise on call.
     
-    # Get models from each backend
-    for backend_name, backend in backends.items():
-        if backend_name == "ollama":
-            ollama_models = backend.list_models()
-            for model in ollama_models:
-                models.append({
-                    "id": model["name"],
-                    "object": "model",
-                    "backend": "ollama",
-                    "size": model.get("size", 0)
-                })
-        elif backend_name == "llama-gpu":
-            models.append({
-                "id": "llama-base",
-                "object": "model",
-                "backend": "llama-gpu"
-            })
+    ``usage`` is filled with Ollama's token counts and timing by the end
+    of the stream.
+    """
+    fn, args, kwargs, prompt = generation_args(backend_name, backend, req, messages, stream=True)
+    tokenizer = getattr(backend, "tokenizer", None)
+    usage = {} if usage is None else usage
+
+    def start() -> AsyncIterator[str]:
+        tracker = serving_metrics.track(backend_name, req.model)
+        extra = {"usage": usage} if backend_name == "ollama" else {}
+        gate = async_executor if backend_name in ASYNC_BACKENDS else executor
+        try:
+            tokens = gate.stream(tracker.timed(fn), *args, **kwargs, **extra)
+        except OverloadedError:
+            tracker.finish(status="rejected")
+            raise
+        return tracker.stream(
+            tokens,
+            lambda: usage.get("prompt_tokens") or count_tokens(prompt, tokenizer),
+            lambda: usage.get("completion_tokens")
+        )
+
+    return start
+
+
+def route_request(req: BaseModel) -> RouteDecision:
+    """Pick the backend for a request, honouring an explicit ``backend``."""
+    try:
+        return router.route(req.model, req.backend)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def routed_generation(
+    decision: RouteDecision,
+    req: BaseModel,
+    messages: Optional[List[Dict[str, str]]] = None
+) -> Callable[[], Awaitable[RoutedResult]]:
+    """Like :func:`generation_call`, failing over to healthy backends."""
+    async def generate() -> RoutedResult:
+        return await router.call(
+            decision,
+            lambda name: generation_call(name, backends[name], req, messages)()
+        )
+
+    return generate
+
+
+def routed_stream(
+    decision: RouteDecision,
+    req: BaseModel,
+    messages: Optional[List[Dict[str, str]]] = None,
+    usage: Optional[Dict[str, Any]] = None
+) -> Callable[[], AsyncIterator[str]]:
+    """Like :func:`stream_call`, failing over until the first token."""
+    def start() -> AsyncIterator[str]:
+        return router.stream(
+            decision,
+            lambda name: stream_call(name, backends[name], req, messages, usage)()
+        )
+
+    return start
+
+
+def routed_text(generate: Callable[[], Awaitable[RoutedResult]]) -> Callable[[], Awaitable[str]]:
+    """Text-only view of a routed generation (for semantic cache audits)."""
+    async def text() -> str:
+        return (await generate()).value
+
+    return text
+
+
+async def semantic_lookup(
+    tenant: str,
+    prompt: str,
+    params: Dict[str, Any],
+    read: bool,
+    regenerate: Callable[[], Awaitable[str]]
+) -> Optional[SemanticLookup]:
+    """Find a cached answer to a paraphrased prompt.
     
-    return {"data": models}
+    For a sampled fraction of hits, ``regenerate`` runs in the background
+    and the fresh answer is audited against the cached one.
+    """
+    if semantic_cache is None or not read:
+        return None
+    lookup = await asyncio.to_thread(semantic_cache.lookup, tenant, prompt, params)
+    if lookup.hit is not None and semantic_cache.should_audit():
+        task = asyncio.ensure_future(audit_semantic_hit(lookup.hit, regenerate))
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+    return lookup
+
+
+async def audit_semantic_hit(
+    hit: SemanticHit, regenerate: Callable[[], Awaitable[str]]
+) -> None:
+    """Regenerate a semantic hit and record whether the cached answer held up."""
+    try:
+        fresh = await regenerate()
+    except OverloadedError:
+        return  # Audits never compete with live traffic
+    await asyncio.to_thread(semantic_cache.audit, hit, fresh, hit.response["text"])
+
+
+async def store_response(
+    cache_key: Optional[str],
+    write: bool,
+    backend_name: str,
+    text: str,
+    tenant: str,
+    prompt: str,
+    params: Dict[str, Any],
+    lookup: Optional[SemanticLookup]
+) -> None:
+    """Cache generated text unless the client opted out or generation failed."""
+    # OllamaBackend reports failures as "Error: ..." text instead of raising
+    if not write or (backend_name == "ollama" and text.startswith("Error: ")):
+        return
+    response_cache.set(cache_key, {"text": text})
+    if semantic_cache is not None:
+        await asyncio.to_thread(
+            semantic_cache.store,
+            tenant,
+            prompt,
+            params,
+            {"text": text},
+            lookup.embedding if lookup is not None else None
+        )
 
 
-@app.post("/v1/completions")
-def completions(
+def stream_response(
+    request: Request,
+    tokens: Union[Iterator[str], AsyncIterator[str]],
+    kind: str,
+    model: Optional[str],
+    backend_name: str,
+    x_cache: str,
+    usage: Optional[Dict[str, Any]] = None
+) -> StreamingResponse:
+    """Wrap a backend token iterator in an OpenAI-style SSE response.
+    
+    Tokens are forwarded as the backend produces them, and a client
+    disconnect closes ``tokens``, which cancels the upstream generation.
+    ``usage`` (filled by the backend) goes into the final chunk.
+    """
+    return StreamingResponse(
+        sse_stream(
+            tokens,
+            kind,
+            model or "default",
+            request.is_disconnected,
+            usage=usage,
+            backend=backend_name
+        ),
+        media_type="text/event-stream",
+        headers={**SSE_HEADERS, "X-Cache": x_cache, "X-Backend": backend_name}
+    )
+
+
+def charge_tokens(request: Request, tokens: int) -> None:
+    """Charge the caller's token budget, when rate limiting is on."""
+    key = getattr(request.state, "rate_limit_key", None)
+    if rate_limiter is not None and key is not None:
+        rate_limiter.charge_tokens(key, tokens)
+
+
+@app.post("/v1/completions", response_model=None)
+async def completions(
     req: CompletionRequest,
-    authorization: Optional[str] = Header(None)
-) -> Dict[str, Any]:
+    request: Request,
+    response: Response,
+    authorization: Optional[str] = Header(None),
+    x_coalesce: Optional[str] = Header(None),
+    cache_control: Optional[str] = Header(None),
+    x_tenant_id: Optional[str] = Header(None)
+) -> Union[Dict[str, Any], StreamingResponse]:
     """Text completion endpoint supporting multiple backends."""
     guard_api_key(authorization)
     
     # Determine which backend to use
-    backend_name = req.backend or active_backend
-    if backend_name not in backends:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Backend '{backend_name}' not available"
-        )
+    decision = route_request(req)
+    backend_name = decision.backend
+    fields = dict(
+        backend=backend_name,
+        model=req.model,
+        prompt=req.prompt,
+        max_tokens=req.max_tokens
+    )
+    key = coalescing_key(req.temperature, x_coalesce, **fields)
+    cache_key = coalescing_key(req.temperature, None, **fields)
+    read, write = cache_policy(cache_control)
+    cached = response_cache.get(cache_key) if read else None
+    x_cache = cache_status(cache_key, cached)
+    generate = routed_generation(decision, req, None)
+    
+    # Near-duplicate prompts from the same tenant reuse earlier answers
+    tenant = tenant_for(authorization, x_tenant_id)
+    semantic_params = dict(
+        backend=backend_name,
+        model=req.model,
+        max_tokens=req.max_tokens,
+        temperature=req.temperature
+    )
+    lookup = None
+    if cached is None:
+        lookup = await semantic_lookup(tenant, req.prompt, semantic_params, read, routed_text(generate))
+        if lookup is not None and lookup.hit is not None:
+            cached, x_cache = lookup.hit.response, "SEMANTIC-HIT"
     
-    backend = backends[backend_name]
+    if req.stream:
+        # Coalesced followers share the leader's tokens but not its usage
+        usage: Dict[str, Any] = {}
+        if cached is not None:
+            tokens = iter([cached["text"]])
+        else:
+            tokens = singleflight.stream(key, routed_stream(decision, req, None, usage))
+        # Streams are charged up front for the most they may generate
+        charge_tokens(request, count_tokens(req.prompt) + req.max_tokens)
+        return stream_response(
+            request, tokens, "completion", req.model, backend_name, x_cache, usage
+        )
     
     try:
         # Generate text
-        if backend_name == "ollama":
-            text = backend.infer(
-                prompt=req.prompt,
-                model=req.model,
-                max_tokens=req.max_tokens,
-                temperature=req.temperature
-            )
+        if cached is not None:
+            text = cached["text"]
+            served, routing = backend_name, decision.info(cached=True)
         else:
-            text = backend.infer(
-                req.prompt,
-                max_tokens=req.max_tokens,
-                temperature=req.temperature
+            routed = await singleflight.run(key, generate)
+            text, served, routing = routed.value, routed.backend, routed.info(decision)
+            await store_response(
+                cache_key, write, served, text,
+                tenant, req.prompt, semantic_params, lookup
             )
+        response.headers["X-Cache"] = x_cache
+        response.headers["X-Backend"] = served
+        charge_tokens(request, count_tokens(req.prompt) + count_tokens(text))
         
         now = int(time.time())
         return {
@@ -214,7 +624,8 @@ def completions(
             "object": "text_completion",
             "created": now,
             "model": req.model or "default",
-            "backend": backend_name,
+            "backend": served,
+            "routing": routing,
             "choices": [
                 {
                     "text": text,
@@ -224,49 +635,84 @@ def completions(
                 }
             ]
         }
+    except OverloadedError:
+        raise
     except Exception as e:
         logger.error(f"Completion failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/v1/chat/completions")
-def chat_completions(
+@app.post("/v1/chat/completions", response_model=None)
+async def chat_completions(
     req: ChatRequest,
-    authorization: Optional[str] = Header(None)
-) -> Dict[str, Any]:
+    request: Request,
+    response: Response,
+    authorization: Optional[str] = Header(None),
+    x_coalesce: Optional[str] = Header(None),
+    cache_control: Optional[str] = Header(None),
+    x_tenant_id: Optional[str] = Header(None)
+) -> Union[Dict[str, Any], StreamingResponse]:
     """Chat completion endpoint supporting multiple backends."""
     guard_api_key(authorization)
     
     # Determine which backend to use
-    backend_name = req.backend or active_backend
-    if backend_name not in backends:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Backend '{backend_name}' not available"
-        )
+    decision = route_request(req)
+    backend_name = decision.backend
+    messages = [{"role": m.role, "content": m.content} for m in req.messages]
+    fields = dict(
+        backend=backend_name,
+        model=req.model,
+        messages=messages,
+        max_tokens=req.max_tokens
+    )
+    key = coalescing_key(req.temperature, x_coalesce, **fields)
+    cache_key = coalescing_key(req.temperature, None, **fields)
+    read, write = cache_policy(cache_control)
+    cached = response_cache.get(cache_key) if read else None
+    x_cache = cache_status(cache_key, cached)
+    generate = routed_generation(decision, req, messages)
+    prompt = "\n".join([f"{m['role']}: {m['content']}" for m in messages])
     
-    backend = backends[backend_name]
+    # Near-duplicate prompts from the same tenant reuse earlier answers
+    tenant = tenant_for(authorization, x_tenant_id)
+    semantic_params = dict(
+        backend=backend_name,
+        model=req.model,
+        max_tokens=req.max_tokens,
+        temperature=req.temperature
+    )
+    lookup = None
+    if cached is None:
+        lookup = await semantic_lookup(tenant, prompt, semantic_params, read, routed_text(generate))
+        if lookup is not None and lookup.hit is not None:
+            cached, x_cache = lookup.hit.response, "SEMANTIC-HIT"
+    
+    if req.stream:
+        usage: Dict[str, Any] = {}
+        if cached is not None:
+            tokens = iter([cached["text"]])
+        else:
+            tokens = singleflight.stream(key, routed_stream(decision, req, messages, usage))
+        charge_tokens(request, count_tokens(prompt) + req.max_tokens)
+        return stream_response(
+            request, tokens, "chat", req.model, backend_name, x_cache, usage
+        )
     
     try:
-        # Convert messages
-        messages = [{"role": m.role, "content": m.content} for m in req.messages]
-        
         # Generate response
-        if backend_name == "ollama":
-            content = backend.chat(
-                messages=messages,
-                model=req.model,
-                max_tokens=req.max_tokens,
-                temperature=req.temperature
-            )
+        if cached is not None:
+            content = cached["text"]
+            served, routing = backend_name, decision.info(cached=True)
         else:
-            # For LlamaGPU, convert to simple prompt
-            prompt = "\n".join([f"{m['role']}: {m['content']}" for m in messages])
-            content = backend.infer(
-                prompt,
-                max_tokens=req.max_tokens,
-                temperature=req.temperature
+            routed = await singleflight.run(key, generate)
+            content, served, routing = routed.value, routed.backend, routed.info(decision)
+            await store_response(
+                cache_key, write, served, content,
+                tenant, prompt, semantic_params, lookup
             )
+        response.headers["X-Cache"] = x_cache
+        response.headers["X-Backend"] = served
+        charge_tokens(request, count_tokens(prompt) + count_tokens(content))
         
         now = int(time.time())
         return {
@@ -274,7 +720,8 @@ def chat_completions(
             "object": "chat.completion",
             "created": now,
             "model": req.model or "default",
-            "backend": backend_name,
+            "backend": served,
+            "routing": routing,
             "choices": [
                 {
                     "index": 0,
@@ -286,11 +733,50 @@ def chat_completions(
                 }
             ]
         }
+    except OverloadedError:
+        raise
     except Exception as e:
         logger.error(f"Chat completion failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/v1/embeddings")
+async def embeddings(
+    req: EmbeddingRequest,
+    request: Request,
+    authorization: Optional[str] = Header(None)
+) -> Dict[str, Any]:
+    """OpenAI-compatible embeddings, micro-batched across concurrent requests."""
+    guard_api_key(authorization)
+    model = req.model or EMBEDDING_MODELS[0]
+    if model not in EMBEDDING_MODELS:
+        raise HTTPException(status_code=400, detail=f"Embedding model '{model}' not available")
+    if req.dtype not in DTYPES or req.encoding_format not in ENCODING_FORMATS:
+        raise HTTPException(status_code=400, detail="Unsupported dtype or encoding_format")
+    texts = [req.input] if isinstance(req.input, str) else req.input
+    if not texts or any(not text for text in texts):
+        raise HTTPException(status_code=400, detail="input must be non-empty text")
+    vectors = await embedding_batcher.embed(texts, model)
+    data = [
+        {"object": "embedding", "index": i, **encode_vector(v, req.dtype, req.encoding_format)}
+        for i, v in enumerate(vectors)
+    ]
+    tokens = sum(count_tokens(text) for text in texts)
+    charge_tokens(request, tokens)
+    return {
+        "object": "list",
+        "data": data,
+        "model": model,
+        "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+    }
+
+
+@app.get("/v1/embeddings/stats")
+def embedding_stats() -> Dict[str, Any]:
+    """Micro-batching and embedding cache counters."""
+    return {**embedding_batcher.stats(), "cache": get_embedding_cache().stats()}
+
+
 @app.post("/v1/backend/switch")
 def switch_backend(backend: str) -> Dict[str, str]:
     """Switch the active backend."""
@@ -303,6 +789,7 @@ def switch_backend(backend: str) -> Dict[str, str]:
         )
     
     active_backend = backend
+    router.preferred = backend
     logger.info(f"Switched to backend: {backend}")
     return {"status": "ok", "active_backend": active_backend}
 
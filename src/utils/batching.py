@@ -1,11 +1,28 @@
 """
 batching.py - Request queuing and dynamic batching utilities for LLaMA GPU API server.
+
+``request_queue`` may be a plain ``queue.Queue`` (FIFO) or a
+``src.fair_scheduler.FairScheduler``, which fills each batch by priority
+class and fair share across API keys. Items are claimed from a scheduler
+and completed after their batch, freeing their key's in-flight slots and,
+given a ``usage`` function, settling each key's charge to the tokens its
+items really used.
+
+``batch_infer`` on every engine returns a :class:`BatchReport`. Backends
+that serve one prompt per call (Ollama) build it with :func:`fan_out`,
+which runs the prompts concurrently with a bounded number in flight.
 """
 
 import queue
 import threading
 import time
-from typing import Any, Callable, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+try:
+    from src.serving_metrics import count_tokens as _count_tokens
+except ImportError:  # imported as utils.batching with src/ on sys.path
+    from serving_metrics import count_tokens as _count_tokens
 
 
 class BatchWorker(threading.Thread):
@@ -14,28 +31,51 @@ class BatchWorker(threading.Thread):
                  batch_process_fn: Callable[[List[Any]], List[Any]],
                  batch_size: int = 8, 
                  batch_timeout: float = 0.1,
-                 name: Optional[str] = None):
+                 name: Optional[str] = None,
+                 on_batch: Optional[Callable[[int], None]] = None,
+                 usage: Optional[Callable[[Any, Any], float]] = None):
         super().__init__(daemon=True, name=name)
         self.request_queue = request_queue
         self.batch_process_fn = batch_process_fn
         self.batch_size = batch_size
         self.batch_timeout = batch_timeout
+        # Called with each batch's size, e.g. ServingMetrics.observe_batch
+        self.on_batch = on_batch
+        # Tokens an item used, from the item and its result
+        self.usage = usage
         self.running = True
 
     def run(self):
+        claim = getattr(self.request_queue, "claim", None)
         while self.running:
             batch = []
+            claims = []
             start_time = time.time()
             while len(batch) < self.batch_size:
                 try:
-                    item = self.request_queue.get(timeout=self.batch_timeout)
-                    batch.append(item)
+                    if claim is not None:
+                        claims.append(claim(timeout=self.batch_timeout))
+                        batch.append(claims[-1].item)
+                    else:
+                        batch.append(self.request_queue.get(timeout=self.batch_timeout))
                 except queue.Empty:
                     break
                 if time.time() - start_time > self.batch_timeout:
                     break
             if batch:
-                self.batch_process_fn(batch)
+                if self.on_batch is not None:
+                    self.on_batch(len(batch))
+                used: Dict[int, float] = {}
+                try:
+                    results = self.batch_process_fn(batch)
+                    if self.usage is not None and claims:
+                        used = {
+                            index: self.usage(item, result)
+                            for index, (item, result) in enumerate(zip(batch, results))
+                        }
+                finally:
+                    for index, taken in enumerate(claims):
+                        self.request_queue.complete(taken, used=used.get(index))
 
     def stop(self):
         self.running = False
@@ -47,7 +87,9 @@ def start_batch_workers(
     batch_process_fn: Callable[[List[Any]], List[Any]],
     batch_size: int = 8,
     batch_timeout: float = 0.1,
-    name_prefix: str = "BatchWorker"
+    name_prefix: str = "BatchWorker",
+    on_batch: Optional[Callable[[int], None]] = None,
+    usage: Optional[Callable[[Any, Any], float]] = None
 ) -> List[BatchWorker]:
     workers = []
     for i in range(num_workers):
@@ -56,8 +98,108 @@ def start_batch_workers(
             batch_process_fn=batch_process_fn,
             batch_size=batch_size,
             batch_timeout=batch_timeout,
-            name=f"{name_prefix}-{i+1}"
+            name=f"{name_prefix}-{i+1}",
+            on_batch=on_batch,
+            usage=usage
         )
         worker.start()
         workers.append(worker)
-    return workers 
\ No newline at end of file
+    return workers 
+
+class BatchReport(list):
+    """Outputs of a batch in input order, with errors and throughput.
+
+    It is the list of generated texts, with None where an item failed,
+    so callers that treat ``batch_infer`` results as a list keep working.
+
+    Args:
+        texts: Output per input item
+        errors: Error message by index of each failed item
+        prompt_tokens: Prompt tokens across successful items
+        completion_tokens: Generated tokens across successful items
+        elapsed: Wall-clock seconds for the whole batch
+        latencies: Seconds each item took
+        concurrency: Items that were allowed in flight at once
+    """
+
+    def __init__(
+        self,
+        texts: Iterable[Optional[str]] = (),
+        errors: Optional[Dict[int, str]] = None,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        elapsed: float = 0.0,
+        latencies: Optional[List[float]] = None,
+        concurrency: int = 1,
+    ):
+        super().__init__(texts)
+        self.errors = dict(errors or {})
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.elapsed = elapsed
+        self.latencies = list(latencies or [])
+        self.concurrency = concurrency
+
+    @property
+    def tokens_per_second(self) -> float:
+        """Generated tokens per wall-clock second across the batch."""
+        return self.completion_tokens / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "items": len(self),
+            "failed": len(self.errors),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "elapsed_seconds": self.elapsed,
+            "tokens_per_second": self.tokens_per_second,
+            "concurrency": self.concurrency,
+            "errors": {str(i): e for i, e in sorted(self.errors.items())},
+        }
+
+
+def fan_out(
+    fn: Callable[[Any, Dict[str, int]], str],
+    items: Iterable[Any],
+    concurrency: int = 4,
+    count_tokens: Callable[[str], int] = _count_tokens,
+) -> BatchReport:
+    """Run ``fn(item, usage)`` for every item, ``concurrency`` at a time.
+
+    ``fn`` may fill ``usage`` with ``prompt_tokens`` and
+    ``completion_tokens``; otherwise the output is counted with
+    ``count_tokens``, which should wrap the engine's tokenizer when it has
+    one (see :func:`src.serving_metrics.count_tokens`). An exception fails
+    only its own item.
+    """
+    items = list(items)
+    texts: List[Optional[str]] = [None] * len(items)
+    latencies = [0.0] * len(items)
+    errors: Dict[int, str] = {}
+    totals = [0, 0]
+    lock = threading.Lock()
+
+    def run(index: int) -> None:
+        usage: Dict[str, int] = {}
+        started = time.perf_counter()
+        try:
+            text = fn(items[index], usage)
+        except Exception as e:
+            errors[index] = str(e) or type(e).__name__
+            return
+        finally:
+            latencies[index] = time.perf_counter() - started
+        texts[index] = text
+        completion = usage.get("completion_tokens", count_tokens(text))
+        with lock:
+            totals[0] += usage.get("prompt_tokens", 0)
+            totals[1] += completion
+
+    concurrency = max(1, concurrency)
+    started = time.perf_counter()
+    if items:
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(items))) as pool:
+            list(pool.map(run, range(len(items))))
+    return BatchReport(
+        texts, errors, totals[0], totals[1], time.perf_counter() - started, latencies, concurrency
+    )
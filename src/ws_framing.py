@@ -0,0 +1,350 @@
+"""Coalesced, multiplexed token framing for WebSocket streams.
+
+Sending one WebSocket message per token costs a frame and usually a
+syscall for every token. At high token rates and with many clients, that
+overhead dominates. This module implements an opt-in ``frames`` protocol
+for the ``/v1/stream`` endpoints:
+
+* tokens are buffered per request and flushed when a buffer holds
+  ``max_tokens`` tokens (default 16) or its oldest token is
+  ``window_ms`` old (default 15 ms). One message carries the pending
+  frames of every request that is due;
+* several requests run concurrently on one socket, each identified by a
+  client-chosen ``id``, and can be cancelled individually;
+* messages are JSON text or, with ``encoding=msgpack``, MessagePack
+  binary;
+* a slow reader gets larger frames, because buffers keep filling while a
+  send is blocked. Once a request has ``max_buffered`` unsent tokens, its
+  generation is paused until the writer catches up.
+
+Client to server::
+
+    {"type": "generate", "id": "a", "prompt": "...", "max_tokens": 64}
+    {"type": "cancel", "id": "a"}
+
+Server to client::
+
+    {"type": "tokens", "ts": 1700000000.123, "frames": [
+        {"id": "a", "seq": 0, "text": "Hello wor", "n": 3,
+         "ids": [15043, 3186, 29991],          # when the backend has them
+         "first_ms": 41.2, "last_ms": 52.9}]}
+    # last frame of a request also has:
+        {..., "done": true, "finish_reason": "stop", "tokens": 57, "ttft_ms": 41.2}
+    {"type": "error", "id": "a", "message": "..."}
+
+Backends may yield plain text tokens or ``(token_id, text)`` pairs.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Union
+
+try:
+    import msgpack  # type: ignore
+except ImportError:  # optional: only needed for encoding=msgpack
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+PROTOCOL = "frames"
+DEFAULT_WINDOW_MS = 15.0
+DEFAULT_MAX_TOKENS = 16
+DEFAULT_MAX_BUFFERED = 1024
+
+_EXHAUSTED = object()
+
+Token = Union[str, tuple]
+StreamFactory = Callable[[Dict[str, Any]], Union[AsyncIterator[Token], Iterable[Token]]]
+
+
+class FrameCodec:
+    """Encodes server messages and decodes client messages.
+
+    Args:
+        encoding: ``json`` (text messages) or ``msgpack`` (binary messages)
+    """
+
+    def __init__(self, encoding: str = "json"):
+        if encoding not in ("json", "msgpack"):
+            raise ValueError(f"Unsupported encoding: {encoding}")
+        if encoding == "msgpack" and msgpack is None:
+            raise ValueError("encoding=msgpack requires the msgpack package")
+        self.encoding = encoding
+
+    def encode(self, message: Dict[str, Any]) -> Union[str, bytes]:
+        if self.encoding == "msgpack":
+            return msgpack.packb(message, use_bin_type=True)
+        return json.dumps(message, separators=(",", ":"))
+
+    @staticmethod
+    def decode(data: Union[str, bytes]) -> Dict[str, Any]:
+        """Decode a client message; binary messages are MessagePack."""
+        if isinstance(data, bytes):
+            if msgpack is None:
+                raise ValueError("Binary messages require the msgpack package")
+            return msgpack.unpackb(data, raw=False)
+        return json.loads(data)
+
+
+class _RequestBuffer:
+    """Unsent tokens of one request."""
+
+    def __init__(self, request_id: str, started: float):
+        self.request_id = request_id
+        self.started = started
+        self.seq = 0
+        self.texts: List[str] = []
+        self.ids: List[Any] = []
+        self.first_at: Optional[float] = None
+        self.last_at = 0.0
+        self.first_token_at: Optional[float] = None
+        self.total = 0
+        self.finish_reason: Optional[str] = None
+        self.error: Optional[str] = None
+        self.drained = asyncio.Event()
+        self.drained.set()
+
+    def add(self, token: Token, now: float) -> None:
+        if isinstance(token, tuple):
+            token_id, text = token
+            self.ids.append(token_id)
+        else:
+            text = token
+        self.texts.append(text)
+        if self.first_at is None:
+            self.first_at = now
+        if self.first_token_at is None:
+            self.first_token_at = now
+        self.last_at = now
+        self.total += 1
+        self.drained.clear()
+
+    def due(self, now: float, window: float, max_tokens: int) -> bool:
+        if self.finish_reason is not None:
+            return True
+        if not self.texts:
+            return False
+        return len(self.texts) >= max_tokens or now - self.first_at >= window
+
+    def deadline(self, window: float) -> Optional[float]:
+        return self.first_at + window if self.texts else None
+
+    def take(self) -> Dict[str, Any]:
+        frame: Dict[str, Any] = {
+            "id": self.request_id,
+            "seq": self.seq,
+            "text": "".join(self.texts),
+            "n": len(self.texts),
+        }
+        if self.ids:
+            frame["ids"] = self.ids
+        if self.texts:
+            frame["first_ms"] = round((self.first_at - self.started) * 1000, 3)
+            frame["last_ms"] = round((self.last_at - self.started) * 1000, 3)
+        if self.finish_reason is not None:
+            frame["done"] = True
+            frame["finish_reason"] = self.finish_reason
+            frame["tokens"] = self.total
+            if self.first_token_at is not None:
+                frame["ttft_ms"] = round((self.first_token_at - self.started) * 1000, 3)
+            if self.error is not None:
+                frame["error"] = self.error
+        self.seq += 1
+        self.texts = []
+        self.ids = []
+        self.first_at = None
+        self.drained.set()
+        return frame
+
+
+async def _iterate(tokens: Union[AsyncIterator[Token], Iterable[Token]]) -> AsyncIterator[Token]:
+    """Async view of ``tokens``; blocking iterators are advanced in a thread."""
+    if hasattr(tokens, "__aiter__"):
+        async for token in tokens:
+            yield token
+        return
+    iterator = iter(tokens)
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            token = await loop.run_in_executor(None, next, iterator, _EXHAUSTED)
+            if token is _EXHAUSTED:
+                return
+            yield token
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            try:
+                close()
+            except ValueError:
+                # next() is still running in the worker thread and can't be interrupted
+                logger.debug("Token iterator busy at close")
+
+
+class FramedSession:
+    """Multiplexes coalesced token streams for many requests onto one socket.
+
+    Args:
+        send: Coroutine sending one encoded message (``str`` or ``bytes``)
+        start_stream: Returns the token iterator for a ``generate`` message;
+            exceptions it raises are reported as ``error`` messages
+        codec: Message encoding
+        window_ms: Longest time a token waits for more tokens
+        max_tokens: Tokens that trigger an immediate flush
+        max_buffered: Unsent tokens per request before generation pauses
+    """
+
+    def __init__(
+        self,
+        send: Callable[[Union[str, bytes]], Awaitable[None]],
+        start_stream: StreamFactory,
+        codec: Optional[FrameCodec] = None,
+        window_ms: float = DEFAULT_WINDOW_MS,
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+        max_buffered: int = DEFAULT_MAX_BUFFERED,
+    ):
+        self._send = send
+        self.start_stream = start_stream
+        self.codec = codec or FrameCodec()
+        self.window = window_ms / 1000.0
+        self.max_tokens = max_tokens
+        self.max_buffered = max_buffered
+        self._buffers: Dict[str, _RequestBuffer] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._wake = asyncio.Event()
+        self.messages_sent = 0
+
+    async def handle(self, message: Dict[str, Any]) -> None:
+        """Dispatch one decoded client message."""
+        kind = message.get("type")
+        request_id = str(message.get("id", ""))
+        if kind == "generate":
+            if request_id in self._buffers:
+                await self._error(request_id, "Request id already in use")
+                return
+            try:
+                tokens = self.start_stream(message)
+            except Exception as e:
+                await self._error(request_id, str(e))
+                return
+            buffer = _RequestBuffer(request_id, time.perf_counter())
+            self._buffers[request_id] = buffer
+            self._tasks[request_id] = asyncio.ensure_future(self._produce(buffer, tokens))
+        elif kind == "cancel":
+            task = self._tasks.get(request_id)
+            if task is not None:
+                task.cancel()
+        else:
+            await self._error(request_id or None, f"Unknown message type: {kind}")
+
+    async def _produce(self, buffer: _RequestBuffer, tokens: Any) -> None:
+        stream = _iterate(tokens)
+        try:
+            async for token in stream:
+                while len(buffer.texts) >= self.max_buffered:
+                    # Slow reader: pause generation until the writer drains us
+                    await buffer.drained.wait()
+                buffer.add(token, time.perf_counter())
+                if len(buffer.texts) == 1 or len(buffer.texts) >= self.max_tokens:
+                    self._wake.set()
+            buffer.finish_reason = "stop"
+        except asyncio.CancelledError:
+            buffer.finish_reason = "cancelled"
+        except Exception as e:
+            logger.error(f"Stream {buffer.request_id} failed: {e}")
+            buffer.finish_reason = "error"
+            buffer.error = str(e)
+        finally:
+            await stream.aclose()
+            aclose = getattr(tokens, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            self._tasks.pop(buffer.request_id, None)
+            self._wake.set()
+
+    async def _error(self, request_id: Optional[str], message: str) -> None:
+        await self.send({"type": "error", "id": request_id, "message": message})
+
+    async def send(self, message: Dict[str, Any]) -> None:
+        await self._send(self.codec.encode(message))
+        self.messages_sent += 1
+
+    async def write_loop(self) -> None:
+        """Flush due buffers until cancelled."""
+        while True:
+            self._wake.clear()
+            now = time.perf_counter()
+            due = [
+                b for b in self._buffers.values()
+                if b.due(now, self.window, self.max_tokens)
+            ]
+            if due:
+                frames = []
+                for buffer in due:
+                    frames.append(buffer.take())
+                    if buffer.finish_reason is not None:
+                        del self._buffers[buffer.request_id]
+                await self.send({"type": "tokens", "ts": time.time(), "frames": frames})
+                continue
+            deadlines = [
+                d for d in (b.deadline(self.window) for b in self._buffers.values())
+                if d is not None
+            ]
+            timeout = max(0.0, min(deadlines) - now) if deadlines else None
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def flush(self) -> None:
+        """Wait until every started request has sent its final frame."""
+        while self._buffers or self._tasks:
+            await asyncio.sleep(self.window / 4 or 0.001)
+
+    async def close(self) -> None:
+        """Cancel all in-flight generations."""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def serve_websocket(
+    websocket: Any,
+    start_stream: StreamFactory,
+    encoding: str = "json",
+    **options: Any,
+) -> None:
+    """Run the ``frames`` protocol on an accepted Starlette/FastAPI WebSocket.
+
+    Returns when the client disconnects; in-flight generations are
+    cancelled.
+    """
+    async def send(data: Union[str, bytes]) -> None:
+        if isinstance(data, bytes):
+            await websocket.send_bytes(data)
+        else:
+            await websocket.send_text(data)
+
+    session = FramedSession(send, start_stream, FrameCodec(encoding), **options)
+    writer = asyncio.ensure_future(session.write_loop())
+    try:
+        while True:
+            message = await websocket.receive()
+            if message.get("type") == "websocket.disconnect":
+                break
+            data = message.get("text")
+            if data is None:
+                data = message.get("bytes")
+            try:
+                request = FrameCodec.decode(data)
+            except ValueError as e:  # includes json.JSONDecodeError
+                await session.send({"type": "error", "id": None, "message": f"Invalid message: {e}"})
+                continue
+            await session.handle(request)
+    finally:
+        await session.close()
+        writer.cancel()
+        await asyncio.gather(writer, return_exceptions=True)
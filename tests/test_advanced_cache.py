@@ -1,5 +1,9 @@
+import os
+import tempfile
+import time
+
 import pytest
-from src.advanced_cache import cache_model, cache_inference_result
+from src.advanced_cache import ResponseCache, cache_inference_result, cache_model, cache_policy
 
 def test_cache_model_logs():
     cache_model('test_model', {'cache': True})
@@ -10,3 +14,58 @@ def test_cache_inference_result_logs():
     cache_inference_result('test_result', {'cache': True})
     with open('logs/advanced_cache.log') as log:
         assert 'Inference result caching called' in log.read()
+
+
+def test_response_cache_hit_and_miss():
+    cache = ResponseCache(max_bytes=1024, ttl=60)
+    assert cache.get("k") is None
+    cache.set("k", {"text": "hello"})
+    value = cache.get("k")
+    assert value == {"text": "hello"}
+    value["text"] = "mutated"
+    assert cache.get("k") == {"text": "hello"}
+    stats = cache.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 1
+    assert cache.get(None) is None
+
+
+def test_response_cache_byte_budget_evicts_lru():
+    cache = ResponseCache(max_bytes=60, ttl=60)
+    cache.set("a", {"text": "x" * 10})
+    cache.set("b", {"text": "y" * 10})
+    cache.get("a")
+    cache.set("c", {"text": "z" * 10})
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats()["bytes"] <= 60
+    assert cache.stats()["evictions"] == 1
+    cache.set("huge", {"text": "w" * 100})
+    assert cache.get("huge") is None
+
+
+def test_response_cache_ttl_expiry():
+    cache = ResponseCache(ttl=0.01)
+    cache.set("k", {"text": "v"})
+    time.sleep(0.02)
+    assert cache.get("k") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_response_cache_disk_tier_shared():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "cache.db")
+        writer = ResponseCache(disk_path=path)
+        writer.set("k", {"text": "from disk"})
+        reader = ResponseCache(disk_path=path)
+        assert reader.get("k") == {"text": "from disk"}
+        assert reader.stats()["disk_hits"] == 1
+        assert reader.get("k") == {"text": "from disk"}
+        assert reader.stats()["hits"] == 1
+        writer.disk.close()
+        reader.disk.close()
+
+
+def test_cache_policy():
+    assert cache_policy(None) == (True, True)
+    assert cache_policy("no-cache") == (False, True)
+    assert cache_policy("max-age=0, no-store") == (False, False)
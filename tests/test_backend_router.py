@@ -0,0 +1,216 @@
+"""Tests for model-aware backend routing and circuit breaking."""
+
+import asyncio
+import time
+
+import pytest
+
+from src.backend_router import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    BackendRouter,
+    CircuitBreaker,
+    RouteDecision,
+    parse_model_routes,
+)
+from src.core.exceptions import OverloadedError
+from src.serving_metrics import MetricsRegistry
+
+
+class FakeBackend:
+    """Backend double with a switchable health check and model list."""
+
+    def __init__(self, models=(), healthy=True):
+        self.models = list(models)
+        self.healthy = healthy
+
+    def health_check(self):
+        return self.healthy
+
+    def list_models(self):
+        return [{"name": m} for m in self.models]
+
+
+def make_router(**kwargs):
+    backends = {"llama-gpu": FakeBackend(), "ollama": FakeBackend(["llama3"])}
+    return BackendRouter(backends, preferred="llama-gpu", **kwargs)
+
+
+def test_parse_model_routes():
+    assert parse_model_routes("llama3=ollama, mistral = llama-gpu,bad,=x") == {
+        "llama3": "ollama",
+        "mistral": "llama-gpu",
+    }
+    assert parse_model_routes(None) == {}
+
+
+def test_route_by_explicit_table_probe_and_default():
+    router = make_router(model_routes={"tiny": "ollama"})
+    assert router.route("tiny").backend == "ollama"
+    assert router.route("tiny").reason == "model"
+
+    # Unknown until the probe reports Ollama's models
+    assert router.route("llama3").reason == "default"
+    asyncio.run(router.probe_all())
+    decision = router.route("llama3")
+    assert (decision.backend, decision.reason) == ("ollama", "model")
+    assert decision.fallbacks == ["llama-gpu"]
+
+    assert router.route("other").backend == "llama-gpu"
+    explicit = router.route("llama3", backend="llama-gpu")
+    assert (explicit.backend, explicit.reason) == ("llama-gpu", "explicit")
+    with pytest.raises(ValueError):
+        router.route(None, backend="missing")
+
+
+def test_circuit_breaker_opens_and_recovers():
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.available()
+    assert breaker.allow()  # the single half-open trial
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.allow()
+
+
+def test_open_circuit_routes_around_backend():
+    router = make_router(failure_threshold=1)
+    router.record("llama-gpu", ok=False)
+    decision = router.route(None)
+    assert (decision.backend, decision.reason) == ("ollama", "failover")
+
+
+def test_call_fails_over_on_exception_and_error_result():
+    router = make_router(
+        is_failure=lambda name, value: value.startswith("Error: "),
+    )
+    calls = []
+
+    async def call(name):
+        calls.append(name)
+        if name == "llama-gpu":
+            raise RuntimeError("CUDA out of memory")
+        return f"hello from {name}"
+
+    result = asyncio.run(router.call(router.route(None), call))
+    assert result.value == "hello from ollama"
+    assert result.backend == "ollama"
+    assert calls == ["llama-gpu", "ollama"]
+    assert result.info(router.route(None))["reason"] == "failover"
+    assert router.health("llama-gpu").failures == 1
+
+    async def error_text(name):
+        return "Error: model not found" if name == "ollama" else "ok"
+
+    decision = RouteDecision("ollama", "model", ["llama-gpu"])
+    result = asyncio.run(router.call(decision, error_text))
+    assert (result.value, result.backend) == ("ok", "llama-gpu")
+
+
+def test_explicit_backend_does_not_fail_over():
+    router = make_router()
+
+    async def call(name):
+        raise RuntimeError(f"{name} down")
+
+    with pytest.raises(RuntimeError, match="llama-gpu down"):
+        asyncio.run(router.call(router.route(None, backend="llama-gpu"), call))
+
+
+def test_overload_is_not_a_backend_failure():
+    router = make_router(failure_threshold=1)
+
+    async def call(name):
+        raise OverloadedError("queue full")
+
+    with pytest.raises(OverloadedError):
+        asyncio.run(router.call(router.route(None), call))
+    assert router.health("llama-gpu").breaker.state == CLOSED
+    assert router.health("llama-gpu").failures == 0
+
+
+def test_hedged_request_takes_first_answer():
+    router = make_router(hedge_after=0.02)
+
+    async def call(name):
+        await asyncio.sleep(0.5 if name == "llama-gpu" else 0.01)
+        return name
+
+    started = time.perf_counter()
+    result = asyncio.run(router.call(router.route(None), call))
+    assert result.backend == "ollama"
+    assert result.hedged
+    assert time.perf_counter() - started < 0.4
+
+
+def test_stream_fails_over_before_first_token_only():
+    router = make_router()
+
+    def factory(name):
+        async def tokens():
+            if name == "llama-gpu":
+                raise RuntimeError("load failed")
+            for token in ("a", "b"):
+                yield token
+        return tokens()
+
+    async def collect(stream):
+        return [token async for token in stream]
+
+    assert asyncio.run(collect(router.stream(router.route(None), factory))) == ["a", "b"]
+
+    def broken_midway(name):
+        async def tokens():
+            yield "x"
+            raise RuntimeError(f"{name} died")
+        return tokens()
+
+    async def consume():
+        received = []
+        with pytest.raises(RuntimeError, match="llama-gpu died"):
+            async for token in router.stream(router.route(None), broken_midway):
+                received.append(token)
+        return received
+
+    assert asyncio.run(consume()) == ["x"]
+
+
+def test_probe_marks_unhealthy_and_recovery_closes_circuit():
+    router = make_router(failure_threshold=2, recovery_timeout=60)
+    backend = router.backends["ollama"]
+    backend.healthy = False
+    asyncio.run(router.probe_all())
+    asyncio.run(router.probe_all())
+    assert router.health("ollama").breaker.state == OPEN
+    assert router.stats()["backends"]["ollama"]["healthy"] is False
+
+    backend.healthy = True
+    asyncio.run(router.probe("ollama"))
+    assert router.health("ollama").breaker.state == CLOSED
+    assert router.stats()["backends"]["ollama"]["models"] == ["llama3"]
+
+
+def test_routing_metrics():
+    registry = MetricsRegistry()
+    router = make_router(registry=registry, failure_threshold=1)
+    router.route(None)
+    router.record("llama-gpu", ok=False)
+    router.route(None)
+
+    text = registry.render()
+    assert 'llm_routing_decisions_total{backend="llama-gpu",reason="default"} 1' in text
+    assert 'llm_routing_decisions_total{backend="ollama",reason="failover"} 1' in text
+    assert 'llm_backend_circuit_state{backend="llama-gpu"} 2' in text
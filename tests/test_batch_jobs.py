@@ -0,0 +1,226 @@
+"""Tests for offline batch jobs."""
+
+import asyncio
+import json
+
+import pytest
+
+from src.batch_jobs import (
+    BatchJobStore,
+    BatchRequest,
+    BatchRunner,
+    bucket_batches,
+    parse_jsonl,
+    progress,
+)
+
+
+def jsonl(*lines):
+    return "\n".join(json.dumps(line) for line in lines).encode("utf-8")
+
+
+def completion(custom_id, prompt, **body):
+    return {"custom_id": custom_id, "method": "POST", "url": "/v1/completions",
+            "body": {"prompt": prompt, **body}}
+
+
+class FakeEngine:
+    """Echoes prompts upper-cased and records every batch."""
+
+    def __init__(self, fail_on=None):
+        self.batches = []
+        self.fail_on = fail_on
+
+    async def __call__(self, prompts, params):
+        self.batches.append(list(prompts))
+        if self.fail_on in prompts:
+            raise RuntimeError("CUDA out of memory")
+        return [p.upper() for p in prompts]
+
+
+def read_output(store, job_id):
+    with open(store.output_path(job_id)) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_parse_jsonl_validates_lines():
+    requests = parse_jsonl(jsonl(
+        completion("a", "hi", max_tokens=8),
+        {"custom_id": "b", "url": "/v1/chat/completions",
+         "body": {"messages": [{"role": "user", "content": "yo"}]}},
+    ))
+    assert [r.prompt for r in requests] == ["hi", "user: yo"]
+    assert requests[0].params == {"max_tokens": 8}
+
+    with pytest.raises(ValueError, match="Line 2: duplicate"):
+        parse_jsonl(jsonl(completion("a", "x"), completion("a", "y")))
+    with pytest.raises(ValueError, match="Line 1: unsupported url"):
+        parse_jsonl(jsonl({"custom_id": "a", "url": "/v1/embeddings", "body": {}}))
+    with pytest.raises(ValueError, match="Line 2"):
+        parse_jsonl(b'{"custom_id": "a", "body": {"prompt": "x"}}\nnot json')
+    with pytest.raises(ValueError, match="no requests"):
+        parse_jsonl(b"\n")
+
+
+def test_bucket_batches_sorts_by_length_within_limits():
+    requests = [BatchRequest(str(i), "/v1/completions", "x", {}) for i in range(6)]
+    lengths = {"0": 50, "1": 5, "2": 40, "3": 6, "4": 7, "5": 45}
+    batches = bucket_batches(requests, lengths, max_batch_size=4, max_batch_tokens=100)
+    assert [[r.custom_id for r in b] for b in batches] == [["1", "3", "4"], ["2", "5"], ["0"]]
+
+    # Different sampling parameters never share a batch
+    mixed = [BatchRequest("a", "/v1/completions", "x", {"max_tokens": 8}),
+             BatchRequest("b", "/v1/completions", "x", {"max_tokens": 16})]
+    assert len(bucket_batches(mixed, {"a": 1, "b": 1}, 8, 100)) == 2
+
+
+def test_job_runs_to_completion(tmp_path):
+    store = BatchJobStore(str(tmp_path))
+    engine = FakeEngine()
+    runner = BatchRunner(store, engine, max_batch_size=2)
+
+    async def scenario():
+        job = await runner.submit(jsonl(*(completion(f"r{i}", f"prompt {i}") for i in range(5))))
+        return await runner.run_job(job["id"])
+
+    job = asyncio.run(scenario())
+    assert job["status"] == "completed"
+    assert job["request_counts"] == {"total": 5, "completed": 5, "failed": 0}
+    assert job["usage"] == {"prompt_tokens": 10, "completion_tokens": 10}
+    assert [len(b) for b in engine.batches] == [2, 2, 1]
+
+    output = {r["custom_id"]: r for r in read_output(store, job["id"])}
+    assert output["r3"]["response"]["body"]["choices"][0]["text"] == "PROMPT 3"
+    status = progress(store.get(job["id"]))
+    assert status["progress"] == 1.0
+    assert status["tokens_per_second"] > 0
+
+
+def test_line_params_reach_the_engine(tmp_path):
+    store = BatchJobStore(str(tmp_path))
+    seen = {}
+
+    async def engine(prompts, params):
+        for prompt in prompts:
+            seen[prompt] = params
+        return list(prompts)
+
+    runner = BatchRunner(store, engine)
+    job = asyncio.run(runner.submit(jsonl(
+        completion("a", "x", max_tokens=8, temperature=0.0),
+        completion("b", "y", max_tokens=64, temperature=1.0),
+    )))
+    asyncio.run(runner.run_job(job["id"]))
+
+    assert seen["x"] == {"max_tokens": 8, "temperature": 0.0}
+    assert seen["y"] == {"max_tokens": 64, "temperature": 1.0}
+
+
+def test_server_passes_sampling_params_to_batch_infer():
+    pytest.importorskip("fastapi")
+    from src import api_server
+
+    calls = []
+
+    class RecordingEngine:
+        def batch_infer(self, prompts, batch_size=1, max_tokens=128, temperature=0.7):
+            calls.append((list(prompts), max_tokens, temperature))
+            return list(prompts)
+
+    api_server.model_registry.register("recording", RecordingEngine(), activate=False)
+    params = {"model": "recording", "max_tokens": 8, "temperature": 0.0}
+    assert asyncio.run(api_server.run_batch(["x", "y"], params)) == ["x", "y"]
+    assert calls == [(["x", "y"], 8, 0.0)]
+
+
+def test_failed_batch_is_recorded_per_request(tmp_path):
+    store = BatchJobStore(str(tmp_path))
+    runner = BatchRunner(store, FakeEngine(fail_on="bad"), max_batch_size=1)
+
+    async def scenario():
+        job = await runner.submit(jsonl(completion("ok", "good"), completion("ko", "bad")))
+        return await runner.run_job(job["id"])
+
+    job = asyncio.run(scenario())
+    assert job["request_counts"] == {"total": 2, "completed": 1, "failed": 1}
+    errors = {r["custom_id"]: r["error"] for r in read_output(store, job["id"])}
+    assert errors["ok"] is None
+    assert "out of memory" in errors["ko"]["message"]
+
+
+def test_short_results_fail_the_missing_requests(tmp_path):
+    store = BatchJobStore(str(tmp_path))
+
+    async def short_engine(prompts, params):
+        return [p.upper() for p in prompts[:-1]]
+
+    runner = BatchRunner(store, short_engine, max_batch_size=3)
+    job = asyncio.run(runner.submit(jsonl(*(completion(f"r{i}", "x") for i in range(3)))))
+    job = asyncio.run(runner.run_job(job["id"]))
+
+    assert job["request_counts"] == {"total": 3, "completed": 2, "failed": 1}
+    errors = [r["error"] for r in read_output(store, job["id"])]
+    assert sum(error is not None for error in errors) == 1
+
+
+def test_restart_resumes_from_checkpoint(tmp_path):
+    store = BatchJobStore(str(tmp_path))
+    job = store.create(jsonl(*(completion(f"r{i}", f"p{i}") for i in range(4))))
+    # A previous process finished r0 and died while writing r1
+    with open(store.output_path(job["id"]), "w") as f:
+        f.write(json.dumps({"custom_id": "r0", "error": None, "response": {
+            "status_code": 200, "body": {"usage": {"prompt_tokens": 1, "completion_tokens": 1}}}}) + "\n")
+        f.write('{"custom_id": "r1", "err')
+    job["status"] = "in_progress"
+    store.save(job)
+
+    engine = FakeEngine()
+    runner = BatchRunner(store, engine)
+    finished = asyncio.run(runner.run_job(job["id"]))
+
+    assert sorted(engine.batches[0]) == ["p1", "p2", "p3"]
+    assert finished["request_counts"]["completed"] == 4
+    assert sorted(r["custom_id"] for r in read_output(store, job["id"])) == ["r0", "r1", "r2", "r3"]
+
+
+def test_batches_wait_for_interactive_traffic(tmp_path):
+    store = BatchJobStore(str(tmp_path))
+    engine = FakeEngine()
+    busy = {"value": True}
+    runner = BatchRunner(store, engine, is_busy=lambda: busy["value"], idle_poll=0.01)
+
+    async def scenario():
+        job = await runner.submit(jsonl(completion("a", "x")))
+        task = asyncio.ensure_future(runner.run_job(job["id"]))
+        await asyncio.sleep(0.05)
+        assert engine.batches == []  # deferred while busy
+        busy["value"] = False
+        return await task
+
+    assert asyncio.run(scenario())["status"] == "completed"
+
+
+def test_cancel(tmp_path):
+    store = BatchJobStore(str(tmp_path))
+    runner = BatchRunner(store, FakeEngine(), max_batch_size=1)
+
+    async def scenario():
+        queued = await runner.submit(jsonl(completion("a", "x")))
+        assert runner.cancel(queued["id"])["status"] == "cancelled"
+        assert (await runner.run_job(queued["id"]))["status"] == "cancelled"
+        assert runner._cancelled == set()
+
+        running = await runner.submit(jsonl(completion("a", "x"), completion("b", "y")))
+
+        async def cancelling_engine(prompts, params):
+            runner.cancel(running["id"])  # arrives while the first batch runs
+            return prompts
+
+        runner.process = cancelling_engine
+        job = await runner.run_job(running["id"])
+        assert job["status"] == "cancelled"
+        assert job["request_counts"]["completed"] == 1
+
+    asyncio.run(scenario())
+    with pytest.raises(KeyError):
+        runner.cancel("batch_missing")
@@ -0,0 +1,65 @@
+"""Tests for concurrent batch fan-out and batch reports."""
+
+import threading
+import time
+
+import pytest
+
+from src.llama_gpu import LlamaGPU
+from src.utils.batching import BatchReport, fan_out
+
+
+def test_fan_out_keeps_order_and_isolates_errors():
+    def generate(prompt, usage):
+        time.sleep(0.01 * (5 - int(prompt)))  # later prompts finish first
+        if prompt == "2":
+            raise ValueError("bad prompt")
+        usage["prompt_tokens"] = 1
+        return f"answer {prompt}"
+
+    report = fan_out(generate, ["0", "1", "2", "3", "4"], concurrency=5)
+    assert report == ["answer 0", "answer 1", None, "answer 3", "answer 4"]
+    assert report.errors == {2: "bad prompt"}
+    assert report.prompt_tokens == 4 and report.completion_tokens == 8
+    assert len(report.latencies) == 5 and report.tokens_per_second > 0
+    assert report.summary()["failed"] == 1
+
+
+def test_fan_out_bounds_concurrency():
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def generate(prompt, usage):
+        with lock:
+            running.append(prompt)
+            peak.append(len(running))
+        time.sleep(0.01)
+        with lock:
+            running.remove(prompt)
+        return prompt
+
+    report = fan_out(generate, [str(i) for i in range(12)], concurrency=3)
+    assert max(peak) == 3 and report.concurrency == 3
+    assert fan_out(generate, [], concurrency=3) == BatchReport()
+
+
+def test_llama_gpu_batch_infer_returns_report():
+    report = LlamaGPU(prefer_gpu=False).batch_infer(["a", "b"], max_tokens=4)
+    assert [text.startswith("[demo:") for text in report] == [True, True]
+    assert report.errors == {} and report.completion_tokens > 0
+
+
+def test_ollama_batch_chat_against_fake_server():
+    pytest.importorskip("requests")
+    from src.backends.ollama import OllamaBackend
+    from src.backends.ollama.fake_server import FakeOllamaServer
+
+    with FakeOllamaServer(reply="one two three", token_delay=0.0) as server:
+        backend = OllamaBackend(server.url, default_model="fake:latest")
+        conversations = [[{"role": "user", "content": f"q{i}"}] for i in range(6)]
+        report = backend.batch_chat(conversations, concurrency=3)
+        missing = backend.batch_infer(["hi"], model="nope")
+    assert report == ["one two three"] * 6
+    assert report.completion_tokens == 18 and report.prompt_tokens == 6
+    assert missing == [None] and "404" in missing.errors[0]
@@ -0,0 +1,111 @@
+"""Tests for the embedding cache, micro-batcher and wire encodings."""
+
+import asyncio
+import base64
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from src.embeddings import (  # noqa: E402
+    EmbeddingBatcher,
+    EmbeddingCache,
+    encode_texts,
+    encode_vector,
+)
+
+
+class CountingEncoder:
+    """Deterministic 4-dim encoder recording every batch it sees."""
+
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, texts):
+        self.batches.append(list(texts))
+        return np.array([[len(t), t.count("a"), 1.0, -2.0] for t in texts], dtype=np.float32)
+
+
+def test_encode_texts_caches_and_sorts_by_length():
+    encoder = CountingEncoder()
+    cache = EmbeddingCache()
+    vectors = encode_texts(["ccc", "a", "bb", "a"], "m", encoder=encoder, cache=cache)
+    assert vectors.shape == (4, 4)
+    assert encoder.batches == [["a", "bb", "ccc"]]
+    assert vectors[0][0] == 3 and vectors[1][0] == 1 and vectors[3][0] == 1
+
+    encode_texts(["bb", "dddd"], "m", encoder=encoder, cache=cache)
+    assert encoder.batches[-1] == ["dddd"]
+    # Cache entries are per model
+    encode_texts(["bb"], "other", encoder=encoder, cache=cache)
+    assert encoder.batches[-1] == ["bb"]
+    assert cache.stats()["hits"] == 1
+
+
+def test_cache_evicts_least_recently_used():
+    cache = EmbeddingCache(max_entries=2)
+    encoder = CountingEncoder()
+    encode_texts(["a", "b"], "m", encoder=encoder, cache=cache)
+    encode_texts(["a"], "m", encoder=encoder, cache=cache)
+    encode_texts(["c"], "m", encoder=encoder, cache=cache)
+    assert cache.get_many("m", ["a", "b", "c"])[1] is None
+
+
+def test_encode_vector_formats():
+    vector = np.array([0.5, -1.0, 0.25], dtype=np.float32)
+    assert encode_vector(vector)["embedding"] == [0.5, -1.0, 0.25]
+
+    half = encode_vector(vector, "float16", "base64")["embedding"]
+    assert np.frombuffer(base64.b64decode(half), dtype="<f2").tolist() == [0.5, -1.0, 0.25]
+
+    quantized = encode_vector(vector, "int8")
+    assert quantized["embedding"] == [64, -127, 32]
+    restored = np.array(quantized["embedding"]) * quantized["scale"]
+    assert np.allclose(restored, vector, atol=0.01)
+
+    raw = encode_vector(vector, "int8", "base64")["embedding"]
+    assert np.frombuffer(base64.b64decode(raw), dtype=np.int8).tolist() == [64, -127, 32]
+    with pytest.raises(ValueError):
+        encode_vector(vector, "bfloat16")
+
+
+def test_batcher_coalesces_concurrent_requests():
+    encoder = CountingEncoder()
+    calls = []
+
+    def encode(texts, model):
+        calls.append((model, list(texts)))
+        return encoder(texts)
+
+    batcher = EmbeddingBatcher(encode, max_batch_size=64, window_ms=20)
+
+    async def scenario():
+        return await asyncio.gather(
+            batcher.embed(["a"], "m"),
+            batcher.embed(["bb", "ccc"], "m"),
+            batcher.embed(["dddd"], "m"),
+        )
+
+    first, second, third = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert [v[0] for v in second] == [2, 3]
+    assert third[0][0] == 4 and first[0][0] == 1
+    assert batcher.stats()["avg_batch_size"] == 4
+
+
+def test_batcher_flushes_full_batches_and_propagates_errors():
+    def encode(texts, model):
+        if "boom" in texts:
+            raise RuntimeError("encoder failed")
+        return np.zeros((len(texts), 2), dtype=np.float32)
+
+    batcher = EmbeddingBatcher(encode, max_batch_size=2, window_ms=10_000)
+
+    async def scenario():
+        # Reaching max_batch_size flushes without waiting for the window
+        vectors = await asyncio.wait_for(batcher.embed(["a", "b"]), 1)
+        assert vectors.shape == (2, 2)
+        with pytest.raises(RuntimeError):
+            await asyncio.wait_for(batcher.embed(["boom", "x"]), 1)
+
+    asyncio.run(scenario())
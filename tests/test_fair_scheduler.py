@@ -0,0 +1,212 @@
+"""Tests for priority classes and fair-share scheduling."""
+
+import asyncio
+import queue
+import threading
+import time
+
+import pytest
+
+from src.fair_scheduler import FairScheduler, Ticket, parse_priority
+from src.inference_executor import InferenceExecutor
+from src.serving_metrics import MetricsRegistry
+from src.utils.batching import BatchWorker
+
+
+def drain(scheduler):
+    items = []
+    while True:
+        try:
+            claim = scheduler.claim(block=False)
+        except queue.Empty:
+            return items
+        items.append(claim.item)
+        scheduler.complete(claim)
+
+
+def test_priority_classes_run_in_order():
+    scheduler = FairScheduler()
+    scheduler.put("b1", "k", "batch")
+    scheduler.put("s1", "k", "standard")
+    scheduler.put("i1", "k", "interactive")
+    scheduler.put("i2", "other", "interactive")
+    # "other" has consumed nothing yet, so it goes before "k" in its class
+    assert drain(scheduler) == ["i2", "i1", "s1", "b1"]
+    with pytest.raises(ValueError):
+        scheduler.put("x", "k", "urgent")
+
+
+def test_keys_share_by_tokens_and_weight():
+    scheduler = FairScheduler(weights={"gold": 2.0})
+    # A heavy tenant queues first; a light one arrives behind it
+    for i in range(4):
+        scheduler.put(f"heavy{i}", "heavy", cost=100)
+    for i in range(4):
+        scheduler.put(f"light{i}", "light", cost=10)
+    assert drain(scheduler) == [f"light{i}" for i in range(4)] + [f"heavy{i}" for i in range(4)]
+
+    for i in range(3):
+        scheduler.put(f"gold{i}", "gold", cost=10)
+        scheduler.put(f"plain{i}", "plain", cost=10)
+    # gold's tags advance half as fast as plain's
+    assert drain(scheduler) == ["gold0", "plain0", "gold1", "gold2", "plain1", "plain2"]
+
+
+def test_inflight_cap_per_key():
+    scheduler = FairScheduler(max_inflight_per_key=1, inflight_limits={"vip": 2})
+    for name in ("a1", "a2", "b1"):
+        scheduler.put(name, name[0])
+    scheduler.put("v1", "vip")
+    scheduler.put("v2", "vip")
+    taken = {claim.item: claim for claim in (scheduler.claim(block=False) for _ in range(4))}
+    assert sorted(taken) == ["a1", "b1", "v1", "v2"]
+    with pytest.raises(queue.Empty):
+        scheduler.claim(timeout=0.01)
+    scheduler.complete(taken["a1"])
+    assert scheduler.claim(block=False).item == "a2"
+
+
+def test_identical_items_complete_for_their_own_key():
+    scheduler = FairScheduler(max_inflight_per_key=1)
+    scheduler.put("same prompt", "alice")
+    scheduler.put("same prompt", "bob")
+    scheduler.put("next", "alice")
+    alice, bob = scheduler.claim(block=False), scheduler.claim(block=False)
+    assert alice.item == bob.item and alice.handle != bob.handle
+    scheduler.complete(bob)
+    assert scheduler.stats()["inflight"] == {"alice": 1}
+    with pytest.raises(queue.Empty):
+        scheduler.claim(block=False)
+    scheduler.complete(alice)
+    assert scheduler.claim(block=False).item == "next"
+
+
+@pytest.mark.parametrize("key, cost, used, order", [
+    # Declared far more than it generated: refunded, so it goes first
+    ("over", 100, 10, ["over1", "other0"]),
+    # Declared less than it generated: billed, so it waits
+    ("under", 10, 200, ["other0", "under1"]),
+])
+def test_complete_settles_estimate_to_tokens_used(key, cost, used, order):
+    scheduler = FairScheduler()
+    scheduler.put(f"{key}0", key, cost=cost)
+    scheduler.complete(scheduler.claim(block=False), used=used)
+    scheduler.put("other0", "other", cost=50)
+    scheduler.put(f"{key}1", key, cost=20)
+    assert drain(scheduler) == order
+
+
+def wait_idle(scheduler):
+    # Claims are completed just after the caller sees the result
+    deadline = time.monotonic() + 1.0
+    while scheduler.stats()["inflight"] and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+
+def test_executor_and_batch_worker_report_tokens_used():
+    scheduler = FairScheduler()
+    executor = InferenceExecutor(scheduler=scheduler)
+    ticket = Ticket("exec", "standard", cost=100, usage=len)
+    assert asyncio.run(executor.run(str.upper, "ab", ticket=ticket)) == "AB"
+    wait_idle(scheduler)
+
+    done = threading.Event()
+
+    def process(batch):
+        done.set()
+        return [item.upper() for item in batch]
+
+    scheduler.put("w0", "worker", cost=100)
+    worker = BatchWorker(scheduler, process, batch_timeout=0.02,
+                         usage=lambda item, result: len(result))
+    worker.start()
+    try:
+        assert done.wait(2)
+        wait_idle(scheduler)
+    finally:
+        worker.stop()
+        worker.join(1)
+    scheduler.put("other0", "other", cost=50)
+    scheduler.put("exec1", "exec", cost=20)
+    scheduler.put("worker1", "worker", cost=20)
+    # Both were charged 100 up front but used 2 tokens
+    assert drain(scheduler) == ["exec1", "worker1", "other0"]
+
+
+def test_aging_promotes_waiting_batch_work():
+    scheduler = FairScheduler(aging_seconds=0.05)
+    scheduler.put("old-batch", "k", "batch")
+    time.sleep(0.12)  # two promotions: batch -> interactive
+    scheduler.put("new-interactive", "k2", "interactive")
+    assert drain(scheduler) == ["old-batch", "new-interactive"]
+    assert scheduler.stats()["promotions"] == 1
+
+
+def test_waits_recorded_per_class():
+    registry = MetricsRegistry()
+    scheduler = FairScheduler(registry=registry)
+    scheduler.put("i", "k", "interactive")
+    scheduler.put("b", "k", "batch")
+    assert scheduler.stats()["waiting"] == {"interactive": {"k": 1}, "batch": {"k": 1}}
+    drain(scheduler)
+    stats = scheduler.stats()
+    assert stats["classes"]["batch"]["dispatched"] == 1
+    assert stats["queue_depth"] == 0 and stats["inflight"] == {}
+    assert 'llm_scheduler_queue_wait_seconds_count{priority="interactive"} 1' in registry.render()
+
+
+def test_parse_priority():
+    assert parse_priority(None) == "interactive"
+    assert parse_priority(" Batch ") == "batch"
+    with pytest.raises(ValueError, match="Unknown priority"):
+        parse_priority("urgent")
+
+
+def test_executor_gives_free_slot_to_interactive_work():
+    executor = InferenceExecutor(max_concurrency=1, max_queue=16, scheduler=FairScheduler())
+    release = threading.Event()
+    order = []
+
+    async def main():
+        blocker = asyncio.ensure_future(executor.run(release.wait))
+        await asyncio.sleep(0.05)
+        jobs = [
+            executor.run(order.append, f"batch{i}", ticket=Ticket("jobs", "batch"))
+            for i in range(3)
+        ]
+        jobs.append(executor.run(order.append, "chat", ticket=Ticket("alice", "interactive")))
+        waiting = [asyncio.ensure_future(job) for job in jobs]
+        await asyncio.sleep(0.01)
+        release.set()
+        await asyncio.gather(blocker, *waiting)
+
+    asyncio.run(main())
+    assert order == ["chat", "batch0", "batch1", "batch2"]
+    stats = executor.stats()
+    assert stats["completed"] == 5 and stats["queue_depth"] == 0
+    assert stats["scheduler"]["classes"]["interactive"]["dispatched"] == 1
+
+
+def test_batch_worker_drains_scheduler_and_releases_keys():
+    scheduler = FairScheduler(max_inflight_per_key=2)
+    batches = []
+    done = threading.Event()
+
+    def process(batch):
+        batches.append(list(batch))
+        if sum(len(b) for b in batches) == 4:
+            done.set()
+
+    for name in ("a1", "a2", "a3"):
+        scheduler.put(name, "a", "batch")
+    scheduler.put("b1", "b", "interactive")
+    worker = BatchWorker(scheduler, process, batch_size=8, batch_timeout=0.02)
+    worker.start()
+    try:
+        assert done.wait(2)
+    finally:
+        worker.stop()
+    # b1 jumps the queue; a3 waits for a1/a2's batch to finish
+    assert batches[0] == ["b1", "a1", "a2"]
+    assert batches[1] == ["a3"]
+    assert scheduler.stats()["inflight"] == {}
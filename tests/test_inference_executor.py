@@ -0,0 +1,192 @@
+"""Tests for the bounded inference executor."""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.core.exceptions import OverloadedError, QueueFullError
+from src.inference_executor import AsyncInferenceExecutor, InferenceExecutor
+
+
+def test_run_returns_result_and_records_stats():
+    executor = InferenceExecutor(max_concurrency=2, max_queue=4)
+
+    async def main():
+        return await asyncio.gather(*(executor.run(lambda x: x * 2, i) for i in range(4)))
+
+    assert asyncio.run(main()) == [0, 2, 4, 6]
+    stats = executor.stats()
+    assert stats["completed"] == 4
+    assert stats["queue_depth"] == 0 and stats["active"] == 0
+
+
+def test_concurrency_is_bounded():
+    executor = InferenceExecutor(max_concurrency=2, max_queue=8)
+    lock = threading.Lock()
+    running = {"now": 0, "peak": 0}
+
+    def work():
+        with lock:
+            running["now"] += 1
+            running["peak"] = max(running["peak"], running["now"])
+        time.sleep(0.02)
+        with lock:
+            running["now"] -= 1
+
+    async def main():
+        await asyncio.gather(*(executor.run(work) for _ in range(6)))
+
+    asyncio.run(main())
+    assert running["peak"] == 2
+
+
+def test_full_queue_rejected_with_429():
+    executor = InferenceExecutor(max_concurrency=1, max_queue=1)
+    release = threading.Event()
+
+    async def main():
+        first = asyncio.ensure_future(executor.run(release.wait))
+        await asyncio.sleep(0.05)  # first job is running, queue empty
+        second = asyncio.ensure_future(executor.run(lambda: "queued"))
+        await asyncio.sleep(0)
+        with pytest.raises(QueueFullError) as excinfo:
+            await executor.run(lambda: "rejected")
+        release.set()
+        await asyncio.gather(first, second)
+        return excinfo.value
+
+    error = asyncio.run(main())
+    assert error.status_code == 429
+    assert error.retry_after >= 1
+    assert executor.stats()["rejected_queue_full"] == 1
+
+
+def test_predicted_wait_beyond_timeout_rejected_with_503():
+    executor = InferenceExecutor(max_concurrency=1, max_queue=8)
+    release = threading.Event()
+
+    async def main():
+        await executor.run(time.sleep, 0.1)  # learn the service time
+        blocker = asyncio.ensure_future(executor.run(release.wait))
+        await asyncio.sleep(0.05)
+        with pytest.raises(OverloadedError) as excinfo:
+            await executor.run(lambda: None, timeout=0.05)
+        release.set()
+        await blocker
+        return excinfo.value
+
+    error = asyncio.run(main())
+    assert error.status_code == 503
+    assert executor.stats()["rejected_deadline"] == 1
+
+
+def test_slow_call_does_not_lock_out_idle_executor():
+    executor = InferenceExecutor(max_concurrency=1, max_queue=8, default_timeout=0.2)
+
+    async def main():
+        await executor.run(time.sleep, 0.3)  # service time now exceeds the timeout
+        return [await executor.run(lambda: "fast") for _ in range(3)]
+
+    assert asyncio.run(main()) == ["fast"] * 3
+    stats = executor.stats()
+    assert stats["rejected_deadline"] == 0
+    assert stats["completed"] == 4
+
+
+def test_stream_yields_tokens_and_stops_on_close():
+    executor = InferenceExecutor(max_concurrency=1)
+    closed = threading.Event()
+
+    def tokens(n):
+        try:
+            for i in range(n):
+                time.sleep(0.005)
+                yield str(i)
+        finally:
+            closed.set()
+
+    async def main():
+        full = [t async for t in executor.stream(tokens, 3)]
+        closed.clear()
+        partial = []
+        stream = executor.stream(tokens, 1000)
+        async for token in stream:
+            partial.append(token)
+            if len(partial) == 2:
+                break
+        await stream.aclose()
+        return full, partial
+
+    full, partial = asyncio.run(main())
+    assert full == ["0", "1", "2"]
+    assert partial == ["0", "1"]
+    assert closed.wait(1.0)
+
+
+def test_stream_propagates_errors():
+    executor = InferenceExecutor()
+
+    def failing():
+        yield "a"
+        raise RuntimeError("backend down")
+
+    async def main():
+        return [t async for t in executor.stream(failing)]
+
+    with pytest.raises(RuntimeError, match="backend down"):
+        asyncio.run(main())
+
+
+def test_async_executor_bounds_concurrency_and_sheds():
+    executor = AsyncInferenceExecutor(max_concurrency=2, max_queue=1)
+    running = {"now": 0, "peak": 0}
+
+    async def work(gate):
+        running["now"] += 1
+        running["peak"] = max(running["peak"], running["now"])
+        await gate.wait()
+        running["now"] -= 1
+        return "done"
+
+    async def main():
+        gate = asyncio.Event()
+        jobs = [asyncio.ensure_future(executor.run(work, gate)) for _ in range(3)]
+        await asyncio.sleep(0.01)  # two running, one queued
+        with pytest.raises(QueueFullError) as excinfo:
+            await executor.run(work, gate)
+        gate.set()
+        return await asyncio.gather(*jobs), excinfo.value
+
+    results, error = asyncio.run(main())
+    assert results == ["done"] * 3
+    assert running["peak"] == 2
+    assert error.status_code == 429
+    stats = executor.stats()
+    assert stats["completed"] == 3 and stats["rejected_queue_full"] == 1
+    assert stats["queue_depth"] == 0 and stats["active"] == 0
+
+
+def test_async_stream_frees_its_place_when_closed_early():
+    executor = AsyncInferenceExecutor(max_concurrency=1, max_queue=4)
+
+    async def tokens(n):
+        for i in range(n):
+            await asyncio.sleep(0)
+            yield str(i)
+
+    async def main():
+        full = [t async for t in executor.stream(tokens, 3)]
+        partial = executor.stream(tokens, 1000)
+        first = await partial.__anext__()
+        await partial.aclose()
+        unused = executor.stream(tokens, 3)
+        await unused.aclose()  # never iterated
+        return full, first
+
+    full, first = asyncio.run(main())
+    assert full == ["0", "1", "2"] and first == "0"
+    stats = executor.stats()
+    assert stats["queue_depth"] == 0 and stats["active"] == 0
+    assert stats["completed"] == 2 and stats["cancelled"] == 1
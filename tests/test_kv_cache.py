@@ -0,0 +1,153 @@
+"""Tests for the int8 quantized KV cache."""
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+from transformers.cache_utils import DynamicCache
+
+from backend.cpu_backend import CPUBackend
+from backend.kv_cache import QuantizedKVCache, create_kv_cache, dequantize_block, quantize_block
+from src.quantization_benchmark import build_byte_tokenizer, build_tiny_llama
+
+
+@pytest.fixture(scope="module")
+def tokenizer():
+    return build_byte_tokenizer()
+
+
+@pytest.fixture(scope="module")
+def model(tokenizer):
+    return build_tiny_llama(tokenizer, hidden_size=64, num_layers=2)
+
+
+def test_block_round_trip():
+    block = torch.randn(2, 4, 16, 8)
+    q, scale = quantize_block(block)
+    assert q.dtype == torch.int8
+    assert scale.shape == (2, 4, 1, 1)
+    restored = dequantize_block(q, scale, torch.float32)
+    assert torch.max(torch.abs(restored - block)) <= scale.max() / 2 + 1e-6
+
+
+def test_update_returns_full_sequence_and_halves_memory():
+    cache = QuantizedKVCache(block_size=64)
+    keys = torch.randn(1, 4, 256, 32, dtype=torch.float16)
+    values = torch.randn(1, 4, 256, 32, dtype=torch.float16)
+
+    k, v = cache.update(keys[:, :, :200], values[:, :, :200], layer_idx=0)
+    assert k.shape == (1, 4, 200, 32)
+    for step in range(200, 256):
+        k, v = cache.update(keys[:, :, step:step + 1], values[:, :, step:step + 1], layer_idx=0)
+    assert k.shape == (1, 4, 256, 32)
+    assert k.dtype == torch.float16
+    assert cache.get_seq_length() == 256
+    assert torch.allclose(k.float(), keys.float(), atol=0.05)
+    assert torch.allclose(v.float(), values.float(), atol=0.05)
+
+    assert cache.memory_bytes() < 0.55 * cache.fp16_equivalent_bytes()
+
+
+def filled_cache(block_size=4, tokens=10, layers=2):
+    torch.manual_seed(0)
+    cache = QuantizedKVCache(block_size=block_size)
+    legacy = []
+    for layer_idx in range(layers):
+        keys = torch.randn(3, 2, tokens, 8)
+        values = torch.randn(3, 2, tokens, 8)
+        cache.update(keys, values, layer_idx)
+        legacy.append((keys, values))
+    return cache, legacy
+
+
+def test_inherited_accessors_read_the_int8_blocks():
+    cache, legacy = filled_cache()
+    keys, values = cache[1]
+    assert keys.shape == (3, 2, 10, 8)
+    assert torch.allclose(keys, legacy[1][0], atol=0.05)
+    assert len(cache.to_legacy_cache()) == 2
+    assert torch.equal(cache.key_cache[0], cache[0][0])
+    with pytest.raises(KeyError):
+        cache[2]
+    with pytest.raises(NotImplementedError):
+        cache.key_cache = [keys]
+
+    restored = QuantizedKVCache.from_legacy_cache(tuple(legacy), block_size=4)
+    assert restored.get_seq_length() == 10
+    assert torch.allclose(restored[0][1], legacy[0][1], atol=0.05)
+
+
+def test_crop_keeps_whole_blocks_and_requantizes_nothing():
+    cache, legacy = filled_cache()
+    before = cache[0][0]
+    cache.crop(6)  # one whole block plus half of the second
+    assert cache.get_seq_length() == 6
+    assert torch.equal(cache[0][0], before[:, :, :6])
+    cache.crop(-3)
+    assert cache.get_seq_length() == 3
+    assert torch.equal(cache[1][0], cache.to_legacy_cache()[1][0])
+    keys, _ = cache.update(legacy[0][0][:, :, :1], legacy[0][1][:, :, :1], 0)
+    assert keys.shape[-2] == 4
+
+
+def test_batch_reordering():
+    cache, _ = filled_cache()
+    keys = cache[0][0]
+    cache.reorder_cache(torch.tensor([2, 0, 1]))
+    assert torch.equal(cache[0][0], keys[[2, 0, 1]])
+    cache.batch_select_indices(torch.tensor([0, 2]))
+    assert torch.equal(cache[0][0], keys[[2, 1]])
+    cache.batch_repeat_interleave(2)
+    assert torch.equal(cache[0][0], keys[[2, 2, 1, 1]])
+    with pytest.raises(NotImplementedError):
+        cache.batch_split(4, 2)
+
+
+def test_create_kv_cache():
+    assert create_kv_cache(None) is None
+    assert isinstance(create_kv_cache("int8"), QuantizedKVCache)
+    with pytest.raises(ValueError):
+        create_kv_cache("int3")
+
+
+def _decode(model, prompt_ids, forced_tokens, cache):
+    logits = []
+    with torch.no_grad():
+        out = model(input_ids=prompt_ids, past_key_values=cache, use_cache=True)
+        logits.append(out.logits[:, -1])
+        for token in forced_tokens:
+            out = model(input_ids=token.view(1, 1), past_key_values=out.past_key_values,
+                        use_cache=True)
+            logits.append(out.logits[:, -1])
+    return torch.cat(logits)
+
+
+def test_logit_drift_is_bounded(model, tokenizer):
+    torch.manual_seed(0)
+    prompt_ids = torch.randint(3, len(tokenizer), (1, 48))
+    forced = torch.randint(3, len(tokenizer), (24,))
+
+    reference = _decode(model, prompt_ids, forced, DynamicCache())
+    quantized = _decode(model, prompt_ids, forced, QuantizedKVCache(block_size=16))
+
+    drift = (reference - quantized).abs().max()
+    assert drift <= 0.05 * reference.abs().max()
+
+
+def test_generate_with_quantized_cache(model, tokenizer):
+    inputs = tokenizer("hello there", return_tensors="pt")
+    with torch.no_grad():
+        output = model.generate(**inputs, max_new_tokens=4, do_sample=False,
+                                past_key_values=QuantizedKVCache(block_size=4),
+                                pad_token_id=tokenizer.pad_token_id)
+    assert output.shape[1] <= inputs["input_ids"].shape[1] + 4
+
+
+def test_backend_stream_with_int8_cache(model, tokenizer):
+    backend = CPUBackend()
+    backend.model = model
+    backend.tokenizer = tokenizer
+    backend.kv_cache = "int8"
+
+    tokens = list(backend.stream_infer("hello", max_tokens=5))
+    assert len(tokens) <= 5
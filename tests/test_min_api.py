@@ -27,3 +27,22 @@ async def test_completions_basic() -> None:
         data = res.json()
         assert data["object"] == "text_completion"
         assert isinstance(data["choices"], list) and data["choices"]
+
+
+@pytest.mark.anyio
+async def test_chat_completions_stream() -> None:
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        res = await ac.post(
+            "/v1/chat/completions",
+            json={
+                "messages": [{"role": "user", "content": "Hello"}],
+                "stream": True,
+            },
+        )
+        assert res.status_code == 200
+        assert res.headers["content-type"].startswith("text/event-stream")
+        events = [e for e in res.text.split("\n\n") if e]
+        assert events[-1] == "data: [DONE]"
+        assert '"object":"chat.completion.chunk"' in events[0]
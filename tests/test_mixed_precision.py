@@ -0,0 +1,197 @@
+"""
+Tests for sensitivity-driven mixed-precision planning.
+"""
+
+import json
+import os
+import tempfile
+
+import pytest
+import torch
+import torch.nn as nn
+
+from src.mixed_precision import (
+    MixedPrecisionPlan,
+    MixedPrecisionPlanner,
+    QuantizedEmbedding,
+    QuantizedLinear,
+    apply_plan,
+    bytes_per_weight,
+    quantizable_modules,
+)
+from src.quantization import (
+    QuantizationCache,
+    QuantizationConfig,
+    QuantizationManager,
+    QuantizationType,
+)
+from src.streaming_quantization import StreamingQuantizer, load_quantized_state_dict
+
+
+class TinyLM(nn.Module):
+    """LLaMA-shaped toy model: embeddings, two MLP blocks and an lm_head."""
+
+    def __init__(self, vocab_size=64, hidden_size=32):
+        super().__init__()
+        self.embed_tokens = nn.Embedding(vocab_size, hidden_size)
+        self.up_proj = nn.Linear(hidden_size, hidden_size * 4)
+        self.down_proj = nn.Linear(hidden_size * 4, hidden_size)
+        self.lm_head = nn.Linear(hidden_size, vocab_size)
+
+    def forward(self, x):
+        h = self.embed_tokens(x)
+        h = h + self.down_proj(torch.relu(self.up_proj(h)))
+        return self.lm_head(h)
+
+
+@pytest.fixture
+def model():
+    torch.manual_seed(0)
+    return TinyLM()
+
+
+@pytest.fixture
+def calibration():
+    torch.manual_seed(1)
+    return [torch.randint(0, 64, (2, 8)) for _ in range(2)]
+
+
+@pytest.fixture
+def temp_dir():
+    with tempfile.TemporaryDirectory() as directory:
+        yield directory
+
+
+def module_shapes(model):
+    return {name: tuple(m.weight.shape) for name, m in quantizable_modules(model)}
+
+
+def test_sensitivity_leaves_model_unchanged(model, calibration):
+    before = {k: v.clone() for k, v in model.state_dict().items()}
+    sensitivities = MixedPrecisionPlanner(group_size=32).measure_sensitivity(model, calibration)
+
+    assert set(sensitivities) == {"embed_tokens", "up_proj", "down_proj", "lm_head"}
+    for values in sensitivities.values():
+        assert values["fp16"] == 0.0
+        assert values["int4"] >= values["int8"] >= 0.0
+    for name, tensor in model.state_dict().items():
+        assert torch.equal(tensor, before[name])
+
+
+def test_plan_meets_budget_and_pins_head(model, calibration):
+    planner = MixedPrecisionPlanner(group_size=32)
+    shapes = module_shapes(model)
+    full = sum(o * i * 2 for o, i in shapes.values())
+    plan = planner.build_plan(model, calibration, budget_bytes=int(full * 0.6))
+
+    assert plan.estimated_bytes <= plan.budget_bytes
+    assert plan.assignments["embed_tokens"] == "fp16"
+    assert plan.assignments["lm_head"] == "fp16"
+    assert plan.assignments["up_proj"] != "fp16" or plan.assignments["down_proj"] != "fp16"
+
+
+def test_plan_prefers_least_sensitive_layer():
+    planner = MixedPrecisionPlanner(group_size=32, keep_high_precision=())
+    shapes = {"a": (64, 64), "b": (64, 64)}
+    sensitivities = {
+        "a": {"fp16": 0.0, "int8": 0.5, "int4": 2.0},
+        "b": {"fp16": 0.0, "int8": 0.01, "int4": 0.1},
+    }
+    budget = int(64 * 64 * (2 + bytes_per_weight("int8", 64)))
+    plan = planner.plan(shapes, sensitivities, budget)
+    assert plan.assignments == {"a": "fp16", "b": "int8"}
+
+
+def test_unreachable_budget_raises(model, calibration):
+    planner = MixedPrecisionPlanner(group_size=32)
+    with pytest.raises(ValueError, match="not reachable"):
+        planner.build_plan(model, calibration, budget_bytes=1)
+
+
+def test_plan_save_load_and_apply(model, calibration, temp_dir):
+    planner = MixedPrecisionPlanner(group_size=32)
+    shapes = module_shapes(model)
+    plan = planner.build_plan(model, calibration,
+                              budget_bytes=int(sum(o * i for o, i in shapes.values()) * 1.5))
+    path = os.path.join(temp_dir, "plan.json")
+    plan.save(path)
+
+    loaded = MixedPrecisionPlan.load(path)
+    assert loaded.assignments == plan.assignments
+    assert loaded.precision_for("up_proj.weight") == plan.assignments["up_proj"]
+    assert loaded.precision_for("up_proj.bias") == plan.assignments["up_proj"]
+    assert loaded.precision_for("missing.weight") is None
+
+    manager = QuantizationManager(QuantizationConfig(
+        quantization_type=QuantizationType.MIXED, mixed_precision_plan=path))
+    quantized = manager.quantize_model(model, "tiny")
+    assert quantized is not model
+    assert quantized(calibration[0]).shape == model(calibration[0]).shape
+
+
+
+def test_apply_plan_stores_quantized_weights(model, calibration):
+    plan = MixedPrecisionPlan(
+        assignments={"embed_tokens": "int8", "up_proj": "int4",
+                     "down_proj": "int8", "lm_head": "fp16"},
+        budget_bytes=0, estimated_bytes=0, estimated_kl=0.0, group_size=32)
+    reference = model(calibration[0])
+    full_bytes = sum(p.nelement() * p.element_size() for p in model.parameters())
+
+    quantized = apply_plan(model, plan)
+    assert isinstance(quantized.up_proj, QuantizedLinear)
+    assert isinstance(quantized.embed_tokens, QuantizedEmbedding)
+    assert quantized.up_proj.packed.qweight.dtype == torch.uint8
+    assert quantized.down_proj.packed.qweight.dtype == torch.int8
+    assert quantized.lm_head.packed.qweight.dtype == torch.float16
+    stored = sum(t.nelement() * t.element_size()
+                 for t in list(quantized.parameters()) + list(quantized.buffers()))
+    assert stored < full_bytes / 2
+    error = torch.linalg.norm(quantized(calibration[0]) - reference) / torch.linalg.norm(reference)
+    assert error < 0.25
+
+
+def test_mixed_requires_plan(model):
+    manager = QuantizationManager(QuantizationConfig(quantization_type=QuantizationType.MIXED))
+    with pytest.raises(ValueError, match="mixed_precision_plan"):
+        manager.quantize_model(model, "tiny")
+
+
+def test_streaming_quantizer_follows_plan(model, temp_dir):
+    checkpoint_dir = os.path.join(temp_dir, "checkpoint")
+    os.makedirs(checkpoint_dir)
+    torch.save(model.state_dict(), os.path.join(checkpoint_dir, "pytorch_model.bin"))
+
+    plan = MixedPrecisionPlan(
+        assignments={"embed_tokens": "fp16", "up_proj": "int4",
+                     "down_proj": "int8", "lm_head": "fp16"},
+        budget_bytes=0, estimated_bytes=0, estimated_kl=0.0, group_size=32)
+    config = QuantizationConfig(quantization_type=QuantizationType.MIXED)
+    output_dir = os.path.join(temp_dir, "out")
+    StreamingQuantizer(config, plan=plan).quantize_checkpoint(checkpoint_dir, output_dir)
+
+    with open(os.path.join(output_dir, "quantization_manifest.json")) as f:
+        tensors = json.load(f)["tensors"]
+    assert tensors["up_proj.weight"]["precision"] == "int4"
+    assert tensors["down_proj.weight"]["precision"] == "int8"
+    assert tensors["lm_head.weight"]["precision"] == "fp16"
+    assert tensors["up_proj.bias"]["precision"] == "fp16"
+
+    restored = load_quantized_state_dict(output_dir)
+    assert torch.allclose(restored["down_proj.weight"], model.down_proj.weight, atol=0.01)
+
+
+def test_cache_keeps_plan(model, temp_dir):
+    plan = MixedPrecisionPlan(assignments={"up_proj": "int8"}, budget_bytes=0,
+                              estimated_bytes=0, estimated_kl=0.0)
+    plan_path = os.path.join(temp_dir, "plan.json")
+    plan.save(plan_path)
+    cache = QuantizationCache(os.path.join(temp_dir, "cache"))
+    config = QuantizationConfig(quantization_type=QuantizationType.MIXED,
+                                mixed_precision_plan=plan_path)
+    cache.cache_model("tiny", apply_plan(model, plan), config)
+
+    os.remove(plan_path)
+    cached = cache.load_cached_plan("tiny")
+    assert cached is not None
+    assert cached.assignments == {"up_proj": "int8"}
@@ -0,0 +1,127 @@
+"""Tests for the background-refreshed model catalog."""
+
+import asyncio
+import threading
+import time
+
+from src.model_catalog import ModelCatalog, etag_for, etag_matches
+
+
+class FakeBackend:
+    """Backend double counting ``list_models`` calls."""
+
+    def __init__(self, models=("llama3",), delay=0.0):
+        self.models = list(models)
+        self.delay = delay
+        self.down = False
+        self.calls = 0
+        self.listeners = []
+
+    def list_models(self, strict=False):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.down:
+            raise ConnectionError("connection refused")
+        return [{"name": m, "size": 1} for m in self.models]
+
+    def add_model_listener(self, callback):
+        self.listeners.append(callback)
+
+    def pull(self, model):
+        self.models.append(model)
+        for callback in self.listeners:
+            callback(model)
+
+
+def test_reads_are_served_from_memory():
+    ollama = FakeBackend()
+    catalog = ModelCatalog({"ollama": ollama, "llama-gpu": object()},
+                           static_models={"llama-gpu": [{"name": "llama-base"}]})
+    asyncio.run(catalog.refresh())
+    for _ in range(100):
+        models = catalog.models()
+        catalog.snapshot()
+    assert ollama.calls == 1
+    assert models == [
+        {"id": "llama3", "object": "model", "backend": "ollama", "size": 1},
+        {"id": "llama-base", "object": "model", "backend": "llama-gpu"},
+    ]
+
+
+def test_unavailable_backend_keeps_stale_models():
+    ollama = FakeBackend()
+    catalog = ModelCatalog({"ollama": ollama})
+    asyncio.run(catalog.refresh())
+    ollama.down = True
+    asyncio.run(catalog.refresh())
+
+    entry = catalog.snapshot()["ollama"]
+    assert entry["available"] is False
+    assert entry["stale"] is True
+    assert entry["models"] == ["llama3"]
+    assert "refused" in entry["error"]
+    assert catalog.failures == 1
+
+    ollama.down = False
+    asyncio.run(catalog.refresh())
+    assert catalog.snapshot()["ollama"]["stale"] is False
+
+
+def test_slow_backend_times_out_without_delaying_others():
+    catalog = ModelCatalog(
+        {"slow": FakeBackend(delay=0.5), "fast": FakeBackend(["tiny"])}, timeout=0.05
+    )
+
+    async def timed_refresh():
+        started = time.perf_counter()
+        await catalog.refresh()
+        return time.perf_counter() - started
+
+    assert asyncio.run(timed_refresh()) < 0.4
+    assert catalog.snapshot()["slow"]["available"] is False
+    assert catalog.model_names("fast") == ["tiny"]
+
+
+def test_pull_event_triggers_refresh():
+    ollama = FakeBackend()
+    catalog = ModelCatalog({"ollama": ollama}, refresh_interval=60)
+    catalog.watch("ollama")
+
+    async def scenario():
+        await catalog.refresh()
+        task = asyncio.ensure_future(catalog.run())
+        await asyncio.sleep(0.01)
+        # Pulls happen on worker threads
+        thread = threading.Thread(target=ollama.pull, args=("mistral",))
+        thread.start()
+        thread.join()
+        for _ in range(100):
+            if "mistral" in catalog.model_names("ollama"):
+                break
+            await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(scenario())
+    assert catalog.model_names("ollama") == ["llama3", "mistral"]
+    assert ollama.calls == 2
+
+
+def test_etag_only_changes_with_content():
+    ollama = FakeBackend()
+    catalog = ModelCatalog({"ollama": ollama})
+    asyncio.run(catalog.refresh())
+    first = etag_for(catalog.snapshot())
+    asyncio.run(catalog.refresh())
+    assert etag_for(catalog.snapshot()) == first
+
+    ollama.models.append("mistral")
+    asyncio.run(catalog.refresh())
+    second = etag_for(catalog.snapshot())
+    assert second != first
+
+    assert etag_matches(second, second)
+    assert etag_matches(f'"other", W/{second}', second)
+    assert etag_matches("*", second)
+    assert not etag_matches(first, second)
+    assert not etag_matches(None, second)
@@ -0,0 +1,152 @@
+"""Tests for hot model loading, leases and eviction."""
+
+import asyncio
+import threading
+
+import pytest
+
+from src.model_registry import READY, RETIRED, ModelRegistry
+
+
+class FakeEngine:
+    def __init__(self, source, size=100):
+        self.source = source
+        self.size = size
+        self.freed = False
+        self.warmed = False
+
+    def infer(self, prompt):
+        return f"{self.source}: {prompt}"
+
+
+def make_registry(**kwargs):
+    freed = []
+
+    def free(engine):
+        engine.freed = True
+        freed.append(engine.source)
+
+    registry = ModelRegistry(
+        lambda source: FakeEngine(source),
+        measure=lambda engine: engine.size,
+        free=free,
+        **kwargs,
+    )
+    return registry, freed
+
+
+def test_background_load_swaps_atomically():
+    registry, freed = make_registry()
+    registry.register("base", FakeEngine("v1"))
+    gate = threading.Event()
+
+    def slow_loader(source):
+        gate.wait(5)
+        return FakeEngine(source)
+
+    registry.loader = slow_loader
+    future = registry.load("base", "v2")
+    # Still serving the old weights while the new ones load
+    with registry.lease() as model:
+        assert model.engine.source == "v1"
+    assert registry.status("base")["state"] == "loading"
+
+    gate.set()
+    future.result(5)
+    with registry.lease("base") as model:
+        assert model.engine.source == "v2"
+    assert freed == ["v1"]
+    assert registry.status("base")["state"] == READY
+
+
+def test_old_model_drains_before_it_is_freed():
+    registry, freed = make_registry()
+    registry.register("base", FakeEngine("v1"))
+    old = registry.acquire("base")  # an in-flight request
+
+    registry.register("tuned", FakeEngine("v2"))
+    assert registry.active == "tuned"
+    assert old.state == RETIRED
+    assert freed == []
+    assert old.engine.infer("hi") == "v1: hi"
+    assert registry.stats()["draining"][0]["in_flight"] == 1
+
+    registry.release(old)
+    assert freed == ["v1"]
+    assert old.engine is None
+    assert registry.stats()["swaps"] == 1
+
+
+def test_stream_lease_lasts_until_stream_ends():
+    registry, freed = make_registry()
+    registry.register("base", FakeEngine("v1"))
+
+    async def tokens():
+        for token in ("a", "b"):
+            yield token
+
+    async def scenario():
+        stream = registry.hold(registry.acquire(), tokens())
+        assert await stream.__anext__() == "a"
+        registry.register("next", FakeEngine("v2"))
+        assert freed == []
+        assert [t async for t in stream] == ["b"]
+
+    asyncio.run(scenario())
+    assert freed == ["v1"]
+
+
+def test_lru_eviction_under_memory_budget():
+    registry, freed = make_registry(memory_budget=350)
+    registry.register("a", FakeEngine("a"))
+    registry.register("b", FakeEngine("b"), activate=False)
+    registry.register("c", FakeEngine("c"), activate=False)
+    with registry.lease("b"):
+        pass  # b is now more recently used than c
+    registry.register("d", FakeEngine("d"), activate=False)
+
+    assert sorted(registry.names()) == ["a", "b", "d"]
+    assert freed == ["c"]
+    assert registry.stats()["resident_bytes"] == 300
+    assert registry.stats()["evictions"] == 1
+
+    # Neither the active nor the new model is evicted, even over budget
+    registry.register("e", FakeEngine("e", size=300), activate=False)
+    assert sorted(registry.names()) == ["a", "e"]
+
+
+def test_unknown_name_uses_active_model_and_failures_are_reported():
+    registry, _ = make_registry(warmup=lambda engine: setattr(engine, "warmed", True))
+    with pytest.raises(LookupError):
+        registry.acquire()
+    registry.load("base", "v1").result(5)
+    with registry.lease("gpt-4") as model:
+        assert model.name == "base"
+        assert model.engine.warmed
+
+    def broken(source):
+        raise OSError("no such file")
+
+    registry.loader = broken
+    with pytest.raises(OSError):
+        registry.load("other", "missing").result(5)
+    assert registry.status("other")["state"] == "failed"
+    assert "no such file" in registry.status("other")["error"]
+    assert registry.active == "base"
+
+
+def test_server_counts_tokens_with_the_leased_models_tokenizer():
+    pytest.importorskip("fastapi")
+    from src import api_server
+
+    class CharTokenizer:
+        def encode(self, text, add_special_tokens=False):
+            return list(text)
+
+    engine = FakeEngine("chars")
+    engine.tokenizer = CharTokenizer()
+    api_server.model_registry.register("chars", engine, activate=False)
+
+    assert api_server.tokens_for("two words") == 2  # active demo engine
+    assert api_server.tokens_for("two words", "chars") == 9
+    assert api_server.usage("ab", "cde", "chars")["total_tokens"] == 5
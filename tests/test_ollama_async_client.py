@@ -0,0 +1,134 @@
+"""Tests for the asyncio Ollama client against the fake Ollama server."""
+
+import asyncio
+import time
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+
+from src.backends.ollama import AsyncOllamaClient, OllamaBackend  # noqa: E402
+from src.backends.ollama.fake_server import FakeOllamaServer  # noqa: E402
+from src.core.exceptions import QueueFullError  # noqa: E402
+from src.inference_executor import AsyncInferenceExecutor  # noqa: E402
+
+
+@pytest.fixture
+def server():
+    with FakeOllamaServer(models=["fake:latest"], reply="one two three") as fake:
+        yield fake
+
+
+def test_generate_and_chat_share_connections(server):
+    async def scenario():
+        client = AsyncOllamaClient(server.url)
+        usage = {}
+        text = await client.generate("fake:latest", "a b", usage=usage)
+        reply = await client.chat("fake:latest", [{"role": "user", "content": "x"}])
+        models = await client.list_models()
+        await client.close()
+        return text, usage, reply, models
+
+    text, usage, reply, models = asyncio.run(scenario())
+    assert text == "one two three" and reply == "one two three"
+    assert usage["prompt_tokens"] == 2 and usage["completion_tokens"] == 3
+    assert usage["timing"]["eval_ms"] >= 0
+    assert models[0]["name"] == "fake:latest"
+    assert server.connections == 1
+
+
+def test_concurrent_streams_multiplex_on_one_loop():
+    with FakeOllamaServer(reply="a b c d", token_delay=0.05) as fake:
+        async def scenario():
+            client = AsyncOllamaClient(fake.url, pool_size=20)
+
+            async def one():
+                usage = {}
+                chunks = [c async for c in client.stream_chat(
+                    "fake:latest", [{"role": "user", "content": "hi"}], usage=usage)]
+                return "".join(chunks), usage["completion_tokens"]
+
+            results = await asyncio.gather(*(one() for _ in range(20)))
+            await client.close()
+            return results
+
+        started = time.perf_counter()
+        results = asyncio.run(scenario())
+        elapsed = time.perf_counter() - started
+    assert results == [("a b c d", 4)] * 20
+    # 20 sequential streams would take ~4 s; overlapping ones take ~0.2 s
+    assert elapsed < 2.0
+
+
+def test_idempotent_calls_retry_but_generation_does_not(server):
+    async def scenario():
+        client = AsyncOllamaClient(server.url, max_retries=2, backoff=0.001)
+        server.fail_next(503, 502)
+        models = await client.list_models(strict=True)
+        server.fail_next(503)
+        with pytest.raises(aiohttp.ClientResponseError):
+            await client.generate("fake:latest", "hi")
+        await client.close()
+        return models, client.latency_stats()
+
+    models, stats = asyncio.run(scenario())
+    assert [m["name"] for m in models] == ["fake:latest"]
+    assert stats["tags"]["retries"] == 2 and stats["tags"]["calls"] == 3
+    assert sum(1 for _, path in server.requests if path == "/api/generate") == 1
+
+
+def test_closing_a_stream_early_drops_its_connection():
+    with FakeOllamaServer(reply="a b c d e f", token_delay=0.02) as fake:
+        async def scenario():
+            client = AsyncOllamaClient(fake.url)
+            stream = client.stream_generate("fake:latest", "hi")
+            first = await stream.__anext__()
+            await stream.aclose()
+            text = await client.generate("fake:latest", "again")
+            await client.close()
+            return first, text
+
+        first, text = asyncio.run(scenario())
+        connections = fake.connections
+    assert first == "a " and text == "a b c d e f"
+    # The abandoned stream's connection is not handed to the next call
+    assert connections == 2
+
+
+def test_backend_async_methods_report_errors_as_text(server):
+    async def scenario():
+        backend = OllamaBackend(server.url, default_model="fake:latest")
+        ok = await backend.ainfer("hi")
+        chunks = [c async for c in backend.astream_infer("hi")]
+        missing = await backend.achat([{"role": "user", "content": "x"}], model="nope")
+        await backend.aclose()
+        return ok, chunks, missing
+
+    ok, chunks, missing = asyncio.run(scenario())
+    assert ok == "one two three"
+    assert "".join(chunks) == ok
+    assert missing.startswith("Error: ")
+
+
+def test_saturated_backend_sheds_behind_async_executor():
+    with FakeOllamaServer(reply="a b c d", token_delay=0.05) as fake:
+        async def scenario():
+            backend = OllamaBackend(fake.url, default_model="fake:latest")
+            executor = AsyncInferenceExecutor(max_concurrency=1, max_queue=1)
+
+            async def consume(tokens):
+                return "".join([t async for t in tokens])
+
+            running = asyncio.ensure_future(consume(executor.stream(backend.astream_infer, "hi")))
+            await asyncio.sleep(0.05)  # first stream holds the only slot
+            queued = asyncio.ensure_future(consume(executor.stream(backend.astream_infer, "hi")))
+            with pytest.raises(QueueFullError) as excinfo:
+                executor.stream(backend.astream_infer, "hi")
+            texts = await asyncio.gather(running, queued)
+            await backend.aclose()
+            return texts, excinfo.value, executor.stats()
+
+        texts, error, stats = asyncio.run(scenario())
+    assert texts == ["a b c d"] * 2
+    assert error.status_code == 429 and error.retry_after >= 1
+    assert stats["rejected_queue_full"] == 1 and stats["completed"] == 2
@@ -0,0 +1,161 @@
+"""Tests for the pooled Ollama client against the fake Ollama server."""
+
+import threading
+
+import pytest
+
+requests = pytest.importorskip("requests")
+
+from src.advanced_cache import ResponseCache  # noqa: E402
+from src.backends.ollama import OllamaClient  # noqa: E402
+from src.backends.ollama.ollama_client import NDJSONDecoder, eval_timing  # noqa: E402
+from src.backends.ollama.fake_server import FakeOllamaServer  # noqa: E402
+
+
+@pytest.fixture
+def server():
+    with FakeOllamaServer(models=["fake:latest"], reply="one two three") as fake:
+        yield fake
+
+
+def test_calls_reuse_pooled_connections(server):
+    client = OllamaClient(server.url, pool_size=2)
+    for _ in range(20):
+        assert client.generate("fake:latest", "hi") == "one two three"
+    assert client.list_models()[0]["name"] == "fake:latest"
+    assert server.connections == 1
+
+    threads = [
+        threading.Thread(target=client.chat, args=("fake:latest", [{"role": "user", "content": "x"}]))
+        for _ in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # Concurrent callers open extra connections, but no more than needed
+    assert server.connections <= 9
+    client.close()
+
+
+def test_stream_reports_usage_and_keeps_connection(server):
+    client = OllamaClient(server.url)
+    usage = {}
+    chunks = list(client.generate("fake:latest", "a b", stream=True, usage=usage))
+    assert "".join(chunks) == "one two three"
+    assert usage["prompt_tokens"] == 2 and usage["completion_tokens"] == 3
+    timing = usage["timing"]
+    assert timing["eval_ms"] > 0 and timing["tokens_per_second"] > 0
+    client.generate("fake:latest", "again")
+    assert server.connections == 1
+
+
+def test_idempotent_calls_retry_gateway_errors(server):
+    client = OllamaClient(server.url, max_retries=2, backoff=0.001)
+    server.fail_next(503, 502)
+    assert [m["name"] for m in client.list_models(strict=True)] == ["fake:latest"]
+    stats = client.latency_stats()["tags"]
+    assert stats["retries"] == 2 and stats["errors"] == 2 and stats["calls"] == 3
+
+    server.fail_next(503, 503, 503)
+    with pytest.raises(requests.HTTPError):
+        client.list_models(strict=True)
+
+
+def test_generation_is_not_retried(server):
+    client = OllamaClient(server.url, max_retries=3, backoff=0.001)
+    server.fail_next(503)
+    with pytest.raises(requests.HTTPError):
+        client.generate("fake:latest", "hi")
+    assert sum(1 for _, path in server.requests if path == "/api/generate") == 1
+
+
+def test_read_timeout_bounds_each_chunk():
+    seen = []
+    with FakeOllamaServer(reply="slow reply", token_delay=0.3) as fake:
+        client = OllamaClient(
+            fake.url, read_timeout=0.05, on_request=lambda *call: seen.append(call)
+        )
+        with pytest.raises(requests.exceptions.ConnectionError):
+            list(client.generate("fake:latest", "hi", stream=True))
+    assert seen[0][0] == "generate"
+
+
+def test_connect_errors_are_retried_then_raised():
+    client = OllamaClient("http://127.0.0.1:9", connect_timeout=0.2, max_retries=1, backoff=0.001)
+    assert client.is_available() is False
+    assert client.list_models() == []
+    assert client.latency_stats()["tags"]["retries"] == 1
+
+
+def test_ndjson_decoder_handles_split_and_long_lines():
+    decoder = NDJSONDecoder()
+    big = "x" * 200_000
+    data = b'{"a": 1}\n{"b": "' + big.encode() + b'"}\nnot json\n{"c"'
+    items = []
+    for i in range(0, len(data), 7):
+        items.extend(decoder.feed(data[i:i + 7]))
+    assert items == [{"a": 1}, {"b": big}]
+    assert decoder.feed(b": 3}") == []
+    assert decoder.flush() == [{"c": 3}]
+    assert decoder.skipped == 1
+
+
+def test_eval_timing_converts_nanoseconds():
+    timing = eval_timing({
+        "total_duration": 3_000_000_000, "load_duration": 500_000_000,
+        "prompt_eval_count": 10, "prompt_eval_duration": 250_000_000,
+        "eval_count": 40, "eval_duration": 2_000_000_000,
+    })
+    assert timing == {
+        "total_ms": 3000.0, "load_ms": 500.0, "prompt_eval_ms": 250.0, "eval_ms": 2000.0,
+        "prompt_tokens_per_second": 40.0, "tokens_per_second": 20.0,
+    }
+    assert eval_timing({"done": True}) is None
+
+
+def test_cache_serves_deterministic_calls_until_digest_changes(server, tmp_path):
+    client = OllamaClient(server.url, cache=ResponseCache(disk_path=str(tmp_path / "c.db")),
+                          digest_ttl=0)
+    messages = [{"role": "user", "content": "x"}]
+
+    def generations():
+        return sum(1 for _, path in server.requests if path in ("/api/generate", "/api/chat"))
+
+    assert client.chat("fake:latest", messages, temperature=0) == "one two three"
+    usage = {}
+    assert client.chat("fake:latest", messages, temperature=0, usage=usage) == "one two three"
+    assert usage["cached"] and usage["completion_tokens"] == 3
+    assert "".join(client.chat("fake:latest", messages, temperature=0, stream=True)) == "one two three"
+    assert generations() == 1
+
+    # Sampled calls always reach the model; a fixed seed makes them cacheable
+    client.generate("fake:latest", "hi")
+    client.generate("fake:latest", "hi")
+    assert generations() == 3
+    assert "".join(client.generate("fake:latest", "hi", seed=7, stream=True)) == "one two three"
+    assert client.generate("fake:latest", "hi", seed=7) == "one two three"
+    assert generations() == 4
+
+    server.digests["fake:latest"] = "sha256:repulled"
+    client.chat("fake:latest", messages, temperature=0)
+    assert generations() == 5
+    assert client.cache_stats()["hits"] == 3
+
+
+
+def test_cache_resolves_untagged_names_with_one_listing(server):
+    client = OllamaClient(server.url, cache=ResponseCache(), digest_ttl=60)
+    for _ in range(3):
+        assert client.generate("fake", "hi", temperature=0) == "one two three"
+    paths = [path for _, path in server.requests]
+    assert paths.count("/api/generate") == 1 and paths.count("/api/tags") == 1
+    # Unlisted models are remembered as such until the listing expires
+    assert client.model_digest("other") is None
+    assert [path for _, path in server.requests].count("/api/tags") == 1
+
+def test_cache_is_opt_in(monkeypatch, server):
+    monkeypatch.delenv("OLLAMA_RESPONSE_CACHE", raising=False)
+    assert OllamaClient.from_env(server.url).cache_stats() is None
+    monkeypatch.setenv("OLLAMA_RESPONSE_CACHE", "true")
+    assert OllamaClient.from_env(server.url).cache_stats()["entries"] == 0
@@ -0,0 +1,121 @@
+"""Tests for Ollama model residency decisions against the fake Ollama server."""
+
+import pytest
+
+pytest.importorskip("requests")
+
+from src.backends.ollama import OllamaBackend, ResidencyManager  # noqa: E402
+from src.backends.ollama.fake_server import FakeOllamaServer, keep_alive_seconds  # noqa: E402
+
+GB = 1024 ** 3
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def server(clock):
+    sizes = {"a": 4 * GB, "b": 4 * GB, "c": 4 * GB, "big": 12 * GB}
+    with FakeOllamaServer(models=list(sizes), sizes=sizes, clock=clock) as fake:
+        yield fake
+
+
+def backend_with(server, clock, **options):
+    backend = OllamaBackend(server.url, default_model="a")
+    backend.residency = ResidencyManager(backend.client, half_life=60, clock=clock, **options)
+    return backend
+
+
+def test_keep_alive_durations():
+    assert keep_alive_seconds("5m") == 300
+    assert keep_alive_seconds("1h30m") == 5400
+    assert keep_alive_seconds(0) == 0
+    assert keep_alive_seconds(-1) == float("inf")
+    assert keep_alive_seconds(None) == 300
+
+
+def test_preloads_configured_models_once(server, clock):
+    backend = backend_with(server, clock, preload=["b"])
+    report = backend.residency.reconcile()
+    assert report["loaded"] == ["b"] and server.resident_models() == ["b"]
+    # Requests for a preloaded model are pinned and find it warm
+    backend.infer("hi", model="b")
+    backend.residency.reconcile()
+    assert server.loads == 1
+    clock.now += 3000  # longer than Ollama's default keep_alive
+    assert server.resident_models() == ["b"]
+
+
+def test_hot_models_are_pinned_and_cold_ones_expire(server, clock):
+    backend = backend_with(server, clock)
+    for _ in range(10):
+        backend.infer("hi", model="b")
+    backend.infer("hi", model="c")
+    assert backend.residency.reconcile()["pinned"] == ["b"]
+    backend.infer("hi", model="b")
+    backend.infer("hi", model="c")
+
+    clock.now += 301
+    assert server.resident_models() == ["b"]
+
+    # Traffic stops; the pin lapses and the model expires like any other
+    clock.now += 600
+    assert backend.residency.reconcile()["pinned"] == []
+    clock.now += 3600
+    assert server.resident_models() == []
+
+
+def test_budget_evicts_coldest_unpinned_model(server, clock):
+    backend = backend_with(server, clock, vram_budget=8 * GB)
+    backend.infer("hi", model="a")
+    for _ in range(10):
+        backend.infer("hi", model="b")
+        backend.infer("hi", model="big")
+    clock.now += 5
+    for _ in range(12):
+        backend.residency.touch("c")
+
+    report = backend.residency.reconcile()
+    # big does not fit next to the hotter models; a is cold and makes room
+    assert report["pinned"] == ["c", "b"]
+    assert report["unloaded"] == ["a", "big"]
+    assert report["loaded"] == ["c"]
+    assert sorted(server.resident_models()) == ["b", "c"]
+    stats = backend.residency.stats()
+    assert stats["resident"] == ["b", "c"] and stats["unloads"] == 2
+
+
+def test_from_env_is_off_by_default(monkeypatch):
+    monkeypatch.delenv("OLLAMA_PRELOAD_MODELS", raising=False)
+    monkeypatch.delenv("OLLAMA_RESIDENCY", raising=False)
+    assert ResidencyManager.from_env(object()) is None
+    monkeypatch.setenv("OLLAMA_PRELOAD_MODELS", "a, b")
+    monkeypatch.setenv("OLLAMA_VRAM_BUDGET_GB", "16")
+    manager = ResidencyManager.from_env(object())
+    assert manager.preload == ["a", "b"] and manager.vram_budget == 16 * GB
+
+
+def test_unknown_and_quiet_models_are_forgotten(server, clock):
+    backend = backend_with(server, clock)
+    for i in range(50):
+        backend.residency.touch(f"missing-{i}")
+    backend.infer("hi", model="a")
+    backend.residency.reconcile()
+    assert list(backend.residency.rates()) == ["a"]
+    tags = sum(1 for _, path in server.requests if path == "/api/tags")
+    backend.residency.reconcile()
+    assert sum(1 for _, path in server.requests if path == "/api/tags") == tags
+
+    clock.now += 60 * 10  # ten half-lives
+    backend.residency.reconcile()
+    assert backend.residency.rates() == {}
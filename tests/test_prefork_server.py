@@ -0,0 +1,109 @@
+"""Tests for the fork-after-load prefork server."""
+
+import gc
+import http.client
+import os
+import signal
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.prefork_server import PreforkServer, memory_report
+
+pytestmark = pytest.mark.skipif(
+    not os.path.exists("/proc/self/smaps_rollup"), reason="needs Linux /proc smaps"
+)
+
+WEIGHTS_BYTES = 64 * 1024 * 1024
+
+
+def make_server(weights, workers):
+    def serve(sock):
+        while True:
+            conn, _ = sock.accept()
+            with conn:
+                conn.recv(65536)
+                # Read (never write) the shared weights, like a forward pass
+                checksum = sum(weights[::1 << 20])
+                body = f"{os.getpid()} {checksum}".encode()
+                conn.sendall(
+                    b"HTTP/1.1 200 OK\r\nConnection: close\r\n"
+                    b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body
+                )
+
+    return PreforkServer(serve, workers=workers)
+
+
+def fetch(address):
+    conn = http.client.HTTPConnection(*address, timeout=10)
+    try:
+        conn.request("GET", "/")
+        return conn.getresponse().read().decode().split()
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def weights():
+    # "Model" loaded once in the parent; every page is touched
+    data = bytes([1]) * WEIGHTS_BYTES
+    yield data
+    gc.unfreeze()
+
+
+def test_workers_share_weights_and_serve_in_parallel(weights, record_property):
+    workers = 4
+    requests = 400
+    with make_server(weights, workers) as server:
+        address = server.address
+        time.sleep(0.2)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            responses = list(pool.map(lambda _: fetch(address), range(requests)))
+        elapsed = time.perf_counter() - started
+        report = memory_report(server.worker_pids)
+
+    pids = {int(pid) for pid, _ in responses}
+    assert all(int(checksum) == WEIGHTS_BYTES >> 20 for _, checksum in responses)
+    assert len(pids) > 1
+    assert len(report) == workers
+
+    throughput = requests / elapsed
+    total_pss = sum(m["pss"] for m in report.values())
+    for pid, m in report.items():
+        print(f"worker {pid}: rss={m['rss'] / 2**20:.1f} MiB pss={m['pss'] / 2**20:.1f} MiB")
+        # Every worker maps the full weights...
+        assert m["rss"] >= WEIGHTS_BYTES
+        # ...but only pays for a share of them
+        assert m["pss"] < WEIGHTS_BYTES * 0.75
+    print(f"aggregate throughput: {throughput:.0f} req/s over {workers} workers")
+    record_property("throughput_rps", round(throughput, 1))
+    record_property("total_pss_mib", round(total_pss / 2**20, 1))
+    # Private copies would cost workers * WEIGHTS_BYTES
+    assert total_pss < workers * WEIGHTS_BYTES / 2
+
+
+def test_dead_worker_is_restarted(weights):
+    with make_server(weights, 2) as server:
+        victim = server.worker_pids[0]
+        os.kill(victim, signal.SIGKILL)
+        deadline = time.monotonic() + 5
+        while server.restarts == 0 and time.monotonic() < deadline:
+            server.reap()
+            time.sleep(0.05)
+        assert server.restarts == 1
+        assert victim not in server.worker_pids
+        assert len(server.worker_pids) == 2
+        assert fetch(server.address)[1] == str(WEIGHTS_BYTES >> 20)
+        pids = server.worker_pids
+
+    for pid in pids:
+        with pytest.raises(ProcessLookupError):
+            os.kill(pid, 0)
+
+
+def test_rejects_zero_workers():
+    with socket.socket() as sock, pytest.raises(ValueError):
+        PreforkServer(lambda s: None, workers=0, sock=sock)
@@ -0,0 +1,130 @@
+"""
+Tests for the quantization benchmark matrix.
+
+Runs the harness end to end on a tiny random-weight LLaMA and checks the
+report, plus the token accounting fixes in QuantizedInference.
+"""
+
+import json
+import math
+import os
+import tempfile
+from unittest.mock import Mock
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+from src.quantization import (
+    QuantizationConfig,
+    QuantizationManager,
+    QuantizationType,
+    QuantizedInference,
+)
+from src.quantization_benchmark import (
+    DEFAULT_TYPES,
+    QuantizationBenchmark,
+    build_byte_tokenizer,
+    build_tiny_llama,
+    compute_perplexity,
+    format_table,
+    write_report,
+)
+
+
+@pytest.fixture(scope="module")
+def tokenizer():
+    return build_byte_tokenizer()
+
+
+@pytest.fixture(scope="module")
+def report(tokenizer):
+    benchmark = QuantizationBenchmark(
+        lambda: build_tiny_llama(tokenizer),
+        tokenizer,
+        quantization_types=[QuantizationType.INT8, QuantizationType.INT4,
+                            QuantizationType.STATIC],
+        batch_sizes=[1, 2],
+        max_new_tokens=4,
+        model_name="tiny",
+    )
+    return benchmark.run()
+
+
+def test_default_types_leave_out_mixed(tokenizer):
+    benchmark = QuantizationBenchmark(lambda: build_tiny_llama(tokenizer), tokenizer)
+    assert QuantizationType.MIXED not in benchmark.quantization_types
+    assert benchmark.quantization_types == list(DEFAULT_TYPES)
+    assert set(DEFAULT_TYPES) == set(QuantizationType) - {QuantizationType.MIXED}
+
+
+def test_byte_tokenizer_round_trip(tokenizer):
+    ids = tokenizer("héllo GPU")["input_ids"]
+    assert tokenizer.decode(ids) == "héllo GPU"
+
+
+def test_random_model_perplexity_near_vocab(tokenizer):
+    model = build_tiny_llama(tokenizer)
+    perplexity = compute_perplexity(model, tokenizer, ["some fixed text for scoring"])
+    # An untrained model is close to uniform over the vocabulary
+    assert 0.5 * len(tokenizer) < perplexity < 2 * len(tokenizer)
+
+
+def test_report_contents(report):
+    results = report["results"]
+    assert set(results) == {"baseline", "int8", "int4", "static"}
+    assert results["static"]["status"] == "error"
+
+    for name in ("baseline", "int8", "int4"):
+        entry = results[name]
+        assert entry["status"] == "ok"
+        assert math.isfinite(entry["perplexity"])
+        assert entry["model_bytes"] > 0
+        assert entry["peak_rss_bytes"] > 0
+        for batch_size in ("1", "2"):
+            generation = entry["generation"][batch_size]
+            assert generation["generated_tokens"] > 0
+            assert generation["tokens_per_second"] > 0
+            assert generation["time_to_first_token"] > 0
+
+    assert results["int8"]["model_bytes"] < results["baseline"]["model_bytes"]
+    assert results["baseline"]["accuracy_loss"] == 0.0
+
+
+def test_write_report(report):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        json_path, table_path = write_report(report, temp_dir, "bench")
+        with open(json_path) as f:
+            data = json.load(f)
+        assert data["results"]["int8"]["status"] == "ok"
+        with open(table_path) as f:
+            table = f.read()
+        assert "| int8 | ok |" in table
+        assert "| static | error |" in table
+    assert format_table(report).count("\n") == len(report["results"]) + 2
+
+
+def test_accuracy_loss_recorded():
+    manager = QuantizationManager(QuantizationConfig())
+    manager.quantized_models["m"] = {}
+    loss = manager.record_accuracy_loss("m", 10.0, 11.0)
+    assert loss == pytest.approx(0.1)
+    assert manager.get_overall_stats()["accuracy_loss"] == pytest.approx(0.1)
+
+
+def test_benchmark_counts_generated_tokens(tokenizer):
+    model = build_tiny_llama(tokenizer)
+    inference = QuantizedInference(model, QuantizationConfig(), tokenizer=tokenizer)
+    results = inference.benchmark_performance(["hello", "world"], max_tokens=3)
+    assert results["total_tokens"] <= 6
+    assert results["failed_prompts"] == 0
+
+
+def test_benchmark_does_not_count_failures():
+    model = Mock(side_effect=RuntimeError("boom"))
+    inference = QuantizedInference(model, QuantizationConfig())
+    results = inference.benchmark_performance(["hello", "world"], max_tokens=5)
+    assert results["total_tokens"] == 0
+    assert results["failed_prompts"] == 2
+    assert results["tokens_per_second"] == 0
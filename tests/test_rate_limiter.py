@@ -0,0 +1,154 @@
+"""Tests for the token-bucket rate limiter and its ASGI middleware."""
+
+import asyncio
+import multiprocessing
+import os
+import time
+
+import pytest
+
+from src.rate_limiter import (
+    MemoryStore,
+    RateLimiter,
+    RateLimitMiddleware,
+    SQLiteStore,
+    client_key,
+)
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_request_bucket_allows_burst_then_refills():
+    clock = Clock()
+    limiter = RateLimiter(requests_per_minute=60, burst=0.05, clock=clock)  # 3 per burst
+    assert [limiter.check("k").allowed for _ in range(4)] == [True, True, True, False]
+    denied = limiter.check("k")
+    assert not denied.allowed and 0 < denied.retry_after <= 1.0
+    assert limiter.check("other").allowed  # keys are independent
+
+    clock.now += 1.0  # one request per second refills
+    assert limiter.check("k").allowed
+    assert not limiter.check("k").allowed
+    assert limiter.stats()["limited"] == 3
+
+
+def test_token_budget_goes_into_debt():
+    clock = Clock()
+    limiter = RateLimiter(requests_per_minute=0, tokens_per_minute=600, clock=clock)
+    assert limiter.check("k").remaining_tokens == 600
+    limiter.charge_tokens("k", 700)  # a long answer overspends
+    decision = limiter.check("k")
+    assert not decision.allowed
+    assert abs(decision.retry_after - 10.0) < 1e-6  # 100 tokens at 10/s
+
+    clock.now += 10.5
+    decision = limiter.check("k")
+    assert decision.allowed and decision.remaining_tokens == 5
+
+
+def test_idle_buckets_are_evicted():
+    clock = Clock()
+    store = MemoryStore()
+    limiter = RateLimiter(requests_per_minute=60, store=store, evict_interval=10, clock=clock)
+    for i in range(100):
+        limiter.check(f"ip-{i}")
+    assert len(store) == 100
+    clock.now += 61  # every bucket has refilled
+    limiter.check("fresh")
+    assert len(store) == 1
+    assert limiter.stats()["evicted"] == 100
+
+
+def hammer(path, count):
+    limiter = RateLimiter(requests_per_minute=60, burst=1, store=SQLiteStore(path))
+    return sum(limiter.check("shared").allowed for _ in range(count))
+
+
+def test_sqlite_store_is_shared_between_processes(tmp_path):
+    path = str(tmp_path / "limits.db")
+    with multiprocessing.get_context("spawn").Pool(3) as pool:
+        allowed = pool.starmap(hammer, [(path, 40)] * 3)
+    # 60 burst plus at most a few refilled during the test, across all workers
+    assert 60 <= sum(allowed) <= 65
+    assert len(SQLiteStore(path)) == 1
+
+
+
+_inherited = {}
+
+
+def hammer_inherited(count):
+    store = _inherited["store"]
+    reused = getattr(store._local, "connection", None) is not None
+    limiter = RateLimiter(requests_per_minute=60, burst=1, store=store)
+    return reused, sum(limiter.check("shared").allowed for _ in range(count))
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork()")
+def test_sqlite_store_created_before_fork_reconnects_in_workers(tmp_path):
+    store = _inherited["store"] = SQLiteStore(str(tmp_path / "limits.db"))
+    assert store.update("parent", 1.0, 10.0, 1.0, time.time())[0]
+    with multiprocessing.get_context("fork").Pool(3) as pool:
+        results = pool.map(hammer_inherited, [40] * 3)
+    assert not any(reused for reused, _ in results)
+    assert 60 <= sum(allowed for _, allowed in results) <= 65
+    # The parent's own connection still works
+    assert len(store) == 2
+
+def test_client_key_prefers_api_key():
+    headers = [(b"authorization", b"Bearer secret")]
+    assert client_key(headers, ("10.0.0.1", 5000)).startswith("key-")
+    assert client_key(headers, None) == client_key(headers, ("10.0.0.2", 1))
+    assert client_key([], ("10.0.0.1", 5000)) == "ip-10.0.0.1"
+
+
+def run_request(middleware, path="/v1/completions"):
+    scope = {"type": "http", "path": path, "headers": [], "client": ("1.2.3.4", 1)}
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(middleware(scope, receive, send))
+    return scope, sent
+
+
+def test_middleware_limits_and_annotates_responses():
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    limiter = RateLimiter(requests_per_minute=1)
+    middleware = RateLimitMiddleware(app, limiter)
+
+    scope, sent = run_request(middleware)
+    assert sent[0]["status"] == 200
+    assert (b"x-ratelimit-remaining-requests", b"0") in sent[0]["headers"]
+    assert scope["state"]["rate_limit_key"] == "ip-1.2.3.4"
+
+    _, sent = run_request(middleware)
+    assert sent[0]["status"] == 429
+    assert dict(sent[0]["headers"])[b"retry-after"] == b"60"
+    assert b"Rate limit exceeded" in sent[1]["body"]
+
+    # Health probes are never limited
+    _, sent = run_request(middleware, "/healthz")
+    assert sent[0]["status"] == 200
+
+
+def test_check_is_cheap():
+    limiter = RateLimiter(requests_per_minute=1e9, tokens_per_minute=1e9)
+    started = time.perf_counter()
+    for i in range(10000):
+        limiter.check(f"ip-{i % 100}")
+    per_call = (time.perf_counter() - started) / 10000
+    assert per_call < 50e-6
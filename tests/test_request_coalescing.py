@@ -0,0 +1,122 @@
+"""Tests for single-flight request coalescing."""
+
+import asyncio
+
+import pytest
+
+from src.request_coalescing import SingleFlight, coalescing_key, request_key
+
+
+def test_request_key_is_canonical():
+    assert request_key(model="m", prompt="p") == request_key(prompt="p", model="m")
+    assert request_key(model="m", prompt="p") != request_key(model="m", prompt="q")
+
+
+def test_only_deterministic_or_opted_in_requests_coalesce():
+    assert coalescing_key(0.0, None, prompt="p") is not None
+    assert coalescing_key(0.7, None, prompt="p") is None
+    assert coalescing_key(0.7, "true", prompt="p") is not None
+    assert coalescing_key(0.7, "false", prompt="p") is None
+
+
+def test_identical_requests_share_one_generation():
+    flight = SingleFlight()
+    calls = []
+
+    async def generate():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def main():
+        key = request_key(prompt="p")
+        results = await asyncio.gather(*(flight.run(key, generate) for _ in range(5)))
+        unkeyed = await asyncio.gather(*(flight.run(None, generate) for _ in range(2)))
+        return results, unkeyed
+
+    results, unkeyed = asyncio.run(main())
+    assert results == ["result"] * 5
+    assert unkeyed == ["result"] * 2
+    assert len(calls) == 1 + 2
+    assert flight.stats() == {"leaders": 1, "coalesced": 4, "in_flight": 0}
+
+
+def test_errors_reach_every_waiter():
+    flight = SingleFlight()
+
+    async def generate():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("backend down")
+
+    async def main():
+        return await asyncio.gather(*(flight.run("k", generate) for _ in range(3)),
+                                    return_exceptions=True)
+
+    assert all(isinstance(r, RuntimeError) for r in asyncio.run(main()))
+
+
+async def _tokens(n, started):
+    started.append(1)
+    for i in range(n):
+        await asyncio.sleep(0.005)
+        yield str(i)
+
+
+def test_stream_fans_out_including_late_joiners():
+    flight = SingleFlight()
+    started = []
+
+    async def collect(stream):
+        return [t async for t in stream]
+
+    async def main():
+        first = asyncio.ensure_future(collect(flight.stream("k", lambda: _tokens(5, started))))
+        await asyncio.sleep(0.012)  # a couple of tokens already produced
+        second = await collect(flight.stream("k", lambda: _tokens(5, started)))
+        return await first, second
+
+    first, second = asyncio.run(main())
+    assert first == second == ["0", "1", "2", "3", "4"]
+    assert len(started) == 1
+
+
+def test_stream_cancelled_when_last_subscriber_leaves():
+    flight = SingleFlight()
+    produced = []
+
+    async def endless():
+        i = 0
+        while True:
+            await asyncio.sleep(0.001)
+            produced.append(i)
+            yield str(i)
+            i += 1
+
+    async def main():
+        stream = flight.stream("k", endless)
+        async for token in stream:
+            if token == "3":
+                break
+        await stream.aclose()
+        await asyncio.sleep(0.02)
+        count = len(produced)
+        await asyncio.sleep(0.02)
+        return count
+
+    count = asyncio.run(main())
+    assert len(produced) == count
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_stream_error_propagates_to_subscribers():
+    flight = SingleFlight()
+
+    async def failing():
+        yield "a"
+        raise RuntimeError("boom")
+
+    async def main():
+        return [t async for t in flight.stream("k", failing)]
+
+    with pytest.raises(RuntimeError, match="boom"):
+        asyncio.run(main())
@@ -0,0 +1,128 @@
+"""Tests for the per-tenant semantic response cache."""
+
+import hashlib
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from src.semantic_cache import SemanticCache, tenant_for
+
+PARAMS = {"backend": "llama-gpu", "model": "m", "max_tokens": 64, "temperature": 0.0}
+
+
+def bag_of_words(texts):
+    """Hashing bag-of-words encoder; paraphrases share most dimensions."""
+    vectors = np.zeros((len(texts), 256), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for word in text.lower().replace("?", "").split():
+            vectors[row, int(hashlib.md5(word.encode()).hexdigest(), 16) % 256] += 1.0
+    return vectors
+
+
+def make_cache(**kwargs):
+    return SemanticCache(threshold=0.8, encoder=bag_of_words, **kwargs)
+
+
+def test_paraphrase_hits_and_unrelated_prompt_misses():
+    cache = make_cache()
+    cache.store("t", "how do I reset my password", PARAMS, {"text": "Use the reset link."})
+
+    lookup = cache.lookup("t", "how do I reset my password please", PARAMS)
+    assert lookup.hit is not None
+    assert lookup.hit.response == {"text": "Use the reset link."}
+    assert lookup.hit.similarity >= 0.8
+
+    assert cache.lookup("t", "what is the weather in paris", PARAMS).hit is None
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
+
+
+def test_params_must_match_exactly():
+    cache = make_cache()
+    cache.store("t", "how do I reset my password", PARAMS, {"text": "a"})
+    other = dict(PARAMS, max_tokens=128)
+    assert cache.lookup("t", "how do I reset my password", other).hit is None
+
+
+def test_tenants_are_isolated():
+    cache = make_cache()
+    cache.store("alice", "how do I reset my password", PARAMS, {"text": "a"})
+    assert cache.lookup("bob", "how do I reset my password", PARAMS).hit is None
+    assert cache.lookup("alice", "how do I reset my password", PARAMS).hit is not None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = make_cache(max_entries=2)
+    cache.store("t", "reset my password", PARAMS, {"text": "1"})
+    cache.store("t", "cancel my subscription", PARAMS, {"text": "2"})
+    assert cache.lookup("t", "reset my password", PARAMS).hit is not None
+    cache.store("t", "update billing address", PARAMS, {"text": "3"})
+
+    assert cache.lookup("t", "cancel my subscription", PARAMS).hit is None
+    assert cache.lookup("t", "reset my password", PARAMS).hit is not None
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["entries"] == 2
+
+
+def test_lookup_embedding_is_reused_on_store():
+    calls = []
+
+    def counting(texts):
+        calls.append(len(texts))
+        return bag_of_words(texts)
+
+    cache = SemanticCache(threshold=0.8, encoder=counting)
+    lookup = cache.lookup("t", "reset my password", PARAMS)
+    cache.store("t", "reset my password", PARAMS, {"text": "a"}, lookup.embedding)
+    assert calls == [1]
+
+
+def test_audit_counts_and_evicts_false_hits():
+    cache = make_cache(audit_threshold=0.9)
+    cache.store("t", "how do I reset my password", PARAMS, {"text": "use the reset link"})
+    hit = cache.lookup("t", "how do I reset my password", PARAMS).hit
+
+    assert cache.audit(hit, "use the reset link", hit.response["text"])
+    assert not cache.audit(hit, "contact billing support today", hit.response["text"])
+
+    stats = cache.stats()
+    assert stats["audits"] == 2
+    assert stats["false_hits"] == 1
+    assert stats["false_hit_rate"] == 0.5
+    assert cache.lookup("t", "how do I reset my password", PARAMS).hit is None
+
+
+def test_should_audit_respects_rate():
+    assert not make_cache().should_audit()
+    assert make_cache(audit_rate=1.0).should_audit()
+
+
+def test_from_env_is_opt_in(monkeypatch):
+    monkeypatch.delenv("SEMANTIC_CACHE_ENABLED", raising=False)
+    assert SemanticCache.from_env() is None
+    monkeypatch.setenv("SEMANTIC_CACHE_ENABLED", "true")
+    monkeypatch.setenv("SEMANTIC_CACHE_THRESHOLD", "0.95")
+    assert SemanticCache.from_env().threshold == 0.95
+
+
+def test_tenant_for_prefers_api_key():
+    assert tenant_for("Bearer secret", "spoofed") == tenant_for("Bearer secret", None)
+    assert tenant_for("Bearer secret").startswith("key-")
+    assert "secret" not in tenant_for("Bearer secret")
+    assert tenant_for(None, "acme") == "acme"
+    assert tenant_for(None) == "default"
+
+
+def test_total_entries_are_bounded_across_tenants():
+    cache = make_cache(max_entries=4, max_total_entries=3)
+    cache.store("t0", "reset my password", PARAMS, {"text": "0"})
+    for i in range(1, 6):
+        # Every client-chosen tenant id adds an entry, not a full-size index
+        cache.store(f"t{i}", "reset my password", PARAMS, {"text": str(i)})
+    stats = cache.stats()
+    assert stats["entries"] == 3 and stats["tenants"] == 3
+    assert stats["evictions"] == 3
+    assert cache.lookup("t0", "reset my password", PARAMS).hit is None
+    assert cache.lookup("t5", "reset my password", PARAMS).hit is not None
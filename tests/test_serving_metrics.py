@@ -0,0 +1,184 @@
+"""Tests for the Prometheus serving metrics."""
+
+import asyncio
+import queue
+import time
+import timeit
+
+import pytest
+
+from src.serving_metrics import (
+    MetricsRegistry,
+    ServingMetrics,
+    count_tokens,
+    memory_utilization,
+)
+from src.utils.batching import BatchWorker
+
+
+def sample(text, line_prefix):
+    """Value of the first exposition line starting with ``line_prefix``."""
+    for line in text.splitlines():
+        if line.startswith(line_prefix):
+            return float(line.rsplit(" ", 1)[1])
+    raise AssertionError(f"{line_prefix} not in output")
+
+
+def test_exposition_format():
+    registry = MetricsRegistry()
+    counter = registry.counter("requests_total", "Requests.", ("backend",))
+    gauge = registry.gauge("depth", "Depth.")
+    hist = registry.histogram("latency_seconds", "Latency.", ("backend",), (0.1, 1.0))
+    counter.labels("ollama").inc(2)
+    gauge.labels().set(3)
+    for value in (0.05, 0.5, 5.0):
+        hist.labels('we"ird').observe(value)
+
+    text = registry.render()
+    assert "# TYPE requests_total counter" in text
+    assert 'requests_total{backend="ollama"} 2' in text
+    assert "depth 3" in text
+    assert 'latency_seconds_bucket{backend="we\\"ird",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{backend="we\\"ird",le="1"} 2' in text
+    assert 'latency_seconds_bucket{backend="we\\"ird",le="+Inf"} 3' in text
+    assert 'latency_seconds_count{backend="we\\"ird"} 3' in text
+    assert sample(text, "latency_seconds_sum") == pytest.approx(5.55)
+    assert text.endswith("\n")
+
+
+def test_label_arity_and_counter_monotonicity():
+    registry = MetricsRegistry()
+    counter = registry.counter("c", "C.", ("a", "b"))
+    with pytest.raises(ValueError):
+        counter.labels("only-one")
+    with pytest.raises(ValueError):
+        counter.labels("x", "y").inc(-1)
+    with pytest.raises(ValueError):
+        registry.counter("c", "Duplicate.")
+
+
+def test_gauge_callback_failure_does_not_break_scrape():
+    registry = MetricsRegistry()
+    gauge = registry.gauge("g", "G.", ("k",))
+    gauge.labels("ok").set_function(lambda: 0.5)
+    gauge.labels("bad").set_function(lambda: 1 / 0)
+    text = registry.render()
+    assert 'g{k="ok"} 0.5' in text
+    assert 'k="bad"' not in text
+
+
+def test_tracker_records_non_streaming_generation():
+    metrics = ServingMetrics()
+    tracker = metrics.track("llama-gpu", "m")
+    assert metrics.waiting.labels("llama-gpu", "m").get() == 1
+
+    time.sleep(0.01)
+    run = tracker.timed(lambda prompt: prompt.upper())
+    assert run("hi") == "HI"
+    assert metrics.waiting.labels("llama-gpu", "m").get() == 0
+    assert metrics.running.labels("llama-gpu", "m").get() == 1
+    tracker.finish(prompt_tokens=3, completion_tokens=4)
+    tracker.finish(prompt_tokens=3, completion_tokens=4)  # idempotent
+
+    text = metrics.render()
+    labels = '{backend="llama-gpu",model="m"}'
+    assert metrics.running.labels("llama-gpu", "m").get() == 0
+    assert sample(text, "llm_queue_wait_seconds_sum" + labels) >= 0.01
+    assert sample(text, "llm_prompt_tokens_total" + labels) == 3
+    assert sample(text, "llm_completion_tokens_total" + labels) == 4
+    assert sample(text, "llm_time_per_output_token_seconds_count" + labels) == 1
+    assert sample(text, "llm_e2e_request_latency_seconds_count" + labels) == 1
+    assert 'llm_requests_total{backend="llama-gpu",model="m",status="ok"} 1' in text
+    # No streamed tokens, so no first-token time
+    assert "llm_time_to_first_token_seconds_count" not in text
+
+
+def test_rejected_request_only_counts_status():
+    metrics = ServingMetrics()
+    metrics.track("ollama", None).finish(status="rejected")
+    text = metrics.render()
+    assert 'status="rejected"} 1' in text
+    assert metrics.waiting.labels("ollama", "default").get() == 0
+    assert "llm_e2e_request_latency_seconds_count" not in text
+
+
+def test_stream_records_ttft_tpot_and_reported_counts():
+    metrics = ServingMetrics()
+    usage = {}
+
+    async def tokens():
+        for token in ("a", "b", "c"):
+            await asyncio.sleep(0.005)
+            yield token
+        usage["completion_tokens"] = 7
+
+    async def main():
+        tracker = metrics.track("ollama", "m")
+        tracker.start()
+        return [t async for t in tracker.stream(
+            tokens(), lambda: 5, lambda: usage.get("completion_tokens"))]
+
+    assert asyncio.run(main()) == ["a", "b", "c"]
+    text = metrics.render()
+    labels = '{backend="ollama",model="m"}'
+    assert sample(text, "llm_time_to_first_token_seconds_count" + labels) == 1
+    assert sample(text, "llm_time_to_first_token_seconds_sum" + labels) >= 0.005
+    assert sample(text, "llm_time_per_output_token_seconds_count" + labels) == 1
+    assert sample(text, "llm_prompt_tokens_total" + labels) == 5
+    assert sample(text, "llm_completion_tokens_total" + labels) == 7
+
+
+def test_abandoned_stream_is_counted_as_cancelled():
+    metrics = ServingMetrics()
+
+    async def main():
+        tracker = metrics.track("llama-gpu", "m")
+        tracker.start()
+        stream = tracker.stream(iter(["a", "b", "c"]))
+        async for _ in stream:
+            break
+        await stream.aclose()
+
+    asyncio.run(main())
+    assert 'status="cancelled"} 1' in metrics.render()
+    assert metrics.running.labels("llama-gpu", "m").get() == 0
+
+
+def test_count_tokens_prefers_tokenizer():
+    class CharTokenizer:
+        def encode(self, text, add_special_tokens=True):
+            return list(text) + (["<s>"] if add_special_tokens else [])
+
+    assert count_tokens("hello world", CharTokenizer()) == 11
+    assert count_tokens("hello world") == 2
+    assert count_tokens("") == 0
+
+
+def test_memory_utilization_is_a_fraction():
+    assert 0.0 < memory_utilization() < 1.0
+
+
+def test_batch_worker_reports_batch_size():
+    metrics = ServingMetrics()
+    requests = queue.Queue()
+    for i in range(3):
+        requests.put(i)
+    done = []
+    worker = BatchWorker(
+        requests, done.extend, batch_size=8, batch_timeout=0.05,
+        on_batch=lambda size: metrics.observe_batch("llama-gpu", "m", size))
+    worker.start()
+    deadline = time.time() + 2
+    while len(done) < 3 and time.time() < deadline:
+        time.sleep(0.01)
+    worker.stop()
+    assert metrics.batch_size.labels("llama-gpu", "m").get() == 3
+
+
+def test_recording_overhead_is_sub_microsecond():
+    metrics = ServingMetrics()
+    child = metrics.time_per_output_token.labels("llama-gpu", "m")
+    n = 50000
+    per_event = min(timeit.repeat(lambda: child.observe(0.02), number=n, repeat=5)) / n
+    # Budget is 1us; allow slack for loaded CI machines
+    assert per_event < 2e-6
@@ -0,0 +1,88 @@
+"""Tests for the OpenAI-compatible SSE streaming helpers."""
+
+import asyncio
+import json
+import threading
+
+from src.streaming import SSE_DONE, iterate_in_thread, sse_event, sse_stream
+
+
+def collect(agen):
+    async def run():
+        return [item async for item in agen]
+    return asyncio.run(run())
+
+
+def parse(events):
+    assert events[-1] == SSE_DONE
+    return [json.loads(e[len("data: "):]) for e in events[:-1]]
+
+
+def test_sse_event_format():
+    assert sse_event({"a": 1}) == 'data: {"a":1}\n\n'
+    assert sse_event("[DONE]") == SSE_DONE
+
+
+def test_completion_stream_chunks():
+    chunks = parse(collect(sse_stream(iter(["Hel", "lo"]), "completion", "m", backend="x")))
+    assert [c["choices"][0]["text"] for c in chunks] == ["Hel", "lo", ""]
+    assert chunks[-1]["choices"][0]["finish_reason"] == "stop"
+    assert all(c["object"] == "text_completion" and c["backend"] == "x" for c in chunks)
+
+
+def test_chat_stream_starts_with_role_and_ends_with_stop():
+    chunks = parse(collect(sse_stream(iter(["a", "", "b"]), "chat", "m")))
+    deltas = [c["choices"][0]["delta"] for c in chunks]
+    assert deltas == [{"role": "assistant", "content": ""}, {"content": "a"},
+                      {"content": "b"}, {}]
+    assert chunks[-1]["choices"][0]["finish_reason"] == "stop"
+    assert len({c["id"] for c in chunks}) == 1
+
+
+def test_final_chunk_carries_backend_usage():
+    usage = {}
+
+    def tokens():
+        yield "a"
+        usage.update(prompt_tokens=3, completion_tokens=1, timing={"eval_ms": 5.0})
+
+    chunks = parse(collect(sse_stream(tokens(), "chat", "m", usage=usage)))
+    assert "usage" not in chunks[1]
+    assert chunks[-1]["usage"] == {
+        "prompt_tokens": 3, "completion_tokens": 1, "total_tokens": 4, "timing": {"eval_ms": 5.0}
+    }
+    plain = parse(collect(sse_stream(iter(["a"]), "chat", "m", usage={})))
+    assert "usage" not in plain[-1]
+
+
+def test_backend_error_becomes_error_event():
+    def failing():
+        yield "ok"
+        raise RuntimeError("boom")
+
+    chunks = parse(collect(sse_stream(failing(), "completion", "m")))
+    assert chunks[-1] == {"error": {"message": "boom", "type": "server_error"}}
+
+
+def test_disconnect_stops_and_closes_iterator():
+    produced = []
+    closed = threading.Event()
+
+    def tokens():
+        try:
+            for i in range(100):
+                produced.append(i)
+                yield str(i)
+        finally:
+            closed.set()
+
+    checks = {"n": 0}
+
+    async def is_disconnected():
+        checks["n"] += 1
+        return checks["n"] > 3
+
+    items = collect(iterate_in_thread(tokens(), is_disconnected))
+    assert items == ["0", "1", "2"]
+    assert closed.wait(1.0)
+    assert len(produced) == 3
@@ -0,0 +1,162 @@
+"""
+Tests for layer-streaming quantization.
+
+Builds a tiny sharded LLaMA-style checkpoint on disk and checks that the
+streaming quantizer round-trips it, bounds per-group memory, reports
+progress and resumes after an interruption.
+"""
+
+import json
+import os
+import tempfile
+
+import pytest
+import torch
+
+from src.quantization import QuantizationConfig, QuantizationManager, QuantizationType
+from src.streaming_quantization import (
+    MANIFEST_NAME,
+    StreamingQuantizer,
+    dequantize_int4,
+    dequantize_int8,
+    group_name_for,
+    load_quantized_state_dict,
+    quantize_int4,
+    quantize_int8,
+)
+
+NUM_LAYERS = 4
+HIDDEN = 64
+
+
+def make_state_dict():
+    torch.manual_seed(0)
+    state = {"model.embed_tokens.weight": torch.randn(100, HIDDEN)}
+    for i in range(NUM_LAYERS):
+        prefix = f"model.layers.{i}"
+        state[f"{prefix}.self_attn.q_proj.weight"] = torch.randn(HIDDEN, HIDDEN)
+        state[f"{prefix}.mlp.up_proj.weight"] = torch.randn(2 * HIDDEN, HIDDEN)
+        state[f"{prefix}.input_layernorm.weight"] = torch.ones(HIDDEN)
+    state["model.norm.weight"] = torch.ones(HIDDEN)
+    state["lm_head.weight"] = torch.randn(100, HIDDEN)
+    return state
+
+
+@pytest.fixture
+def sharded_checkpoint():
+    """Write a two-shard pytorch_model.bin checkpoint with an index."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        state = make_state_dict()
+        names = list(state)
+        shards = {
+            "pytorch_model-00001-of-00002.bin": names[: len(names) // 2],
+            "pytorch_model-00002-of-00002.bin": names[len(names) // 2:],
+        }
+        weight_map = {}
+        for shard, shard_names in shards.items():
+            torch.save({n: state[n] for n in shard_names}, os.path.join(temp_dir, shard))
+            weight_map.update({n: shard for n in shard_names})
+        with open(os.path.join(temp_dir, "pytorch_model.bin.index.json"), "w") as f:
+            json.dump({"metadata": {}, "weight_map": weight_map}, f)
+        with open(os.path.join(temp_dir, "config.json"), "w") as f:
+            json.dump({"model_type": "llama"}, f)
+        yield temp_dir, state
+
+
+@pytest.fixture
+def output_dir():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        yield os.path.join(temp_dir, "quantized")
+
+
+class TestPrimitives:
+    """Test tensor-level quantization helpers."""
+
+    def test_int8_round_trip(self):
+        weight = torch.randn(32, 48)
+        q, scale = quantize_int8(weight)
+        assert q.dtype == torch.int8
+        restored = dequantize_int8(q, scale)
+        assert torch.max(torch.abs(restored - weight)) <= scale.max() / 2 + 1e-6
+
+    def test_int4_round_trip_with_padding(self):
+        weight = torch.randn(16, 100)
+        packed, scale = quantize_int4(weight, group_size=32)
+        assert packed.dtype == torch.uint8
+        assert packed.shape == (16, 64)
+        restored = dequantize_int4(packed, scale, weight.shape, group_size=32)
+        assert restored.shape == weight.shape
+        assert torch.max(torch.abs(restored - weight)) <= scale.max() / 2 + 1e-6
+
+    def test_group_names(self):
+        assert group_name_for("model.layers.12.mlp.up_proj.weight") == "model.layers.12"
+        assert group_name_for("model.embed_tokens.weight") == "model.embed_tokens"
+        assert group_name_for("lm_head.weight") == "lm_head"
+
+
+class TestStreamingQuantizer:
+    """Test checkpoint streaming."""
+
+    def test_int8_checkpoint_round_trip(self, sharded_checkpoint, output_dir):
+        checkpoint_dir, state = sharded_checkpoint
+        config = QuantizationConfig(quantization_type=QuantizationType.INT8)
+        result = StreamingQuantizer(config).quantize_checkpoint(checkpoint_dir, output_dir)
+
+        assert result.completed
+        assert result.total_groups == NUM_LAYERS + 3
+        assert result.quantized_size < result.original_size
+        assert os.path.exists(os.path.join(output_dir, "config.json"))
+
+        restored = load_quantized_state_dict(output_dir)
+        assert set(restored) == set(state)
+        for name, tensor in state.items():
+            assert restored[name].shape == tensor.shape
+            assert torch.allclose(restored[name], tensor, atol=0.05)
+
+    def test_peak_memory_is_one_group(self, sharded_checkpoint, output_dir):
+        checkpoint_dir, state = sharded_checkpoint
+        config = QuantizationConfig(quantization_type=QuantizationType.INT4)
+        result = StreamingQuantizer(config, group_size=32).quantize_checkpoint(
+            checkpoint_dir, output_dir)
+
+        total_bytes = sum(t.nelement() * t.element_size() for t in state.values())
+        assert result.peak_group_bytes < total_bytes / 2
+
+    def test_progress_and_resume(self, sharded_checkpoint, output_dir):
+        checkpoint_dir, _ = sharded_checkpoint
+        config = QuantizationConfig(quantization_type=QuantizationType.INT8)
+        seen = []
+
+        def interrupt(progress):
+            seen.append(progress)
+            if progress.completed_groups == 3:
+                raise KeyboardInterrupt
+
+        with pytest.raises(KeyboardInterrupt):
+            StreamingQuantizer(config, progress_callback=interrupt).quantize_checkpoint(
+                checkpoint_dir, output_dir)
+        assert [p.completed_groups for p in seen] == [1, 2, 3]
+
+        with open(os.path.join(output_dir, MANIFEST_NAME)) as f:
+            assert json.load(f)["completed"] is False
+
+        result = StreamingQuantizer(config).quantize_checkpoint(checkpoint_dir, output_dir)
+        assert result.groups_skipped == 3
+        assert result.groups_quantized == result.total_groups - 3
+
+    def test_config_change_restarts(self, sharded_checkpoint, output_dir):
+        checkpoint_dir, _ = sharded_checkpoint
+        StreamingQuantizer(QuantizationConfig(quantization_type=QuantizationType.INT8)
+                           ).quantize_checkpoint(checkpoint_dir, output_dir)
+        result = StreamingQuantizer(QuantizationConfig(quantization_type=QuantizationType.FP16)
+                                    ).quantize_checkpoint(checkpoint_dir, output_dir)
+        assert result.groups_skipped == 0
+
+    def test_manager_quantize_checkpoint(self, sharded_checkpoint, output_dir):
+        checkpoint_dir, _ = sharded_checkpoint
+        manager = QuantizationManager(QuantizationConfig(quantization_type=QuantizationType.INT8))
+        summary = manager.quantize_checkpoint(checkpoint_dir, output_dir, "tiny")
+
+        assert summary["output_dir"] == output_dir
+        assert manager.get_quantization_stats("tiny")["memory_saved"] > 0
+        assert manager.get_overall_stats()["total_models"] == 1
@@ -0,0 +1,216 @@
+"""Tests for coalesced, multiplexed WebSocket token framing."""
+
+import asyncio
+import importlib
+import json
+import os
+import sys
+
+import pytest
+
+from src.ws_framing import FrameCodec, FramedSession, serve_websocket
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def fast_tokens(n, delay=0.0):
+    for i in range(n):
+        if delay:
+            await asyncio.sleep(delay)
+        yield f"t{i} "
+
+
+def run_session(requests, send_delay=0.0, **options):
+    """Run generate messages to completion; return the decoded messages."""
+    sent = []
+
+    async def send(data):
+        if send_delay:
+            await asyncio.sleep(send_delay)
+        sent.append(json.loads(data))
+
+    async def main():
+        session = FramedSession(send, lambda req: req["tokens"], **options)
+        writer = asyncio.ensure_future(session.write_loop())
+        for request in requests:
+            await session.handle(request)
+        await session.flush()
+        writer.cancel()
+        return session
+
+    session = asyncio.run(main())
+    return sent, session
+
+
+def frames_for(messages, request_id):
+    return [f for m in messages if m["type"] == "tokens" for f in m["frames"]
+            if f["id"] == request_id]
+
+
+def test_fast_stream_is_coalesced_into_bounded_frames():
+    sent, session = run_session(
+        [{"type": "generate", "id": "a", "tokens": fast_tokens(40, delay=0.0005)}])
+    frames = frames_for(sent, "a")
+    assert "".join(f["text"] for f in frames) == "".join(f"t{i} " for i in range(40))
+    # Flushes trigger at 16 tokens; a frame may pick up a token that
+    # arrived while the writer was waking
+    assert all(f["n"] <= 18 for f in frames)
+    assert [f["seq"] for f in frames] == list(range(len(frames)))
+    assert session.messages_sent < 10
+    final = frames[-1]
+    assert final["done"] and final["finish_reason"] == "stop"
+    assert final["tokens"] == 40
+    assert final["ttft_ms"] >= 0
+
+
+def test_slow_stream_flushes_after_window():
+    sent, _ = run_session(
+        [{"type": "generate", "id": "a", "tokens": fast_tokens(4, delay=0.04)}],
+        window_ms=5)
+    frames = [f for f in frames_for(sent, "a") if f["n"]]
+    assert [f["n"] for f in frames] == [1, 1, 1, 1]
+    assert all(f["last_ms"] >= f["first_ms"] for f in frames)
+
+
+def test_requests_are_multiplexed_and_cancellable():
+    sent = []
+
+    async def send(data):
+        sent.append(json.loads(data))
+
+    async def main():
+        session = FramedSession(send, lambda req: req["tokens"], window_ms=5)
+        writer = asyncio.ensure_future(session.write_loop())
+        await session.handle({"type": "generate", "id": "a", "tokens": fast_tokens(5, 0.01)})
+        await session.handle({"type": "generate", "id": "b", "tokens": fast_tokens(1000, 0.01)})
+        await asyncio.sleep(0.03)
+        await session.handle({"type": "cancel", "id": "b"})
+        await session.flush()
+        writer.cancel()
+
+    asyncio.run(main())
+    a, b = frames_for(sent, "a"), frames_for(sent, "b")
+    assert a[-1]["finish_reason"] == "stop" and a[-1]["tokens"] == 5
+    assert b[-1]["finish_reason"] == "cancelled" and b[-1]["tokens"] < 1000
+    # Some messages carried frames of both requests
+    assert any(len(m["frames"]) == 2 for m in sent if m["type"] == "tokens")
+
+
+def test_slow_reader_gets_larger_frames_and_pauses_generation():
+    produced = []
+
+    async def tokens():
+        for i in range(60):
+            produced.append(i)
+            yield "x"
+
+    sent = []
+
+    async def send(data):
+        sent.append(json.loads(data))
+        await asyncio.sleep(0.05)
+
+    async def main():
+        session = FramedSession(send, lambda req: tokens(), max_tokens=4, max_buffered=8)
+        writer = asyncio.ensure_future(session.write_loop())
+        await session.handle({"type": "generate", "id": "a"})
+        await asyncio.sleep(0.02)
+        # The first frame is on the wire and the next max_buffered tokens
+        # wait; generation is paused on the token after that
+        in_flight = len(produced)
+        await session.flush()
+        writer.cancel()
+        return in_flight
+
+    in_flight = asyncio.run(main())
+    frames = frames_for(sent, "a")
+    assert in_flight <= 8 + 8 + 1
+    assert max(f["n"] for f in frames) == 8
+    assert sum(f["n"] for f in frames) == 60
+
+
+def test_token_ids_and_blocking_iterators():
+    sent, _ = run_session(
+        [{"type": "generate", "id": "a", "tokens": iter([(1, "a"), (2, "b")])}])
+    frames = frames_for(sent, "a")
+    assert [i for f in frames for i in f.get("ids", [])] == [1, 2]
+    assert "".join(f["text"] for f in frames) == "ab"
+
+
+def test_errors_are_reported_per_request():
+    async def failing():
+        yield "a"
+        raise RuntimeError("backend down")
+
+    def start(request):
+        if request["id"] == "rejected":
+            raise RuntimeError("queue full")
+        return failing()
+
+    sent = []
+
+    async def send(data):
+        sent.append(json.loads(data))
+
+    async def main():
+        session = FramedSession(send, start)
+        writer = asyncio.ensure_future(session.write_loop())
+        await session.handle({"type": "generate", "id": "rejected"})
+        await session.handle({"type": "generate", "id": "a"})
+        await session.handle({"type": "bogus"})
+        await session.flush()
+        writer.cancel()
+
+    asyncio.run(main())
+    errors = [m for m in sent if m["type"] == "error"]
+    assert errors[0] == {"type": "error", "id": "rejected", "message": "queue full"}
+    assert "Unknown message type" in errors[1]["message"]
+    final = frames_for(sent, "a")[-1]
+    assert final["finish_reason"] == "error" and final["error"] == "backend down"
+
+
+class FakeWebSocket:
+    def __init__(self, incoming):
+        self.incoming = incoming
+        self.sent = []
+
+    async def receive(self):
+        if self.incoming:
+            return {"type": "websocket.receive", "text": self.incoming.pop(0)}
+        await asyncio.sleep(0.2)  # let the stream finish, then hang up
+        return {"type": "websocket.disconnect"}
+
+    async def send_text(self, data):
+        self.sent.append(json.loads(data))
+
+
+def test_serve_websocket_runs_protocol_until_disconnect():
+    ws = FakeWebSocket([
+        "not json",
+        json.dumps({"type": "generate", "id": "a", "prompt": "hi"}),
+    ])
+    asyncio.run(serve_websocket(ws, lambda req: fast_tokens(3)))
+    assert ws.sent[0]["type"] == "error"
+    final = frames_for(ws.sent, "a")[-1]
+    assert final["done"] and final["tokens"] == 3
+
+
+def test_codec_rejects_unknown_encoding():
+    with pytest.raises(ValueError):
+        FrameCodec("xml")
+
+
+def test_msgpack_round_trip():
+    msgpack = pytest.importorskip("msgpack")
+    codec = FrameCodec("msgpack")
+    data = codec.encode({"type": "tokens", "frames": [{"id": "a", "text": "hi"}]})
+    assert isinstance(data, bytes)
+    assert FrameCodec.decode(data) == msgpack.unpackb(data, raw=False)
+
+
+def test_organized_server_shares_this_implementation(monkeypatch):
+    monkeypatch.syspath_prepend(os.path.join(ROOT, "_organized", "core", "src", "llama_gpu"))
+    monkeypatch.delitem(sys.modules, "ws_framing", raising=False)
+    organized = importlib.import_module("ws_framing")
+    assert organized.serve_websocket is serve_websocket
+    assert organized.FramedSession is FramedSession
@@ -123,7 +123,7 @@ Work autonomously and efficiently until tasks are complete."""
         if not OLLAMA_AVAILABLE:
             raise RuntimeError("Ollama client is required but not available")
 
-        self.ollama = OllamaClient()
+        self.ollama = OllamaClient.from_env()
 
         # Initialize command executor
         if allow_execution and EXECUTOR_AVAILABLE:
@@ -442,7 +442,7 @@ def main():
 
     # Check if Ollama is available
     if OLLAMA_AVAILABLE:
-        client = OllamaClient()
+        client = OllamaClient.from_env()
         if not client.is_available():
             print("❌ Error: Ollama service is not running")
             print("Start it with: ollama serve")
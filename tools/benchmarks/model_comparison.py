@@ -5,20 +5,25 @@ Compares performance across different models (Phi4-mini, DeepSeek-R1, etc.)
 """
 
 import sys
-import time
 import json
-from typing import Dict, List, Any
+from typing import Any, Dict, List, Optional
 from datetime import datetime
 
 sys.path.insert(0, "/home/kevin/Projects/Llama-GPU")
-from src.backends.ollama import OllamaClient
+from src.backends.ollama import OllamaBackend, OllamaClient
 
 
 class ModelBenchmark:
-    """Benchmark and compare different models."""
+    """Benchmark and compare different models.
     
-    def __init__(self):
-        self.client = OllamaClient()
+    Prompts run ``concurrency`` at a time (default ``OLLAMA_NUM_PARALLEL``);
+    per-prompt times then include waiting for a parallel slot in Ollama.
+    """
+    
+    def __init__(self, concurrency: Optional[int] = None):
+        self.backend = OllamaBackend()
+        self.client = self.backend.client
+        self.concurrency = concurrency or self.backend.num_parallel
         self.results = []
         
     def benchmark_model(
@@ -39,20 +44,24 @@ class ModelBenchmark:
             "tokens_per_second": 0
         }
         
+        report = self.backend.batch_infer(
+            prompts,
+            model=model,
+            max_tokens=max_tokens,
+            temperature=0.7,
+            concurrency=self.concurrency
+        )
+        results["wall_time"] = report.elapsed
+        results["tokens_per_second"] = report.tokens_per_second
+        
         for i, prompt in enumerate(prompts, 1):
             print(f"\nPrompt {i}/{len(prompts)}: {prompt[:50]}...")
             
-            start_time = time.time()
             try:
-                response = self.client.generate(
-                    model=model,
-                    prompt=prompt,
-                    max_tokens=max_tokens,
-                    temperature=0.7
-                )
-                end_time = time.time()
-                
-                elapsed = end_time - start_time
+                if i - 1 in report.errors:
+                    raise RuntimeError(report.errors[i - 1])
+                response = report[i - 1]
+                elapsed = report.latencies[i - 1]
                 response_length = len(response.split())
                 
                 prompt_result = {
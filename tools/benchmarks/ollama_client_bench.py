@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Ollama client connection benchmark.
+
+Measures calls per second against the in-process fake Ollama server,
+with a new connection per call (plain ``requests.post``, as the client
+used to work) and with the pooled keep-alive ``OllamaClient``.
+
+Usage: python tools/benchmarks/ollama_client_bench.py [calls] [threads]
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+from src.backends.ollama import OllamaClient
+from src.backends.ollama.fake_server import FakeOllamaServer
+
+PAYLOAD = {"model": "fake:latest", "prompt": "Hello", "stream": False}
+
+
+def unpooled_call(url: str) -> None:
+    response = requests.post(f"{url}/api/generate", json=PAYLOAD, timeout=60)
+    response.raise_for_status()
+    response.json()
+
+
+def run(label: str, call, calls: int, threads: int) -> float:
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda _: call(), range(calls)))
+    rate = calls / (time.perf_counter() - started)
+    print(f"{label:<28} {rate:10.0f} calls/s")
+    return rate
+
+
+def main() -> None:
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    print(f"{calls} generate calls, {threads} threads, fake Ollama server")
+    print("=" * 50)
+    with FakeOllamaServer() as server:
+        before = run("new connection per call", lambda: unpooled_call(server.url), calls, threads)
+        opened = server.connections
+        client = OllamaClient(server.url, pool_size=threads)
+        after = run("pooled OllamaClient", lambda: client.generate("fake:latest", "Hello"), calls, threads)
+        print(f"connections: {opened} unpooled, {server.connections - opened} pooled")
+        print(f"speedup: {after / before:.2f}x")
+        stats = client.latency_stats()["generate"]
+        print(f"pooled latency: avg {stats['avg_seconds'] * 1000:.2f} ms, "
+              f"max {stats['max_seconds'] * 1000:.2f} ms")
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -259,7 +259,7 @@ Current working directory: {cwd}
         """
         self.model = model
         self.max_tool_calls = max_tool_calls
-        self.ollama = OllamaClient()
+        self.ollama = OllamaClient.from_env()
         self.tools = ToolRegistry()
         self.conversation_history: List[Dict[str, Any]] = []
 
@@ -407,7 +407,7 @@ def main():
     args = parser.parse_args()
 
     # Check Ollama availability
-    client = OllamaClient()
+    client = OllamaClient.from_env()
     if not client.is_available():
         print("❌ Error: Ollama is not running. Start with: ollama serve")
         sys.exit(1)